@@ -0,0 +1,49 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" torch reference of the fused residual-add + RMSNorm between TP layers.
+
+it follows the same order as the Triton kernel in kernels/nvidia/add_rmsnorm.py: the sum is rounded to the activation
+dtype first, because that rounded value is the next residual, and the norm is then taken in fp32 over it.
+"""
+from typing import Optional, Tuple
+
+import torch
+
+
+def add_rmsnorm_torch(x: torch.Tensor, residual: Optional[torch.Tensor], w: torch.Tensor,
+                      eps: float) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Args:
+        x (torch.Tensor): [..., N], e.g. the attention/MLP output (a gemm_rs or all_reduce output slice).
+        residual (torch.Tensor, Optional): [..., N]. None for the first layer: x itself is the residual.
+        w (torch.Tensor): [N] norm weight.
+
+    Returns:
+        (rmsnorm(x + residual) * w, x + residual), both in x.dtype
+    """
+    residual = x if residual is None else (x.float() + residual.float()).to(x.dtype)
+    r = residual.float()
+    rstd = torch.rsqrt(r.pow(2).mean(dim=-1, keepdim=True) + eps)
+    return (r * rstd * w.float()).to(x.dtype), residual
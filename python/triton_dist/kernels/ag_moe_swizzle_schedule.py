@@ -0,0 +1,112 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" host-side AG-MoE threadblock swizzle: the whole schedule of threadblock_swizzle_ag_moe_kernel at once, with numpy.
+
+the kernel numbers the tiles of all experts one after the other (tile_index, BLOCK_SIZE_M tokens of an expert each),
+finds for each tile the ranks holding its first and last token (segment_start / segment_end) and the stage at which
+the last one arrives from this rank's view, and lays the tiles out grouped by expert, then by stage. tiles within one
+(expert, stage) group are placed by an atomic counter in the kernel, so their order there is not fixed; here they keep
+ascending tile_index. everything else agrees with the kernel element by element.
+"""
+import dataclasses
+
+import numpy as np
+
+
+def _cdiv(x, y):
+    return (x + y - 1) // y
+
+
+def segment_to_stage(segment, rank: int, tp_size: int, local_tp_size: int):
+    """ at which stage rank sees the tokens of rank `segment`: nodes first, then the ranks of a node """
+    nnodes = tp_size // local_tp_size
+    off_node = (segment // local_tp_size - rank // local_tp_size + nnodes) % nnodes
+    return off_node * local_tp_size + (segment - rank + local_tp_size) % local_tp_size
+
+
+@dataclasses.dataclass(frozen=True)
+class AGMoESwizzleSchedule:
+    """ [ntiles] int32 arrays in the order the GEMM programs run (program pid_m takes entry pid_m) """
+    expert_idx: np.ndarray
+    tile_index: np.ndarray  # global: the tiles of expert e follow those of experts 0 .. e - 1
+    segment_start: np.ndarray
+    segment_end: np.ndarray
+    stage: np.ndarray
+    ntiles_by_expert: np.ndarray
+
+    @property
+    def ntiles(self) -> int:
+        return len(self.expert_idx)
+
+    def tiled_m(self) -> np.ndarray:
+        """ tile index within its expert """
+        ntiles_by_expert_acc = np.cumsum(self.ntiles_by_expert)
+        return self.tile_index - (ntiles_by_expert_acc - self.ntiles_by_expert)[self.expert_idx]
+
+
+def ag_moe_swizzle_schedule(rank: int, tp_size: int, local_tp_size: int, block_size_m: int,
+                            ntokens_by_rank_by_expert) -> AGMoESwizzleSchedule:
+    """ what threadblock_swizzle_ag_moe_kernel computes for rank, from the [tp_size, nexperts] token counts """
+    ntokens_by_rank_by_expert = np.asarray(ntokens_by_rank_by_expert, dtype=np.int64)
+    assert ntokens_by_rank_by_expert.ndim == 2 and ntokens_by_rank_by_expert.shape[0] == tp_size, \
+        f"expect token counts of shape [tp_size={tp_size}, nexperts], got {ntokens_by_rank_by_expert.shape}"
+    assert tp_size % local_tp_size == 0, f"tp_size {tp_size} is not a multiple of local_tp_size {local_tp_size}"
+    assert 0 <= rank < tp_size, f"rank {rank} out of [0, {tp_size})"
+
+    ntokens_by_expert_by_rank_acc = np.cumsum(ntokens_by_rank_by_expert.T, axis=1)
+    ntokens_by_expert = ntokens_by_expert_by_rank_acc[:, -1]
+    ntiles_by_expert = _cdiv(ntokens_by_expert, block_size_m)
+    ntiles_by_expert_acc = np.cumsum(ntiles_by_expert)
+    ntiles = int(ntiles_by_expert_acc[-1])
+
+    # tile_index -> (expert_id, tiled_m in expert)
+    tile_index = np.arange(ntiles, dtype=np.int64)
+    expert_idx = np.searchsorted(ntiles_by_expert_acc, tile_index, side="right")
+    tiled_m = tile_index - (ntiles_by_expert_acc - ntiles_by_expert)[expert_idx]
+
+    # tiled_m -> ranks of its first and last token (bisect_right over the token cumsum of its expert)
+    acc = ntokens_by_expert_by_rank_acc[expert_idx]
+    m_start = tiled_m * block_size_m
+    m_end = np.minimum(m_start + block_size_m, ntokens_by_expert[expert_idx]) - 1
+    segment_start = (acc <= m_start[:, None]).sum(axis=1)
+    segment_end = (acc <= m_end[:, None]).sum(axis=1)
+    stage = segment_to_stage(segment_end, rank, tp_size, local_tp_size)
+    # the tile just before this rank's first one runs last. as in get_tile_stage, the check is on the tile index
+    global_m_start = acc[:, rank - 1] if rank > 0 else np.zeros_like(tiled_m)
+    global_tiled_m_start = _cdiv(global_m_start, block_size_m)
+    last = (tiled_m == global_tiled_m_start - 1) & (global_tiled_m_start % block_size_m != 0)
+    stage = np.where(last, tp_size - 1, stage)
+
+    # grouped by expert, then by stage
+    order = np.lexsort((tile_index, stage, expert_idx))
+    as_int32 = lambda x: np.ascontiguousarray(x[order], dtype=np.int32)
+    return AGMoESwizzleSchedule(
+        expert_idx=as_int32(expert_idx),
+        tile_index=as_int32(tile_index),
+        segment_start=as_int32(segment_start),
+        segment_end=as_int32(segment_end),
+        stage=as_int32(stage),
+        ntiles_by_expert=ntiles_by_expert.astype(np.int32),
+    )
@@ -22,21 +22,26 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 ################################################################################
+import dataclasses
 from enum import IntEnum
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import torch
 
 
 class AllReduceMethod(IntEnum):
     Unknown = 0
     OneShot = 1
-    TwoShot = 2  # TODO(houqi.1993) not implemented
+    TwoShot = 2
     DoubleTree = 3
     OneShot_TMA = 4
     OneShot_Multimem = 5
     TwoShot_Multimem = 6
     TwoShot_Multimem_ST = 7
-    OneShot_LL = 8  # TODO(houqi.1993) not implemented
+    OneShot_LL = 8
     OneShot_Multimem_LL = 9  # TODO(houqi.1993) not implemented
-    AllReduceEnumMax = 10
+    Hierarchical = 10  # inter node. composed of reduce-scatter and allgather
+    AllReduceEnumMax = 11
 
 
 _ALLREDUCE_METHODS = {
@@ -44,10 +49,12 @@ _ALLREDUCE_METHODS = {
     "one_shot": AllReduceMethod.OneShot,
     "two_shot": AllReduceMethod.TwoShot,
     "one_shot_tma": AllReduceMethod.OneShot_TMA,
+    "one_shot_ll": AllReduceMethod.OneShot_LL,  # requires nbytes * world_size * 5 symmetric buffer
     "one_shot_multimem": AllReduceMethod.OneShot_Multimem,  # requires nbytes symmetric buffer
     "two_shot_multimem": AllReduceMethod.TwoShot_Multimem,  # requires
     # deprecated: TwoShot_Multimem_ST use multimem but not fully use multimem instructions.
     "two_shot_multimem_st": AllReduceMethod.TwoShot_Multimem_ST,
+    "hierarchical": AllReduceMethod.Hierarchical,  # requires nbytes * world_size symmetric buffer
 }
 
 
@@ -59,3 +66,189 @@ def to_allreduce_method(method: str) -> AllReduceMethod:
 
 def get_allreduce_methods():
     return list(_ALLREDUCE_METHODS.keys())
+
+
+@dataclasses.dataclass(frozen=True)
+class AllReduceChunkPlan:
+    """ chunk layout of an all-reduce whose input does not fit in one workspace chunk.
+
+    the plan depends only on the input shape and the workspace size, so a kernel that loops over it on device
+    issues exactly the same work on every call: it can be captured by CUDAGraph.
+
+    chunk n lives in workspace slot `n % num_slots`. with num_slots == 2 chunk n+1 is pushed into the other slot
+    while chunk n is being reduced.
+    """
+    numel: int
+    chunk_numel: int
+    num_slots: int = 2
+
+    @property
+    def nchunks(self) -> int:
+        return (self.numel + self.chunk_numel - 1) // self.chunk_numel
+
+    def chunk(self, n: int) -> Tuple[int, int]:
+        """ returns (elem_offset, numel) of chunk n """
+        assert 0 <= n < self.nchunks, f"chunk {n} out of range [0, {self.nchunks})"
+        start = n * self.chunk_numel
+        return start, min(self.chunk_numel, self.numel - start)
+
+    def chunks(self) -> List[Tuple[int, int]]:
+        return [self.chunk(n) for n in range(self.nchunks)]
+
+    def slot(self, n: int) -> int:
+        return n % self.num_slots
+
+    def pipeline_schedule(self) -> List[Tuple[str, int]]:
+        """ the per-rank op sequence of the pipelined kernel, as (op, chunk) pairs. chunk n + num_slots - 1 is pushed
+        before chunk n is reduced.
+            push:     put chunk to all peers and set the data signal to chunk + 1
+            wait_ack: wait until all peers have reduced chunk, so its slot can be overwritten
+            reduce:   wait for the data signal of chunk and reduce it
+            ack:      tell all peers chunk is consumed
+        """
+        lookahead = self.num_slots - 1
+        steps = [("push", n) for n in range(min(max(lookahead, 1), self.nchunks))]
+        for n in range(self.nchunks):
+            if lookahead > 0 and n + lookahead < self.nchunks:
+                if n + lookahead >= self.num_slots:
+                    steps.append(("wait_ack", n + lookahead - self.num_slots))
+                steps.append(("push", n + lookahead))
+            steps.append(("reduce", n))
+            # the ack is only waited on by the push of chunk n + num_slots. never send an ack nobody waits for:
+            #  it may land after the peer has reset its signals for the next call.
+            if n + self.num_slots < self.nchunks:
+                steps.append(("ack", n))
+            if lookahead == 0 and n + 1 < self.nchunks:
+                steps.append(("wait_ack", n))
+                steps.append(("push", n + 1))
+        return steps
+
+
+def plan_allreduce_chunks(numel: int, itemsize: int, workspace_nbytes: int, workspace_bytes_per_in_byte: int,
+                          num_slots: int = 2, alignment: int = 16) -> AllReduceChunkPlan:
+    """ split `numel` elements into chunks such that `num_slots` chunks fit in the workspace at the same time.
+
+    Args:
+        workspace_bytes_per_in_byte (int): symmetric bytes one input byte takes for a method. world_size for one-shot.
+        alignment (int): chunk size in bytes is aligned to this, for vectorized load/store.
+    """
+    assert numel > 0 and itemsize > 0 and num_slots > 0
+    assert alignment % itemsize == 0, f"alignment {alignment} is not a multiple of itemsize {itemsize}"
+    slot_nbytes = workspace_nbytes // (workspace_bytes_per_in_byte * num_slots)
+    chunk_nbytes = slot_nbytes // alignment * alignment
+    if chunk_nbytes == 0:
+        raise ValueError(f"workspace of {workspace_nbytes} bytes is too small for {num_slots} slots "
+                         f"with {workspace_bytes_per_in_byte} bytes per input byte")
+    return AllReduceChunkPlan(numel=numel, chunk_numel=chunk_nbytes // itemsize, num_slots=num_slots)
+
+
+class AllReduceStageKind(IntEnum):
+    ReduceScatter = 0  # intra-node reduce-scatter + inter-node reduce across ranks with the same local_rank
+    AllGather = 1
+    LocalReduce = 2  # reduce world_size gathered copies on each rank. no communication
+
+
+@dataclasses.dataclass(frozen=True)
+class AllReduceStage:
+    kind: AllReduceStageKind
+    nbytes: int  # nbytes of the whole collective, as comm_perf_model.estimate_*_time_ms expects
+    world_size: int
+    local_world_size: int
+
+    @property
+    def num_sync_steps(self) -> int:
+        """ reduce_scatter_2d synchronizes once for each node and once more for the inter-node reduce """
+        if self.kind == AllReduceStageKind.ReduceScatter:
+            return self.world_size // self.local_world_size + 1
+        return 1
+
+
+@dataclasses.dataclass(frozen=True)
+class HierarchicalAllReducePlan:
+    """ a multi node all-reduce as a sequence of existing collectives.
+
+        rs_ag:     reduce_scatter_2d (intra-node scatter + reduce, inter-node reduce) => allgather. bandwidth optimal.
+        ag_reduce: allgather the whole input => local reduce. fewer steps, so better for small messages.
+    """
+    name: str
+    stages: Tuple[AllReduceStage, ...]
+
+    def estimate_time_ms(self, stage_cost_fn: Callable[[AllReduceStage], float]) -> float:
+        return sum(stage_cost_fn(stage) for stage in self.stages)
+
+
+def build_hierarchical_allreduce_plans(nbytes: int, world_size: int, local_world_size: int,
+                                       alignment: int = 16) -> List[HierarchicalAllReducePlan]:
+    """ all valid plans for an all-reduce of `nbytes` per rank.
+
+    Args:
+        alignment (int): reduce-scatter splits the input into world_size pieces of a multiple of `alignment` bytes.
+            use the row size in bytes if the input is reduce-scattered as a 2D tensor.
+    """
+    assert nbytes > 0 and world_size % local_world_size == 0
+    plans = [
+        HierarchicalAllReducePlan(
+            "ag_reduce",
+            (
+                AllReduceStage(AllReduceStageKind.AllGather, nbytes * world_size, world_size, local_world_size),
+                AllReduceStage(AllReduceStageKind.LocalReduce, nbytes * world_size, world_size, local_world_size),
+            ),
+        )
+    ]
+    if nbytes % (alignment * world_size) == 0:
+        plans.append(
+            HierarchicalAllReducePlan(
+                "rs_ag",
+                (
+                    AllReduceStage(AllReduceStageKind.ReduceScatter, nbytes, world_size, local_world_size),
+                    AllReduceStage(AllReduceStageKind.AllGather, nbytes, world_size, local_world_size),
+                ),
+            ))
+    return plans
+
+
+def select_hierarchical_allreduce_plan(nbytes: int, world_size: int, local_world_size: int,
+                                       stage_cost_fn: Callable[[AllReduceStage], float], alignment: int = 16,
+                                       allowed: Optional[Sequence[str]] = None) -> HierarchicalAllReducePlan:
+    """ the plan with the least estimated time. ties go to the plan built first.
+
+    Args:
+        allowed (Sequence[str]): plan names to choose from. None for all. ag_reduce is always allowed.
+    """
+    plans = build_hierarchical_allreduce_plans(nbytes, world_size, local_world_size, alignment)
+    if allowed is not None:
+        plans = [plan for plan in plans if plan.name in allowed or plan.name == "ag_reduce"]
+    return min(plans, key=lambda plan: plan.estimate_time_ms(stage_cost_fn))
+
+
+def ring_reduce_reference(segments: List[torch.Tensor], begin_idx: int) -> torch.Tensor:
+    """ sum segments in the order of `kernel_ring_reduce_non_tma`: (begin_idx + 1) % n, ..., begin_idx.
+
+    accumulates in the input dtype, rounding after each add as the kernel does.
+    """
+    num_segments = len(segments)
+    accum = segments[(begin_idx + 1) % num_segments].clone()
+    for i in range(1, num_segments):
+        accum += segments[(begin_idx + 1 + i) % num_segments]
+    return accum
+
+
+def all_reduce_reference(inputs: List[torch.Tensor], method: AllReduceMethod) -> List[torch.Tensor]:
+    """ CPU reference of the output on each rank, bit-exact with the reduction order of `method`.
+
+        one-shot: each rank reduces the full tensor starting from rank + 1, so ranks may differ in the last bits.
+        two-shot: rank r reduces segment r starting from r + 1 and all-gathers it, so all ranks get the same result.
+    """
+    world_size = len(inputs)
+    if method in [AllReduceMethod.OneShot, AllReduceMethod.OneShot_LL]:
+        return [ring_reduce_reference(inputs, rank).view_as(inputs[0]) for rank in range(world_size)]
+    if method == AllReduceMethod.TwoShot:
+        numel = inputs[0].numel()
+        assert numel % world_size == 0
+        segments = [x.flatten().split(numel // world_size) for x in inputs]
+        output = torch.cat([
+            ring_reduce_reference([segments[src][segment] for src in range(world_size)], segment)
+            for segment in range(world_size)
+        ]).view_as(inputs[0])
+        return [output.clone() for _ in range(world_size)]
+    raise NotImplementedError(f"no reference for allreduce method {method.name}")
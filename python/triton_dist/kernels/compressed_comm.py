@@ -0,0 +1,183 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" compressed-wire transport for bandwidth bound reduce-scatter/allgather: arch-agnostic layout and CPU references.
+
+x is cut into blocks of `block_size` elements. each block goes on the wire as `wire_dtype` values (fp8 e4m3 or int8)
+with one float32 scale = absmax(block) / qmax, and is restored as q * scale on the receiver.
+"""
+import dataclasses
+from typing import List, Optional, Tuple
+
+import torch
+
+WIRE_DTYPE_QMAX = {
+    torch.float8_e4m3fn: 448.0,
+    torch.int8: 127.0,
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class CompressedWireConfig:
+    """
+    Args:
+        wire_dtype (torch.dtype): torch.float8_e4m3fn or torch.int8.
+        block_size (int): elements per scale. a power of 2, at least 16.
+        error_bound (float, optional): max |x - dequant(quant(x))| / absmax(block) the caller accepts. raises if the
+            wire dtype can't guarantee it. None for the bound of the wire dtype.
+    """
+    wire_dtype: torch.dtype = torch.float8_e4m3fn
+    block_size: int = 128
+    error_bound: Optional[float] = None
+
+    def __post_init__(self):
+        if self.wire_dtype not in WIRE_DTYPE_QMAX:
+            raise ValueError(f"unsupported wire dtype {self.wire_dtype}. supported: {list(WIRE_DTYPE_QMAX.keys())}")
+        if self.block_size < 16 or self.block_size & (self.block_size - 1) != 0:
+            raise ValueError(f"block_size should be a power of 2 >= 16, got {self.block_size}")
+        if self.error_bound is not None and self.error_bound < self.wire_error_bound:
+            raise ValueError(f"{self.wire_dtype} guarantees an error bound of {self.wire_error_bound:.3e} "
+                             f"relative to the block absmax, tighter bound {self.error_bound:.3e} is requested")
+
+    @property
+    def qmax(self) -> float:
+        return WIRE_DTYPE_QMAX[self.wire_dtype]
+
+    @property
+    def wire_error_bound(self) -> float:
+        """ worst error of one element relative to its block absmax, with round to nearest. """
+        if self.wire_dtype == torch.int8:
+            return 0.5 / self.qmax
+        # e4m3: 3 mantissa bits => half ulp is 2^-4 of the value, and |value| <= absmax
+        return 2.0**-4
+
+    @property
+    def effective_error_bound(self) -> float:
+        return self.error_bound if self.error_bound is not None else self.wire_error_bound
+
+
+@dataclasses.dataclass(frozen=True)
+class CompressedSegmentLayout:
+    """ byte layout of `numel` elements on the wire: [q: numel wire values | pad to 16 | scales: float32 x num_blocks
+    | pad to 16]. a collective sends world_size segments back to back, each of `nbytes`.
+    """
+    numel: int
+    block_size: int
+
+    @property
+    def num_blocks(self) -> int:
+        return (self.numel + self.block_size - 1) // self.block_size
+
+    @property
+    def scale_offset(self) -> int:
+        return (self.numel + 15) // 16 * 16  # wire dtypes are 1 byte
+
+    @property
+    def nbytes(self) -> int:
+        return self.scale_offset + (self.num_blocks * 4 + 15) // 16 * 16
+
+
+def quantize_blockwise_reference(x: torch.Tensor, config: CompressedWireConfig) -> Tuple[torch.Tensor, torch.Tensor]:
+    """ returns (q of x.numel() wire_dtype values, float32 scales of num_blocks). all zero blocks get scale 0. """
+    numel = x.numel()
+    layout = CompressedSegmentLayout(numel, config.block_size)
+    blocks = torch.zeros((layout.num_blocks * config.block_size, ), dtype=torch.float32, device=x.device)
+    blocks[:numel] = x.flatten().float()
+    blocks = blocks.view(layout.num_blocks, config.block_size)
+    scales = blocks.abs().amax(dim=1) / config.qmax
+    inv_scales = torch.where(scales > 0, 1.0 / scales, torch.zeros_like(scales))
+    y = blocks * inv_scales[:, None]
+    if config.wire_dtype == torch.int8:
+        y = torch.round(y)  # round half to even, as rint
+    q = y.clamp(-config.qmax, config.qmax).to(config.wire_dtype)
+    return q.flatten()[:numel], scales
+
+
+def dequantize_blockwise_reference(q: torch.Tensor, scales: torch.Tensor, config: CompressedWireConfig,
+                                   dtype: torch.dtype = torch.float32) -> torch.Tensor:
+    numel = q.numel()
+    block_ids = torch.arange(numel, device=q.device) // config.block_size
+    return (q.float() * scales[block_ids]).to(dtype)
+
+
+def pack_segment_reference(x: torch.Tensor, config: CompressedWireConfig) -> torch.Tensor:
+    """ x as the int8 bytes of one CompressedSegmentLayout """
+    layout = CompressedSegmentLayout(x.numel(), config.block_size)
+    q, scales = quantize_blockwise_reference(x, config)
+    segment = torch.zeros((layout.nbytes, ), dtype=torch.int8, device=x.device)
+    segment[:layout.numel] = q.view(torch.int8)
+    segment[layout.scale_offset:layout.scale_offset + layout.num_blocks * 4] = scales.view(torch.int8)
+    return segment
+
+
+def unpack_segment_reference(segment: torch.Tensor, numel: int, config: CompressedWireConfig,
+                             dtype: torch.dtype = torch.float32) -> torch.Tensor:
+    layout = CompressedSegmentLayout(numel, config.block_size)
+    assert segment.dtype == torch.int8 and segment.numel() >= layout.nbytes
+    q = segment[:numel].view(config.wire_dtype)
+    scales = segment[layout.scale_offset:layout.scale_offset + layout.num_blocks * 4].view(torch.float32)
+    return dequantize_blockwise_reference(q, scales, config, dtype)
+
+
+@dataclasses.dataclass(frozen=True)
+class QuantizationErrorReport:
+    max_abs_error: float
+    max_rel_error: float  # relative to the block absmax
+    error_bound: float
+
+    @property
+    def within_bound(self) -> bool:
+        return self.max_rel_error <= self.error_bound
+
+
+def measure_quantization_error(x: torch.Tensor, config: CompressedWireConfig) -> QuantizationErrorReport:
+    """ the error one wire round trip adds to x """
+    q, scales = quantize_blockwise_reference(x, config)
+    err = (dequantize_blockwise_reference(q, scales, config) - x.flatten().float()).abs()
+    block_absmax = (scales * config.qmax)[torch.arange(x.numel(), device=x.device) // config.block_size]
+    rel_err = torch.where(block_absmax > 0, err / block_absmax, torch.zeros_like(err))
+    return QuantizationErrorReport(max_abs_error=err.max().item() if err.numel() else 0.0,
+                                   max_rel_error=rel_err.max().item() if rel_err.numel() else 0.0,
+                                   error_bound=config.effective_error_bound)
+
+
+def reduce_scatter_compressed_reference(inputs: List[torch.Tensor], config: CompressedWireConfig) -> List[torch.Tensor]:
+    """ rank r gets sum over src of dequant(quant(segment r of inputs[src])), accumulated in float32 in src order. """
+    world_size = len(inputs)
+    segments = [x.flatten().chunk(world_size) for x in inputs]
+    outputs = []
+    for rank in range(world_size):
+        accum = torch.zeros_like(segments[0][rank], dtype=torch.float32)
+        for src in range(world_size):
+            accum += unpack_segment_reference(pack_segment_reference(segments[src][rank], config),
+                                              segments[src][rank].numel(), config)
+        outputs.append(accum.to(inputs[0].dtype))
+    return outputs
+
+
+def all_gather_compressed_reference(inputs: List[torch.Tensor], config: CompressedWireConfig) -> torch.Tensor:
+    """ the same on all ranks: concat of dequant(quant(inputs[src])). """
+    return torch.cat([
+        unpack_segment_reference(pack_segment_reference(x, config), x.numel(), config, x.dtype) for x in inputs
+    ])
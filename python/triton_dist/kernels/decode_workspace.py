@@ -0,0 +1,103 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" preallocated outputs of split-KV decode attention, see SpGQAFlashDecodeAttention.
+
+the buffers are sized for max_batch at init, and each call takes views of their first batch rows. views are cached
+per batch size, so a batch size always gets the same tensors at the same addresses, as CUDA graph replay needs.
+
+debug mode adds guard rows after max_batch. each call fills the rows past its batch with a sentinel, and its views
+with NaN: check_guards() then finds kernels writing past their batch, and NaN in outputs finds rows never written.
+"""
+import dataclasses
+from typing import Dict, List
+
+import torch
+
+_GUARD_ROWS = 1
+_GUARD_VALUE = -12345.0
+
+
+@dataclasses.dataclass(frozen=True)
+class DecodeWorkspaceViews:
+    output_split: torch.Tensor  # [batch, q_heads, kv_split, v_head_dim + 1]
+    output_combine: torch.Tensor  # [batch, q_heads, v_head_dim + 1]
+    final_output: torch.Tensor  # [batch, q_heads, v_head_dim]
+    q_lens: List[int]
+
+
+class DecodeWorkspace:
+
+    def __init__(self, max_batch: int, num_q_heads: int, kv_split: int, v_head_dim: int, dtype: torch.dtype,
+                 device="cuda", debug: bool = False):
+        if max_batch <= 0 or num_q_heads <= 0 or kv_split <= 0 or v_head_dim <= 0:
+            raise ValueError(f"invalid decode workspace: max_batch {max_batch}, num_q_heads {num_q_heads}, "
+                             f"kv_split {kv_split}, v_head_dim {v_head_dim}")
+        self.max_batch = max_batch
+        self.num_q_heads = num_q_heads
+        self.kv_split = kv_split
+        self.v_head_dim = v_head_dim
+        self.dtype = dtype
+        self.device = torch.device(device)
+        self.debug = debug
+
+        rows = max_batch + (_GUARD_ROWS if debug else 0)
+        self.output_split = torch.empty([rows, num_q_heads, kv_split, v_head_dim + 1], dtype=dtype, device=device)
+        self.output_combine = torch.empty([rows, num_q_heads, v_head_dim + 1], dtype=dtype, device=device)
+        self.final_output = torch.empty([rows, num_q_heads, v_head_dim], dtype=dtype, device=device)
+        self._last_batch = max_batch
+        self._views: Dict[int, DecodeWorkspaceViews] = {}
+
+    def buffers(self):
+        return [self.output_split, self.output_combine, self.final_output]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buf.nbytes for buf in self.buffers())
+
+    def matches(self, dtype: torch.dtype, device) -> bool:
+        return self.dtype == dtype and self.device == torch.device(device)
+
+    def views(self, batch: int) -> DecodeWorkspaceViews:
+        if not 0 < batch <= self.max_batch:
+            raise ValueError(f"batch {batch} is out of the decode workspace of max_batch {self.max_batch}")
+        views = self._views.get(batch)
+        if views is None:
+            views = DecodeWorkspaceViews(self.output_split[:batch], self.output_combine[:batch],
+                                         self.final_output[:batch], [1] * batch)
+            self._views[batch] = views
+        if self.debug:
+            for buf in self.buffers():
+                buf[:batch].fill_(float("nan"))
+                buf[batch:].fill_(_GUARD_VALUE)
+            self._last_batch = batch
+        return views
+
+    def check_guards(self):
+        """ debug mode only: raises if the last call wrote past its batch """
+        assert self.debug, "guard rows are only allocated in debug mode"
+        for name, buf in zip(["output_split", "output_combine", "final_output"], self.buffers()):
+            guard = torch.tensor(_GUARD_VALUE, dtype=buf.dtype, device=buf.device)
+            if not bool((buf[self._last_batch:] == guard).all()):
+                raise RuntimeError(f"decode workspace {name} was written past batch {self._last_batch}")
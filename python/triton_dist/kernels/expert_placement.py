@@ -0,0 +1,289 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" expert replication and placement for EP all-to-all (EPAll2AllLayer, fast_all_to_all).
+
+the EP kernels route a token to physical expert p on rank p // experts_per_rank. by default physical and logical
+experts are the same, so a hot expert makes its rank receive (and compute) far more tokens than the others.
+plan_expert_placement takes routing histograms ([src_rank, logical_expert] token counts, as gathered by bincount in
+ep_a2a.py), gives hot experts redundant replicas and spreads the replicas over ranks to minimize the max tokens per
+rank. a source rank sends the tokens of an expert round robin over its replicas. an expert with as many replicas on
+every node keeps its tokens within the node: each rank only uses the replicas of its own node. the planner spreads
+replicas evenly over nodes for this. ExpertPlacement.expert_map(rank) gives the logical -> physical map the dispatch
+takes.
+"""
+import dataclasses
+import heapq
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+
+@dataclasses.dataclass(frozen=True)
+class ExpertMap:
+    """ logical -> physical experts of one source rank """
+    table: torch.Tensor  # [num_logical_experts, max_replicas] int32 physical experts, rows padded with their first one
+    counts: torch.Tensor  # [num_logical_experts] int32 replicas this rank sends to
+    # copies on the devices __call__ has seen, so a CPU map is moved to the device of exp_indices only once
+    _copies: dict = dataclasses.field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def to(self, device) -> "ExpertMap":
+        return ExpertMap(self.table.to(device), self.counts.to(device))
+
+    def _on(self, device: torch.device) -> Tuple[torch.Tensor, torch.Tensor]:
+        if self.table.device == device:
+            return self.table, self.counts
+        if device not in self._copies:
+            self._copies[device] = (self.table.to(device), self.counts.to(device))
+        return self._copies[device]
+
+    def __call__(self, exp_indices: torch.Tensor) -> torch.Tensor:
+        """ physical experts of exp_indices ([ntokens, topk] logical experts), replicas taken round robin """
+        table, counts = self._on(exp_indices.device)
+        flat = exp_indices.reshape(-1).long()
+        # k-th token of an expert goes to its replica k % counts
+        sorted_experts, order = torch.sort(flat, stable=True)
+        group_start = torch.searchsorted(sorted_experts, sorted_experts)
+        occurrence = torch.empty_like(flat)
+        occurrence[order] = torch.arange(flat.numel(), device=flat.device) - group_start
+        replica = occurrence % counts[flat]
+        return table[flat, replica].to(exp_indices.dtype).view(exp_indices.shape)
+
+
+@dataclasses.dataclass(frozen=True)
+class ExpertPlacement:
+    num_logical_experts: int
+    world_size: int
+    local_world_size: int
+    # physical expert p (held by rank p // experts_per_rank) computes logical expert physical_to_logical[p]
+    physical_to_logical: Tuple[int, ...]
+
+    @staticmethod
+    def contiguous(num_logical_experts: int, world_size: int, local_world_size: int) -> "ExpertPlacement":
+        """ the default layout: experts_per_rank = num_logical_experts // world_size experts per rank, no replica """
+        assert num_logical_experts % world_size == 0
+        return ExpertPlacement(num_logical_experts, world_size, local_world_size, tuple(range(num_logical_experts)))
+
+    @property
+    def experts_per_rank(self) -> int:
+        """ physical experts per rank, replicas included: the experts_per_rank of the EP kernels """
+        return len(self.physical_to_logical) // self.world_size
+
+    @property
+    def num_physical_experts(self) -> int:
+        return len(self.physical_to_logical)
+
+    def replicas(self, expert: int) -> List[int]:
+        return [p for p, e in enumerate(self.physical_to_logical) if e == expert]
+
+    def _node_replicas(self) -> np.ndarray:
+        """ [nnodes, num_logical_experts] replicas of each expert on each node """
+        nnodes = self.world_size // self.local_world_size
+        return _node_replicas(np.asarray(self.physical_to_logical), nnodes, self.num_logical_experts)
+
+    def expert_map(self, rank: int, device="cpu") -> ExpertMap:
+        node_replicas = self._node_replicas()
+        node = rank // self.local_world_size
+        per_node = self.local_world_size * self.experts_per_rank
+        targets = []
+        for e in range(self.num_logical_experts):
+            replicas = self.replicas(e)
+            if _node_local(node_replicas)[e]:
+                replicas = [p for p in replicas if p // per_node == node]
+            targets.append(replicas)
+        max_replicas = max(len(t) for t in targets)
+        table = [t + [t[0]] * (max_replicas - len(t)) for t in targets]
+        return ExpertMap(torch.tensor(table, dtype=torch.int32, device=device),
+                         torch.tensor([len(t) for t in targets], dtype=torch.int32, device=device))
+
+    def physical_tokens(self, histogram) -> np.ndarray:
+        """ [num_physical_experts] tokens each physical expert receives, from [src_rank, logical] counts """
+        histogram = _as_histogram(histogram, self.world_size, self.num_logical_experts)
+        return _physical_tokens(np.asarray(self.physical_to_logical), histogram, self.local_world_size)
+
+    def rank_tokens(self, histogram) -> np.ndarray:
+        """ [world_size] tokens each rank receives (its output_buf rows and GEMM M) """
+        return self.physical_tokens(histogram).reshape(self.world_size, -1).sum(axis=1)
+
+    def internode_tokens(self, histogram) -> float:
+        """ tokens sent to a rank of another node """
+        histogram = _as_histogram(histogram, self.world_size, self.num_logical_experts)
+        nnodes = self.world_size // self.local_world_size
+        per_node = histogram.reshape(nnodes, self.local_world_size, -1).sum(axis=1)
+        node_replicas = self._node_replicas()
+        remote = 1 - node_replicas / node_replicas.sum(axis=0)
+        remote[:, _node_local(node_replicas)] = 0
+        return float((per_node * remote).sum())
+
+    def imbalance(self, histogram) -> float:
+        """ max / mean tokens per rank, 1.0 is perfectly balanced """
+        tokens = self.rank_tokens(histogram)
+        return float(tokens.max() / tokens.mean()) if tokens.sum() > 0 else 1.0
+
+    def to_logical_histogram(self, physical_histogram) -> np.ndarray:
+        """ fold [..., num_physical_experts] counts (e.g. the bincount of dispatched experts) back to logical ones """
+        physical_histogram = np.asarray(physical_histogram)
+        assert physical_histogram.shape[-1] == self.num_physical_experts
+        out = np.zeros(physical_histogram.shape[:-1] + (self.num_logical_experts, ), dtype=physical_histogram.dtype)
+        np.add.at(out, (..., np.asarray(self.physical_to_logical)), physical_histogram)
+        return out
+
+
+def _node_replicas(physical_to_logical: np.ndarray, nnodes: int, num_logical_experts: int) -> np.ndarray:
+    out = np.zeros((nnodes, num_logical_experts), dtype=np.int64)
+    per_node = len(physical_to_logical) // nnodes
+    np.add.at(out, (np.arange(len(physical_to_logical)) // per_node, physical_to_logical), 1)
+    return out
+
+
+def _node_local(node_replicas: np.ndarray) -> np.ndarray:
+    """ [num_logical_experts] whether each node sends an expert's tokens to its own replicas only """
+    return node_replicas.min(axis=0) == node_replicas.max(axis=0)
+
+
+def _physical_tokens(physical_to_logical: np.ndarray, histogram: np.ndarray, local_world_size: int) -> np.ndarray:
+    world_size, num_logical_experts = histogram.shape
+    nnodes = world_size // local_world_size
+    per_node = histogram.reshape(nnodes, local_world_size, -1).sum(axis=1)
+    node_replicas = _node_replicas(physical_to_logical, nnodes, num_logical_experts)
+    node = np.arange(len(physical_to_logical)) // (len(physical_to_logical) // nnodes)
+    local = per_node[node, physical_to_logical] / np.maximum(node_replicas[node, physical_to_logical], 1)
+    spread = per_node.sum(axis=0)[physical_to_logical] / node_replicas.sum(axis=0)[physical_to_logical]
+    return np.where(_node_local(node_replicas)[physical_to_logical], local, spread)
+
+
+def _as_histogram(histogram, world_size: int, num_logical_experts: Optional[int] = None) -> np.ndarray:
+    """ [src_rank, logical] float counts. a 1D histogram is taken as evenly sent by all ranks """
+    if isinstance(histogram, torch.Tensor):
+        histogram = histogram.detach().cpu().numpy()
+    histogram = np.asarray(histogram, dtype=np.float64)
+    if histogram.ndim == 1:
+        histogram = np.broadcast_to(histogram / world_size, (world_size, histogram.shape[0]))
+    assert histogram.ndim == 2 and histogram.shape[0] == world_size, \
+        f"expect a histogram of shape [world_size={world_size}, num_experts], got {histogram.shape}"
+    assert num_logical_experts is None or histogram.shape[1] == num_logical_experts
+    assert (histogram >= 0).all(), "negative token counts"
+    return histogram
+
+
+def _replica_counts(load: Sequence[float], num_physical_experts: int, max_replicas: int) -> List[int]:
+    """ hand the redundant slots one by one to the expert with the most tokens per replica """
+    counts = [1] * len(load)
+    heap = [(-l, e) for e, l in enumerate(load)]
+    heapq.heapify(heap)
+    for _ in range(num_physical_experts - len(load)):
+        while True:
+            _, e = heapq.heappop(heap)
+            if counts[e] < max_replicas:
+                break
+        counts[e] += 1
+        heapq.heappush(heap, (-load[e] / counts[e], e))
+    return counts
+
+
+def plan_expert_placement(histogram, world_size: int, local_world_size: int, num_redundant_experts: int = 0,
+                          max_refine_steps: Optional[int] = None) -> ExpertPlacement:
+    """ replicate and place logical experts to minimize the max tokens per rank.
+
+    histogram: [world_size, num_logical_experts] tokens routed by each source rank to each expert (or their sum over
+    ranks). num_logical_experts + num_redundant_experts must be a multiple of world_size.
+
+    replicas go to the experts with the most tokens per replica, then, heaviest first, each replica to the least loaded
+    rank with a free slot, preferring nodes without a replica of the expert yet so that more nodes keep its tokens
+    local. swaps of experts between the most loaded rank and the least loaded ones then refine the plan under the
+    exact routing.
+    """
+    histogram = _as_histogram(histogram, world_size)
+    num_logical_experts = histogram.shape[1]
+    num_physical_experts = num_logical_experts + num_redundant_experts
+    assert world_size % local_world_size == 0, f"world_size {world_size} % local_world_size {local_world_size} != 0"
+    assert num_redundant_experts >= 0
+    if num_physical_experts % world_size != 0:
+        raise ValueError(f"{num_logical_experts} experts + {num_redundant_experts} redundant can not be split evenly "
+                         f"over {world_size} ranks")
+    if num_physical_experts > num_logical_experts * world_size:
+        raise ValueError(f"{num_redundant_experts} redundant experts need more than one replica of an expert per rank: "
+                         f"at most {num_logical_experts * (world_size - 1)} for {num_logical_experts} experts over "
+                         f"{world_size} ranks")
+    experts_per_rank = num_physical_experts // world_size
+    load = histogram.sum(axis=0)
+    counts = _replica_counts(load.tolist(), num_physical_experts, max_replicas=world_size)
+
+    # heaviest replicas first, each on the least loaded rank with a free slot and no replica of the same expert
+    replicas = sorted(((load[e] / counts[e], e) for e in range(num_logical_experts) for _ in range(counts[e])),
+                      key=lambda x: (-x[0], x[1]))
+    rank_load = [0.0] * world_size
+    rank_experts = [[] for _ in range(world_size)]
+    node_replicas = np.zeros((world_size // local_world_size, num_logical_experts), dtype=np.int64)
+    for w, e in replicas:
+        free = [r for r in range(world_size) if len(rank_experts[r]) < experts_per_rank]
+        # two replicas on one rank only if every free slot is on a rank holding the expert already
+        candidates = [r for r in free if e not in rank_experts[r]] or free
+        r = min(candidates, key=lambda r: (node_replicas[r // local_world_size, e], rank_load[r], r))
+        rank_experts[r].append(e)
+        rank_load[r] += w
+        node_replicas[r // local_world_size, e] += 1
+
+    physical_to_logical = np.array([e for experts in rank_experts for e in experts])
+    steps = max_refine_steps if max_refine_steps is not None else 2 * world_size
+    for _ in range(steps):
+        # the few least loaded ranks first, all of them once that does not help any more
+        if not _swap_from_max(physical_to_logical, histogram, local_world_size, num_partners=4) and \
+                not _swap_from_max(physical_to_logical, histogram, local_world_size, num_partners=world_size):
+            break
+    return ExpertPlacement(num_logical_experts, world_size, local_world_size, tuple(physical_to_logical.tolist()))
+
+
+def _swap_from_max(physical_to_logical: np.ndarray, histogram: np.ndarray, local_world_size: int,
+                   num_partners: int) -> bool:
+    """ apply the swap of two experts between the most loaded rank and one of the num_partners least loaded ranks
+    that lowers the max tokens most """
+    world_size = histogram.shape[0]
+    experts_per_rank = len(physical_to_logical) // world_size
+    rank_tokens = lambda: _physical_tokens(physical_to_logical, histogram, local_world_size).reshape(
+        world_size, -1).sum(axis=1)
+    tokens = rank_tokens()
+    hi = int(tokens.argmax())
+    slots = lambda r: range(r * experts_per_rank, (r + 1) * experts_per_rank)
+    best, best_max = None, tokens.max() - 1e-9
+    for lo in np.argsort(tokens, kind="stable")[:num_partners].tolist():
+        if lo == hi:
+            continue
+        hi_experts, lo_experts = physical_to_logical[slots(hi)].tolist(), physical_to_logical[slots(lo)].tolist()
+        for i in slots(hi):
+            for j in slots(lo):
+                a, b = physical_to_logical[i], physical_to_logical[j]
+                if a in lo_experts or b in hi_experts:
+                    continue
+                physical_to_logical[i], physical_to_logical[j] = b, a
+                candidate_max = rank_tokens().max()
+                physical_to_logical[i], physical_to_logical[j] = a, b
+                if candidate_max < best_max:
+                    best, best_max = (i, j), candidate_max
+    if best is None:
+        return False
+    i, j = best
+    physical_to_logical[i], physical_to_logical[j] = physical_to_logical[j], physical_to_logical[i]
+    return True
@@ -0,0 +1,103 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" CUDA graph safety of triton_dist ops, and the batch size buckets graphs are captured for.
+
+graphs are captured for a ladder of batch sizes (graph_batch_buckets). a live batch runs the graph of the smallest
+bucket that fits (select_graph_bucket), with its inputs padded into the static inputs of that graph (copy_padded)
+and its outputs sliced back to the live batch.
+
+a captured graph replays the kernel arguments of capture time. an op breaks replay if it:
+    - signals peers with a host side counter (the same value every replay, so waits pass at once or hang)
+    - picks a kernel config by benchmarking (autotune) while capturing
+    - launches a different number of kernels for the same shape, or asserts it is not capturing
+
+contexts with such ops implement graph_hazards() -> List[GraphHazard], empty once their graph-safe mode is on
+(e.g. AllGatherGEMMTensorParallelContext.enable_graph_safe). collect_graph_hazards checks them all before capture.
+"""
+import dataclasses
+from typing import Iterable, List
+
+import torch
+
+
+@dataclasses.dataclass(frozen=True)
+class GraphHazard:
+    op: str
+    reason: str
+
+    def __str__(self):
+        return f"{self.op}: {self.reason}"
+
+
+def collect_graph_hazards(components: Iterable, **kwargs) -> List[GraphHazard]:
+    """ graph_hazards(**kwargs) of each component in order, without duplicates. components such as shared contexts
+    may come more than once, and components without graph_hazards are graph safe.
+    """
+    hazards: List[GraphHazard] = []
+    for component in components:
+        graph_hazards = getattr(component, "graph_hazards", None)
+        if graph_hazards is None:
+            continue
+        for hazard in graph_hazards(**kwargs):
+            if hazard not in hazards:
+                hazards.append(hazard)
+    return hazards
+
+
+def format_graph_hazards(hazards: Iterable[GraphHazard]) -> str:
+    return "\n".join(f"  - {hazard}" for hazard in hazards)
+
+
+def graph_batch_buckets(max_bsz: int, multiple_of: int = 1) -> List[int]:
+    """ multiple_of * 1, 2, 4, ... below max_bsz, then max_bsz itself.
+
+    multiple_of: the smallest batch a graph can take, e.g. world_size for triton_dist, which splits the batch over ranks
+    """
+    if multiple_of <= 0 or max_bsz < multiple_of or max_bsz % multiple_of != 0:
+        raise ValueError(f"max_bsz {max_bsz} should be a positive multiple of {multiple_of}")
+    buckets = []
+    bsz = multiple_of
+    while bsz < max_bsz:
+        buckets.append(bsz)
+        bsz *= 2
+    buckets.append(max_bsz)
+    return buckets
+
+
+def select_graph_bucket(bsz: int, buckets: List[int]) -> int:
+    """ the smallest bucket >= bsz. buckets are sorted ascending """
+    for bucket in buckets:
+        if bucket >= bsz:
+            return bucket
+    raise ValueError(f"batch size {bsz} exceeds the largest captured bucket {buckets[-1] if buckets else None}")
+
+
+def copy_padded(dst: torch.Tensor, src: torch.Tensor, pad_value=0) -> torch.Tensor:
+    """ src into the first rows of dst, and pad_value into the rest """
+    assert src.shape[0] <= dst.shape[0] and src.shape[1:] == dst.shape[1:], \
+        f"can not pad {tuple(src.shape)} into {tuple(dst.shape)}"
+    dst[:src.shape[0]].copy_(src)
+    dst[src.shape[0]:].fill_(pad_value)
+    return dst
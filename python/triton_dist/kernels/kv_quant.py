@@ -0,0 +1,161 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" int8 / fp8 (e4m3) paged KV cache for split-KV decode attention (flash_decode.gqa_fwd_batch_decode and its
+variants, with k_scale / v_scale).
+
+caches are [num_pages, page_size, kv_heads, head_dim] of the quantized dtype, and scales are fp32 [num_pages, kv_heads]:
+x ~= q * scale. a scale of shape [1, kv_heads] expanded to num_pages (stride 0) is a static per-head scale. the kernels
+scale qk by the k scale and p by the v scale of each token, so they read half the bytes of an fp16 / bf16 cache.
+
+with per-page scales, append_quantized_kv keeps each page's scale at the running amax of the tokens in it: a token
+larger than the page scale raises it and requantizes the page. each requantization rounds the older tokens of the
+page once more, so pages are best kept small.
+
+the numpy quantizers are the references of the error bounds:
+    int8: |x - dequant(quant(x))| <= scale / 2, scale = amax / 127
+    fp8 e4m3: relative error <= 2 ** -4, or absolute error <= scale * 2 ** -10 below the smallest normal
+"""
+from typing import Tuple
+
+import numpy as np
+import torch
+
+INT8_MAX = 127.0
+FP8_E4M3_MAX = 448.0
+_FP8_E4M3_MANTISSA_BITS = 3
+_FP8_E4M3_MIN_NORMAL_EXP = -6
+
+QUANT_KV_DTYPES = {
+    "int8": torch.int8,
+    "fp8": torch.float8_e4m3fn,
+}
+
+
+def is_quantized_kv_dtype(dtype: torch.dtype) -> bool:
+    return dtype in QUANT_KV_DTYPES.values()
+
+
+def _qmax(dtype: torch.dtype) -> float:
+    if dtype == torch.int8:
+        return INT8_MAX
+    if dtype == torch.float8_e4m3fn:
+        return FP8_E4M3_MAX
+    raise ValueError(f"unsupported quantized KV dtype {dtype}, choose from {list(QUANT_KV_DTYPES.values())}")
+
+
+def round_to_fp8_e4m3_np(x: np.ndarray) -> np.ndarray:
+    """ x rounded to the nearest e4m3 value (ties to even), saturated at +-448 """
+    x = np.clip(np.asarray(x, dtype=np.float64), -FP8_E4M3_MAX, FP8_E4M3_MAX)
+    mag = np.abs(x)
+    exp = np.floor(np.log2(np.where(mag > 0, mag, 1.0)))
+    exp = np.maximum(exp, _FP8_E4M3_MIN_NORMAL_EXP)
+    step = 2.0**(exp - _FP8_E4M3_MANTISSA_BITS)
+    return np.sign(x) * np.round(mag / step) * step
+
+
+def quantize_np(x: np.ndarray, dtype: str, axis=-1) -> Tuple[np.ndarray, np.ndarray]:
+    """ symmetric quantization with one scale per slice over axis (e.g. the head dim, or page and head dim).
+    returns (q, scale), x ~= q * scale, with q in float64 on the int8 / e4m3 grid.
+    """
+    qmax = INT8_MAX if dtype == "int8" else FP8_E4M3_MAX
+    amax = np.max(np.abs(x), axis=axis, keepdims=True)
+    scale = np.where(amax > 0, amax / qmax, 1.0)
+    if dtype == "int8":
+        q = np.clip(np.round(x / scale), -INT8_MAX, INT8_MAX)
+    elif dtype == "fp8":
+        q = round_to_fp8_e4m3_np(x / scale)
+    else:
+        raise ValueError(f"unsupported quantized KV dtype {dtype}, choose from {list(QUANT_KV_DTYPES)}")
+    return q, scale
+
+
+def dequantize_np(q: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    return q * scale
+
+
+def quantize(x: torch.Tensor, scale: torch.Tensor, dtype: torch.dtype) -> torch.Tensor:
+    """ x / scale on the grid of dtype. scale broadcasts against x """
+    qmax = _qmax(dtype)
+    x = (x.float() / scale).clamp(-qmax, qmax)
+    if dtype == torch.int8:
+        x = x.round()
+    return x.to(dtype)
+
+
+def dequantize(q: torch.Tensor, scale: torch.Tensor, dtype: torch.dtype = torch.float32) -> torch.Tensor:
+    return (q.float() * scale).to(dtype)
+
+
+def create_kv_scales(num_pages: int, kv_heads: int, device="cuda", per_page: bool = True,
+                     static_scale: torch.Tensor = None) -> torch.Tensor:
+    """ fp32 [num_pages, kv_heads] scales of a quantized cache: per page, kept by append_quantized_kv, or static
+    per head ([kv_heads] static_scale, e.g. calibrated) broadcast to all pages with stride 0.
+    """
+    if per_page:
+        assert static_scale is None, "per page scales are not static"
+        return torch.zeros((num_pages, kv_heads), dtype=torch.float32, device=device)
+    assert static_scale is not None and static_scale.shape == (kv_heads, )
+    return static_scale.to(device=device, dtype=torch.float32).view(1, kv_heads).expand(num_pages, kv_heads)
+
+
+def _append(cache: torch.Tensor, scales: torch.Tensor, x: torch.Tensor, pages: torch.Tensor, slots: torch.Tensor):
+    dtype = cache.dtype
+    qmax = _qmax(dtype)
+    if scales.stride(0) == 0:
+        # static per head scales
+        cache[pages, slots] = quantize(x, scales[0][:, None], dtype)
+        return
+    needed = (x.float().abs().amax(-1) / qmax).clamp_min(torch.finfo(torch.float32).tiny)  # [batch, kv_heads]
+    old = scales[pages]
+    # the first token of a page sets its scale
+    new = torch.where((slots == 0)[:, None], needed, torch.maximum(old, needed))
+    ratio = torch.where(new > 0, old / new, torch.ones_like(new))
+    page_vals = cache[pages].float() * ratio[:, None, :, None]
+    if dtype == torch.int8:
+        page_vals = page_vals.round()
+    cache[pages] = page_vals.to(dtype)
+    cache[pages, slots] = quantize(x, new[:, :, None], dtype)
+    scales[pages] = new
+
+
+def append_quantized_kv(k_cache: torch.Tensor, v_cache: torch.Tensor, k_scale: torch.Tensor, v_scale: torch.Tensor,
+                        k: torch.Tensor, v: torch.Tensor, block_table: torch.Tensor, kv_lens: torch.Tensor):
+    """ quantizes the new token of each sequence into its page, at position kv_lens (not advanced here).
+    k / v: [batch, kv_heads, head_dim] of the new tokens. the pages of different sequences must differ.
+    """
+    page_size = k_cache.shape[1]
+    assert k_cache.dtype == v_cache.dtype and is_quantized_kv_dtype(k_cache.dtype)
+    assert k.shape[0] == v.shape[0] == kv_lens.shape[0] == block_table.shape[0]
+    positions = kv_lens.long()
+    batch_ids = torch.arange(k.shape[0], device=k.device)
+    pages = block_table[batch_ids, positions // page_size].long()
+    slots = positions % page_size
+    _append(k_cache, k_scale, k, pages, slots)
+    _append(v_cache, v_scale, v, pages, slots)
+
+
+def dequantize_paged_kv(cache: torch.Tensor, scales: torch.Tensor, dtype: torch.dtype = torch.float32) -> torch.Tensor:
+    """ [num_pages, page_size, kv_heads, head_dim] in dtype, e.g. for references """
+    return dequantize(cache, scales[:, None, :, None], dtype)
@@ -0,0 +1,126 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" number of KV splits of the split-KV decode attention (flash_decode.gqa_fwd_batch_decode and its variants).
+
+the split kernel runs batch * head_blocks * num_kv_splits CTAs, each over a 1 / num_kv_splits share of the kv
+length in BLOCK_N tiles, and the combine kernel reduces the num_kv_splits partial results of each (batch, head).
+more splits fill the GPU for small batches and long contexts, but past one full wave they add waves, and past
+kv_len / BLOCK_N they add empty splits. both cost combine work.
+
+KVSplitPlanner estimates both kernels, in BLOCK_N tile loads per CTA, for each candidate split count:
+    split: max(waves * (tiles of a mean length split + overhead), tiles of the longest split + overhead)
+    combine: waves of batch * q_heads CTAs * (num_kv_splits * combine_cost_per_split + overhead)
+and picks the cheapest, fewer splits on ties. plans are cached by shape bucket: kv lengths are rounded up to powers
+of two (at least BLOCK_N), so one plan serves a whole range of decode steps.
+"""
+import dataclasses
+from typing import Dict, Optional, Sequence, Tuple
+
+DEFAULT_KV_SPLITS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _cdiv(a: int, b: int) -> int:
+    return (a + b - 1) // b
+
+
+def _bucket(kv_len: int, block_n: int) -> int:
+    bucket = block_n
+    while bucket < kv_len:
+        bucket *= 2
+    return bucket
+
+
+@dataclasses.dataclass(frozen=True)
+class KVSplitPlan:
+    num_kv_splits: int
+    block_n: int
+    block_h: int
+    # of the split kernel
+    num_ctas: int
+    waves: int
+    cost: float
+
+
+class KVSplitPlanner:
+
+    def __init__(self, num_sms: int, candidates: Sequence[int] = DEFAULT_KV_SPLITS, block_n: int = 64,
+                 block_h: int = 16, ctas_per_sm: int = 2, cta_overhead: float = 1.0,
+                 combine_cost_per_split: float = 0.05):
+        """
+        num_sms: SMs of the device, e.g. torch.cuda.get_device_properties(device).multi_processor_count
+        candidates: split counts to choose from, e.g. those with AOT compiled kernels
+        ctas_per_sm: CTAs of the split kernel resident on one SM
+        cta_overhead: fixed cost of a CTA (q load, output store), in tile loads
+        combine_cost_per_split: cost of reading one partial result in the combine kernel, in tile loads
+        """
+        if num_sms <= 0 or not candidates or min(candidates) <= 0:
+            raise ValueError(f"invalid planner: num_sms {num_sms}, candidates {candidates}")
+        self.num_sms = num_sms
+        self.candidates = sorted(set(candidates))
+        self.block_n = block_n
+        self.block_h = block_h
+        self.ctas_per_sm = ctas_per_sm
+        self.cta_overhead = cta_overhead
+        self.combine_cost_per_split = combine_cost_per_split
+        self._cache: Dict[Tuple, KVSplitPlan] = {}
+
+    def estimate(self, num_kv_splits: int, batch: int, q_heads: int, kv_heads: int, max_kv_len: int,
+                 mean_kv_len: int) -> KVSplitPlan:
+        kv_group_num = q_heads // kv_heads
+        head_blocks = _cdiv(q_heads, min(self.block_h, kv_group_num))
+        slots = self.num_sms * self.ctas_per_sm
+        num_ctas = batch * head_blocks * num_kv_splits
+        waves = _cdiv(num_ctas, slots)
+        mean_tiles = _cdiv(_cdiv(mean_kv_len, num_kv_splits), self.block_n)
+        max_tiles = _cdiv(_cdiv(max_kv_len, num_kv_splits), self.block_n)
+        split_cost = max(waves * (mean_tiles + self.cta_overhead), max_tiles + self.cta_overhead)
+        combine_cost = _cdiv(batch * q_heads, slots) * (num_kv_splits * self.combine_cost_per_split +
+                                                       self.cta_overhead)
+        return KVSplitPlan(num_kv_splits, self.block_n, self.block_h, num_ctas, waves, split_cost + combine_cost)
+
+    def plan(self, batch: int, q_heads: int, kv_heads: int, max_kv_len: int, mean_kv_len: Optional[int] = None,
+             max_splits: Optional[int] = None) -> KVSplitPlan:
+        """ max_splits: e.g. the split dim of a preallocated output_split """
+        if batch <= 0 or kv_heads <= 0 or q_heads % kv_heads != 0 or max_kv_len <= 0:
+            raise ValueError(f"invalid decode shape: batch {batch}, q_heads {q_heads}, kv_heads {kv_heads}, "
+                             f"max_kv_len {max_kv_len}")
+        max_kv_len = _bucket(max_kv_len, self.block_n)
+        mean_kv_len = max_kv_len if mean_kv_len is None else min(_bucket(mean_kv_len, self.block_n), max_kv_len)
+        key = (batch, q_heads, kv_heads, max_kv_len, mean_kv_len, max_splits)
+        plan = self._cache.get(key)
+        if plan is not None:
+            return plan
+
+        candidates = [s for s in self.candidates if max_splits is None or s <= max_splits]
+        if not candidates:
+            raise ValueError(f"no candidate of {self.candidates} is at most max_splits {max_splits}")
+        # no empty splits, except for the fewest splits there are
+        candidates = [candidates[0]] + [s for s in candidates[1:] if s * self.block_n <= max_kv_len]
+        for num_kv_splits in candidates:
+            estimate = self.estimate(num_kv_splits, batch, q_heads, kv_heads, max_kv_len, mean_kv_len)
+            if plan is None or estimate.cost < plan.cost:
+                plan = estimate
+        self._cache[key] = plan
+        return plan
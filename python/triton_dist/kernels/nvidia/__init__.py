@@ -23,7 +23,8 @@
 #
 ################################################################################
 from .allgather import get_auto_all_gather_method, AllGatherMethod, cp_engine_producer_all_gather_intra_node, cp_engine_producer_all_gather_inter_node
-from .allgather_gemm import ag_gemm, create_ag_gemm_context, gemm_persistent, gemm_non_persistent
+from .allgather_gemm import (ag_gemm, create_ag_gemm_context, gemm_persistent, gemm_non_persistent,
+                             interleave_gate_up_weight)
 from .low_latency_allgather import (fast_allgather, create_fast_allgather_context, _forward_pull_kernel,
                                     _forward_push_2d_kernel, _forward_push_3d_kernel, _forward_push_2d_ll_kernel,
                                     _forward_push_2d_ll_multimem_kernel, _forward_push_numa_2d_ll_kernel,
@@ -32,11 +33,15 @@ from .allgather_group_gemm import (create_ag_group_gemm_context, ag_group_gemm)
 from .flash_decode import (gqa_fwd_batch_decode_persistent, kernel_gqa_fwd_batch_decode_split_kv_persistent,
                            gqa_fwd_batch_decode_persistent_aot, gqa_fwd_batch_decode, gqa_fwd_batch_decode_aot,
                            gqa_fwd_batch_decode_intra_rank_aot, get_triton_combine_kv_algo_info,
-                           gqa_fwd_batch_decode_intra_rank, kernel_inter_rank_gqa_fwd_batch_decode_combine_kv)
+                           gqa_fwd_batch_decode_intra_rank, kernel_inter_rank_gqa_fwd_batch_decode_combine_kv,
+                           get_kv_split_planner, AOT_KV_SPLITS, AOT_QUANT_KV_DTYPES)
 from .gemm_reduce_scatter import create_gemm_rs_context, gemm_rs
-from .low_latency_all_to_all import create_all_to_all_context, fast_all_to_all, all_to_all_post_process
+from .low_latency_all_to_all import (create_all_to_all_context, fast_all_to_all, all_to_all_post_process,
+                                     create_packed_all_to_all_context, fast_all_to_all_packed,
+                                     all_to_all_packed_post_process)
 from .moe_reduce_rs import create_moe_rs_context, select_experts, moe_reduce_rs_rowise, create_moe_rs_context_colwise
-from .sp_ag_attention_intra_node import fused_sp_ag_attn_intra_node, create_sp_ag_attention_context_intra_node
+from .sp_ag_attention_intra_node import (fused_sp_ag_attn_intra_node, create_sp_ag_attention_context_intra_node,
+                                         fused_sp_ring_attn_intra_node, create_sp_ring_attention_context_intra_node)
 from .sp_ag_attention_inter_node import fused_sp_ag_attn_inter_node, create_sp_ag_attention_context_inter_node
 
 __all__ = [
@@ -51,14 +56,17 @@ __all__ = [
     "ag_gemm",
     "ag_group_gemm",
     "all_to_all_post_process",
+    "all_to_all_packed_post_process",
     "create_ag_gemm_context",
     "create_ag_group_gemm_context",
     "create_all_to_all_context",
+    "create_packed_all_to_all_context",
     "create_fast_allgather_context",
     "create_gemm_rs_context",
     "create_moe_rs_context",
     "create_moe_rs_context_colwise",
     "fast_all_to_all",
+    "fast_all_to_all_packed",
     "fast_allgather",
     "get_auto_all_gather_method",
     "AllGatherMethod",
@@ -67,7 +75,11 @@ __all__ = [
     "gemm_rs",
     "gemm_persistent",
     "gemm_non_persistent",
+    "interleave_gate_up_weight",
     "get_triton_combine_kv_algo_info",
+    "get_kv_split_planner",
+    "AOT_KV_SPLITS",
+    "AOT_QUANT_KV_DTYPES",
     "gqa_fwd_batch_decode_aot",
     "gqa_fwd_batch_decode_intra_rank_aot",
     "gqa_fwd_batch_decode_intra_rank",
@@ -80,6 +92,8 @@ __all__ = [
     "select_experts",
     "fused_sp_ag_attn_intra_node",
     "create_sp_ag_attention_context_intra_node",
+    "fused_sp_ring_attn_intra_node",
+    "create_sp_ring_attention_context_intra_node",
     "fused_sp_ag_attn_inter_node",
     "create_sp_ag_attention_context_inter_node",
 ]
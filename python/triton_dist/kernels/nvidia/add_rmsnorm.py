@@ -0,0 +1,96 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+from typing import Optional
+
+import torch
+import triton
+import triton.language as tl
+
+from triton_dist.kernels.add_rmsnorm import add_rmsnorm_torch
+
+
+@triton.jit
+def kernel_add_rmsnorm(
+    x_ptr,
+    residual_ptr,
+    w_ptr,
+    out_ptr,
+    residual_out_ptr,
+    stride_x,
+    stride_residual,
+    N,
+    eps,
+    HAS_RESIDUAL: tl.constexpr,
+    BLOCK_N: tl.constexpr,
+):
+    row = tl.program_id(0).to(tl.int64)
+    offs = tl.arange(0, BLOCK_N)
+    mask = offs < N
+    dtype = out_ptr.dtype.element_ty
+
+    x = tl.load(x_ptr + row * stride_x + offs, mask=mask, other=0.0).to(tl.float32)
+    if HAS_RESIDUAL:
+        r = tl.load(residual_ptr + row * stride_residual + offs, mask=mask, other=0.0).to(tl.float32)
+        # round to the activation dtype first: that is the next residual, as with `residual + hidden_states`
+        x = (x + r).to(dtype)
+        tl.store(residual_out_ptr + row * N + offs, x, mask=mask)
+        x = x.to(tl.float32)
+
+    rstd = tl.rsqrt(tl.sum(x * x, axis=0) / N + eps)
+    w = tl.load(w_ptr + offs, mask=mask, other=0.0).to(tl.float32)
+    tl.store(out_ptr + row * N + offs, (x * rstd * w).to(dtype), mask=mask)
+
+
+def add_rmsnorm(x: torch.Tensor, residual: Optional[torch.Tensor], w: torch.Tensor, eps: float):
+    """ fused `residual = x + residual; out = rmsnorm(residual) * w`, one read of x/residual and one write of each
+    output. x and residual may be row-strided views, e.g. a slice of the gemm_rs output, as long as rows are contiguous.
+    falls back to add_rmsnorm_torch on CPU.
+
+    Returns:
+        (out, residual): residual is x itself if residual is None.
+    """
+    if not x.is_cuda:
+        return add_rmsnorm_torch(x, residual, w, eps)
+    N = x.shape[-1]
+    assert w.shape == (N, ), f"norm weight of shape {tuple(w.shape)} does not match hidden size {N}"
+    x_2d = x.reshape(-1, N)
+    assert x_2d.stride(-1) == 1, "rows of x should be contiguous"
+    out = torch.empty(x.shape, dtype=x.dtype, device=x.device)
+    if residual is None:
+        residual_2d, residual_out = x_2d, x
+    else:
+        assert residual.shape == x.shape, f"residual {tuple(residual.shape)} does not match x {tuple(x.shape)}"
+        residual_2d = residual.reshape(-1, N)
+        assert residual_2d.stride(-1) == 1, "rows of residual should be contiguous"
+        residual_out = torch.empty(x.shape, dtype=x.dtype, device=x.device)
+
+    M = x_2d.shape[0]
+    if M == 0:
+        return out, residual_out
+    BLOCK_N = triton.next_power_of_2(N)
+    num_warps = min(max(BLOCK_N // 256, 1), 16)
+    kernel_add_rmsnorm[(M, )](x_2d, residual_2d, w, out, residual_out, x_2d.stride(0), residual_2d.stride(0), N, eps,
+                              HAS_RESIDUAL=residual is not None, BLOCK_N=BLOCK_N, num_warps=num_warps)
+    return out, residual_out
@@ -22,6 +22,8 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 ################################################################################
+import logging
+import numpy as np
 import triton
 import triton.language as tl
 from triton.language.extra.cuda.language_extra import (
@@ -162,11 +164,103 @@ def naive_thread_block_swizzle_allgather_gemm_kernel(
     return swizzle_m_rank * pid_ms_per_rank + pid_m_intra_rank
 
 
+def cdiv(n, m):
+    return (n - 1 + m) // m
+
+
+# host reference of threadblock_swizzle_allgather_gemm_kernel, for verification
+def threadblock_swizzle_allgather_gemm(tiled_m, M, rank, WORLD_SIZE, NNODES, BLOCK_SIZE_M):
+    LOCAL_WORLD_SIZE = WORLD_SIZE // NNODES
+    node_id = rank // LOCAL_WORLD_SIZE
+    M_per_rank = M // WORLD_SIZE
+    M_per_node = M // NNODES
+    node_start = node_id
+
+    swizzled_tiled_m_sizes = np.empty(NNODES, dtype=np.int32)
+    for i in range(NNODES):
+        n = (i + node_start) % NNODES
+        M_node_start = M_per_node * n
+        M_node_end = M_per_node * (n + 1)
+        tiled_m_node_start = M_node_start // BLOCK_SIZE_M
+        tiled_m_node_end = (M_node_end - 1) // BLOCK_SIZE_M
+        prev_tiled_m_node_end = (M_node_start - 1) // BLOCK_SIZE_M
+        next_tiled_m_node_start = M_node_end // BLOCK_SIZE_M
+        if tiled_m == 0:
+            logging.debug(
+                f"rank {rank}, node_id {node_start}, n {n} == M_node_start {M_node_start}, M_node_end {M_node_end}")
+            logging.debug(
+                f"rank {rank}, node_id {node_start}, n {n} == tiled_m_node_start {tiled_m_node_start}, tiled_m_node_end {tiled_m_node_end}"
+            )
+            logging.debug(
+                f"rank {rank}, node_id {node_start}, n {n} == prev_tiled_m_node_end {prev_tiled_m_node_end}, next_tiled_m_node_start {next_tiled_m_node_start}"
+            )
+
+        if i == 0 and M_node_start != 0:
+            if prev_tiled_m_node_end == tiled_m_node_start:
+                tiled_m_node_start += 1
+
+        if i == 0 and M_node_end != M:
+            if next_tiled_m_node_start == tiled_m_node_end:
+                tiled_m_node_end -= 1
+
+        if i != NNODES - 1 and M_node_end != M:
+            if next_tiled_m_node_start == tiled_m_node_end:
+                tiled_m_node_end -= 1
+
+        if tiled_m == 0:
+            logging.debug(
+                f"rank {rank}, node_id {node_start}, n {n} => tiled_m_node_start {tiled_m_node_start}, tiled_m_node_end {tiled_m_node_end}"
+            )
+
+        swizzled_tiled_m_sizes[i] = tiled_m_node_end - tiled_m_node_start + 1
+
+    swizzled_tiled_m_sizes_accum = np.cumsum(swizzled_tiled_m_sizes)
+    swizzled_tiled_m_sizes_accum = np.insert(swizzled_tiled_m_sizes_accum, 0, 0)
+
+    tiled_m_sizes = np.concatenate((swizzled_tiled_m_sizes[-node_start:], swizzled_tiled_m_sizes[:-node_start]))
+    tiled_m_sizes_accum = np.cumsum(tiled_m_sizes)
+    tiled_m_sizes_accum = np.insert(tiled_m_sizes_accum, 0, 0)
+
+    if tiled_m == 0:
+        logging.debug(
+            f"swizzled_tiled_m_sizes {swizzled_tiled_m_sizes}, tiled_m_sizes {tiled_m_sizes}, tiled_m_sizes_accum: {tiled_m_sizes_accum}"
+        )
+
+    # upper bound
+    for n in range(NNODES + 1):
+        if tiled_m < swizzled_tiled_m_sizes_accum[n]:
+            break
+
+    n = n - 1
+
+    # map node
+    nid = (n + node_start) % NNODES
+    node_offset = swizzled_tiled_m_sizes_accum[n]
+
+    tiled_m_intra_node = tiled_m - node_offset
+    local_rank = rank % LOCAL_WORLD_SIZE
+    m_start = M_per_node * nid + M_per_rank * local_rank
+    tiled_m_start = cdiv(m_start, BLOCK_SIZE_M)
+    swizzled_node_offset = tiled_m_sizes_accum[nid]
+    rank_offset = max(0, tiled_m_start - swizzled_node_offset)  # this may < 0, bad
+    logging.debug(
+        f"tiled_m: {tiled_m} @ node {n}: tiled_m_start = {tiled_m_start}, swizzled_node_offset = {swizzled_node_offset}, rank_offset = {rank_offset}"
+    )
+
+    # map rank
+    tiled_m_intra_node_new = (tiled_m_intra_node + rank_offset) % swizzled_tiled_m_sizes[n]
+
+    logging.debug(
+        f"tiled_m: {tiled_m} @ node {n}: nid = {nid}, node_offset = {node_offset}, rank_offset = {rank_offset}, m_start={m_start}, tiled_m_sizes_accum[{n}], tiled_m_intra_node = {tiled_m_intra_node}, swizzled_offset = {swizzled_node_offset} + {tiled_m_intra_node_new}"
+    )
+
+    return swizzled_node_offset + tiled_m_intra_node_new
+
+
 if __name__ == "__main__":
     from functools import partial
-    import logging
-    import numpy as np
     import torch
+    from triton_dist.kernels.swizzle_lut import ag_gemm_swizzle_lut
     from triton_dist.utils import perf_func
 
     import argparse
@@ -183,97 +277,6 @@ if __name__ == "__main__":
     else:
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-    def cdiv(n, m):
-        return (n - 1 + m) // m
-
-    # Just for verification
-    def threadblock_swizzle_allgather_gemm_torch(tiled_m, M, rank, WORLD_SIZE, NNODES, BLOCK_SIZE_M):
-        LOCAL_WORLD_SIZE = WORLD_SIZE // NNODES
-        node_id = rank // LOCAL_WORLD_SIZE
-        M_per_rank = M // WORLD_SIZE
-        M_per_node = M // NNODES
-        node_start = node_id
-
-        swizzled_tiled_m_sizes = np.empty(NNODES, dtype=np.int32)
-        for i in range(NNODES):
-            n = (i + node_start) % NNODES
-            M_node_start = M_per_node * n
-            M_node_end = M_per_node * (n + 1)
-            tiled_m_node_start = M_node_start // BLOCK_SIZE_M
-            tiled_m_node_end = (M_node_end - 1) // BLOCK_SIZE_M
-            prev_tiled_m_node_end = (M_node_start - 1) // BLOCK_SIZE_M
-            next_tiled_m_node_start = M_node_end // BLOCK_SIZE_M
-            if tiled_m == 0:
-                logging.debug(
-                    f"rank {rank}, node_id {node_start}, n {n} == M_node_start {M_node_start}, M_node_end {M_node_end}")
-                logging.debug(
-                    f"rank {rank}, node_id {node_start}, n {n} == tiled_m_node_start {tiled_m_node_start}, tiled_m_node_end {tiled_m_node_end}"
-                )
-                logging.debug(
-                    f"rank {rank}, node_id {node_start}, n {n} == prev_tiled_m_node_end {prev_tiled_m_node_end}, next_tiled_m_node_start {next_tiled_m_node_start}"
-                )
-
-            if i == 0 and M_node_start != 0:
-                if prev_tiled_m_node_end == tiled_m_node_start:
-                    tiled_m_node_start += 1
-
-            if i == 0 and M_node_end != M:
-                if next_tiled_m_node_start == tiled_m_node_end:
-                    tiled_m_node_end -= 1
-
-            if i != NNODES - 1 and M_node_end != M:
-                if next_tiled_m_node_start == tiled_m_node_end:
-                    tiled_m_node_end -= 1
-
-            if tiled_m == 0:
-                logging.debug(
-                    f"rank {rank}, node_id {node_start}, n {n} => tiled_m_node_start {tiled_m_node_start}, tiled_m_node_end {tiled_m_node_end}"
-                )
-
-            swizzled_tiled_m_sizes[i] = tiled_m_node_end - tiled_m_node_start + 1
-
-        swizzled_tiled_m_sizes_accum = np.cumsum(swizzled_tiled_m_sizes)
-        swizzled_tiled_m_sizes_accum = np.insert(swizzled_tiled_m_sizes_accum, 0, 0)
-
-        tiled_m_sizes = np.concatenate((swizzled_tiled_m_sizes[-node_start:], swizzled_tiled_m_sizes[:-node_start]))
-        tiled_m_sizes_accum = np.cumsum(tiled_m_sizes)
-        tiled_m_sizes_accum = np.insert(tiled_m_sizes_accum, 0, 0)
-
-        if tiled_m == 0:
-            logging.debug(
-                f"swizzled_tiled_m_sizes {swizzled_tiled_m_sizes}, tiled_m_sizes {tiled_m_sizes}, tiled_m_sizes_accum: {tiled_m_sizes_accum}"
-            )
-
-        # upper bound
-        for n in range(NNODES + 1):
-            if tiled_m < swizzled_tiled_m_sizes_accum[n]:
-                break
-
-        n = n - 1
-
-        # map node
-        nid = (n + node_start) % NNODES
-        node_offset = swizzled_tiled_m_sizes_accum[n]
-
-        tiled_m_intra_node = tiled_m - node_offset
-        local_rank = rank % LOCAL_WORLD_SIZE
-        m_start = M_per_node * nid + M_per_rank * local_rank
-        tiled_m_start = cdiv(m_start, BLOCK_SIZE_M)
-        swizzled_node_offset = tiled_m_sizes_accum[nid]
-        rank_offset = max(0, tiled_m_start - swizzled_node_offset)  # this may < 0, bad
-        logging.debug(
-            f"tiled_m: {tiled_m} @ node {n}: tiled_m_start = {tiled_m_start}, swizzled_node_offset = {swizzled_node_offset}, rank_offset = {rank_offset}"
-        )
-
-        # map rank
-        tiled_m_intra_node_new = (tiled_m_intra_node + rank_offset) % swizzled_tiled_m_sizes[n]
-
-        logging.debug(
-            f"tiled_m: {tiled_m} @ node {n}: nid = {nid}, node_offset = {node_offset}, rank_offset = {rank_offset}, m_start={m_start}, tiled_m_sizes_accum[{n}], tiled_m_intra_node = {tiled_m_intra_node}, swizzled_offset = {swizzled_node_offset} + {tiled_m_intra_node_new}"
-        )
-
-        return swizzled_node_offset + tiled_m_intra_node_new
-
     @triton.jit
     def _threadblock_complex_swizzle_run(
         output,
@@ -327,9 +330,11 @@ if __name__ == "__main__":
 
         for rank in range(WORLD_SIZE):
             swizzled = []
+            lut = ag_gemm_swizzle_lut(M, rank, WORLD_SIZE, NNODES, BLOCK_SIZE_M)
             for n in range(cdiv(M, BLOCK_SIZE_M)):
                 x = threadblock_complex_swizzle_allgather_gemm_triton(n, M, rank, WORLD_SIZE, NNODES, BLOCK_SIZE_M)
-                y = threadblock_swizzle_allgather_gemm_torch(n, M, rank, WORLD_SIZE, NNODES, BLOCK_SIZE_M)
+                y = threadblock_swizzle_allgather_gemm(n, M, rank, WORLD_SIZE, NNODES, BLOCK_SIZE_M)
+                assert x == lut[n], f"{n} => {x} {lut[n]}"
                 if M % BLOCK_SIZE_M == 0:  # test results of naive swizzle under perfect shape
                     z = threadblock_naive_swizzle_allgather_gemm_triton(n, M, rank, WORLD_SIZE, NNODES, BLOCK_SIZE_M)
                     assert x == z, f"{n} => {x} {z}"
@@ -28,12 +28,15 @@ import triton.language as tl
 import triton_dist.language as dl
 from triton.language.extra.cuda.language_extra import tid, st
 
-from typing import Optional, List
+from typing import Dict, Optional, List
 from dataclasses import dataclass, field
 
 from triton_dist.kernels.nvidia.common_ops import set_signal, barrier_all_intra_node_non_atomic
 from triton_dist.kernels.nvidia.allgather import AllGatherMethod, cp_engine_producer_all_gather_intra_node, get_auto_all_gather_method, cp_engine_producer_all_gather_inter_node
 from triton_dist.kernels.nvidia.ag_gemm_threadblock_swizzle import threadblock_swizzle_allgather_gemm_kernel
+from triton_dist.kernels.swizzle_lut import AG_GEMM, get_swizzle_lut_tensor
+from triton_dist.kernels.graph_safety import GraphHazard
+from triton_dist.kernels.swiglu_epilogue import SWIGLU_INTERLEAVE_GROUP, swiglu_interleave_index
 from triton_dist.utils import NVSHMEM_SIGNAL_DTYPE, nvshmem_barrier_all_on_stream, nvshmem_create_tensor, nvshmem_create_tensors, nvshmem_free_tensor_sync
 
 
@@ -88,7 +91,12 @@ def copy_and_barrier_all_intra_node_kernel(
     flag_value,
     BLOCK_SIZE_M: tl.constexpr,
     BLOCK_SIZE_N: tl.constexpr,
+    phase_ptr=None,
+    PHASE_ON_DEVICE: tl.constexpr = False,
 ):
+    # PHASE_ON_DEVICE: flag_value is read from phase_ptr, which the caller advances after the kernel
+    if PHASE_ON_DEVICE:
+        flag_value = tl.load(phase_ptr)
     barrier_all_intra_node_non_atomic(local_rank, rank, num_ranks, symm_sync_ptr, flag_value)
     copy_kernel(rank, local_buf_ptr, global_buf_ptr, M_per_rank, N, stride_local_m, stride_local_n, stride_global_m,
                 stride_global_n, BLOCK_SIZE_M, BLOCK_SIZE_N)
@@ -99,13 +107,19 @@ def copy_and_barrier_all_intra_node_kernel(
 
 
 def local_copy_and_barrier_all(local_rank, rank, num_ranks, local_data, global_data, comm_buf, barrier_ptr, M_per_rank,
-                               N, phase, is_internode: bool = False):
+                               N, phase, is_internode: bool = False, phase_buf: Optional[torch.Tensor] = None):
+    """ phase_buf: int32 [1] on device. if given, the barrier phase is read from it instead of `phase` and advanced by 2
+        on the stream, so a captured CUDA graph does not replay the phase of capture time.
+    """
     if not is_internode:
         grid = lambda META: (triton.cdiv(M_per_rank, META["BLOCK_SIZE_M"]) * triton.cdiv(N, META["BLOCK_SIZE_N"]), )
         copy_and_barrier_all_intra_node_kernel[grid](local_rank, rank, num_ranks, local_data,
                                                      global_data, barrier_ptr, comm_buf, M_per_rank, N,
                                                      local_data.stride(0), local_data.stride(1), global_data.stride(0),
-                                                     global_data.stride(1), phase, 128, 256)
+                                                     global_data.stride(1), phase, 128, 256, phase_buf,
+                                                     PHASE_ON_DEVICE=phase_buf is not None)
+        if phase_buf is not None:
+            phase_buf.add_(2)
 
     else:
         nvshmem_barrier_all_on_stream()
@@ -128,6 +142,19 @@ def swizzle_2d(tile_id, num_pid_m, num_pid_n, GROUP_SIZE_M: tl.constexpr):
     return pid_m, pid_n
 
 
+# fused SwiGLU epilogue of ag_gemm(..., fuse_swiglu=True)
+@triton.jit
+def swiglu_epilogue(accumulator, BLOCK_SIZE_M: tl.constexpr, BLOCK_SIZE_N: tl.constexpr, SWIGLU_GROUP: tl.constexpr):
+    """ interleaved gate/up columns [BLOCK_SIZE_M, BLOCK_SIZE_N] => SiLU(gate) * up [BLOCK_SIZE_M, BLOCK_SIZE_N // 2].
+    see triton_dist.kernels.swiglu_epilogue for the layout.
+    """
+    acc = tl.reshape(accumulator, (BLOCK_SIZE_M, BLOCK_SIZE_N // (2 * SWIGLU_GROUP), 2, SWIGLU_GROUP))
+    acc = tl.permute(acc, (0, 1, 3, 2))
+    acc = tl.reshape(acc, (BLOCK_SIZE_M, BLOCK_SIZE_N // 2, 2))
+    gate, up = tl.split(acc)
+    return gate / (1.0 + tl.exp(-gate)) * up
+
+
 # TMA related test
 def _matmul_launch_metadata(grid, kernel, args):
     ret = {}
@@ -152,8 +179,13 @@ def kernel_consumer_gemm_persistent(a_ptr, b_ptr, c_ptr,  #
                                     GROUP_SIZE_M: tl.constexpr,  #
                                     EPILOGUE_SUBTILE: tl.constexpr,  #
                                     NUM_SMS: tl.constexpr, ready_value: tl.constexpr = 1,
-                                    LOCAL_WORLD_SIZE: tl.constexpr = 8):  #
+                                    LOCAL_WORLD_SIZE: tl.constexpr = 8,  #
+                                    FUSE_SWIGLU: tl.constexpr = False,
+                                    SWIGLU_GROUP: tl.constexpr = SWIGLU_INTERLEAVE_GROUP,  #
+                                    swizzle_lut_ptr=None, USE_SWIZZLE_LUT: tl.constexpr = False):  #
     # Matmul using TMA and device-side descriptor creation
+    # FUSE_SWIGLU: b is interleaved gate/up [N, K], c is SiLU(gate) * up of [M, N // 2]
+    # USE_SWIZZLE_LUT: swizzle_lut_ptr is the multi-node tile order of triton_dist.kernels.swizzle_lut
     dtype = c_ptr.dtype.element_ty
     start_pid = tl.program_id(axis=0)
     num_pid_m = tl.cdiv(M, BLOCK_SIZE_M)
@@ -174,13 +206,14 @@ def kernel_consumer_gemm_persistent(a_ptr, b_ptr, c_ptr,  #
         strides=[K, 1],
         block_shape=[BLOCK_SIZE_N, BLOCK_SIZE_K],
     )
+    C_N = N // 2 if FUSE_SWIGLU else N
     c_desc = tl.make_tensor_descriptor(
         c_ptr,
-        shape=[M, N],
-        strides=[N, 1],
+        shape=[M, C_N],
+        strides=[C_N, 1],
         block_shape=[
             BLOCK_SIZE_M,
-            BLOCK_SIZE_N if not EPILOGUE_SUBTILE else BLOCK_SIZE_N // 2,
+            BLOCK_SIZE_N if not (EPILOGUE_SUBTILE or FUSE_SWIGLU) else BLOCK_SIZE_N // 2,
         ],
     )
 
@@ -212,6 +245,8 @@ def kernel_consumer_gemm_persistent(a_ptr, b_ptr, c_ptr,  #
                 alpha = 0
                 beta = 0
                 pid_m = (pid_m + ((((rank ^ alpha) + beta) % num_ranks) * pid_ms_per_rank)) % num_pid_m
+            elif USE_SWIZZLE_LUT:
+                pid_m = tl.load(swizzle_lut_ptr + pid_m)
             else:
                 pid_m = threadblock_swizzle_allgather_gemm_kernel(pid_m, M, rank, num_ranks, nnodes, BLOCK_SIZE_M)
 
@@ -236,7 +271,10 @@ def kernel_consumer_gemm_persistent(a_ptr, b_ptr, c_ptr,  #
         accumulator = tl.dot(a, b.T, accumulator)
 
         if ki == k_tiles - 1:
-            if EPILOGUE_SUBTILE:
+            if FUSE_SWIGLU:
+                c = swiglu_epilogue(accumulator, BLOCK_SIZE_M, BLOCK_SIZE_N, SWIGLU_GROUP).to(dtype)
+                c_desc.store([offs_am, offs_bn // 2], c)
+            elif EPILOGUE_SUBTILE:
                 acc = tl.reshape(accumulator, (BLOCK_SIZE_M, 2, BLOCK_SIZE_N // 2))
                 acc = tl.permute(acc, (0, 2, 1))
                 acc0, acc1 = tl.split(acc)
@@ -298,9 +336,11 @@ def kernel_consumer_gemm_non_persistent(
         # Meta-parameters
         BLOCK_SIZE_M: tl.constexpr, BLOCK_SIZE_N: tl.constexpr, BLOCK_SIZE_K: tl.constexpr,  #
         GROUP_SIZE_M: tl.constexpr,  #
+        FUSE_SWIGLU: tl.constexpr = False, SWIGLU_GROUP: tl.constexpr = SWIGLU_INTERLEAVE_GROUP,
 ):
     """Kernel for computing the matmul C = A x B.
     A has shape (M, K), B has shape (K, N) and C has shape (M, N)
+    With FUSE_SWIGLU, B columns are interleaved gate/up and C is SiLU(gate) * up of shape (M, N // 2)
     """
     # -----------------------------------------------------------
     # Map program ids `pid` to the block of C it should compute.
@@ -373,11 +413,19 @@ def kernel_consumer_gemm_non_persistent(
     # -----------------------------------------------------------
     # Write back the block of the output matrix C with masks.
     offs_cm = pid_m * BLOCK_SIZE_M + tl.arange(0, BLOCK_SIZE_M)
-    offs_cn = pid_n * BLOCK_SIZE_N + tl.arange(0, BLOCK_SIZE_N)
-    c_ptrs = c_ptr + stride_cm * offs_cm[:, None] + stride_cn * offs_cn[None, :]
-    c_mask = (offs_cm[:, None] < M) & (offs_cn[None, :] < N)
+    if FUSE_SWIGLU:
+        tl.static_assert(a_dtype != tl.int8, "SwiGLU epilogue expects a floating point accumulator")
+        offs_cn = pid_n * (BLOCK_SIZE_N // 2) + tl.arange(0, BLOCK_SIZE_N // 2)
+        c_ptrs = c_ptr + stride_cm * offs_cm[:, None] + stride_cn * offs_cn[None, :]
+        c_mask = (offs_cm[:, None] < M) & (offs_cn[None, :] < N // 2)
+        c = swiglu_epilogue(accumulator, BLOCK_SIZE_M, BLOCK_SIZE_N, SWIGLU_GROUP)
+        tl.store(c_ptrs, c.to(c_dtype), mask=c_mask)
+    else:
+        offs_cn = pid_n * BLOCK_SIZE_N + tl.arange(0, BLOCK_SIZE_N)
+        c_ptrs = c_ptr + stride_cm * offs_cm[:, None] + stride_cn * offs_cn[None, :]
+        c_mask = (offs_cm[:, None] < M) & (offs_cn[None, :] < N)
 
-    tl.store(c_ptrs, accumulator.to(c_dtype), mask=c_mask)
+        tl.store(c_ptrs, accumulator.to(c_dtype), mask=c_mask)
 
 
 def matmul_get_configs():
@@ -441,6 +489,11 @@ class AllGatherGEMMTensorParallelContext:
     all_gather_method: AllGatherMethod = AllGatherMethod.Auto
     # testing options
     for_correctness: bool = False
+    # graph-safe mode, see enable_graph_safe
+    graph_safe: bool = False
+    phase_buf: torch.Tensor = field(init=False)
+    # best config of the autotuned GEMM by (persistent, M, fuse_swiglu)
+    gemm_configs: Dict[tuple, triton.Config] = field(default_factory=dict)
 
     def __post_init__(self):
         assert self.num_ranks % self.num_local_ranks == 0
@@ -462,6 +515,7 @@ class AllGatherGEMMTensorParallelContext:
         self.symm_barrier.fill_(0)
 
         self.fake_barrier = torch.ones([self.num_ranks], dtype=barrier_dtype, device="cuda")
+        self.phase_buf = torch.full((1, ), self.phase, dtype=torch.int32, device="cuda")
         self.max_gemm_sm = torch.cuda.get_device_properties("cuda").multi_processor_count
 
         nvshmem_barrier_all_on_stream(torch.cuda.current_stream())
@@ -480,6 +534,31 @@ class AllGatherGEMMTensorParallelContext:
         self.ag_stream = ag_stream
         self.internode_ag_stream = internode_ag_stream
 
+    def enable_graph_safe(self):
+        """ for CUDA graph capture:
+            - the intra node barrier phase lives in phase_buf on device, instead of being passed from self.phase
+            - autotuned GEMMs launch the config found by an earlier autotune run of the same shape, and never
+              benchmark while capturing
+            - multi-node swizzle tables are pinned, so a captured graph never reads an evicted one
+
+        call on all ranks at the same point: the device phase starts from the host one.
+        """
+        self.phase_buf.fill_(self.phase)
+        self.graph_safe = True
+
+    def graph_hazards(self, M: Optional[int] = None, persistent: bool = False, autotune: bool = False,
+                      fuse_swiglu: bool = False) -> List[GraphHazard]:
+        """ what breaks a captured ag_gemm of M rows with these options. see triton_dist.kernels.graph_safety """
+        hazards = []
+        if not self.graph_safe and not self.is_multinode:
+            hazards.append(GraphHazard("ag_gemm", "barrier phase advances on the host. call enable_graph_safe"))
+        if autotune and (persistent, M, fuse_swiglu) not in self.gemm_configs:
+            hazards.append(
+                GraphHazard(
+                    "ag_gemm", f"autotune of M={M} persistent={persistent} fuse_swiglu={fuse_swiglu} is not frozen. "
+                    "run it once before capture"))
+        return hazards
+
     def finailize(self):
         nvshmem_free_tensor_sync(self.symm_workspace)
         nvshmem_free_tensor_sync(self.symm_barrier)
@@ -532,7 +611,7 @@ def create_ag_gemm_context(tensor_A, tensor_B, rank, num_ranks, max_M, num_local
 
 
 def ag_gemm(a, b, ctx: AllGatherGEMMTensorParallelContext = None, rank=None, num_ranks=None, persistent=True,
-            autotune=False, straggler_option=None):
+            autotune=False, straggler_option=None, fuse_swiglu=False):
     """allgather gemm
     Allgather global matrix A and do matmul with local matrix B, produces local matrix C
 
@@ -545,9 +624,11 @@ def ag_gemm(a, b, ctx: AllGatherGEMMTensorParallelContext = None, rank=None, num
         persistent (bool, Optional): whether to use persistent GEMM kernel
         autotune(bool, Optional): whether to use autotuned GEMM kernel
         straggler_option(tuple[int, int], Optional): [straggler id, straggler_latency (ns)] options for debugging straggler
+        fuse_swiglu(bool, Optional): b is gate/up interleaved as by interleave_gate_up_weight, and SiLU(gate) * up
+            is computed in the GEMM epilogue
 
     Returns:
-        c (torch.Tensor<float>): local matmul C matrix. shape: [M, N_per_rank]
+        c (torch.Tensor<float>): local matmul C matrix. shape: [M, N_per_rank], or [M, N_per_rank // 2] with fuse_swiglu
     """
 
     assert a.shape[1] == b.shape[
@@ -568,19 +649,33 @@ def ag_gemm(a, b, ctx: AllGatherGEMMTensorParallelContext = None, rank=None, num
         0] == ctx.N_per_rank, f"N_per_rank of tensor_B must match that of ctx: tensor_B shape [{b.shape[0]}], ctx shape [{ctx.N_per_rank}]"
     assert ctx.tensor_dtype == a.dtype, f"dtype of ctx must match that of ctx: tensor_A dtype {a.dtype}, ctx dtype {ctx.tensor_dtype}"
 
-    C = torch.empty([ctx.num_ranks * M_per_rank, N_per_rank], dtype=a.dtype, device=a.device)
+    if fuse_swiglu:
+        assert N_per_rank % (2 * SWIGLU_INTERLEAVE_GROUP) == 0, \
+            f"N_per_rank {N_per_rank} should be a multiple of 2 * {SWIGLU_INTERLEAVE_GROUP} to fuse SwiGLU"
+        assert ctx.BLOCK_N % (2 * SWIGLU_INTERLEAVE_GROUP) == 0, \
+            f"BLOCK_N {ctx.BLOCK_N} should be a multiple of 2 * {SWIGLU_INTERLEAVE_GROUP} to fuse SwiGLU"
+    C_N = N_per_rank // 2 if fuse_swiglu else N_per_rank
+    C = torch.empty([ctx.num_ranks * M_per_rank, C_N], dtype=a.dtype, device=a.device)
 
     local_copy_and_barrier_all(ctx.local_rank, ctx.rank, ctx.num_ranks, a, ctx.symm_workspace, ctx.symm_comm_buf,
-                               ctx.symm_barrier, M_per_rank, K, ctx.phase, is_internode=ctx.is_multinode)
+                               ctx.symm_barrier, M_per_rank, K, ctx.phase, is_internode=ctx.is_multinode,
+                               phase_buf=ctx.phase_buf if ctx.graph_safe else None)
     ctx.phase += 2
 
-    rowise_ag_gemm_dispatcher(a, b, C, ctx, persistent=persistent, autotune=autotune, straggler_option=straggler_option)
+    rowise_ag_gemm_dispatcher(a, b, C, ctx, persistent=persistent, autotune=autotune, straggler_option=straggler_option,
+                              fuse_swiglu=fuse_swiglu)
 
     return C
 
 
+def interleave_gate_up_weight(gate: torch.Tensor, up: torch.Tensor, group: int = SWIGLU_INTERLEAVE_GROUP):
+    """ [I, K] gate and up => [2 * I, K] in the layout of ag_gemm(..., fuse_swiglu=True) """
+    index = torch.from_numpy(swiglu_interleave_index(gate.shape[0], group)).to(gate.device)
+    return torch.cat([gate, up], dim=0).index_select(0, index).contiguous()
+
+
 def rowise_ag_gemm_dispatcher(a, b, c, ctx: AllGatherGEMMTensorParallelContext, persistent=False, autotune=False,
-                              straggler_option=None):
+                              straggler_option=None, fuse_swiglu=False):
     current_stream = torch.cuda.current_stream()
     if ctx.is_multinode:
         ctx.ag_internode_stream.wait_stream(current_stream)
@@ -608,6 +703,11 @@ def rowise_ag_gemm_dispatcher(a, b, c, ctx: AllGatherGEMMTensorParallelContext,
 
     M_per_rank, K = a.shape
     M = M_per_rank * ctx.num_ranks
+    # in graph-safe mode, launch the config an earlier autotune run found for this shape
+    gemm_config_key = (persistent, M, fuse_swiglu)
+    frozen_config = ctx.gemm_configs.get(gemm_config_key) if autotune and ctx.graph_safe else None
+    assert not (autotune and frozen_config is None and torch.cuda.is_current_stream_capturing()), \
+        f"autotune of ag_gemm M={M} is not frozen: enable_graph_safe and run it once before CUDA graph capture"
     if not persistent:
         grid = lambda META: (triton.cdiv(M, META["BLOCK_SIZE_M"]) * triton.cdiv(ctx.N_per_rank, META["BLOCK_SIZE_N"]), )
         if not autotune:
@@ -616,13 +716,21 @@ def rowise_ag_gemm_dispatcher(a, b, c, ctx: AllGatherGEMMTensorParallelContext,
                 M, ctx.N_per_rank, ctx.K,  #
                 ctx.symm_workspace.stride(0), ctx.symm_workspace.stride(1), b.stride(1), b.stride(0), c.stride(0),
                 c.stride(1), ctx.rank, ctx.num_ranks, ctx.symm_barrier, ctx.BLOCK_M, ctx.BLOCK_N, ctx.BLOCK_K,
-                ctx.GROUP_SIZE_M, num_stages=ctx.stages, num_warps=ctx.warps)
+                ctx.GROUP_SIZE_M, FUSE_SWIGLU=fuse_swiglu, num_stages=ctx.stages, num_warps=ctx.warps)
+        elif frozen_config is not None:
+            compiled = kernel_consumer_gemm_non_persistent[grid](
+                ctx.symm_workspace[:M], b, c,  #
+                M, ctx.N_per_rank, ctx.K,  #
+                ctx.symm_workspace.stride(0), ctx.symm_workspace.stride(1), b.stride(1), b.stride(0), c.stride(0),
+                c.stride(1), ctx.rank, ctx.num_ranks, ctx.symm_barrier, FUSE_SWIGLU=fuse_swiglu,
+                **frozen_config.all_kwargs())
         else:
             compiled = kernel_consumer_gemm_non_persistent_autotune[grid](
                 ctx.symm_workspace[:M], b, c,  #
                 M, ctx.N_per_rank, ctx.K,  #
                 ctx.symm_workspace.stride(0), ctx.symm_workspace.stride(1), b.stride(1), b.stride(0), c.stride(0),
-                c.stride(1), ctx.rank, ctx.num_ranks, ctx.symm_barrier)
+                c.stride(1), ctx.rank, ctx.num_ranks, ctx.symm_barrier, FUSE_SWIGLU=fuse_swiglu)
+            ctx.gemm_configs[gemm_config_key] = kernel_consumer_gemm_non_persistent_autotune.best_config
     else:
         # TMA descriptors require a global memory allocation
         def alloc_fn(size: int, alignment: int, stream: Optional[int]):
@@ -637,18 +745,37 @@ def rowise_ag_gemm_dispatcher(a, b, c, ctx: AllGatherGEMMTensorParallelContext,
             triton.cdiv(M, META["BLOCK_SIZE_M"]) * triton.cdiv(ctx.N_per_rank, META["BLOCK_SIZE_N"]),
         ), )
 
+        # multi-node tile order as a precomputed table once BLOCK_M is known, None keeps the in-kernel swizzle
+        swizzle_lut = None
+        if ctx.is_multinode and (not autotune or frozen_config is not None):
+            block_m = ctx.BLOCK_M if not autotune else frozen_config.kwargs["BLOCK_SIZE_M"]
+            swizzle_lut = get_swizzle_lut_tensor(AG_GEMM, M, ctx.rank, ctx.num_ranks, ctx.n_nodes, block_m, b.device,
+                                                 graph_safe=ctx.graph_safe)
+
         if not autotune:
             compiled = kernel_consumer_gemm_persistent[grid](ctx.symm_workspace[:M], b, c, M, ctx.N_per_rank, ctx.K,
                                                              ctx.rank, ctx.num_ranks, ctx.symm_barrier, ctx.BLOCK_M,
                                                              ctx.BLOCK_N, ctx.BLOCK_K, ctx.GROUP_SIZE_M, False, gemm_sm,
                                                              ready_value=ctx.barrier_target,
                                                              LOCAL_WORLD_SIZE=ctx.num_local_ranks,
+                                                             FUSE_SWIGLU=fuse_swiglu, swizzle_lut_ptr=swizzle_lut,
+                                                             USE_SWIZZLE_LUT=swizzle_lut is not None,
                                                              num_stages=ctx.stages, num_warps=ctx.warps)
+        elif frozen_config is not None:
+            compiled = kernel_consumer_gemm_persistent[grid](ctx.symm_workspace[:M], b, c, M, ctx.N_per_rank, ctx.K,
+                                                             ctx.rank, ctx.num_ranks, ctx.symm_barrier,
+                                                             LOCAL_WORLD_SIZE=ctx.num_local_ranks,
+                                                             EPILOGUE_SUBTILE=False, NUM_SMS=gemm_sm,
+                                                             FUSE_SWIGLU=fuse_swiglu, swizzle_lut_ptr=swizzle_lut,
+                                                             USE_SWIZZLE_LUT=swizzle_lut is not None,
+                                                             **frozen_config.all_kwargs())
         else:
             compiled = kernel_consumer_gemm_persistent_autotune[grid](ctx.symm_workspace[:M], b, c, M, ctx.N_per_rank,
                                                                       ctx.K, ctx.rank, ctx.num_ranks, ctx.symm_barrier,
                                                                       LOCAL_WORLD_SIZE=ctx.num_local_ranks,
-                                                                      EPILOGUE_SUBTILE=False, NUM_SMS=gemm_sm)
+                                                                      EPILOGUE_SUBTILE=False, NUM_SMS=gemm_sm,
+                                                                      FUSE_SWIGLU=fuse_swiglu)
+            ctx.gemm_configs[gemm_config_key] = kernel_consumer_gemm_persistent_autotune.best_config
 
     if ctx.is_multinode:
         current_stream.wait_stream(ctx.ag_internode_stream)
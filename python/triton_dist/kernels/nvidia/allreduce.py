@@ -26,7 +26,7 @@ import dataclasses
 import functools
 import math
 import warnings
-from typing import List
+from typing import List, Optional
 
 import torch
 from torch import Tensor
@@ -34,26 +34,36 @@ from cuda import cudart
 
 import triton
 import triton.language as tl
-from triton_dist.kernels.allreduce import AllReduceMethod
+from triton_dist.kernels.allreduce import (AllReduceMethod, HierarchicalAllReducePlan, plan_allreduce_chunks,
+                                           select_hierarchical_allreduce_plan)
+from triton_dist.kernels.graph_safety import GraphHazard
 from triton.language.extra.cuda.language_extra import (__syncthreads, atomic_cas, load_v2_b64, multimem_st_b64, ntid,
-                                                       pack_b32_v2, st_v4_b32, tid, multimem_ld_reduce_v4)
+                                                       pack_b32_v2, st, st_v4_b32, tid, multimem_ld_reduce_v4)
 from triton.language.extra.cuda.utils import num_warps
 from triton_dist.kernels.nvidia.common_ops import (add_v8_bf16, barrier_on_this_grid, get_flat_tid, load_b64_v2)
-from triton_dist.kernels.nvidia.reduce_scatter import copy_continuous_kernel, kernel_ring_reduce_tma, kernel_ring_reduce_non_tma
+from triton_dist.kernels.nvidia.comm_perf_model import estimate_allreduce_stage_time_ms, get_nic_gbps_per_gpu
+from triton_dist.kernels.nvidia.reduce_scatter import (ReduceScatter2DContext, copy_continuous_kernel,
+                                                       create_reduce_scater_2d_ctx, kernel_ring_reduce_tma,
+                                                       kernel_ring_reduce_non_tma, reduce_scatter_2d_op, ring_reduce)
+from triton_dist.kernels.nvidia.low_latency_allgather import (FastAllGatherContext, _pack_ll_block, _recv_ll_block,
+                                                              create_fast_allgather_context, fast_allgather)
 from triton_dist.language.extra import libshmem_device
-from triton_dist.utils import (CUDA_CHECK, NVSHMEM_SIGNAL_DTYPE, get_device_property, is_tma_support,
-                               nvshmem_barrier_all_on_stream, nvshmem_create_tensors, nvshmem_free_tensor_sync,
-                               requires, is_nvshmem_multimem_supported)
+from triton_dist.utils import (CUDA_CHECK, NVSHMEM_SIGNAL_DTYPE, get_device_property, get_intranode_max_speed,
+                               is_tma_support, nvshmem_barrier_all_on_stream, nvshmem_create_tensors,
+                               nvshmem_free_tensor_sync, requires, is_nvshmem_multimem_supported)
 
 SIGNAL_TARGET = 1
 MAX_DOUBLE_TREE_BLOCKS = 1024  # for double tree op
 
 
 def workspace_bytes_per_in_byte(world_size, method: AllReduceMethod) -> int:
-    if method in [AllReduceMethod.OneShot, AllReduceMethod.OneShot_TMA]:
+    if method in [AllReduceMethod.OneShot, AllReduceMethod.OneShot_TMA, AllReduceMethod.Hierarchical]:
         return world_size
     if method in [AllReduceMethod.TwoShot]:
         return 2
+    if method in [AllReduceMethod.OneShot_LL]:
+        # 2 slots of LL packed (data + flag) all-gather buffer, and world_size for unpacked data
+        return world_size * 5
     if method in [AllReduceMethod.OneShot_Multimem, AllReduceMethod.TwoShot_Multimem, AllReduceMethod.DoubleTree]:
         return 1
     raise Exception(f"Unknown allreduce method {method}")
@@ -89,6 +99,12 @@ class AllReduceContext:
 
     # use this to sync all grids
     grid_barrier: torch.Tensor = dataclasses.field(init=False)
+    # LL flag of the last call. lives on device so LL ops need no host side counter
+    ll_flag: torch.Tensor = dataclasses.field(init=False)
+
+    # for inter node only
+    rs_ctx: Optional[ReduceScatter2DContext] = None
+    ag_ctx: Optional[FastAllGatherContext] = None
 
     local_rank: int = dataclasses.field(init=False)
     node_id: int = dataclasses.field(init=False)
@@ -100,12 +116,17 @@ class AllReduceContext:
         assert self.world_size % self.local_world_size == 0
         self.nnodes = self.world_size // self.local_world_size
         self.grid_barrier = torch.zeros(1, dtype=torch.int32, device="cuda")
+        self.ll_flag = torch.zeros(1, dtype=torch.int32, device="cuda")
         self.symm_signal = self.symm_signals[self.local_rank]
         self.symm_scatter_buf = self.symm_scatter_bufs[self.local_rank]
 
     def finalize(self):
         nvshmem_free_tensor_sync(self.symm_scatter_buf)
         nvshmem_free_tensor_sync(self.symm_signal)
+        if self.rs_ctx is not None:
+            self.rs_ctx.finalize()
+        if self.ag_ctx is not None:
+            self.ag_ctx.finalize()
 
     def get_symm_list(self):
         return self.symm_scatter_bufs, self.symm_signals
@@ -116,6 +137,9 @@ def create_allreduce_ctx(
     rank,
     world_size,
     local_world_size,
+    max_M: int = 0,
+    N: int = 0,
+    dtype: Optional[torch.dtype] = None,
 ) -> AllReduceContext:
     """
     symmetric buffer requirement for input tensor x with x.nbytes = N.
@@ -123,10 +147,15 @@ def create_allreduce_ctx(
     method                 |  symmetric buffer size
     double_tree            | N (for scatter)
     one_shot/one_shot_tma  | N * world_size (for all-gather)
+    one_shot_ll            | N * world_size * 5 (2 stages of LL all-gather, N * world_size for unpacked)
     two_shot               | N + N (N for scatter, N for output)
     one_shot_multimem      | N (for ld_reduce)
     two_shot_multimem      | N (for ld_reduce/scatter)
     two_shot_multimem_st   | N + N (N for scatter, N for output)
+    hierarchical           | N * world_size (for all-gather)
+
+    max_M/N/dtype: only used if world_size != local_world_size. with max_M > 0 hierarchical allreduce may
+    reduce-scatter x viewed as [-1, N], which needs another ReduceScatter2DContext of [max_M, N] buffers.
     """
     local_rank = rank % local_world_size
     symm_scatter_bufs = nvshmem_create_tensors((workspace_nbytes, ), torch.int8, rank, local_world_size)
@@ -140,6 +169,13 @@ def create_allreduce_ctx(
     ctx = AllReduceContext(workspace_nbytes=workspace_nbytes, rank=rank, world_size=world_size,
                            local_world_size=local_world_size, symm_scatter_bufs=symm_scatter_bufs,
                            symm_signals=symm_signals)
+    if world_size != local_world_size:
+        ctx.ag_ctx = create_fast_allgather_context(rank, ctx.node_id, world_size, ctx.nnodes,
+                                                   max_buffer_size=2 * workspace_nbytes)
+        if max_M > 0:
+            assert N > 0 and dtype is not None
+            ctx.rs_ctx = create_reduce_scater_2d_ctx(max_M, N, rank, world_size, local_world_size, dtype,
+                                                     overlap_with_gemm=False)
     return ctx
 
 
@@ -414,6 +450,169 @@ def allreduce_one_shot_push_intra_node_kernel(
     )
 
 
+@triton.jit(do_not_specialize=["rank", "n_elements", "chunk_elems"])
+def allreduce_one_shot_push_chunked_intra_node_kernel(
+    input_ptr,
+    output_ptr,
+    symm_signal_ptr,
+    symm_buffer_ptr,
+    grid_barrier_ptr,
+    rank,
+    world_size: tl.constexpr,
+    n_elements,
+    chunk_elems,
+    NUM_SLOTS: tl.constexpr,
+    BLOCK_SIZE: tl.constexpr,
+):
+    """ one-shot all-reduce looping over workspace chunks on device. see AllReduceChunkPlan.pipeline_schedule.
+
+    symm_buffer: NUM_SLOTS slots of [world_size, chunk_elems]. chunk n uses slot n % NUM_SLOTS.
+    symm_signal[0:world_size]: set to n + 1 by peer after chunk n is pushed.
+    symm_signal[world_size:2*world_size]: set to n + 1 by peer after chunk n is reduced.
+    the signals are reset on each call, so there is no host side phase counter and the kernel is CUDAGraph safe.
+    """
+    thread_idx = tid(0)
+    pid = tl.program_id(0)
+    num_pid = tl.num_programs(axis=0)
+    elem_size = tl.constexpr(input_ptr.dtype.element_ty.primitive_bitwidth) // 8
+    symm_buffer_ptr = tl.cast(symm_buffer_ptr, input_ptr.dtype)
+    data_signal_ptr = symm_signal_ptr
+    ack_signal_ptr = symm_signal_ptr + world_size
+    nchunks = tl.cdiv(n_elements, chunk_elems)
+    slot_elems = chunk_elems * world_size
+
+    # reset signals and then barrier all
+    if pid == 0:
+        offs = tl.arange(0, world_size * 2)
+        tl.store(symm_signal_ptr + offs, 0)
+        libshmem_device.barrier_all_block()
+    barrier_on_this_grid(grid_barrier_ptr)
+
+    # prologue: push chunk 0
+    chunk_size = tl.minimum(chunk_elems, n_elements)
+    for peer in range(pid, world_size, num_pid):
+        libshmem_device.putmem_signal_nbi_block(
+            symm_buffer_ptr + chunk_size * rank,
+            input_ptr,
+            chunk_size * elem_size,
+            data_signal_ptr + rank,
+            1,
+            libshmem_device.NVSHMEM_SIGNAL_SET,
+            peer,
+        )
+
+    for n in range(0, nchunks):
+        # push chunk n + 1 before reducing chunk n, so the copy overlaps with the reduction
+        if n + 1 < nchunks:
+            next_start = (n + 1) * chunk_elems
+            next_size = tl.minimum(chunk_elems, n_elements - next_start)
+            next_slot_ptr = symm_buffer_ptr + ((n + 1) % NUM_SLOTS) * slot_elems
+            for peer in range(pid, world_size, num_pid):
+                if n + 1 >= NUM_SLOTS:
+                    # the slot is still in use by chunk n + 1 - NUM_SLOTS on peer
+                    if thread_idx == 0:
+                        libshmem_device.signal_wait_until(ack_signal_ptr + peer, libshmem_device.NVSHMEM_CMP_GE,
+                                                          n + 2 - NUM_SLOTS)
+                    __syncthreads()
+                # chunk n must land before the signal of chunk n + 1
+                libshmem_device.fence()
+                libshmem_device.putmem_signal_nbi_block(
+                    next_slot_ptr + next_size * rank,
+                    input_ptr + next_start,
+                    next_size * elem_size,
+                    data_signal_ptr + rank,
+                    n + 2,
+                    libshmem_device.NVSHMEM_SIGNAL_SET,
+                    peer,
+                )
+
+        if thread_idx < world_size:
+            libshmem_device.signal_wait_until(data_signal_ptr + thread_idx, libshmem_device.NVSHMEM_CMP_GE, n + 1)
+        __syncthreads()
+
+        start = n * chunk_elems
+        kernel_ring_reduce_non_tma(
+            symm_buffer_ptr + (n % NUM_SLOTS) * slot_elems,
+            output_ptr + start,
+            tl.minimum(chunk_elems, n_elements - start),
+            rank,
+            world_size,
+            BLOCK_SIZE=BLOCK_SIZE,
+        )
+
+        # only ack when some peer waits for it: a late ack may land after the peer reset signals for the next call.
+        if n + NUM_SLOTS < nchunks:
+            barrier_on_this_grid(grid_barrier_ptr)
+            if pid == 0 and thread_idx < world_size:
+                libshmem_device.signal_op(ack_signal_ptr + rank, n + 1, libshmem_device.NVSHMEM_SIGNAL_SET,
+                                          thread_idx)
+
+
+@triton.jit(do_not_specialize=["rank", "n_elements", "ll_slot_nbytes"])
+def allreduce_one_shot_ll_push_intra_node_kernel(
+    input_ptr,
+    output_ptr,
+    symm_buffer_ptr,
+    ll_flag_ptr,
+    grid_barrier_ptr,
+    rank,
+    world_size: tl.constexpr,
+    n_elements,
+    ll_slot_nbytes,
+    BLOCK_SIZE: tl.constexpr,
+):
+    """ one-shot all-reduce with LL protocol: no signal, no barrier with peers.
+
+    symm_buffer: [LL slot 0 | LL slot 1 | unpacked [world_size, n_elements]], each LL slot of ll_slot_nbytes.
+    each rank stores LL packed input to slot (flag % 2) of all peers with NVLink st, then polls the flags of the
+    segments it receives. the flag is a device counter, the same on all ranks as long as all ranks run the same ops.
+    """
+    pid = tl.program_id(0)
+    num_pid = tl.num_programs(axis=0)
+    thread_idx = tid(0)
+    elem_size = tl.constexpr(input_ptr.dtype.element_ty.primitive_bitwidth) // 8
+    nbytes = n_elements * elem_size
+    num_ints = nbytes // 4
+
+    ll_flag = tl.load(ll_flag_ptr) + 1
+    symm_buffer_ptr = tl.cast(symm_buffer_ptr, tl.pointer_type(tl.int8))
+    ll_buffer_ptr = symm_buffer_ptr + (ll_flag % 2) * ll_slot_nbytes
+    unpacked_ptr = symm_buffer_ptr + 2 * ll_slot_nbytes
+
+    # push: pack LL directly into peers' buffer
+    for peer in range(pid, world_size, num_pid):
+        _pack_ll_block(
+            libshmem_device.remote_ptr(ll_buffer_ptr + rank * nbytes * 2, peer),
+            input_ptr,
+            num_ints,
+            ll_flag,
+            2048,
+        )
+
+    # recv: wait for LL flags and unpack
+    for peer in range(pid, world_size, num_pid):
+        _recv_ll_block(
+            unpacked_ptr + peer * nbytes,
+            ll_buffer_ptr + peer * nbytes * 2,
+            num_ints,
+            ll_flag,
+        )
+
+    barrier_on_this_grid(grid_barrier_ptr)
+    # all blocks have read the flag. ready for next call
+    if pid == 0 and thread_idx == 0:
+        st(ll_flag_ptr, ll_flag)
+
+    kernel_ring_reduce_non_tma(
+        tl.cast(unpacked_ptr, input_ptr.dtype),
+        output_ptr,
+        n_elements,
+        rank,
+        world_size,
+        BLOCK_SIZE=BLOCK_SIZE,
+    )
+
+
 @triton.jit(do_not_specialize=["rank"])
 def allreduce_one_shot_tma_push_intra_node_kernel(
     M,
@@ -736,6 +935,102 @@ def allreduce_one_shot_push_intra_node(
     return output
 
 
+def allreduce_one_shot_push_chunked_intra_node(
+    ctx: AllReduceContext,
+    x: Tensor,
+    output: Tensor,
+    straggler_option=None,
+    max_sm: int = -1,
+    num_warps: int = 32,
+):
+    """ One-shot all-reduce for inputs larger than the workspace, in a single launch.
+
+    The workspace is split into 2 slots: chunk n + 1 is pushed to one slot while chunk n is reduced from the other.
+    The chunk loop and signals live on device, so unlike calling `allreduce_one_shot_push_intra_node` per chunk,
+    this op can be captured by CUDAGraph.
+    """
+    assert x.is_cuda and x.is_contiguous()
+    assert output.is_cuda and output.is_contiguous()
+    assert x.dtype == output.dtype and x.shape == output.shape, f"x.dtype({x.dtype}) == output.dtype({output.dtype}) and x.shape({x.shape}) == output.shape({output.shape})"
+
+    plan = plan_allreduce_chunks(x.numel(), x.itemsize, ctx.workspace_nbytes,
+                                 workspace_bytes_per_in_byte(ctx.world_size, AllReduceMethod.OneShot), num_slots=2)
+    assert ctx.symm_signal.numel() >= ctx.world_size * 2
+
+    block_size = num_warps * 32 * 16 // x.itemsize
+    num_tiles = triton.cdiv(plan.chunk_numel, block_size)
+    _run_straggler(ctx, straggler_option)
+    # the grid can't be too large: cooperative_launchs
+    if max_sm > 0:
+        num_tiles = min(max_sm, num_tiles)
+    num_tiles = min(get_device_property().multi_processor_count - 4, num_tiles)
+    allreduce_one_shot_push_chunked_intra_node_kernel[(num_tiles, )](
+        x,
+        output,
+        ctx.symm_signal,
+        ctx.symm_scatter_buf,
+        ctx.grid_barrier,
+        ctx.rank,
+        ctx.world_size,
+        x.numel(),
+        plan.chunk_numel,
+        NUM_SLOTS=plan.num_slots,
+        BLOCK_SIZE=block_size,
+        num_warps=num_warps,
+        launch_cooperative_grid=True,
+    )
+    return output
+
+
+def allreduce_one_shot_ll_push_intra_node(
+    ctx: AllReduceContext,
+    x: Tensor,
+    output: Tensor,
+    straggler_option=None,
+    max_sm: int = -1,
+    num_warps: int = 16,
+):
+    """ One-shot with LL protocol for small messages such as decode.
+
+    Data are sent with the flag interleaved, so no signal and no barrier is needed: saves the latency of
+    barrier_all and putmem_signal. Costs 2x traffic, so only for small messages.
+
+    Notes:
+        - requires x.nbytes * world_size * 5 of symmetric buffer.
+        - do not share the workspace of ctx with other methods: stale data may be taken as a valid LL flag.
+    """
+    assert x.is_cuda and x.is_contiguous()
+    assert output.is_cuda and output.is_contiguous()
+    assert x.dtype == output.dtype and x.shape == output.shape, f"x.dtype({x.dtype}) == output.dtype({output.dtype}) and x.shape({x.shape}) == output.shape({output.shape})"
+    assert x.nbytes % 8 == 0, "LL protocol packs 8 bytes per vector"
+    # fixed size slots: peers may write the next call into the other slot while this call is still being read.
+    ll_slot_nbytes = ctx.workspace_nbytes // 5 * 2 // 16 * 16
+    assert x.nbytes * ctx.world_size * 2 <= ll_slot_nbytes
+
+    block_size = num_warps * 32 * 16 // x.itemsize
+    num_tiles = max(ctx.world_size, triton.cdiv(x.numel(), block_size))
+    _run_straggler(ctx, straggler_option)
+    # the grid can't be too large: cooperative_launchs
+    if max_sm > 0:
+        num_tiles = min(max_sm, num_tiles)
+    num_tiles = min(get_device_property().multi_processor_count - 4, num_tiles)
+    allreduce_one_shot_ll_push_intra_node_kernel[(num_tiles, )](
+        x,
+        output,
+        ctx.symm_scatter_buf,
+        ctx.ll_flag,
+        ctx.grid_barrier,
+        ctx.rank,
+        ctx.world_size,
+        x.numel(),
+        ll_slot_nbytes,
+        BLOCK_SIZE=block_size,
+        num_warps=num_warps,
+        launch_cooperative_grid=True,
+    )
+    return output
+
+
 def allreduce_two_shot_push_intra_node(
     ctx: AllReduceContext,
     x: Tensor,
@@ -744,12 +1039,15 @@ def allreduce_two_shot_push_intra_node(
     max_sm: int = -1,
     num_warps: int = 32,
 ):
-    """ this function requires x.nbytes as
+    """ Two-shot with push and without TMA: reduce-scatter then all-gather. bandwidth optimal for large messages.
 
+    each rank reduces 1/world_size of x and pushes it to all peers, so all ranks get the same result.
+    this function requires x.nbytes for symmetric scatter and x.nbytes for symmetric output.
     """
     assert x.is_cuda and x.is_contiguous()
     assert output.is_cuda and output.is_contiguous()
     assert x.dtype == output.dtype and x.nbytes == output.nbytes
+    assert x.numel() % ctx.world_size == 0, f"x.numel() {x.numel()} should be divisible by {ctx.world_size}"
     # two_shot requires x.nbytes for symmetric scatter and x.nbytes for symmetric output
     assert x.nbytes <= ctx.workspace_nbytes // 2
 
@@ -1036,7 +1334,79 @@ def allreduce_two_shot_multimem_st_intra_node(
     return output if output is not None else ctx.symm_scatter_buf[:num_elem].view_as(x)
 
 
-def get_auto_allreduce_method(nbytes):
+@functools.lru_cache()
+def _get_hierarchical_allreduce_plan(nbytes, world_size, local_world_size, alignment, with_reduce_scatter: bool):
+    stage_cost_fn = functools.partial(estimate_allreduce_stage_time_ms, intranode_bw=get_intranode_max_speed(),
+                                      internode_bw=get_nic_gbps_per_gpu())
+    return select_hierarchical_allreduce_plan(nbytes, world_size, local_world_size, stage_cost_fn, alignment,
+                                              allowed=None if with_reduce_scatter else [])
+
+
+def get_hierarchical_allreduce_plan(ctx: AllReduceContext, x: Tensor) -> HierarchicalAllReducePlan:
+    """ select the plan by comm_perf_model. rs_ag is allowed only if x fits in ctx.rs_ctx. """
+    rs_ctx = ctx.rs_ctx
+    with_reduce_scatter = (rs_ctx is not None and rs_ctx.dtype == x.dtype
+                           and x.numel() <= rs_ctx.max_M * rs_ctx.N)
+    alignment = rs_ctx.N * x.itemsize if rs_ctx is not None else 16
+    return _get_hierarchical_allreduce_plan(x.nbytes, ctx.world_size, ctx.local_world_size, alignment,
+                                            with_reduce_scatter)
+
+
+def allreduce_hierarchical_inter_node(
+    ctx: AllReduceContext,
+    x: Tensor,
+    output: Tensor,
+    straggler_option=None,
+    max_sm: int = -1,  # dummy arg
+    num_warps: int = 32,  # dummy arg
+    plan: Optional[HierarchicalAllReducePlan] = None,
+):
+    """ inter node all-reduce chained from reduce_scatter_2d_op and fast_allgather. see HierarchicalAllReducePlan.
+
+        rs_ag:     reduce_scatter_2d_op of x viewed as [-1, ctx.rs_ctx.N] into the symmetric buffer, then allgather.
+        ag_reduce: allgather x into the symmetric buffer, then reduce in the same order on all ranks.
+
+    Args:
+        plan (HierarchicalAllReducePlan, optional): selected by comm_perf_model if None.
+
+    Notes:
+        does not support CUDAGraph: fast_allgather signals with a host side counter.
+    """
+    assert x.is_cuda and x.is_contiguous()
+    assert output.is_cuda and output.is_contiguous()
+    assert x.dtype == output.dtype and x.nbytes == output.nbytes
+    assert ctx.ag_ctx is not None, "hierarchical allreduce requires a ctx created with world_size != local_world_size"
+    assert not torch.cuda.is_current_stream_capturing(), "hierarchical allreduce does not support CUDAGraph"
+    assert x.nbytes * ctx.world_size <= ctx.workspace_nbytes
+
+    plan = plan or get_hierarchical_allreduce_plan(ctx, x)
+    _run_straggler(ctx, straggler_option)
+    nbytes = x.nbytes
+    if plan.name == "rs_ag":
+        N = ctx.rs_ctx.N
+        M_per_rank = x.numel() // N // ctx.world_size
+        symm_out = ctx.symm_scatter_buf[:nbytes].view(x.dtype).view(-1, N)
+        # reduce_scatter_2d_op starts with a barrier: no peer pushes into symm_out before we are done with it
+        reduce_scatter_2d_op(x.view(-1, N), ctx.rs_ctx, symm_out[ctx.rank * M_per_rank:(ctx.rank + 1) * M_per_rank])
+        fast_allgather(ctx.symm_scatter_buf[:nbytes], ctx.ag_ctx, mode="push2d")
+        output.copy_(symm_out.view_as(output))
+        return output
+
+    assert plan.name == "ag_reduce", f"unknown hierarchical allreduce plan {plan.name}"
+    symm_gathered = ctx.symm_scatter_buf[:nbytes * ctx.world_size]
+    nvshmem_barrier_all_on_stream(torch.cuda.current_stream())
+    symm_gathered.view(ctx.world_size, nbytes)[ctx.rank].copy_(x.view(-1).view(torch.int8))
+    fast_allgather(symm_gathered, ctx.ag_ctx, mode="push2d")
+    # begin from world_size - 1: all ranks reduce in order 0, 1, ..., world_size - 1 and get the same result
+    ring_reduce(symm_gathered.view(x.dtype).view(ctx.world_size, -1), output.view(1, -1), ctx.world_size - 1,
+                ctx.world_size)
+    return output
+
+
+def get_auto_allreduce_method(nbytes, world_size: int = 1, local_world_size: Optional[int] = None):
+    if local_world_size is not None and local_world_size != world_size:
+        return AllReduceMethod.Hierarchical
+
     if is_nvshmem_multimem_supported():
         if nbytes > 64 * 1024:
             return AllReduceMethod.TwoShot_Multimem
@@ -1044,13 +1414,40 @@ def get_auto_allreduce_method(nbytes):
             return AllReduceMethod.OneShot_Multimem
 
     # TODO(houqi.1993) re-determine nbytes
+    # OneShot_LL is opt-in only: it must not share ctx's workspace with other methods
     if is_tma_support() and nbytes < 16 * 1024:
         return AllReduceMethod.OneShot_TMA
 
-    # TODO(houqi.1993) no two-shot without TMA implementation
+    # two-shot splits x evenly over ranks
+    if nbytes >= 1024 * 1024 and nbytes % (world_size * 16) == 0:
+        return AllReduceMethod.TwoShot
     return AllReduceMethod.OneShot
 
 
+def get_allreduce_elems_per_chunk(ctx: AllReduceContext, method: AllReduceMethod, itemsize: int) -> int:
+    nbytes_per_chunk = ctx.workspace_nbytes // workspace_bytes_per_in_byte(ctx.world_size, method)
+    # keep each chunk 16 byte aligned and evenly split over ranks for two-shot
+    chunk_alignment = 16 * ctx.world_size
+    elems_per_chunk = nbytes_per_chunk // chunk_alignment * chunk_alignment // itemsize
+    assert elems_per_chunk > 0, f"workspace of {ctx.workspace_nbytes} bytes is too small for {method.name}"
+    return elems_per_chunk
+
+
+def allreduce_graph_hazards(ctx: AllReduceContext, method: Optional[AllReduceMethod], nbytes: int,
+                            itemsize: int) -> List[GraphHazard]:
+    """ what breaks a captured all_reduce of nbytes. see triton_dist.kernels.graph_safety """
+    method = method or get_auto_allreduce_method(nbytes, ctx.world_size, ctx.local_world_size)
+    if method == AllReduceMethod.Hierarchical:
+        return [GraphHazard("all_reduce", "Hierarchical signals fast_allgather with a host side counter")]
+    nchunks = triton.cdiv(nbytes // itemsize, get_allreduce_elems_per_chunk(ctx, method, itemsize))
+    if nchunks > 1 and method != AllReduceMethod.OneShot:
+        return [
+            GraphHazard("all_reduce", f"{method.name} of {nbytes} bytes runs in {nchunks} chunks. "
+                        "enlarge the workspace or use OneShot")
+        ]
+    return []
+
+
 def all_reduce(
     x: Tensor,
     output: Tensor,
@@ -1059,36 +1456,43 @@ def all_reduce(
     max_sm: int = -1,
     straggler_option=None,
 ):
-    """ TODO(houqi.1993) if use multiple chunks, does not support CUDAGraph.
+    """ if x does not fit in the workspace:
+        - OneShot runs all chunks in one pipelined kernel, which supports CUDAGraph.
+        - other methods launch one kernel per chunk, which does not support CUDAGraph.
     """
-    method = method or get_auto_allreduce_method(x.nbytes)
+    method = method or get_auto_allreduce_method(x.nbytes, ctx.world_size, ctx.local_world_size)
     # method naming: allreduce_${algo}_${arch}_${impl}_${protocol}_${extra}
     #  algo: double_tree / one_shot / two_shot / ring
     #  arch: arch related such as multicast/tma/null
     #  impl: push / pull
-    #  protocol: null / LL. currently only null supported
+    #  protocol: null / LL
     #  extra: intra_node / inter_node (or null)
     op_handle = {
         AllReduceMethod.OneShot: allreduce_one_shot_push_intra_node,
         AllReduceMethod.TwoShot: allreduce_two_shot_push_intra_node,
         AllReduceMethod.OneShot_TMA: allreduce_one_shot_tma_push_intra_node,
+        AllReduceMethod.OneShot_LL: allreduce_one_shot_ll_push_intra_node,
         AllReduceMethod.OneShot_Multimem: allreduce_one_shot_multimem_intra_node,
         AllReduceMethod.DoubleTree: allreduce_double_tree_intra_node,
         AllReduceMethod.TwoShot_Multimem: allreduce_two_shot_multimem_intra_node,
         AllReduceMethod.TwoShot_Multimem_ST: allreduce_two_shot_multimem_st_intra_node,
+        AllReduceMethod.Hierarchical: allreduce_hierarchical_inter_node,
     }[method]
 
-    nbytes_per_chunk = ctx.workspace_nbytes // workspace_bytes_per_in_byte(ctx.world_size, method)
-    nchunks = triton.cdiv(x.nbytes, nbytes_per_chunk)
-    elems_per_chunk = nbytes_per_chunk // x.itemsize
-
-    if nchunks > 1:
-        assert not torch.cuda.is_current_stream_capturing(
-        ), "allreduce does not support CUDAGraph if use multiple chunks"
+    elems_per_chunk = get_allreduce_elems_per_chunk(ctx, method, x.itemsize)
+    nchunks = triton.cdiv(x.numel(), elems_per_chunk)
 
     if output is None:
         output = torch.empty_like(x)
 
+    if nchunks > 1 and method == AllReduceMethod.OneShot:
+        return allreduce_one_shot_push_chunked_intra_node(ctx=ctx, x=x, output=output, max_sm=max_sm, num_warps=32,
+                                                          straggler_option=straggler_option)
+
+    if nchunks > 1:
+        assert not torch.cuda.is_current_stream_capturing(
+        ), f"allreduce {method.name} does not support CUDAGraph if use multiple chunks. use OneShot instead"
+
     for n in range(nchunks):
         op_handle(
             ctx=ctx,
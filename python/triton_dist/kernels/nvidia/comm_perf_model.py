@@ -28,6 +28,7 @@ import torch
 import os
 import subprocess
 
+from triton_dist.kernels.allreduce import AllReduceStage, AllReduceStageKind
 from triton_dist.utils import get_has_fullmesh_nvlink
 
 
@@ -112,3 +113,18 @@ def estimate_all_gather_time_ms(nbytes, world_size, local_world_size, intranode_
     intranode_bw/internode_bw in GB/s
     """
     return estimate_reduce_scatter_time_ms(nbytes, world_size, local_world_size, intranode_bw, internode_bw)
+
+
+def estimate_allreduce_stage_time_ms(stage: AllReduceStage, intranode_bw, internode_bw, latency_ms=0.02):
+    """ for selecting a HierarchicalAllReducePlan. each synchronization step of a stage pays `latency_ms`.
+    intranode_bw/internode_bw in GB/s
+    """
+    latency_ms = latency_ms * stage.num_sync_steps
+    if stage.kind == AllReduceStageKind.ReduceScatter:
+        return latency_ms + estimate_reduce_scatter_time_ms(stage.nbytes, stage.world_size, stage.local_world_size,
+                                                            intranode_bw, internode_bw)
+    if stage.kind == AllReduceStageKind.AllGather:
+        return latency_ms + estimate_all_gather_time_ms(stage.nbytes, stage.world_size, stage.local_world_size,
+                                                        intranode_bw, internode_bw)
+    # local reduce reads all gathered copies from HBM, which is far faster than the links. count the launch only.
+    return latency_ms
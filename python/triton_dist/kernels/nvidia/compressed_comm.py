@@ -0,0 +1,257 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" opt-in compressed-wire reduce-scatter/allgather. see triton_dist.kernels.compressed_comm for the layout.
+
+the producer quantizes straight into the symmetric send buffer, segments are pushed with putmem_signal, and the
+consumer dequantizes while reducing (reduce-scatter) or copying out (allgather). works intra and inter node.
+"""
+import dataclasses
+from typing import Optional
+
+import torch
+from torch import Tensor
+
+import triton
+import triton.language as tl
+from triton.language.extra import libdevice
+from triton.language.extra.cuda.language_extra import __syncthreads, tid
+from triton_dist.kernels.compressed_comm import CompressedSegmentLayout, CompressedWireConfig
+from triton_dist.language.extra import libshmem_device
+from triton_dist.utils import (NVSHMEM_SIGNAL_DTYPE, nvshmem_barrier_all_on_stream, nvshmem_create_tensor,
+                               nvshmem_free_tensor_sync)
+
+
+@triton.jit
+def quantize_blockwise_kernel(
+    x_ptr,  # [NUM_SEGS, seg_numel]
+    out_ptr,  # int8 of [NUM_SEGS, seg_nbytes], each segment of CompressedSegmentLayout
+    seg_numel,
+    seg_nbytes,
+    scale_offset,
+    QMAX: tl.constexpr,
+    WIRE_IS_FP8: tl.constexpr,
+    BLOCK_SIZE: tl.constexpr,
+):
+    pid = tl.program_id(0)
+    seg = tl.program_id(1)
+    offs = pid * BLOCK_SIZE + tl.arange(0, BLOCK_SIZE)
+    mask = offs < seg_numel
+    x = tl.load(x_ptr + seg * seg_numel + offs, mask=mask, other=0).to(tl.float32)
+    scale = tl.max(tl.abs(x), axis=0) / QMAX
+    inv_scale = tl.where(scale > 0, 1.0 / scale, 0.0)
+    y = tl.clamp(x * inv_scale, -QMAX, QMAX)
+    seg_ptr = out_ptr + seg * seg_nbytes
+    if WIRE_IS_FP8:
+        tl.store(tl.cast(seg_ptr, tl.pointer_type(tl.float8e4nv)) + offs, y.to(tl.float8e4nv), mask=mask)
+    else:
+        tl.store(seg_ptr + offs, libdevice.rint(y).to(tl.int8), mask=mask)
+    tl.store(tl.cast(seg_ptr + scale_offset, tl.pointer_type(tl.float32)) + pid, scale)
+
+
+@triton.jit
+def _dequantize_block(seg_ptr, offs, mask, pid, scale_offset, WIRE_IS_FP8: tl.constexpr):
+    if WIRE_IS_FP8:
+        q = tl.load(tl.cast(seg_ptr, tl.pointer_type(tl.float8e4nv)) + offs, mask=mask, other=0)
+    else:
+        q = tl.load(seg_ptr + offs, mask=mask, other=0)
+    scale = tl.load(tl.cast(seg_ptr + scale_offset, tl.pointer_type(tl.float32)) + pid)
+    return q.to(tl.float32) * scale
+
+
+@triton.jit(do_not_specialize=["signal_target"])
+def dequantize_blockwise_kernel(
+    symm_recv_ptr,  # int8 of [NUM_SEGS, seg_nbytes]
+    symm_signal_ptr,  # [NUM_SEGS]. segment s is ready when signal s == signal_target
+    out_ptr,  # [seg_numel] if REDUCE else [NUM_SEGS, seg_numel]
+    seg_numel,
+    seg_nbytes,
+    scale_offset,
+    signal_target,
+    NUM_SEGS: tl.constexpr,
+    REDUCE: tl.constexpr,
+    WIRE_IS_FP8: tl.constexpr,
+    BLOCK_SIZE: tl.constexpr,
+):
+    thread_idx = tid(0)
+    if thread_idx < NUM_SEGS:
+        libshmem_device.signal_wait_until(symm_signal_ptr + thread_idx, libshmem_device.NVSHMEM_CMP_EQ, signal_target)
+    __syncthreads()
+
+    pid = tl.program_id(0)
+    offs = pid * BLOCK_SIZE + tl.arange(0, BLOCK_SIZE)
+    mask = offs < seg_numel
+    if REDUCE:
+        accum = tl.zeros((BLOCK_SIZE, ), dtype=tl.float32)
+        for seg in range(NUM_SEGS):
+            accum += _dequantize_block(symm_recv_ptr + seg * seg_nbytes, offs, mask, pid, scale_offset, WIRE_IS_FP8)
+        tl.store(out_ptr + offs, accum.to(out_ptr.dtype.element_ty), mask=mask)
+    else:
+        for seg in range(NUM_SEGS):
+            x = _dequantize_block(symm_recv_ptr + seg * seg_nbytes, offs, mask, pid, scale_offset, WIRE_IS_FP8)
+            tl.store(out_ptr + seg * seg_numel + offs, x.to(out_ptr.dtype.element_ty), mask=mask)
+
+
+@triton.jit(do_not_specialize=["rank", "signal_target"])
+def push_compressed_segments_kernel(
+    symm_send_ptr,  # int8 of [NUM_SEGS, seg_nbytes] if SEND_PER_PEER else [seg_nbytes]
+    symm_recv_ptr,  # int8 of [world_size, seg_nbytes]
+    symm_signal_ptr,  # [world_size]
+    seg_nbytes,
+    rank,
+    signal_target,
+    SEND_PER_PEER: tl.constexpr,
+):
+    """ program `peer` puts one segment to recv segment `rank` of peer, and itself too. """
+    peer = tl.program_id(0)
+    send_seg = peer if SEND_PER_PEER else 0
+    libshmem_device.putmem_signal_nbi_block(
+        symm_recv_ptr + rank * seg_nbytes,
+        symm_send_ptr + send_seg * seg_nbytes,
+        seg_nbytes,
+        symm_signal_ptr + rank,
+        signal_target,
+        libshmem_device.NVSHMEM_SIGNAL_SET,
+        peer,
+    )
+
+
+@dataclasses.dataclass
+class CompressedCommContext:
+    rank: int
+    world_size: int
+    max_numel: int  # max elements per segment
+    config: CompressedWireConfig
+
+    symm_send_buf: Tensor  # int8 of [world_size, max_layout.nbytes]
+    symm_recv_buf: Tensor  # int8 of [world_size, max_layout.nbytes]
+    symm_signal: Tensor  # [world_size]
+    signal_target: int = 0
+
+    def finalize(self):
+        nvshmem_free_tensor_sync(self.symm_send_buf)
+        nvshmem_free_tensor_sync(self.symm_recv_buf)
+        nvshmem_free_tensor_sync(self.symm_signal)
+
+
+def create_compressed_comm_context(rank, world_size, max_numel,
+                                   config: Optional[CompressedWireConfig] = None) -> CompressedCommContext:
+    """ max_numel: max elements each rank sends to one peer. output numel for reduce-scatter, input numel for allgather
+    """
+    config = config or CompressedWireConfig()
+    max_layout = CompressedSegmentLayout(max_numel, config.block_size)
+    symm_send_buf = nvshmem_create_tensor((world_size, max_layout.nbytes), torch.int8)
+    symm_recv_buf = nvshmem_create_tensor((world_size, max_layout.nbytes), torch.int8)
+    symm_signal = nvshmem_create_tensor((world_size, ), NVSHMEM_SIGNAL_DTYPE)
+    symm_signal.zero_()
+    nvshmem_barrier_all_on_stream(torch.cuda.current_stream())
+    return CompressedCommContext(rank=rank, world_size=world_size, max_numel=max_numel, config=config,
+                                 symm_send_buf=symm_send_buf, symm_recv_buf=symm_recv_buf, symm_signal=symm_signal)
+
+
+def _compressed_exchange(ctx: CompressedCommContext, x: Tensor, output: Tensor, seg_numel: int, reduce: bool):
+    config = ctx.config
+    layout = CompressedSegmentLayout(seg_numel, config.block_size)
+    num_send_segs = ctx.world_size if reduce else 1
+    wire_is_fp8 = config.wire_dtype == torch.float8_e4m3fn
+
+    # peers may still read the recv buffer of the last call, and the last puts from the send buffer may be in flight
+    nvshmem_barrier_all_on_stream(torch.cuda.current_stream())
+    ctx.signal_target += 1
+    quantize_blockwise_kernel[(layout.num_blocks, num_send_segs)](
+        x,
+        ctx.symm_send_buf,
+        seg_numel,
+        layout.nbytes,
+        layout.scale_offset,
+        QMAX=config.qmax,
+        WIRE_IS_FP8=wire_is_fp8,
+        BLOCK_SIZE=config.block_size,
+        num_warps=4,
+    )
+    push_compressed_segments_kernel[(ctx.world_size, )](
+        ctx.symm_send_buf,
+        ctx.symm_recv_buf,
+        ctx.symm_signal,
+        layout.nbytes,
+        ctx.rank,
+        ctx.signal_target,
+        SEND_PER_PEER=reduce,
+        num_warps=16,
+    )
+    dequantize_blockwise_kernel[(layout.num_blocks, )](
+        ctx.symm_recv_buf,
+        ctx.symm_signal,
+        output,
+        seg_numel,
+        layout.nbytes,
+        layout.scale_offset,
+        ctx.signal_target,
+        NUM_SEGS=ctx.world_size,
+        REDUCE=reduce,
+        WIRE_IS_FP8=wire_is_fp8,
+        BLOCK_SIZE=config.block_size,
+        num_warps=4,
+    )
+    return output
+
+
+def reduce_scatter_compressed(ctx: CompressedCommContext, x: Tensor, output: Optional[Tensor] = None) -> Tensor:
+    """ output = sum over ranks of segment `rank` of x, with x sent as ctx.config.wire_dtype and reduced in float32.
+
+    Args:
+        x (Tensor): [world_size * n] elements on each rank.
+        output (Tensor, optional): [n] elements of x.dtype.
+
+    Notes:
+        does not support CUDAGraph: signals with a host side counter as fast_allgather.
+        the error of each element is at most ctx.config.effective_error_bound * absmax of its block, summed over ranks.
+    """
+    assert x.is_cuda and x.is_contiguous()
+    assert x.numel() % ctx.world_size == 0
+    seg_numel = x.numel() // ctx.world_size
+    assert seg_numel <= ctx.max_numel, f"{seg_numel} elements per rank exceeds ctx.max_numel {ctx.max_numel}"
+    if output is None:
+        output = torch.empty((seg_numel, ), dtype=x.dtype, device=x.device)
+    assert output.is_contiguous() and output.numel() == seg_numel and output.dtype == x.dtype
+    return _compressed_exchange(ctx, x, output, seg_numel, reduce=True)
+
+
+def all_gather_compressed(ctx: CompressedCommContext, x: Tensor, output: Optional[Tensor] = None) -> Tensor:
+    """ output = concat of x over ranks, with x sent as ctx.config.wire_dtype. all ranks get the same result.
+
+    Args:
+        x (Tensor): [n] elements on each rank.
+        output (Tensor, optional): [world_size * n] elements of x.dtype.
+
+    Notes:
+        does not support CUDAGraph: signals with a host side counter as fast_allgather.
+    """
+    assert x.is_cuda and x.is_contiguous()
+    seg_numel = x.numel()
+    assert seg_numel <= ctx.max_numel, f"{seg_numel} elements per rank exceeds ctx.max_numel {ctx.max_numel}"
+    if output is None:
+        output = torch.empty((ctx.world_size * seg_numel, ), dtype=x.dtype, device=x.device)
+    assert output.is_contiguous() and output.numel() == ctx.world_size * seg_numel and output.dtype == x.dtype
+    return _compressed_exchange(ctx, x, output, seg_numel, reduce=False)
@@ -59,6 +59,13 @@ if use_aot:
     from triton._C.libtriton_distributed import distributed
 
 from triton_dist.kernels.nvidia.common_ops import barrier_on_this_grid
+from triton_dist.kernels.kv_split_planner import KVSplitPlanner
+from triton_dist.kernels.kv_quant import is_quantized_kv_dtype
+
+# NUM_KV_SPLITS of the AOT compiled split kernels, all of which have AOT compiled combine kernels
+AOT_KV_SPLITS = (16, 32, 64)
+# AOT signature dtypes of the quantized KV caches of triton_dist.kernels.kv_quant
+AOT_QUANT_KV_DTYPES = {torch.int8: "i8", torch.float8_e4m3fn: "fp8e4nv"}
 
 
 @triton.jit
@@ -79,6 +86,7 @@ split_kv_signature = ((
                               "i32:16", "i32:16",  # v
                               "i32:16", "i32:16", "i32",  # o
                               "i32",  # table
+                              "*fp32", "*fp32", "i32", "i32",  # k_scale/v_scale, their page/head strides
                           ]) + ", ") +  # strides
                       ("%kv_group_num, "
                        "%q_head_num, "
@@ -91,7 +99,8 @@ split_kv_signature = ((
                        "%PAGE_SIZE, "
                        "%soft_cap, "
                        "%K_DIM, "
-                       "%V_DIM"))
+                       "%V_DIM, "
+                       "%KV_QUANT"))
 
 _split_kv_grid = [
     "batch",
@@ -100,12 +109,13 @@ _split_kv_grid = [
 ]
 
 
-def get_triton_split_kv_algo_info(q_heads, kv_heads, q_head_dim, v_head_dim, page_size, split_kv=32, soft_cap=0.0):
+def get_triton_split_kv_algo_info(q_heads, kv_heads, q_head_dim, v_head_dim, page_size, split_kv=32, soft_cap=0.0,
+                                  kv_quant=False):
     return {
         "kv_group_num": q_heads // kv_heads, "q_head_num": q_heads, "BLOCK_HEAD_DIM": 2**int(math.log2(q_head_dim)),
         "BLOCK_DPE": q_head_dim - 2**int(math.log2(q_head_dim)), "BLOCK_DV": triton.next_power_of_2(v_head_dim),
         "BLOCK_N": 64, "BLOCK_H": 16, "NUM_KV_SPLITS": split_kv, "PAGE_SIZE": page_size, "soft_cap": soft_cap, "K_DIM":
-        q_head_dim, "V_DIM": v_head_dim, "num_warps": 4, "num_stages": 2
+        q_head_dim, "V_DIM": v_head_dim, "KV_QUANT": kv_quant, "num_warps": 4, "num_stages": 2
     }
 
 
@@ -114,16 +124,30 @@ def get_triton_split_kv_algo_info(q_heads, kv_heads, q_head_dim, v_head_dim, pag
         "signature":
         split_kv_signature.format(input_dtype="fp16", cache_dtype="fp16", output_dtype="fp32"), "grid":
         _split_kv_grid, "triton_algo_infos": [
-            get_triton_split_kv_algo_info(96, 12, 128, 128, 1, split_kv=32, soft_cap=0),
-            get_triton_split_kv_algo_info(96 // 4, 12 // 4, 128, 128, 1, split_kv=32, soft_cap=0),
+            get_triton_split_kv_algo_info(q_heads, kv_heads, 128, 128, 1, split_kv=split_kv, soft_cap=0)
+            for q_heads, kv_heads in [(96, 12), (96 // 4, 12 // 4)]
+            for split_kv in AOT_KV_SPLITS
         ]
     }, "gqa_fwd_batch_decode_split_kv_fp16_fp16_fp16": {
         "signature":
         split_kv_signature.format(input_dtype="fp16", cache_dtype="fp16", output_dtype="fp16"), "grid":
         _split_kv_grid, "triton_algo_infos": [
-            get_triton_split_kv_algo_info(96, 12, 128, 128, 1, split_kv=32, soft_cap=0),
-            get_triton_split_kv_algo_info(96 // 4, 12 // 4, 128, 128, 1, split_kv=32, soft_cap=0),
+            get_triton_split_kv_algo_info(q_heads, kv_heads, 128, 128, 1, split_kv=split_kv, soft_cap=0)
+            for q_heads, kv_heads in [(96, 12), (96 // 4, 12 // 4)]
+            for split_kv in AOT_KV_SPLITS
         ]
+    }, **{
+        f"gqa_fwd_batch_decode_split_kv_fp16_{cache_dtype}_fp32": {
+            "signature":
+            split_kv_signature.format(input_dtype="fp16", cache_dtype=cache_dtype, output_dtype="fp32"), "grid":
+            _split_kv_grid, "triton_algo_infos": [
+                get_triton_split_kv_algo_info(q_heads, kv_heads, 128, 128, 1, split_kv=split_kv, soft_cap=0,
+                                              kv_quant=True)
+                for q_heads, kv_heads in [(96, 12), (96 // 4, 12 // 4)]
+                for split_kv in AOT_KV_SPLITS
+            ]
+        }
+        for cache_dtype in AOT_QUANT_KV_DTYPES.values()
     }
 })
 @triton.jit
@@ -148,6 +172,10 @@ def kernel_gqa_fwd_batch_decode_split_kv(
     stride_o_h,
     stride_o_split,
     stride_table_bs,
+    k_scale_ptr,
+    v_scale_ptr,
+    stride_scale_page,
+    stride_scale_h,
     # constants
     kv_group_num: tl.constexpr,
     q_head_num: tl.constexpr,
@@ -161,6 +189,7 @@ def kernel_gqa_fwd_batch_decode_split_kv(
     soft_cap: tl.constexpr,
     K_DIM: tl.constexpr,
     V_DIM: tl.constexpr,
+    KV_QUANT: tl.constexpr = False,
 ):
     bid = tl.program_id(0)
     hid = tl.program_id(1)
@@ -213,6 +242,11 @@ def kernel_gqa_fwd_batch_decode_split_kv(
                           & mask_dpe[:, None], other=0.0)
             qk += tl.dot(qpe, kpe.to(qpe.dtype))
 
+        if KV_QUANT:
+            # dequantize k by scaling qk, per token of the page
+            offs_scale = kv_page_number * stride_scale_page + kv_hid * stride_scale_h
+            qk *= tl.load(k_scale_ptr + offs_scale, mask=offs_n < split_kv_end, other=0.0)[None, :]
+
         qk *= sm_scale
 
         if soft_cap > 0:
@@ -227,7 +261,12 @@ def kernel_gqa_fwd_batch_decode_split_kv(
         re_scale = libdevice.fast_expf(e_max - n_e_max)
         p = libdevice.fast_expf(qk - n_e_max[:, None])
         acc *= re_scale[:, None]
-        acc += tl.dot(p.to(v.dtype), v)
+        if KV_QUANT:
+            # dequantize v by scaling p
+            v_scale = tl.load(v_scale_ptr + offs_scale, mask=offs_n < split_kv_end, other=0.0)
+            acc += tl.dot((p * v_scale[None, :]).to(q.dtype), v.to(q.dtype))
+        else:
+            acc += tl.dot(p.to(v.dtype), v)
 
         e_sum = e_sum * re_scale + tl.sum(p, 1)
         e_max = n_e_max
@@ -545,6 +584,7 @@ persistent_signature = (
             "i32:16", "i32:16",  # "i32:1",
             "i32:16", "i32:16", "i32",  # "i32:1",
             "i32:16", "i32:16", "i32",  # "i32:1"
+            "*fp32", "*fp32", "i32", "i32",  # k_scale/v_scale, their page/head strides
         ]) + ", ")
     +  # strides: q_bs/q_h/q_d/k_cache_bs/k_cache_h/k_cache_d/v_cache_bs/v_cache_h/v_cache_d/o_bs/o_h/o_split/o_d/final_o_bs/final_o_h/table_bs/table_d
     ("%kv_group_num, "
@@ -559,18 +599,20 @@ persistent_signature = (
      "%PAGE_SIZE, "
      "%soft_cap, "
      "%K_DIM, "
-     "%V_DIM"))
+     "%V_DIM, "
+     "%KV_QUANT"))
 
 _persistent_grid = ["132", "1", "1"]
 
 
 def get_triton_persistent_algo_info(q_heads, kv_heads, q_head_dim, v_head_dim, page_size, split_kv=32, soft_cap=0.0,
-                                    max_kv_len=8192):
+                                    max_kv_len=8192, kv_quant=False):
     return {
         "kv_group_num": q_heads // kv_heads, "max_kv_seq_len": max_kv_len, "q_head_num": q_heads, "BLOCK_HEAD_DIM":
         2**int(math.log2(q_head_dim)), "BLOCK_DPE": q_head_dim - 2**int(math.log2(q_head_dim)), "BLOCK_DV":
         triton.next_power_of_2(v_head_dim), "BLOCK_N": 64, "BLOCK_H": 16, "NUM_KV_SPLITS": split_kv, "PAGE_SIZE":
-        page_size, "soft_cap": soft_cap, "K_DIM": q_head_dim, "V_DIM": v_head_dim, "num_warps": 8, "num_stages": 2
+        page_size, "soft_cap": soft_cap, "K_DIM": q_head_dim, "V_DIM": v_head_dim, "KV_QUANT": kv_quant,
+        "num_warps": 8, "num_stages": 2
     }
 
 
@@ -581,6 +623,16 @@ def get_triton_persistent_algo_info(q_heads, kv_heads, q_head_dim, v_head_dim, p
         _persistent_grid, "triton_algo_infos": [
             get_triton_persistent_algo_info(96, 12, 128, 128, 1, split_kv=32, soft_cap=0, max_kv_len=8192),
         ]
+    }, **{
+        f"gqa_fwd_batch_decode_split_kv_persistent_fp16_{cache_dtype}_fp16": {
+            "signature":
+            persistent_signature.format(input_dtype="fp16", cache_dtype=cache_dtype, output_dtype="fp16"), "grid":
+            _persistent_grid, "triton_algo_infos": [
+                get_triton_persistent_algo_info(96, 12, 128, 128, 1, split_kv=32, soft_cap=0, max_kv_len=8192,
+                                                kv_quant=True),
+            ]
+        }
+        for cache_dtype in AOT_QUANT_KV_DTYPES.values()
     }
 })
 @triton.jit
@@ -614,6 +666,10 @@ def kernel_gqa_fwd_batch_decode_split_kv_persistent(
     stride_final_o_h,
     stride_table_bs,
     # stride_table_d,
+    k_scale_ptr,
+    v_scale_ptr,
+    stride_scale_page,
+    stride_scale_h,
     # constants
     kv_group_num: tl.constexpr,
     max_kv_seq_len: tl.constexpr,
@@ -628,6 +684,7 @@ def kernel_gqa_fwd_batch_decode_split_kv_persistent(
     soft_cap: tl.constexpr,
     K_DIM: tl.constexpr,
     V_DIM: tl.constexpr,
+    KV_QUANT: tl.constexpr = False,
 ):
     sm_id = tl.program_id(0)
     num_sms = tl.num_programs(0)
@@ -688,6 +745,11 @@ def kernel_gqa_fwd_batch_decode_split_kv_persistent(
                               & mask_dpe[:, None], other=0.0)
                 qk += tl.dot(qpe, kpe.to(qpe.dtype))
 
+            if KV_QUANT:
+                # dequantize k by scaling qk, per token of the page
+                offs_scale = kv_page_number * stride_scale_page + kv_hid * stride_scale_h
+                qk *= tl.load(k_scale_ptr + offs_scale, mask=offs_n < split_kv_end, other=0.0)[None, :]
+
             qk *= sm_scale
 
             if soft_cap > 0:
@@ -704,7 +766,12 @@ def kernel_gqa_fwd_batch_decode_split_kv_persistent(
             re_scale = libdevice.fast_expf(e_max - n_e_max)
             p = libdevice.fast_expf(qk - n_e_max[:, None])
             acc *= re_scale[:, None]
-            acc += tl.dot(p.to(v.dtype), v)
+            if KV_QUANT:
+                # dequantize v by scaling p
+                v_scale = tl.load(v_scale_ptr + offs_scale, mask=offs_n < split_kv_end, other=0.0)
+                acc += tl.dot((p * v_scale[None, :]).to(q.dtype), v.to(q.dtype))
+            else:
+                acc += tl.dot(p.to(v.dtype), v)
 
             e_sum = e_sum * re_scale + tl.sum(p, 1)
             e_max = n_e_max
@@ -760,8 +827,59 @@ def kernel_gqa_fwd_batch_decode_split_kv_persistent(
         )
 
 
+_kv_split_planners = {}
+
+
+def get_kv_split_planner(device, aot: bool = False) -> KVSplitPlanner:
+    """ the planner of the device, over AOT_KV_SPLITS with aot """
+    device = torch.device(device)
+    key = (device.index, aot)
+    if key not in _kv_split_planners:
+        num_sms = torch.cuda.get_device_properties(device).multi_processor_count
+        _kv_split_planners[key] = KVSplitPlanner(num_sms, candidates=AOT_KV_SPLITS) if aot else KVSplitPlanner(num_sms)
+    return _kv_split_planners[key]
+
+
+def _get_num_kv_splits(kv_split, q, kv_heads, output_split, max_kv_len, mean_kv_len, aot=False):
+    """ kv_split if given (not -1), else planned from the host side kv length hints, else 32 """
+    if kv_split != -1:
+        return kv_split
+    if max_kv_len is None:
+        return 32
+    batch, q_heads, _ = q.shape
+    max_splits = None if output_split is None else output_split.shape[2]
+    return get_kv_split_planner(q.device, aot).plan(batch, q_heads, kv_heads, max_kv_len, mean_kv_len,
+                                                    max_splits).num_kv_splits
+
+
+def _kv_scale_args(k_cache, k_scale, v_scale):
+    """ (k_scale, v_scale, stride_scale_page, stride_scale_h, KV_QUANT) kernel args, see triton_dist.kernels.kv_quant
+    """
+    if k_scale is None:
+        assert v_scale is None and not is_quantized_kv_dtype(k_cache.dtype), \
+            f"a {k_cache.dtype} KV cache needs k_scale and v_scale"
+        return None, None, 0, 0, False
+    assert is_quantized_kv_dtype(k_cache.dtype), f"k_scale / v_scale are for quantized KV caches, not {k_cache.dtype}"
+    assert k_scale.dtype == v_scale.dtype == torch.float32
+    assert k_scale.shape == v_scale.shape == (k_cache.shape[0], k_cache.shape[2])
+    assert k_scale.stride() == v_scale.stride()
+    return k_scale, v_scale, k_scale.stride(0), k_scale.stride(1), True
+
+
+def _aot_kv_scale_args(kv_scale_args):
+    k_scale, v_scale, stride_scale_page, stride_scale_h, _ = kv_scale_args
+    return (0 if k_scale is None else k_scale.data_ptr(), 0 if v_scale is None else v_scale.data_ptr(),
+            stride_scale_page, stride_scale_h)
+
+
 def gqa_fwd_batch_decode(q, k_cache, v_cache, workspace, q_lens, kv_lens, block_table, scale, soft_cap=0.0,
-                         output_split=None, output_combine=None, kv_split=-1):
+                         output_split=None, output_combine=None, kv_split=-1, max_kv_len=None, mean_kv_len=None,
+                         k_scale=None, v_scale=None):
+    """ kv_split: -1 to plan it from max_kv_len / mean_kv_len, host side hints of kv_lens (see get_kv_split_planner),
+    or 32 without them
+    k_scale, v_scale: fp32 [num_pages, kv_heads] scales of an int8 / fp8 k_cache and v_cache, see
+    triton_dist.kernels.kv_quant
+    """
     batch, q_heads, q_head_dim = q.shape
     _, page_size, kv_heads, k_head_dim = k_cache.shape
     assert page_size == v_cache.shape[1] and kv_heads == v_cache.shape[2] and k_head_dim == q_head_dim
@@ -776,7 +894,8 @@ def gqa_fwd_batch_decode(q, k_cache, v_cache, workspace, q_lens, kv_lens, block_
     assert q_heads % kv_heads == 0
 
     BLOCK_H = 16
-    NUM_KV_SPLITS = 32 if kv_split == -1 else kv_split
+    NUM_KV_SPLITS = _get_num_kv_splits(kv_split, q, kv_heads, output_split, max_kv_len, mean_kv_len)
+    kv_scale_args = _kv_scale_args(k_cache, k_scale, v_scale)
 
     grid_split_kv = (batch, triton.cdiv(q_heads, min(BLOCK_H, kv_group_num)), NUM_KV_SPLITS)
 
@@ -806,6 +925,7 @@ def gqa_fwd_batch_decode(q, k_cache, v_cache, workspace, q_lens, kv_lens, block_
         output_split.stride(1),
         output_split.stride(2),
         block_table.stride(0),
+        *kv_scale_args[:4],
         # constants
         kv_group_num,
         q_heads,
@@ -819,6 +939,7 @@ def gqa_fwd_batch_decode(q, k_cache, v_cache, workspace, q_lens, kv_lens, block_
         soft_cap,
         k_head_dim,
         v_head_dim,
+        kv_scale_args[4],
         num_warps=4,
         num_stages=2,
     )
@@ -845,7 +966,8 @@ def gqa_fwd_batch_decode(q, k_cache, v_cache, workspace, q_lens, kv_lens, block_
 
 
 def gqa_fwd_batch_decode_intra_rank(q, k_cache, v_cache, workspace, q_lens, kv_lens, block_table, scale, soft_cap=0.0,
-                                    output_split=None, output_combine=None, kv_split=-1):
+                                    output_split=None, output_combine=None, kv_split=-1, max_kv_len=None,
+                                    mean_kv_len=None, k_scale=None, v_scale=None):
     batch, q_heads, q_head_dim = q.shape
     _, page_size, kv_heads, k_head_dim = k_cache.shape
     assert page_size == v_cache.shape[1] and kv_heads == v_cache.shape[2] and k_head_dim == q_head_dim
@@ -860,7 +982,8 @@ def gqa_fwd_batch_decode_intra_rank(q, k_cache, v_cache, workspace, q_lens, kv_l
     assert q_heads % kv_heads == 0
 
     BLOCK_H = 16
-    NUM_KV_SPLITS = 32 if kv_split == -1 else kv_split
+    NUM_KV_SPLITS = _get_num_kv_splits(kv_split, q, kv_heads, output_split, max_kv_len, mean_kv_len)
+    kv_scale_args = _kv_scale_args(k_cache, k_scale, v_scale)
 
     grid_split_kv = (batch, triton.cdiv(q_heads, min(BLOCK_H, kv_group_num)), NUM_KV_SPLITS)
 
@@ -890,6 +1013,7 @@ def gqa_fwd_batch_decode_intra_rank(q, k_cache, v_cache, workspace, q_lens, kv_l
         output_split.stride(1),
         output_split.stride(2),
         block_table.stride(0),
+        *kv_scale_args[:4],
         # constants
         kv_group_num,
         q_heads,
@@ -903,6 +1027,7 @@ def gqa_fwd_batch_decode_intra_rank(q, k_cache, v_cache, workspace, q_lens, kv_l
         soft_cap,
         k_head_dim,
         v_head_dim,
+        kv_scale_args[4],
         num_warps=4,
         num_stages=2,
     )
@@ -929,7 +1054,8 @@ def gqa_fwd_batch_decode_intra_rank(q, k_cache, v_cache, workspace, q_lens, kv_l
 
 
 def gqa_fwd_batch_decode_persistent(q, k_cache, v_cache, workspace, q_lens, kv_lens, block_table, scale, soft_cap=0,
-                                    output_split=None, output_combine=None, kv_split=-1):
+                                    output_split=None, output_combine=None, kv_split=-1, max_kv_len=None,
+                                    mean_kv_len=None, k_scale=None, v_scale=None):
     batch, q_heads, q_head_dim = q.shape
     _, page_size, kv_heads, k_head_dim = k_cache.shape
     assert page_size == v_cache.shape[1] and kv_heads == v_cache.shape[2] and k_head_dim == q_head_dim
@@ -944,7 +1070,8 @@ def gqa_fwd_batch_decode_persistent(q, k_cache, v_cache, workspace, q_lens, kv_l
     assert q_heads % kv_heads == 0
 
     BLOCK_H = 16
-    NUM_KV_SPLITS = 32 if kv_split == -1 else kv_split
+    NUM_KV_SPLITS = _get_num_kv_splits(kv_split, q, kv_heads, output_split, max_kv_len, mean_kv_len)
+    kv_scale_args = _kv_scale_args(k_cache, k_scale, v_scale)
 
     grid_split_kv = (132, )
 
@@ -983,6 +1110,7 @@ def gqa_fwd_batch_decode_persistent(q, k_cache, v_cache, workspace, q_lens, kv_l
         output_combine.stride(1),
         block_table.stride(0),
         # block_table.stride(1),
+        *kv_scale_args[:4],
         # constants
         kv_group_num,
         8192,  # max_kv_seq_len
@@ -997,6 +1125,7 @@ def gqa_fwd_batch_decode_persistent(q, k_cache, v_cache, workspace, q_lens, kv_l
         soft_cap,
         k_head_dim,
         v_head_dim,
+        kv_scale_args[4],
         num_warps=8,
         num_stages=2,
         launch_cooperative_grid=True,
@@ -1006,7 +1135,8 @@ def gqa_fwd_batch_decode_persistent(q, k_cache, v_cache, workspace, q_lens, kv_l
 
 
 def gqa_fwd_batch_decode_aot(stream, q, k_cache, v_cache, workspace, q_lens, kv_lens, block_table, scale, soft_cap=0,
-                             output_split=None, output_combine=None, kv_split=-1):
+                             output_split=None, output_combine=None, kv_split=-1, max_kv_len=None,
+                             mean_kv_len=None, k_scale=None, v_scale=None):
     if use_aot:
         batch, q_heads, q_head_dim = q.shape
         _, page_size, kv_heads, k_head_dim = k_cache.shape
@@ -1015,7 +1145,8 @@ def gqa_fwd_batch_decode_aot(stream, q, k_cache, v_cache, workspace, q_lens, kv_
 
         assert q_heads % kv_heads == 0
 
-        NUM_KV_SPLITS = 32 if kv_split == -1 else kv_split
+        NUM_KV_SPLITS = _get_num_kv_splits(kv_split, q, kv_heads, output_split, max_kv_len, mean_kv_len,
+                                           aot=True)
 
         output_split = torch.empty([batch, q_heads, NUM_KV_SPLITS, v_head_dim +
                                     1], dtype=torch.float16, device=q.device) if output_split is None else output_split
@@ -1035,8 +1166,16 @@ def gqa_fwd_batch_decode_aot(stream, q, k_cache, v_cache, workspace, q_lens, kv_
         else:
             raise RuntimeError("Unsupported data type of intermediate output:", output_split.dtype)
 
+        kv_scale_args = _kv_scale_args(k_cache, k_scale, v_scale)
+        if kv_scale_args[4]:
+            assert output_split.dtype == torch.float32, "quantized KV caches are AOT compiled for fp32 output_split"
+            kernel_name = f"gqa_fwd_batch_decode_split_kv_fp16_{AOT_QUANT_KV_DTYPES[k_cache.dtype]}_fp32"
+            kernel_split = getattr(distributed, kernel_name)
+            split_algo_info = getattr(distributed, f"{kernel_name}__triton_algo_info_t")()
+
         py_split_algo_info = get_triton_split_kv_algo_info(q_heads, kv_heads, q_head_dim, v_head_dim, page_size,
-                                                           split_kv=NUM_KV_SPLITS, soft_cap=soft_cap)
+                                                           split_kv=NUM_KV_SPLITS, soft_cap=soft_cap,
+                                                           kv_quant=kv_scale_args[4])
         py_combine_algo_info = get_triton_combine_kv_algo_info(split_kv=NUM_KV_SPLITS, v_head_dim=v_head_dim)
         for k, v in py_split_algo_info.items():
             setattr(split_algo_info, k, v)
@@ -1053,6 +1192,7 @@ def gqa_fwd_batch_decode_aot(stream, q, k_cache, v_cache, workspace, q_lens, kv_
                      v_cache.stride(-3), v_cache.stride(-2),  # v_cache
                      output_split.stride(0), output_split.stride(1), output_split.stride(2),  # output_split
                      block_table.stride(0),  # block_table
+                     *_aot_kv_scale_args(kv_scale_args),  # k_scale/v_scale
                      # algo_info
                      split_algo_info)
         kernel_combine(stream.cuda_stream, output_split.data_ptr(), output_combine.data_ptr(), kv_lens.data_ptr(),
@@ -1064,7 +1204,8 @@ def gqa_fwd_batch_decode_aot(stream, q, k_cache, v_cache, workspace, q_lens, kv_
 
 
 def gqa_fwd_batch_decode_intra_rank_aot(stream, q, k_cache, v_cache, workspace, q_lens, kv_lens, block_table, scale,
-                                        soft_cap=0, output_split=None, output_combine=None, kv_split=-1):
+                                        soft_cap=0, output_split=None, output_combine=None, kv_split=-1,
+                                        max_kv_len=None, mean_kv_len=None, k_scale=None, v_scale=None):
     if use_aot:
         batch, q_heads, q_head_dim = q.shape
         _, page_size, kv_heads, k_head_dim = k_cache.shape
@@ -1073,7 +1214,8 @@ def gqa_fwd_batch_decode_intra_rank_aot(stream, q, k_cache, v_cache, workspace,
 
         assert q_heads % kv_heads == 0
 
-        NUM_KV_SPLITS = 32 if kv_split == -1 else kv_split
+        NUM_KV_SPLITS = _get_num_kv_splits(kv_split, q, kv_heads, output_split, max_kv_len, mean_kv_len,
+                                           aot=True)
 
         output_split = torch.empty([batch, q_heads, NUM_KV_SPLITS, v_head_dim +
                                     1], dtype=torch.float16, device=q.device) if output_split is None else output_split
@@ -1093,8 +1235,16 @@ def gqa_fwd_batch_decode_intra_rank_aot(stream, q, k_cache, v_cache, workspace,
         else:
             raise RuntimeError("Unsupported data type of intermediate output:", output_split.dtype)
 
+        kv_scale_args = _kv_scale_args(k_cache, k_scale, v_scale)
+        if kv_scale_args[4]:
+            assert output_split.dtype == torch.float32, "quantized KV caches are AOT compiled for fp32 output_split"
+            kernel_name = f"gqa_fwd_batch_decode_split_kv_fp16_{AOT_QUANT_KV_DTYPES[k_cache.dtype]}_fp32"
+            kernel_split = getattr(distributed, kernel_name)
+            split_algo_info = getattr(distributed, f"{kernel_name}__triton_algo_info_t")()
+
         py_split_algo_info = get_triton_split_kv_algo_info(q_heads, kv_heads, q_head_dim, v_head_dim, page_size,
-                                                           split_kv=NUM_KV_SPLITS, soft_cap=soft_cap)
+                                                           split_kv=NUM_KV_SPLITS, soft_cap=soft_cap,
+                                                           kv_quant=kv_scale_args[4])
         py_combine_algo_info = get_triton_combine_kv_algo_info(split_kv=NUM_KV_SPLITS, v_head_dim=v_head_dim)
         for k, v in py_split_algo_info.items():
             setattr(split_algo_info, k, v)
@@ -1111,6 +1261,7 @@ def gqa_fwd_batch_decode_intra_rank_aot(stream, q, k_cache, v_cache, workspace,
                      v_cache.stride(-3), v_cache.stride(-2),  # v_cache
                      output_split.stride(0), output_split.stride(1), output_split.stride(2),  # output_split
                      block_table.stride(0),  # block_table
+                     *_aot_kv_scale_args(kv_scale_args),  # k_scale/v_scale
                      # algo_info
                      split_algo_info)
         kernel_combine(stream.cuda_stream, output_split.data_ptr(), output_combine.data_ptr(), kv_lens.data_ptr(),
@@ -1122,7 +1273,8 @@ def gqa_fwd_batch_decode_intra_rank_aot(stream, q, k_cache, v_cache, workspace,
 
 
 def gqa_fwd_batch_decode_persistent_aot(stream, q, k_cache, v_cache, workspace, q_lens, kv_lens, block_table, scale,
-                                        soft_cap=0, output_split=None, output_combine=None, kv_split=-1):
+                                        soft_cap=0, output_split=None, output_combine=None, kv_split=-1,
+                                        max_kv_len=None, mean_kv_len=None, k_scale=None, v_scale=None):
     if use_aot:
         batch, q_heads, q_head_dim = q.shape
         _, page_size, kv_heads, k_head_dim = k_cache.shape
@@ -1131,17 +1283,22 @@ def gqa_fwd_batch_decode_persistent_aot(stream, q, k_cache, v_cache, workspace,
 
         assert q_heads % kv_heads == 0
 
-        NUM_KV_SPLITS = 32 if kv_split == -1 else kv_split
+        NUM_KV_SPLITS = _get_num_kv_splits(kv_split, q, kv_heads, output_split, max_kv_len, mean_kv_len,
+                                           aot=True)
 
         output_split = torch.empty([batch, q_heads, NUM_KV_SPLITS, v_head_dim +
                                     1], dtype=torch.float32, device=q.device) if output_split is None else output_split
         output_combine = torch.empty([batch, q_heads, v_head_dim], dtype=torch.float16,
                                      device=q.device) if output_combine is None else output_combine
 
-        kernel = distributed.gqa_fwd_batch_decode_split_kv_persistent_fp16_fp16_fp16
-        algo_info = distributed.gqa_fwd_batch_decode_split_kv_persistent_fp16_fp16_fp16__triton_algo_info_t()
+        kv_scale_args = _kv_scale_args(k_cache, k_scale, v_scale)
+        cache_dtype = AOT_QUANT_KV_DTYPES[k_cache.dtype] if kv_scale_args[4] else "fp16"
+        kernel_name = f"gqa_fwd_batch_decode_split_kv_persistent_fp16_{cache_dtype}_fp16"
+        kernel = getattr(distributed, kernel_name)
+        algo_info = getattr(distributed, f"{kernel_name}__triton_algo_info_t")()
         py_algo_info = get_triton_persistent_algo_info(q_heads, kv_heads, q_head_dim, v_head_dim, page_size,
-                                                       split_kv=NUM_KV_SPLITS, soft_cap=soft_cap, max_kv_len=8192)
+                                                       split_kv=NUM_KV_SPLITS, soft_cap=soft_cap, max_kv_len=8192,
+                                                       kv_quant=kv_scale_args[4])
         for k, v in py_algo_info.items():
             setattr(algo_info, k, v)
         kernel(stream.cuda_stream, q.data_ptr(), k_cache.data_ptr(), v_cache.data_ptr(), output_split.data_ptr(),
@@ -1154,6 +1311,7 @@ def gqa_fwd_batch_decode_persistent_aot(stream, q, k_cache, v_cache, workspace,
                v_cache.stride(-3), v_cache.stride(-2),  # v_cache.stride(-1),
                output_split.stride(0), output_split.stride(1), output_split.stride(2),  # output_split.stride(3),
                output_combine.stride(0), output_combine.stride(1), block_table.stride(0),  # block_table.stride(1),
+               *_aot_kv_scale_args(kv_scale_args),  # k_scale/v_scale
                # algo_info
                algo_info)
         return output_combine
@@ -34,6 +34,7 @@ from triton.language.extra.cuda.language_extra import (__syncthreads, atomic_add
 from triton_dist.kernels.nvidia.reduce_scatter import (ReduceScatter2DContext, create_reduce_scater_2d_ctx,
                                                        reduce_scatter_2d_op, ring_reduce)
 from triton_dist.kernels.nvidia.gemm_rs_threadblock_swizzle import threadblock_swizzle_gemm_reduce_scatter_kernel
+from triton_dist.kernels.swizzle_lut import GEMM_RS, get_swizzle_lut_tensor
 from triton_dist.utils import nvshmem_barrier_all_on_stream, nvshmem_create_tensors, nvshmem_free_tensor_sync
 
 
@@ -146,8 +147,11 @@ def kernel_gemm_rs_producer_persistent(
     GROUP_SIZE_M: tl.constexpr,
     EPILOGUE_SUBTILE: tl.constexpr,
     NUM_SMS: tl.constexpr,
+    swizzle_lut_ptr=None,
+    USE_SWIZZLE_LUT: tl.constexpr = False,
 ):  #
     # Matmul using TMA and device-side descriptor creation
+    # USE_SWIZZLE_LUT: swizzle_lut_ptr is the multi-node tile order of triton_dist.kernels.swizzle_lut
     rank = dl.rank()
     dtype = c_ptr.dtype.element_ty
     start_pid = tl.program_id(axis=0)
@@ -202,7 +206,11 @@ def kernel_gemm_rs_producer_persistent(
             tile_id += NUM_SMS
             pid_m, pid_n = swizzle_2d(tile_id, num_pid_m, num_pid_n, GROUP_SIZE_M)
             if NNODES != 1:  # with complex threadblock swizzle logic
-                pid_m = threadblock_swizzle_gemm_reduce_scatter_kernel(pid_m, M, rank, WORLD_SIZE, NNODES, BLOCK_SIZE_M)
+                if USE_SWIZZLE_LUT:
+                    pid_m = tl.load(swizzle_lut_ptr + pid_m)
+                else:
+                    pid_m = threadblock_swizzle_gemm_reduce_scatter_kernel(pid_m, M, rank, WORLD_SIZE, NNODES,
+                                                                           BLOCK_SIZE_M)
             else:
                 pid_m = (pid_m + pid_m_offset) % num_pid_m
 
@@ -319,9 +327,12 @@ def kernel_gemm_rs_producer_non_persistent(
     BLOCK_SIZE_N: tl.constexpr,
     BLOCK_SIZE_K: tl.constexpr,  #
     GROUP_SIZE_M: tl.constexpr,
+    swizzle_lut_ptr=None,
+    USE_SWIZZLE_LUT: tl.constexpr = False,
 ):
     """Kernel for computing the matmul C = A x B.
     A has shape (M, K), B has shape (K, N) and C has shape (M, N)
+    With USE_SWIZZLE_LUT, the multi-node tile order is read from swizzle_lut_ptr (see triton_dist.kernels.swizzle_lut)
     """
     tl.static_assert(a_ptr.dtype.is_ptr(), "A should be a pointer")
     tl.static_assert(b_ptr.dtype.is_ptr(), "B should be a pointer")
@@ -342,7 +353,10 @@ def kernel_gemm_rs_producer_non_persistent(
     pid_m, pid_n = swizzle_2d(pid, num_pid_m, num_pid_n, GROUP_SIZE_M)
 
     if NNODES != 1:  # with complex threadblock swizzle logic
-        pid_m = threadblock_swizzle_gemm_reduce_scatter_kernel(pid_m, M, rank, WORLD_SIZE, NNODES, BLOCK_SIZE_M)
+        if USE_SWIZZLE_LUT:
+            pid_m = tl.load(swizzle_lut_ptr + pid_m)
+        else:
+            pid_m = threadblock_swizzle_gemm_reduce_scatter_kernel(pid_m, M, rank, WORLD_SIZE, NNODES, BLOCK_SIZE_M)
     else:
         pid_m_offset = (rank + 1) * M_per_rank // BLOCK_SIZE_M
         pid_m = (pid_m + pid_m_offset) % num_pid_m
@@ -420,7 +434,7 @@ def kernel_gemm_rs_producer_non_persistent(
 
 
 def gemm_rs_producer_persistent(a, b, c, barrier, workspace, world_size, local_world_size, fuse_scatter, num_gemm_sms,
-                                triton_config: triton.Config):
+                                triton_config: triton.Config, swizzle_lut=None):
     # Check constraints.
     assert a.shape[1] == b.shape[1], "Incompatible dimensions"  # b is transposed
     assert a.dtype == b.dtype, "Incompatible dtypes"
@@ -434,13 +448,15 @@ def gemm_rs_producer_persistent(a, b, c, barrier, workspace, world_size, local_w
     ), )
 
     compiled = kernel_gemm_rs_producer_persistent[grid](a, b, c, M, N, local_K, barrier, workspace, fuse_scatter,
-                                                        local_world_size, world_size, **triton_config.all_kwargs())
+                                                        local_world_size, world_size, swizzle_lut_ptr=swizzle_lut,
+                                                        USE_SWIZZLE_LUT=swizzle_lut is not None,
+                                                        **triton_config.all_kwargs())
 
     return compiled
 
 
 def gemm_rs_producer_non_persistent(a, b, c, barrier, workspace, world_size, local_world_size, fuse_scatter,
-                                    triton_config: triton.Config):
+                                    triton_config: triton.Config, swizzle_lut=None):
     # Check constraints.
     assert a.shape[1] == b.shape[1], "Incompatible dimensions"  # b is transposed
     assert a.dtype == b.dtype, "Incompatible dtypes"
@@ -467,6 +483,8 @@ def gemm_rs_producer_non_persistent(a, b, c, barrier, workspace, world_size, loc
         fuse_scatter,
         local_world_size,
         world_size,
+        swizzle_lut_ptr=swizzle_lut,
+        USE_SWIZZLE_LUT=swizzle_lut is not None,
         **triton_config.all_kwargs(),
     )
     return compiled
@@ -543,6 +561,12 @@ def gemm_rs_op(input, weight, ctx: GEMMReduceScatterTensorParallelContext, persi
 
     triton.set_allocator(alloc_fn)
 
+    # multi-node tile order as a precomputed table, None keeps the in-kernel swizzle
+    swizzle_lut = None
+    if ctx.rs_ctx.nnodes > 1:
+        swizzle_lut = get_swizzle_lut_tensor(GEMM_RS, M, ctx.rs_ctx.rank, world_size, ctx.rs_ctx.nnodes, ctx.BLOCK_M,
+                                             input.device)
+
     if persistent:
         triton_config = triton.Config(
             {
@@ -550,7 +574,7 @@ def gemm_rs_op(input, weight, ctx: GEMMReduceScatterTensorParallelContext, persi
                 ctx.GROUP_M, "NUM_SMS": num_gemm_sms, "EPILOGUE_SUBTILE": False
             }, num_stages=ctx.stages, num_warps=8)
         gemm_rs_producer_persistent(input, weight, gemm_out, scatter_signal, workspace, world_size, local_world_size,
-                                    fuse_scatter, num_gemm_sms, triton_config)
+                                    fuse_scatter, num_gemm_sms, triton_config, swizzle_lut)
     else:
         triton_config = triton.Config(
             {
@@ -559,7 +583,7 @@ def gemm_rs_op(input, weight, ctx: GEMMReduceScatterTensorParallelContext, persi
             }, num_stages=ctx.stages, num_warps=8)
         triton_config = update_triton_config(M, N, local_K, input.dtype, world_size, local_world_size, triton_config)
         gemm_rs_producer_non_persistent(input, weight, gemm_out, scatter_signal, workspace, world_size,
-                                        local_world_size, fuse_scatter, triton_config)
+                                        local_world_size, fuse_scatter, triton_config, swizzle_lut)
 
     if not fuse_scatter:
         with torch.cuda.stream(rs_stream):
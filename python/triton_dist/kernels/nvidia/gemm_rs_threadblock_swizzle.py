@@ -248,6 +248,8 @@ def cdiv(n, m):
 
 
 if __name__ == "__main__":
+    from triton_dist.kernels.swizzle_lut import gemm_rs_swizzle_lut
+
     LOCAL_WORLD_SIZE = 8
     NNODES = 2
     WORLD_SIZE = LOCAL_WORLD_SIZE * NNODES
@@ -267,10 +269,12 @@ if __name__ == "__main__":
         for rank in range(WORLD_SIZE):
             # rank = 0
             swizzled = []
+            lut = gemm_rs_swizzle_lut(M, rank, WORLD_SIZE, NNODES, BLOCK_SIZE_M)
             for n in range(cdiv(M, BLOCK_SIZE_M)):
                 x = threadblock_swizzle_gemm_reduce_scatter_triton(n, M, rank, WORLD_SIZE, NNODES, BLOCK_SIZE_M)
                 y = threadblock_swizzle_gemm_reduce_scatter(n, M, rank, WORLD_SIZE, NNODES, BLOCK_SIZE_M)
                 assert x == y, f"{n} => {x} {y}"
+                assert x == lut[n], f"{n} => {x} {lut[n]}"
                 # exit()
                 assert x < cdiv(M, BLOCK_SIZE_M), f"{n} => {x}"
                 swizzled.append(x)
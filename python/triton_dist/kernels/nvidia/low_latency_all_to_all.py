@@ -26,9 +26,10 @@ import torch
 import triton
 import triton.language as tl
 
-from typing import Optional
+from typing import List, Optional
 from triton_dist.language.extra import libshmem_device
-from triton.language.extra.cuda.language_extra import tid
+from triton.language.extra.cuda.language_extra import __syncthreads, tid
+from triton_dist.kernels.graph_safety import GraphHazard
 from triton_dist.utils import NVSHMEM_SIGNAL_DTYPE, nvshmem_free_tensor_sync, nvshmem_create_tensor
 
 
@@ -52,6 +53,8 @@ def all_to_all_kernel(
     NUM_TOT_EXPERTS: tl.constexpr,
     ELEMENT_SIZE: tl.constexpr = 2,
     SCALE_ELEMENT_SIZE: tl.constexpr = 4,
+    signal_value_ptr=None,
+    SIGNAL_ON_DEVICE: tl.constexpr = False,
 ):
     pid = tl.program_id(0)
     threadidx = tid(axis=0)
@@ -74,6 +77,10 @@ def all_to_all_kernel(
     tl.store(split_src_ptr + tl.arange(0, EXPERTS_PER_RANK), cumsum_eds - cumsum_sts)
 
     act_pos = call_count % 2
+    # SIGNAL_ON_DEVICE: call_count only picks the stage, and the signal value is read from signal_value_ptr
+    signal_value = call_count
+    if SIGNAL_ON_DEVICE:
+        signal_value = tl.load(signal_value_ptr)
     data_dst_ptr = data_dst + act_pos * WORLD_SIZE * MAX_M * HIDDEN + dst_off * HIDDEN
     split_dst_ptr = splits_dst + act_pos * NUM_TOT_EXPERTS + rank * EXPERTS_PER_RANK
     signal_ptr = signal + act_pos * WORLD_SIZE + rank
@@ -97,7 +104,7 @@ def all_to_all_kernel(
             scale_src + src_off,
             num_rows_cur_block * SCALE_ELEMENT_SIZE,
             signal_ptr,
-            call_count,
+            signal_value,
             libshmem_device.NVSHMEM_SIGNAL_SET,
             pid,
         )
@@ -107,14 +114,14 @@ def all_to_all_kernel(
         if not WITH_SCALE:
             libshmem_device.signal_op(
                 signal_ptr,
-                call_count,
+                signal_value,
                 libshmem_device.NVSHMEM_SIGNAL_SET,
                 pid,
             )
         libshmem_device.signal_wait_until(
             signal + act_pos * WORLD_SIZE + pid,
             libshmem_device.NVSHMEM_CMP_EQ,
-            call_count,
+            signal_value,
         )
 
 
@@ -123,6 +130,7 @@ def dtype_size_in_bytes(dtype: torch.dtype) -> int:
 
 
 class AllToAllContext:
+    OP_NAME = "fast_all_to_all"
 
     def __init__(
         self,
@@ -162,6 +170,24 @@ class AllToAllContext:
         # start from 1, becase the initial values of signal buffer is 0
         self.call_count = 1
         self.MOD_VALUE = 1000000
+        # see enable_graph_safe
+        self.graph_safe = False
+        self.signal_value_buf = torch.ones((1, ), dtype=NVSHMEM_SIGNAL_DTYPE, device="cuda")
+
+    def enable_graph_safe(self):
+        """ for CUDA graph capture: signal with a counter on device, advanced on the stream after each call, so the
+        replays of a captured graph keep signalling new values. call_count still picks the stage on the host: capture
+        an even number of calls per graph, so that the stages keep alternating over replays.
+
+        call on all ranks at the same point: the device counter starts from the host one.
+        """
+        self.signal_value_buf.fill_(self.call_count)
+        self.graph_safe = True
+
+    def graph_hazards(self) -> List[GraphHazard]:
+        if self.graph_safe:
+            return []
+        return [GraphHazard(self.OP_NAME, "signal value call_count advances on the host. call enable_graph_safe")]
 
     def finalize(self):
         nvshmem_free_tensor_sync(self.send_buf)
@@ -203,6 +229,9 @@ def fast_all_to_all(
 ):
     """
     low-latency all-to-all communication
+
+    experts are physical ones: with replicated experts (triton_dist.kernels.expert_placement), map the topk ids with
+    ExpertPlacement.expert_map before computing send_split_cumsum.
     """
     with_scale = send_scale is not None
 
@@ -243,7 +272,11 @@ def fast_all_to_all(
         NUM_TOT_EXPERTS=ctx.num_tot_experts,
         ELEMENT_SIZE=ctx.ele_size,
         SCALE_ELEMENT_SIZE=ctx.scale_ele_size,
+        signal_value_ptr=ctx.signal_value_buf,
+        SIGNAL_ON_DEVICE=ctx.graph_safe,
     )
+    if ctx.graph_safe:
+        ctx.signal_value_buf.add_(1)
 
     ctx.call_count = (ctx.call_count + 1) % ctx.MOD_VALUE
     out_lis: list[torch.Tensor] = []
@@ -277,3 +310,290 @@ def all_to_all_post_process(
     output_scale = torch.concat(scale_vec) if with_scale else None
 
     return output, output_scale
+
+
+@triton.jit
+def all_to_all_packed_kernel(
+    data_src,
+    data_dst,  # [2, MAX_RECV_M, HIDDEN]
+    splits_src,  # [2, NUM_TOT_EXPERTS]
+    splits_dst,  # [2, WORLD_SIZE, NUM_TOT_EXPERTS]
+    split_signal,  # [2, WORLD_SIZE]
+    data_signal,  # [2, WORLD_SIZE]
+    splits_cumsum,
+    scale_src,
+    scale_dst,  # [2, MAX_RECV_M]
+    rank: int,
+    call_count: int,
+    WITH_SCALE: tl.constexpr,
+    WORLD_SIZE: tl.constexpr,
+    WORLD_SIZE_PAD: tl.constexpr,
+    HIDDEN: tl.constexpr,
+    MAX_RECV_M: tl.constexpr,
+    EXPERTS_PER_RANK: tl.constexpr,
+    NUM_TOT_EXPERTS: tl.constexpr,
+    ELEMENT_SIZE: tl.constexpr = 2,
+    SCALE_ELEMENT_SIZE: tl.constexpr = 4,
+    signal_value_ptr=None,
+    SIGNAL_ON_DEVICE: tl.constexpr = False,
+):
+    """ program `pid` sends to rank pid. see triton_dist.kernels.packed_all_to_all for the layout.
+
+        1. put all my splits to row `rank` of the split buffer of pid
+        2. wait for splits of ranks < rank: the rows they send to pid go before mine
+        3. put my rows for pid right after theirs
+    """
+    pid = tl.program_id(0)
+    threadidx = tid(axis=0)
+    act_pos = call_count % 2
+    signal_value = call_count
+    if SIGNAL_ON_DEVICE:
+        signal_value = tl.load(signal_value_ptr)
+
+    splits_dst_stage = splits_dst + act_pos * WORLD_SIZE * NUM_TOT_EXPERTS
+    split_signal_stage = split_signal + act_pos * WORLD_SIZE
+    data_signal_stage = data_signal + act_pos * WORLD_SIZE
+
+    libshmem_device.putmem_signal_nbi_block(
+        splits_dst_stage + rank * NUM_TOT_EXPERTS,
+        splits_src + act_pos * NUM_TOT_EXPERTS,
+        NUM_TOT_EXPERTS * 4,  # now we use `int32` for splits
+        split_signal_stage + rank,
+        signal_value,
+        libshmem_device.NVSHMEM_SIGNAL_SET,
+        pid,
+    )
+
+    if threadidx < rank:
+        libshmem_device.signal_wait_until(split_signal_stage + threadidx, libshmem_device.NVSHMEM_CMP_EQ, signal_value)
+    __syncthreads()
+    src_ranks = tl.arange(0, WORLD_SIZE_PAD)[:, None]
+    experts = pid * EXPERTS_PER_RANK + tl.arange(0, EXPERTS_PER_RANK)[None, :]
+    counts = tl.load(splits_dst_stage + src_ranks * NUM_TOT_EXPERTS + experts, mask=src_ranks < rank, other=0,
+                     volatile=True)
+    dst_off = tl.sum(counts)
+
+    m_st = tl.load(splits_cumsum + pid * EXPERTS_PER_RANK)
+    m_ed = tl.load(splits_cumsum + (pid + 1) * EXPERTS_PER_RANK)
+    # never write past the stage. all_to_all_packed_post_process reports the overflow
+    num_rows_cur_block = tl.minimum(m_ed - m_st, tl.maximum(MAX_RECV_M - dst_off, 0))
+
+    libshmem_device.putmem_nbi_block(
+        data_dst + (act_pos * MAX_RECV_M + dst_off) * HIDDEN,
+        data_src + m_st * HIDDEN,
+        num_rows_cur_block * HIDDEN * ELEMENT_SIZE,
+        pid,
+    )
+    if WITH_SCALE:
+        libshmem_device.putmem_nbi_block(
+            scale_dst + act_pos * MAX_RECV_M + dst_off,
+            scale_src + m_st,
+            num_rows_cur_block * SCALE_ELEMENT_SIZE,
+            pid,
+        )
+
+    libshmem_device.fence()
+    if threadidx == 0:
+        libshmem_device.signal_op(
+            data_signal_stage + rank,
+            signal_value,
+            libshmem_device.NVSHMEM_SIGNAL_SET,
+            pid,
+        )
+        libshmem_device.signal_wait_until(data_signal_stage + pid, libshmem_device.NVSHMEM_CMP_EQ, signal_value)
+
+
+class PackedAllToAllContext:
+    OP_NAME = "fast_all_to_all_packed"
+
+    def __init__(
+        self,
+        max_m: int,
+        hidden: int,
+        rank: int,
+        num_tot_experts: int,
+        WORLD_SIZE: int,
+        experts_per_rank: int,
+        max_recv_m: Optional[int] = None,
+        dtype=torch.bfloat16,
+        scale_dtype=torch.float,
+    ):
+        """
+        max_m: max number of tokens per rank to send
+        max_recv_m: max number of tokens per rank to receive from all ranks. WORLD_SIZE * max_m by default.
+            the recv buffer scales with it instead of WORLD_SIZE * max_m.
+        """
+        self.max_recv_m = max_recv_m or WORLD_SIZE * max_m
+        self.send_buf = nvshmem_create_tensor((max_m, hidden), dtype)
+        self.recv_buf = nvshmem_create_tensor((2, self.max_recv_m, hidden), dtype)
+        self.scale_send_buf = nvshmem_create_tensor((max_m, ), scale_dtype)
+        self.scale_recv_buf = nvshmem_create_tensor((2, self.max_recv_m), scale_dtype)
+        self.split_send_buf = nvshmem_create_tensor((2, num_tot_experts), torch.int32)
+        self.split_recv_buf = nvshmem_create_tensor((2, WORLD_SIZE, num_tot_experts), torch.int32)
+        self.split_signal_buf = nvshmem_create_tensor((2, WORLD_SIZE), NVSHMEM_SIGNAL_DTYPE)
+        self.data_signal_buf = nvshmem_create_tensor((2, WORLD_SIZE), NVSHMEM_SIGNAL_DTYPE)
+        self.split_signal_buf.zero_()
+        self.data_signal_buf.zero_()
+
+        self.max_m = max_m
+        self.hidden = hidden
+        self.dtype = dtype
+        self.scale_dtype = scale_dtype
+        self.ele_size = dtype_size_in_bytes(self.dtype)
+        self.scale_ele_size = dtype_size_in_bytes(self.scale_dtype)
+
+        self.num_tot_experts = num_tot_experts
+        self.experts_per_rank = experts_per_rank
+
+        self.WORLD_SIZE = WORLD_SIZE
+        self.rank = rank
+
+        # start from 1, becase the initial values of signal buffer is 0
+        self.call_count = 1
+        self.MOD_VALUE = 1000000
+        # see enable_graph_safe
+        self.graph_safe = False
+        self.signal_value_buf = torch.ones((1, ), dtype=NVSHMEM_SIGNAL_DTYPE, device="cuda")
+
+    def enable_graph_safe(self):
+        """ for CUDA graph capture: signal with a counter on device, advanced on the stream after each call, so the
+        replays of a captured graph keep signalling new values. call_count still picks the stage on the host: capture
+        an even number of calls per graph, so that the stages keep alternating over replays.
+
+        call on all ranks at the same point: the device counter starts from the host one.
+        """
+        self.signal_value_buf.fill_(self.call_count)
+        self.graph_safe = True
+
+    def graph_hazards(self) -> List[GraphHazard]:
+        if self.graph_safe:
+            return []
+        return [GraphHazard(self.OP_NAME, "signal value call_count advances on the host. call enable_graph_safe")]
+
+    def is_send_buf(self, tensor: torch.Tensor) -> bool:
+        """ tensor lives in the symmetric send buffer, so it can be sent in place """
+        begin = self.send_buf.data_ptr()
+        return begin <= tensor.data_ptr() and tensor.data_ptr() + tensor.nbytes <= begin + self.send_buf.nbytes
+
+    def finalize(self):
+        nvshmem_free_tensor_sync(self.send_buf)
+        nvshmem_free_tensor_sync(self.recv_buf)
+        nvshmem_free_tensor_sync(self.scale_send_buf)
+        nvshmem_free_tensor_sync(self.scale_recv_buf)
+        nvshmem_free_tensor_sync(self.split_send_buf)
+        nvshmem_free_tensor_sync(self.split_recv_buf)
+        nvshmem_free_tensor_sync(self.split_signal_buf)
+        nvshmem_free_tensor_sync(self.data_signal_buf)
+
+
+def create_packed_all_to_all_context(
+    max_m: int,
+    hidden: int,
+    rank: int,
+    num_tot_experts: int,
+    WORLD_SIZE: int,
+    experts_per_rank: int,
+    max_recv_m: Optional[int] = None,
+    dtype=torch.bfloat16,
+    scale_dtype=torch.float,
+):
+    return PackedAllToAllContext(
+        max_m,
+        hidden,
+        rank,
+        num_tot_experts,
+        WORLD_SIZE,
+        experts_per_rank,
+        max_recv_m,
+        dtype,
+        scale_dtype,
+    )
+
+
+def fast_all_to_all_packed(
+    ctx: PackedAllToAllContext,
+    send_tensor: torch.Tensor,
+    send_split_cumsum: torch.Tensor,
+    send_scale: Optional[torch.Tensor],
+):
+    """
+    low-latency all-to-all communication, received rows packed back to back.
+
+    send_tensor is sent in place if it lives in ctx.send_buf (and send_scale in ctx.scale_send_buf), otherwise it is
+    copied there first.
+
+    returns [recv_splits, recv_offsets, recv_buf, recv_scale] without any host sync:
+        recv_splits: [WORLD_SIZE, experts_per_rank] rows received from each rank for each local expert
+        recv_offsets: [WORLD_SIZE + 1] rows from rank i are recv_buf[recv_offsets[i]:recv_offsets[i + 1]]
+        recv_buf: [max_recv_m, hidden], only the first recv_offsets[-1] rows are valid
+        recv_scale: [max_recv_m] or None
+    """
+    with_scale = send_scale is not None
+    act_pos = ctx.call_count % 2
+
+    num_tokens = send_tensor.shape[0]
+    assert num_tokens <= ctx.max_m
+    data_src = send_tensor if ctx.is_send_buf(send_tensor) else ctx.send_buf
+    if data_src is ctx.send_buf:
+        ctx.send_buf[:num_tokens, :] = send_tensor
+    scale_src = ctx.scale_send_buf
+    if with_scale:
+        scale_begin = ctx.scale_send_buf.data_ptr()
+        if scale_begin <= send_scale.data_ptr() < scale_begin + ctx.scale_send_buf.nbytes:
+            scale_src = send_scale
+        else:
+            ctx.scale_send_buf[:num_tokens] = send_scale
+    torch.sub(send_split_cumsum[1:], send_split_cumsum[:-1], out=ctx.split_send_buf[act_pos])
+
+    grid = (ctx.WORLD_SIZE, )
+    all_to_all_packed_kernel[grid](
+        data_src=data_src,
+        data_dst=ctx.recv_buf,
+        splits_src=ctx.split_send_buf,
+        splits_dst=ctx.split_recv_buf,
+        split_signal=ctx.split_signal_buf,
+        data_signal=ctx.data_signal_buf,
+        splits_cumsum=send_split_cumsum,
+        scale_src=scale_src,
+        scale_dst=ctx.scale_recv_buf,
+        rank=ctx.rank,
+        call_count=ctx.call_count,
+        WITH_SCALE=with_scale,
+        WORLD_SIZE=ctx.WORLD_SIZE,
+        WORLD_SIZE_PAD=triton.next_power_of_2(ctx.WORLD_SIZE),
+        HIDDEN=ctx.hidden,
+        MAX_RECV_M=ctx.max_recv_m,
+        EXPERTS_PER_RANK=ctx.experts_per_rank,
+        NUM_TOT_EXPERTS=ctx.num_tot_experts,
+        ELEMENT_SIZE=ctx.ele_size,
+        SCALE_ELEMENT_SIZE=ctx.scale_ele_size,
+        signal_value_ptr=ctx.signal_value_buf,
+        SIGNAL_ON_DEVICE=ctx.graph_safe,
+    )
+    if ctx.graph_safe:
+        ctx.signal_value_buf.add_(1)
+
+    ctx.call_count = (ctx.call_count + 1) % ctx.MOD_VALUE
+    epr = ctx.experts_per_rank
+    recv_splits = ctx.split_recv_buf[act_pos][:, ctx.rank * epr:(ctx.rank + 1) * epr]
+    recv_offsets = torch.nn.functional.pad(recv_splits.sum(dim=1).cumsum(0), (1, 0))
+    return [
+        recv_splits,
+        recv_offsets,
+        ctx.recv_buf[act_pos],
+        ctx.scale_recv_buf[act_pos] if with_scale else None,
+    ]
+
+
+def all_to_all_packed_post_process(
+    ctx: PackedAllToAllContext,
+    recv_offsets: torch.Tensor,
+    recv_buffer: torch.Tensor,
+    scale_buffer: Optional[torch.Tensor] = None,
+):
+    """ slice the valid rows. syncs with host once, for recv_offsets[-1]. """
+    num_recv_tokens = int(recv_offsets[-1].item())
+    assert num_recv_tokens <= ctx.max_recv_m, f"received {num_recv_tokens} tokens > max_recv_m {ctx.max_recv_m}"
+    output = recv_buffer[:num_recv_tokens]
+    output_scale = scale_buffer[:num_recv_tokens] if scale_buffer is not None else None
+    return output, output_scale
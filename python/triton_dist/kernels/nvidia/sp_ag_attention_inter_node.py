@@ -27,7 +27,7 @@ import triton
 import triton.language as tl
 import triton_dist.language as dl
 
-from typing import List
+from typing import List, Optional, Sequence
 import math
 
 from dataclasses import dataclass
@@ -36,6 +36,7 @@ from cuda import cudart
 from triton_dist.language.extra import libshmem_device
 from triton.language.extra.cuda.language_extra import __syncthreads, tid
 from triton_dist.utils import CUDA_CHECK, NVSHMEM_SIGNAL_DTYPE, nvshmem_barrier_all_on_stream, nvshmem_create_tensor, nvshmem_create_tensors
+from triton_dist.kernels.sp_ag_kv_plan import get_kv_all_gather_copy_plan
 
 ##################################################
 
@@ -201,7 +202,9 @@ def cp_engine_producer_kv_all_gather(
     nnodes: int,
     ag_stream: torch.cuda.Stream,
     compute_stream: torch.cuda.Stream,
+    cu_seqlens_k_cpu: Optional[Sequence[int]] = None,
 ):
+    """ cu_seqlens_k_cpu: host copy of cu_seqlens_k. if None, cu_seqlens_k is read back once. """
     assert k_buffer.is_contiguous()
     assert v_buffer.is_contiguous()
     assert k_shard.is_contiguous()
@@ -224,23 +227,18 @@ def cp_engine_producer_kv_all_gather(
         CUDA_CHECK(err)
 
     # local copy in compute stream
+    if cu_seqlens_k_cpu is None:
+        cu_seqlens_k_cpu = cu_seqlens_k.tolist()
+    plan = get_kv_all_gather_copy_plan(tuple(cu_seqlens_k_cpu), rank, world_size)
     with torch.cuda.stream(compute_stream):
-        for i in range(batch_size):
-            cu_seqlens_k_start = cu_seqlens_k[i].item()
-            cu_seqlens_k_end = cu_seqlens_k[i + 1].item()
-            seqlen_k = cu_seqlens_k_end - cu_seqlens_k_start
-            k_shard_len = seqlen_k // world_size
-            byte_start = cu_seqlens_k_start * byte_per_token
-            byte_per_rank = k_shard_len * byte_per_token
-            cp_size = byte_per_rank
-
-            k_dst_ptr = k_buffer.data_ptr() + byte_start + rank * byte_per_rank
-            k_src_ptr = k_shard.data_ptr() + byte_start // world_size
-            _cp_engine_copy_data(k_dst_ptr, k_src_ptr, cp_size, compute_stream)
-
-            v_dst_ptr = v_buffer.data_ptr() + byte_start + rank * byte_per_rank
-            v_src_ptr = v_shard.data_ptr() + byte_start // world_size
-            _cp_engine_copy_data(v_dst_ptr, v_src_ptr, cp_size, compute_stream)
+        for copy in plan.local_copies:
+            cp_size = copy.num_tokens * byte_per_token
+            dst_offset = copy.dst_offset * byte_per_token
+            src_offset = copy.src_offset * byte_per_token
+            _cp_engine_copy_data(k_buffer.data_ptr() + dst_offset, k_shard.data_ptr() + src_offset, cp_size,
+                                 compute_stream)
+            _cp_engine_copy_data(v_buffer.data_ptr() + dst_offset, v_shard.data_ptr() + src_offset, cp_size,
+                                 compute_stream)
 
     nvshmem_barrier_all_on_stream(compute_stream)
     ag_stream.wait_stream(compute_stream)
@@ -517,7 +515,9 @@ def fused_sp_ag_attn_inter_node(
     local_rank: int,
     is_causal: bool = True,
     enable_zig_zag: bool = True,
+    cu_seqlens_k_cpu: Optional[Sequence[int]] = None,
 ):
+    """ cu_seqlens_k_cpu: host copy of cu_seqlens_k, saves reading it back from the device """
     BLOCK_M, BLOCK_N, NUM_WARPS, NUM_STAGES = get_compute_config()
 
     compute_stream = torch.cuda.current_stream()
@@ -538,6 +538,7 @@ def fused_sp_ag_attn_inter_node(
         nnodes,
         ctx.ag_stream,
         compute_stream,
+        cu_seqlens_k_cpu=cu_seqlens_k_cpu,
     )
 
     # flash attn
@@ -27,7 +27,8 @@ import triton
 import triton.language as tl
 import triton_dist.language as dl
 
-from typing import List
+from typing import List, Optional, Sequence
+import functools
 import math
 
 from dataclasses import dataclass
@@ -35,6 +36,8 @@ from cuda import cudart
 
 from triton_dist.utils import CUDA_CHECK, nvshmem_create_tensors, nvshmem_free_tensor_sync
 from triton_dist.kernels.nvidia.common_ops import barrier_all_on_stream, BarrierAllContext
+from triton_dist.kernels.sp_ag_kv_plan import KVAllGatherCopyPlan, get_kv_all_gather_copy_plan
+from triton_dist.kernels.sp_ring_attn_plan import ring_src_rank
 
 ##################################################
 
@@ -50,6 +53,8 @@ class SPAllGatherAttentionContextIntraNode:
     attn_output_buffer: torch.Tensor
     ag_stream: torch.cuda.Stream
     barrier: BarrierAllContext
+    # copy KV with one batched kernel launch per phase instead of one cudaMemcpyAsync per (sequence, rank)
+    use_copy_kernel: bool = False
 
     def finalize(self):
         nvshmem_free_tensor_sync(self.ag_k_buffer)
@@ -68,6 +73,7 @@ def create_sp_ag_attention_context_intra_node(
     rank,
     world_size,
     device,
+    use_copy_kernel=False,
 ):
     ag_k_buffers = nvshmem_create_tensors((batch_size * max_seqlen_k, kv_head, head_dim), input_dtype, rank, world_size)
     ag_k_buffer = ag_k_buffers[rank]
@@ -94,14 +100,128 @@ def create_sp_ag_attention_context_intra_node(
                                                ag_k_buffers_ptr=ag_k_buffers_ptr, ag_v_buffers=ag_v_buffers,
                                                ag_v_buffer=ag_v_buffer, ag_v_buffers_ptr=ag_v_buffers_ptr,
                                                attn_output_buffer=attn_output_buffer, ag_stream=ag_stream,
-                                               barrier=barrier)
+                                               barrier=barrier, use_copy_kernel=use_copy_kernel)
 
     return ctx
 
 
+@dataclass
+class SPRingAttentionContextIntraNode:
+    # [2][world_size] double buffers of KV shards, [batch_size * max_seqlen_k // world_size, kv_head, head_dim] each
+    ring_k_buffers: List[List[torch.Tensor]]
+    ring_v_buffers: List[List[torch.Tensor]]
+    # online softmax state of the local q shard, kept across ring steps
+    acc_buffer: torch.Tensor  # fp32 [batch_size * max_q_shard_len, q_head, head_dim]
+    m_buffer: torch.Tensor  # fp32 [batch_size * max_q_shard_len, q_head]
+    l_buffer: torch.Tensor  # fp32 [batch_size * max_q_shard_len, q_head]
+    attn_output_buffer: torch.Tensor
+    ring_stream: torch.cuda.Stream
+    barrier: BarrierAllContext
+    rank: int
+
+    def finalize(self):
+        for buffers in self.ring_k_buffers + self.ring_v_buffers:
+            nvshmem_free_tensor_sync(buffers[self.rank])
+
+
+def create_sp_ring_attention_context_intra_node(
+    batch_size,
+    q_head,
+    kv_head,
+    max_seqlen_k,
+    max_q_shard_len,
+    head_dim,
+    input_dtype,
+    output_dtype,
+    rank,
+    world_size,
+    device,
+):
+    """ KV memory of 2 shards per rank, instead of the full sequence of create_sp_ag_attention_context_intra_node """
+    max_kv_shard_tokens = batch_size * max_seqlen_k // world_size
+    ring_k_buffers = [
+        nvshmem_create_tensors((max_kv_shard_tokens, kv_head, head_dim), input_dtype, rank, world_size)
+        for _ in range(2)
+    ]
+    ring_v_buffers = [
+        nvshmem_create_tensors((max_kv_shard_tokens, kv_head, head_dim), input_dtype, rank, world_size)
+        for _ in range(2)
+    ]
+    max_q_shard_tokens = batch_size * max_q_shard_len
+    acc_buffer = torch.empty((max_q_shard_tokens, q_head, head_dim), dtype=torch.float32, device=device)
+    m_buffer = torch.empty((max_q_shard_tokens, q_head), dtype=torch.float32, device=device)
+    l_buffer = torch.empty((max_q_shard_tokens, q_head), dtype=torch.float32, device=device)
+    attn_output_buffer = torch.empty((max_q_shard_tokens, q_head, head_dim), dtype=output_dtype, device=device)
+
+    return SPRingAttentionContextIntraNode(ring_k_buffers=ring_k_buffers, ring_v_buffers=ring_v_buffers,
+                                           acc_buffer=acc_buffer, m_buffer=m_buffer, l_buffer=l_buffer,
+                                           attn_output_buffer=attn_output_buffer, ring_stream=torch.cuda.Stream(),
+                                           barrier=BarrierAllContext(True), rank=rank)
+
+
 ##################################################
 
 
+@triton.jit
+def _copy_tokens(src_ptr, dst_ptr, num_elems, split, NUM_SPLITS: tl.constexpr, BLOCK_SIZE: tl.constexpr):
+    offs = tl.arange(0, BLOCK_SIZE)
+    for start in range(split * BLOCK_SIZE, num_elems, NUM_SPLITS * BLOCK_SIZE):
+        mask = start + offs < num_elems
+        tl.store(dst_ptr + start + offs, tl.load(src_ptr + start + offs, mask=mask), mask=mask)
+
+
+@triton.jit
+def kernel_kv_batched_copy(
+    copy_desc,  # [num_copies, 4] int64: (src_rank, src_offset, dst_offset, num_tokens), see KVAllGatherCopyPlan
+    k_peer_ptrs,  # [world_size] int64, all-gather buffers of each rank
+    v_peer_ptrs,
+    k_shard,  # used for src_rank < 0
+    v_shard,
+    k_buffer,
+    v_buffer,
+    elems_per_token,  # in int64
+    NUM_SPLITS: tl.constexpr,
+    BLOCK_SIZE: tl.constexpr,
+):
+    pid = tl.program_id(0)
+    split = tl.program_id(1)
+    src_rank = tl.load(copy_desc + pid * 4)
+    src_offset = tl.load(copy_desc + pid * 4 + 1) * elems_per_token
+    dst_offset = tl.load(copy_desc + pid * 4 + 2) * elems_per_token
+    num_elems = tl.load(copy_desc + pid * 4 + 3) * elems_per_token
+
+    k_dst = tl.cast(k_buffer, tl.pointer_type(tl.int64)) + dst_offset
+    v_dst = tl.cast(v_buffer, tl.pointer_type(tl.int64)) + dst_offset
+    if src_rank < 0:
+        k_src = tl.cast(k_shard, tl.pointer_type(tl.int64))
+        v_src = tl.cast(v_shard, tl.pointer_type(tl.int64))
+    else:
+        k_src = tl.load(k_peer_ptrs + src_rank).to(tl.pointer_type(tl.int64))
+        v_src = tl.load(v_peer_ptrs + src_rank).to(tl.pointer_type(tl.int64))
+    _copy_tokens(k_src + src_offset, k_dst, num_elems, split, NUM_SPLITS, BLOCK_SIZE)
+    _copy_tokens(v_src + src_offset, v_dst, num_elems, split, NUM_SPLITS, BLOCK_SIZE)
+
+
+@functools.lru_cache(maxsize=64)
+def _get_copy_descriptor_tables(plan: KVAllGatherCopyPlan, device: torch.device):
+    return (KVAllGatherCopyPlan.to_descriptor_table(plan.local_copies, device),
+            KVAllGatherCopyPlan.to_descriptor_table(plan.peer_copies, device))
+
+
+def kv_batched_copy(copy_desc: torch.Tensor, k_peer_ptrs, v_peer_ptrs, k_shard, v_shard, k_buffer, v_buffer,
+                    byte_per_token: int):
+    num_copies = copy_desc.shape[0]
+    if num_copies == 0:
+        return
+    assert byte_per_token % 8 == 0, f"byte_per_token {byte_per_token} should be a multiple of 8"
+    num_sms = torch.cuda.get_device_properties(k_buffer.device).multi_processor_count
+    # few large copies (small batch) are split over more CTAs
+    num_splits = max(1, min(16, num_sms // num_copies))
+    kernel_kv_batched_copy[(num_copies, num_splits)](copy_desc, k_peer_ptrs, v_peer_ptrs, k_shard, v_shard, k_buffer,
+                                                     v_buffer, byte_per_token // 8, NUM_SPLITS=num_splits,
+                                                     BLOCK_SIZE=1024, num_warps=4)
+
+
 def cp_engine_producer_kv_all_gather(
     k_shard: torch.Tensor,  # [total_kv_shard, kv_head, head_dim]
     v_shard: torch.Tensor,  # [total_kv_shard, kv_head, head_dim]
@@ -115,16 +235,29 @@ def cp_engine_producer_kv_all_gather(
     ag_stream: torch.cuda.Stream,
     compute_stream: torch.cuda.Stream,
     barrier: BarrierAllContext,
+    cu_seqlens_k_cpu: Optional[Sequence[int]] = None,
+    k_buffers_ptr: Optional[torch.Tensor] = None,
+    v_buffers_ptr: Optional[torch.Tensor] = None,
 ):
+    """
+    cu_seqlens_k_cpu: host copy of cu_seqlens_k. if None, cu_seqlens_k is read back once.
+    k_buffers_ptr/v_buffers_ptr: device tables of k_buffers/v_buffers pointers. if given, copies go through
+        kernel_kv_batched_copy instead of the copy engine.
+    """
     assert k_buffer.is_contiguous()
     assert v_buffer.is_contiguous()
     assert k_shard.is_contiguous()
     assert v_shard.is_contiguous()
 
     total_kv_shard, kv_head, head_dim = k_shard.shape
-    batch_size = cu_seqlens_k.shape[0] - 1
 
     byte_per_token = kv_head * head_dim * k_shard.dtype.itemsize
+    if cu_seqlens_k_cpu is None:
+        cu_seqlens_k_cpu = cu_seqlens_k.tolist()
+    plan = get_kv_all_gather_copy_plan(tuple(cu_seqlens_k_cpu), rank, world_size)
+    use_copy_kernel = k_buffers_ptr is not None and v_buffers_ptr is not None
+    if use_copy_kernel:
+        local_desc, peer_desc = _get_copy_descriptor_tables(plan, k_buffer.device)
 
     def _cp_engine_copy_data(dst_ptr, src_ptr, cp_size, stream):
         (err, ) = cudart.cudaMemcpyAsync(
@@ -139,45 +272,35 @@ def cp_engine_producer_kv_all_gather(
 
     # local copy in compute stream
     with torch.cuda.stream(compute_stream):
-        for i in range(batch_size):
-            cu_seqlens_k_start = cu_seqlens_k[i].item()
-            cu_seqlens_k_end = cu_seqlens_k[i + 1].item()
-            seqlen_k = cu_seqlens_k_end - cu_seqlens_k_start
-            k_shard_len = seqlen_k // world_size
-            byte_start = cu_seqlens_k_start * byte_per_token
-            byte_per_rank = k_shard_len * byte_per_token
-            cp_size = byte_per_rank
-
-            k_dst_ptr = k_buffers[rank].data_ptr() + byte_start + rank * byte_per_rank
-            k_src_ptr = k_shard.data_ptr() + byte_start // world_size
-            _cp_engine_copy_data(k_dst_ptr, k_src_ptr, cp_size, compute_stream)
-
-            v_dst_ptr = v_buffers[rank].data_ptr() + byte_start + rank * byte_per_rank
-            v_src_ptr = v_shard.data_ptr() + byte_start // world_size
-            _cp_engine_copy_data(v_dst_ptr, v_src_ptr, cp_size, compute_stream)
+        if use_copy_kernel:
+            kv_batched_copy(local_desc, k_buffers_ptr, v_buffers_ptr, k_shard, v_shard, k_buffers[rank],
+                            v_buffers[rank], byte_per_token)
+        else:
+            for copy in plan.local_copies:
+                cp_size = copy.num_tokens * byte_per_token
+                dst_offset = copy.dst_offset * byte_per_token
+                src_offset = copy.src_offset * byte_per_token
+                _cp_engine_copy_data(k_buffers[rank].data_ptr() + dst_offset, k_shard.data_ptr() + src_offset,
+                                     cp_size, compute_stream)
+                _cp_engine_copy_data(v_buffers[rank].data_ptr() + dst_offset, v_shard.data_ptr() + src_offset,
+                                     cp_size, compute_stream)
 
     barrier_all_on_stream(barrier, compute_stream)
     ag_stream.wait_stream(compute_stream)
 
     with torch.cuda.stream(ag_stream):
-        for i in range(batch_size):
-            cu_seqlens_k_start = cu_seqlens_k[i].item()
-            cu_seqlens_k_end = cu_seqlens_k[i + 1].item()
-            seqlen_k = cu_seqlens_k_end - cu_seqlens_k_start
-            k_shard_len = seqlen_k // world_size
-            byte_start = cu_seqlens_k_start * byte_per_token
-            byte_per_rank = k_shard_len * byte_per_token
-            cp_size = byte_per_rank
-            for offset in range(1, world_size):
-                src_rank = (rank + offset) % world_size
-
-                k_src_ptr = (k_buffers[src_rank].data_ptr() + byte_start + src_rank * byte_per_rank)
-                k_dst_ptr = (k_buffers[rank].data_ptr() + byte_start + src_rank * byte_per_rank)
-                _cp_engine_copy_data(k_dst_ptr, k_src_ptr, cp_size, ag_stream)
-
-                v_src_ptr = (v_buffers[src_rank].data_ptr() + byte_start + src_rank * byte_per_rank)
-                v_dst_ptr = (v_buffers[rank].data_ptr() + byte_start + src_rank * byte_per_rank)
-                _cp_engine_copy_data(v_dst_ptr, v_src_ptr, cp_size, ag_stream)
+        if use_copy_kernel:
+            kv_batched_copy(peer_desc, k_buffers_ptr, v_buffers_ptr, k_shard, v_shard, k_buffers[rank],
+                            v_buffers[rank], byte_per_token)
+        else:
+            for copy in plan.peer_copies:
+                cp_size = copy.num_tokens * byte_per_token
+                dst_offset = copy.dst_offset * byte_per_token
+                src_offset = copy.src_offset * byte_per_token
+                _cp_engine_copy_data(k_buffers[rank].data_ptr() + dst_offset,
+                                     k_buffers[copy.src_rank].data_ptr() + src_offset, cp_size, ag_stream)
+                _cp_engine_copy_data(v_buffers[rank].data_ptr() + dst_offset,
+                                     v_buffers[copy.src_rank].data_ptr() + src_offset, cp_size, ag_stream)
 
     barrier_all_on_stream(barrier, ag_stream)
     compute_stream.wait_stream(ag_stream)
@@ -204,6 +327,8 @@ def _flash_attn_forward_inner(
     STAGE: tl.constexpr,
     offs_m: tl.constexpr,
     offs_n: tl.constexpr,
+    kv_lo,
+    kv_hi,
 ):
     assert q_len <= kv_len
     prefix_len = kv_len - q_len
@@ -217,6 +342,9 @@ def _flash_attn_forward_inner(
         )
     else:
         lo, hi = 0, kv_len
+    # keys in [kv_lo, kv_hi) only, e.g. the shard of one rank in ring attention
+    lo = tl.maximum(lo, kv_lo)
+    hi = tl.minimum(hi, kv_hi)
 
     for start_n in range(lo, hi, BLOCK_N):
         wait_offset = start_n
@@ -394,6 +522,8 @@ def kernel_consumer_flash_attn_forward(
             2,
             offs_m,
             offs_n,
+            0,
+            kv_len,
         )
 
     # stage 1: off-band
@@ -418,6 +548,8 @@ def kernel_consumer_flash_attn_forward(
             4 - STAGE,
             offs_m,
             offs_n,
+            0,
+            kv_len,
         )
 
     # epilogue
@@ -425,6 +557,181 @@ def kernel_consumer_flash_attn_forward(
     tl.store(O_block_ptr, acc.to(dtype))
 
 
+@triton.jit
+def kernel_ring_flash_attn_forward_step(
+    Q,  # [total_q_shard, q_head, head_dim]
+    K,  # [total_kv_shard, kv_head, head_dim], the shard of src_rank
+    V,  # [total_kv_shard, kv_head, head_dim], the shard of src_rank
+    sm_scale,
+    Acc,  # fp32 [total_q_shard, q_head, head_dim]
+    M,  # fp32 [total_q_shard, q_head]
+    L,  # fp32 [total_q_shard, q_head]
+    Out,  # [total_q_shard, q_head, head_dim]
+    stride_qm,
+    stride_qh,
+    stride_qk,  #
+    stride_kn,
+    stride_kh,
+    stride_kk,  #
+    stride_vk,
+    stride_vh,
+    stride_vn,  #
+    stride_am,
+    stride_ah,
+    stride_ak,  #
+    stride_mm,
+    stride_mh,  #
+    stride_om,
+    stride_oh,
+    stride_on,  #
+    cu_seqlens_q,  # q_shard_lens
+    cu_seqlens_k,  # kv_full_lens
+    src_rank,
+    HQ,
+    HK,
+    enable_zig_zag: tl.constexpr,
+    HEAD_DIM: tl.constexpr,
+    BLOCK_M: tl.constexpr,
+    BLOCK_N: tl.constexpr,
+    STAGE: tl.constexpr,
+    FIRST_STEP: tl.constexpr,
+    LAST_STEP: tl.constexpr,
+):
+    """ one step of ring attention: the local q shard against the KV shard of src_rank.
+    the online softmax state goes through Acc / M / L between steps, the last step writes Out.
+    see triton_dist.kernels.sp_ring_attn_plan for the tiles walked.
+    """
+    start_m = tl.program_id(0)
+    off_h_q = tl.program_id(1)
+    off_z = tl.program_id(2)
+
+    rank = dl.rank()
+    world_size = dl.num_ranks()
+
+    cu_seqlens_q_start = tl.load(cu_seqlens_q + off_z)
+    cu_seqlens_q_end = tl.load(cu_seqlens_q + off_z + 1)
+    q_shard_len = cu_seqlens_q_end - cu_seqlens_q_start
+    q_len = q_shard_len * world_size
+    if start_m * BLOCK_M >= q_shard_len:
+        return
+
+    cu_seqlens_k_start = tl.load(cu_seqlens_k + off_z)
+    cu_seqlens_k_end = tl.load(cu_seqlens_k + off_z + 1)
+    kv_len = cu_seqlens_k_end - cu_seqlens_k_start
+    kv_shard_len = kv_len // world_size
+
+    if not enable_zig_zag:
+        global_offset_q = q_shard_len * rank
+        kv_len_per_sp_block = kv_len // world_size
+        # the single block of src_rank, and an empty one
+        kv_lo_0 = src_rank * kv_len_per_sp_block
+        kv_lo_1 = 0
+        kv_hi_1 = 0
+    else:
+        half_q_shard_len = q_shard_len // 2
+        if start_m * BLOCK_M < half_q_shard_len:
+            global_offset_q = rank * half_q_shard_len
+        else:
+            global_offset_q = q_len - (rank + 1) * half_q_shard_len
+            # correct the extra offset of `start_m`
+            global_offset_q -= half_q_shard_len
+        kv_len_per_sp_block = kv_len // (2 * world_size)
+        kv_lo_0 = src_rank * kv_len_per_sp_block
+        kv_lo_1 = (2 * world_size - 1 - src_rank) * kv_len_per_sp_block
+        kv_hi_1 = kv_lo_1 + kv_len_per_sp_block
+    kv_hi_0 = kv_lo_0 + kv_len_per_sp_block
+
+    # all keys of src_rank are after all rows of this block: nothing to do but keep the state
+    diag_end = kv_len - q_len + global_offset_q + (start_m + 1) * BLOCK_M
+    if STAGE == 3:
+        if not FIRST_STEP:
+            if not LAST_STEP:
+                if kv_lo_0 >= diag_end:
+                    return
+
+    qk_scale = sm_scale
+    qk_scale *= 1.44269504  # 1/log(2)
+
+    dtype = Out.dtype.element_ty
+    offs_m = start_m * BLOCK_M + tl.arange(0, BLOCK_M)
+    offs_n = tl.arange(0, BLOCK_N)
+    offs_d = tl.arange(0, HEAD_DIM)
+    mask_m = offs_m < q_shard_len
+
+    group_size = HQ // HK
+    off_h_kv = off_h_q // group_size if group_size != 1 else off_h_q
+
+    rows = cu_seqlens_q_start + offs_m
+    acc_ptrs = (Acc + off_h_q.to(tl.int64) * stride_ah + rows[:, None].to(tl.int64) * stride_am +
+                offs_d[None, :] * stride_ak)
+    m_ptrs = M + off_h_q.to(tl.int64) * stride_mh + rows.to(tl.int64) * stride_mm
+    l_ptrs = L + off_h_q.to(tl.int64) * stride_mh + rows.to(tl.int64) * stride_mm
+    if FIRST_STEP:
+        m_i = tl.zeros([BLOCK_M], dtype=tl.float32) - float("inf")
+        l_i = tl.zeros([BLOCK_M], dtype=tl.float32) + 1.0
+        acc = tl.zeros([BLOCK_M, HEAD_DIM], dtype=tl.float32)
+    else:
+        m_i = tl.load(m_ptrs, mask=mask_m, other=-float("inf"))
+        l_i = tl.load(l_ptrs, mask=mask_m, other=1.0)
+        acc = tl.load(acc_ptrs, mask=mask_m[:, None], other=0.0)
+
+    q_offset = off_h_q.to(tl.int64) * stride_qh + (cu_seqlens_q_start + start_m * BLOCK_M) * stride_qm
+    Q_block_ptr = tl.make_block_ptr(
+        base=Q + q_offset,
+        shape=(q_shard_len, HEAD_DIM),
+        strides=(stride_qm, stride_qk),
+        offsets=(0, 0),
+        block_shape=(BLOCK_M, HEAD_DIM),
+        order=(1, 0),
+    )
+    # the shard of each sequence is at cu_seqlens_k_start // world_size, as the local shard
+    kv_shard_start = cu_seqlens_k_start // world_size
+    K_block_ptr = tl.make_block_ptr(
+        base=K + off_h_kv.to(tl.int64) * stride_kh + kv_shard_start.to(tl.int64) * stride_kn,
+        shape=(HEAD_DIM, kv_shard_len),
+        strides=(stride_kk, stride_kn),
+        offsets=(0, 0),
+        block_shape=(HEAD_DIM, BLOCK_N),
+        order=(0, 1),
+    )
+    V_block_ptr = tl.make_block_ptr(
+        base=V + off_h_kv.to(tl.int64) * stride_vh + kv_shard_start.to(tl.int64) * stride_vk,
+        shape=(kv_shard_len, HEAD_DIM),
+        strides=(stride_vk, stride_vn),
+        offsets=(0, 0),
+        block_shape=(BLOCK_N, HEAD_DIM),
+        order=(1, 0),
+    )
+
+    q = tl.load(Q_block_ptr)
+
+    # offset_per_rank 0: offsets are into the one shard held at this step
+    for i in tl.static_range(2):
+        kv_lo = kv_lo_0 if i == 0 else kv_lo_1
+        kv_hi = kv_hi_0 if i == 0 else kv_hi_1
+        # stage 2: on-band
+        if STAGE & 2:
+            acc, l_i, m_i = _flash_attn_forward_inner(acc, l_i, m_i, q, global_offset_q, K_block_ptr, V_block_ptr,
+                                                      start_m, qk_scale, q_len, kv_len, kv_len_per_sp_block,
+                                                      world_size, 0, BLOCK_M, BLOCK_N, 2, offs_m, offs_n, kv_lo,
+                                                      kv_hi)
+        # stage 1: off-band
+        if STAGE & 1:
+            acc, l_i, m_i = _flash_attn_forward_inner(acc, l_i, m_i, q, global_offset_q, K_block_ptr, V_block_ptr,
+                                                      start_m, qk_scale, q_len, kv_len, kv_len_per_sp_block,
+                                                      world_size, 0, BLOCK_M, BLOCK_N, 4 - STAGE, offs_m, offs_n,
+                                                      kv_lo, kv_hi)
+
+    if LAST_STEP:
+        out_ptrs = (Out + off_h_q.to(tl.int64) * stride_oh + rows[:, None].to(tl.int64) * stride_om +
+                    offs_d[None, :] * stride_on)
+        tl.store(out_ptrs, (acc / l_i[:, None]).to(dtype), mask=mask_m[:, None])
+    else:
+        tl.store(acc_ptrs, acc, mask=mask_m[:, None])
+        tl.store(m_ptrs, m_i, mask=mask_m)
+        tl.store(l_ptrs, l_i, mask=mask_m)
+
+
 def get_compute_config():
     return (128, 64, 8, 3)
 
@@ -443,7 +750,13 @@ def fused_sp_ag_attn_intra_node(
     world_size: int,
     is_causal: bool = True,
     enable_zig_zag: bool = True,
+    cu_seqlens_k_cpu: Optional[Sequence[int]] = None,
 ):
+    """ cu_seqlens_k_cpu: host copy of cu_seqlens_k, saves reading it back from the device
+
+    sequence lengths must split into world_size (2 * world_size with zig-zag) equal chunks, see
+    triton_dist.kernels.sp_varlen_plan to pad a varlen batch.
+    """
     BLOCK_M, BLOCK_N, NUM_WARPS, NUM_STAGES = get_compute_config()
 
     compute_stream = torch.cuda.current_stream()
@@ -465,6 +778,9 @@ def fused_sp_ag_attn_intra_node(
         ctx.ag_stream,
         compute_stream,
         ctx.barrier,
+        cu_seqlens_k_cpu=cu_seqlens_k_cpu,
+        k_buffers_ptr=ctx.ag_k_buffers_ptr if ctx.use_copy_kernel else None,
+        v_buffers_ptr=ctx.ag_v_buffers_ptr if ctx.use_copy_kernel else None,
     )
 
     # flash attn
@@ -519,3 +835,120 @@ def fused_sp_ag_attn_intra_node(
 
     compute_stream.wait_stream(ctx.ag_stream)
     barrier_all_on_stream(ctx.barrier, compute_stream)
+
+
+def _ring_copy(dst: torch.Tensor, src: torch.Tensor, nbytes: int, stream: torch.cuda.Stream):
+    (err, ) = cudart.cudaMemcpyAsync(dst.data_ptr(), src.data_ptr(), nbytes, cudart.cudaMemcpyKind.cudaMemcpyDefault,
+                                     stream.cuda_stream)
+    CUDA_CHECK(err)
+
+
+def fused_sp_ring_attn_intra_node(
+    ctx: SPRingAttentionContextIntraNode,
+    q_shard: torch.Tensor,  # [total_q_shard, q_head, head_dim]
+    k_shard: torch.Tensor,  # [total_kv_shard, kv_head, head_dim]
+    v_shard: torch.Tensor,  # [total_kv_shard, kv_head, head_dim]
+    output: torch.Tensor,  # [total_q_shard, q_head, head_dim]
+    cu_seqlens_q: torch.Tensor,
+    cu_seqlens_k: torch.Tensor,
+    max_seqlen_q: int,
+    max_seqlen_k: int,
+    rank: int,
+    world_size: int,
+    is_causal: bool = True,
+    enable_zig_zag: bool = True,
+):
+    """ ring attention alternative of fused_sp_ag_attn_intra_node, same inputs and layout.
+
+    the KV shards go around the ring: at step s this rank attends to the shard of rank - s, while the ring stream
+    pulls the shard of rank - s - 1 from rank - 1 into the other ring buffer. needs 2 KV shards of memory instead of
+    the full sequence, for world_size attention launches and ring steps. see triton_dist.kernels.sp_ring_attn_plan.
+    """
+    BLOCK_M, BLOCK_N, NUM_WARPS, NUM_STAGES = get_compute_config()
+
+    compute_stream = torch.cuda.current_stream()
+    assert k_shard.is_contiguous() and v_shard.is_contiguous()
+    total_kv_shard, kv_head, head_dim = k_shard.shape
+    nbytes = total_kv_shard * kv_head * head_dim * k_shard.dtype.itemsize
+    assert nbytes <= ctx.ring_k_buffers[0][rank].nbytes, "KV shards are larger than the ring buffers"
+    total_q_shard = q_shard.shape[0]
+    acc = ctx.acc_buffer[:total_q_shard]
+    m = ctx.m_buffer[:total_q_shard]
+    l = ctx.l_buffer[:total_q_shard]
+
+    stage = 3 if is_causal else 1
+    HEAD_DIM_Q, HEAD_DIM_K = q_shard.shape[-1], k_shard.shape[-1]
+    HEAD_DIM_V = v_shard.shape[-1]
+    assert HEAD_DIM_Q == HEAD_DIM_K and HEAD_DIM_K == HEAD_DIM_V
+    assert HEAD_DIM_K in {16, 32, 64, 128, 256}
+    sm_scale = 1 / math.sqrt(HEAD_DIM_Q)
+
+    # the local shard enters the ring: rank + 1 pulls it at step 0
+    _ring_copy(ctx.ring_k_buffers[0][rank], k_shard, nbytes, compute_stream)
+    _ring_copy(ctx.ring_v_buffers[0][rank], v_shard, nbytes, compute_stream)
+    barrier_all_on_stream(ctx.barrier, compute_stream)
+
+    for step in range(world_size):
+        cur = step % 2
+        if step + 1 < world_size:
+            # the next ring buffer was read by the attention of the previous step
+            ctx.ring_stream.wait_stream(compute_stream)
+            recv_rank = (rank - 1) % world_size
+            _ring_copy(ctx.ring_k_buffers[1 - cur][rank], ctx.ring_k_buffers[cur][recv_rank], nbytes, ctx.ring_stream)
+            _ring_copy(ctx.ring_v_buffers[1 - cur][rank], ctx.ring_v_buffers[cur][recv_rank], nbytes, ctx.ring_stream)
+            # no rank overwrites a buffer that its neighbour still pulls from
+            barrier_all_on_stream(ctx.barrier, ctx.ring_stream)
+
+        k = k_shard if step == 0 else ctx.ring_k_buffers[cur][rank]
+        v = v_shard if step == 0 else ctx.ring_v_buffers[cur][rank]
+        with torch.cuda.stream(compute_stream):
+            grid = lambda args: (
+                triton.cdiv(max_seqlen_q, args["BLOCK_M"]),  # max_num_blocks_m
+                q_shard.shape[1],  # q_head
+                cu_seqlens_q.shape[0] - 1,  # batch_size
+            )
+            kernel_ring_flash_attn_forward_step[grid](
+                q_shard,
+                k,
+                v,
+                sm_scale,
+                acc,
+                m,
+                l,
+                output,
+                q_shard.stride(0),
+                q_shard.stride(1),
+                q_shard.stride(2),
+                k.stride(0),
+                k.stride(1),
+                k.stride(2),
+                v.stride(0),
+                v.stride(1),
+                v.stride(2),
+                acc.stride(0),
+                acc.stride(1),
+                acc.stride(2),
+                m.stride(0),
+                m.stride(1),
+                output.stride(0),
+                output.stride(1),
+                output.stride(2),
+                cu_seqlens_q,
+                cu_seqlens_k,
+                ring_src_rank(rank, step, world_size),
+                q_shard.shape[1],  # HQ
+                k_shard.shape[1],  # HK
+                enable_zig_zag,
+                HEAD_DIM_K,
+                BLOCK_M,
+                BLOCK_N,
+                stage,
+                step == 0,
+                step == world_size - 1,
+                num_stages=NUM_STAGES,
+                num_warps=NUM_WARPS,
+            )
+        if step + 1 < world_size:
+            compute_stream.wait_stream(ctx.ring_stream)
+
+    barrier_all_on_stream(ctx.barrier, compute_stream)
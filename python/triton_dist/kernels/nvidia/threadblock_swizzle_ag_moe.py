@@ -85,7 +85,7 @@ def _split_tiles_for_each_segment(
         # take care for the last tile: may overlap with the first one
         if tid == global_tiled_m_start - 1:
             # if has overlap with the start tile
-            if global_m_start % BLOCK_SIZE_M != 0:
+            if global_m_start % block_size_m != 0:
                 m_segment_end_exclude_first_segment = bisect.bisect_right(token_cnts_acc[:rank], m_end)
                 m_segment_end_exclude_first_segment = (m_segment_end_exclude_first_segment -
                                                        1 if m_segment_end_exclude_first_segment == rank else
@@ -234,32 +234,33 @@ def check_with_token_cnt_per_rank_per_expert(token_cnts_per_rank_per_expert, ver
         # break
 
 
-logging.basicConfig(level=logging.INFO)
-
 DBG = logging.debug
 # DBG = pprint
 
-TP_SIZE = 4
-nexperts = 2
-BLOCK_SIZE_M = 128
-for token_cnts in [
-        generate_token_cnts_per_rank_per_expert_uniform(BLOCK_SIZE_M * nexperts, nexperts, TP_SIZE),
-        generate_token_cnts_per_rank_per_expert_uniform((BLOCK_SIZE_M - 1) * nexperts, nexperts, TP_SIZE),
-        generate_token_cnts_per_rank_per_expert_uniform((BLOCK_SIZE_M + 1) * nexperts, nexperts, TP_SIZE),
-]:
-    check_with_token_cnt_per_rank_per_expert(token_cnts)
-
-# set TP_SIZE=4 and nexperts = 2 is too slow to run for python.
-TP_SIZE = 4
-nexperts = 2
-
-for n in range(100):
-    for n in range(1000):
-        token_cnts = generate_token_cnts_per_rank_per_expert_random(BLOCK_SIZE_M * nexperts, nexperts, TP_SIZE)
-        check_with_token_cnt_per_rank_per_expert(token_cnts, verbose=False)
-    print("[n] random passed...")
-    for n in range(1000):
-        token_cnts = generate_token_cnts_per_rank_per_expert_random_with_many_zeros(BLOCK_SIZE_M * nexperts, nexperts,
-                                                                                    TP_SIZE, 0.3)
-        check_with_token_cnt_per_rank_per_expert(token_cnts, verbose=False)
-    print("[n] random with many zeroes passed...")
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    TP_SIZE = 4
+    nexperts = 2
+    BLOCK_SIZE_M = 128
+    for token_cnts in [
+            generate_token_cnts_per_rank_per_expert_uniform(BLOCK_SIZE_M * nexperts, nexperts, TP_SIZE),
+            generate_token_cnts_per_rank_per_expert_uniform((BLOCK_SIZE_M - 1) * nexperts, nexperts, TP_SIZE),
+            generate_token_cnts_per_rank_per_expert_uniform((BLOCK_SIZE_M + 1) * nexperts, nexperts, TP_SIZE),
+    ]:
+        check_with_token_cnt_per_rank_per_expert(token_cnts)
+
+    # set TP_SIZE=4 and nexperts = 2 is too slow to run for python.
+    TP_SIZE = 4
+    nexperts = 2
+
+    for n in range(100):
+        for n in range(1000):
+            token_cnts = generate_token_cnts_per_rank_per_expert_random(BLOCK_SIZE_M * nexperts, nexperts, TP_SIZE)
+            check_with_token_cnt_per_rank_per_expert(token_cnts, verbose=False)
+        print("[n] random passed...")
+        for n in range(1000):
+            token_cnts = generate_token_cnts_per_rank_per_expert_random_with_many_zeros(
+                BLOCK_SIZE_M * nexperts, nexperts, TP_SIZE, 0.3)
+            check_with_token_cnt_per_rank_per_expert(token_cnts, verbose=False)
+        print("[n] random with many zeroes passed...")
@@ -34,6 +34,7 @@ import torch
 import triton
 import triton.language as tl
 from triton.language.extra.cuda.language_extra import __syncthreads, tid
+from triton_dist.kernels.ag_moe_swizzle_schedule import AGMoESwizzleSchedule, ag_moe_swizzle_schedule
 from triton_dist.kernels.nvidia.common_ops import next_power_of_2, bisect_right_kernel
 
 
@@ -116,6 +117,8 @@ def threadblock_swizzle_ag_moe_kernel(
     DEBUG: tl.constexpr = False,
 ):
     """
+    triton_dist.kernels.ag_moe_swizzle_schedule computes the same schedule on host, for all tiles at once.
+
     tile_index = g(expert_id, stage, index): if tile_index is grouped by expert then stage
 
     but how to map (stage, index) => tile_index_in_expert?
@@ -349,6 +352,17 @@ def _check_tiled_m(tiled_m_global):
                                torch.arange(0, tiled_m_global.shape[0], device="cuda", dtype=tiled_m_global.dtype))
 
 
+def _check_with_host_schedule(expert_idx: torch.Tensor, tile_index: torch.Tensor, schedule: AGMoESwizzleSchedule):
+    # tiles of one (expert, stage) group are placed by atomic_add: compare the layout, then the groups in tile order
+    expert_idx, tile_index = expert_idx.cpu().numpy(), tile_index.cpu().numpy()
+    stage_by_tile = np.empty_like(schedule.stage)
+    stage_by_tile[schedule.tile_index] = schedule.stage
+    stage = stage_by_tile[tile_index]
+    np.testing.assert_array_equal(expert_idx, schedule.expert_idx)
+    np.testing.assert_array_equal(stage, schedule.stage)
+    np.testing.assert_array_equal(tile_index[np.lexsort((tile_index, stage, expert_idx))], schedule.tile_index)
+
+
 def check_with_ntokens_per_rank_per_expert(ntokens_per_rank_per_expert: np.ndarray, nexperts, TP_SIZE, LOCAL_TP_SIZE,
                                            BLOCK_SIZE_M, verbose=True):
     for rank in range(TP_SIZE):
@@ -364,6 +378,9 @@ def check_with_ntokens_per_rank_per_expert(ntokens_per_rank_per_expert: np.ndarr
 
         try:
             _check_tiled_m(tile_index)
+            _check_with_host_schedule(
+                expert_id, tile_index,
+                ag_moe_swizzle_schedule(rank, TP_SIZE, LOCAL_TP_SIZE, BLOCK_SIZE_M, ntokens_per_rank_per_expert))
         except Exception as e:
             logging.fatal(
                 f"rank: {rank}, expert_id: {expert_id}, tiled_m_global: {tile_index}, ntokens_per_rank_per_expert: {ntokens_per_rank_per_expert}"
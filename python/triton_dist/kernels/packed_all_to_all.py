@@ -0,0 +1,96 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" layout math of the packed (token-count-aware) all-to-all, shared by the kernel and CPU tests.
+
+each rank sends rows grouped by expert, experts grouped by destination rank. on the receiver, rows from src rank s
+start at recv_offsets[s] = sum of rows sent to it by ranks < s: no MAX_M stride between ranks.
+"""
+import dataclasses
+from typing import List
+
+import torch
+
+
+@dataclasses.dataclass(frozen=True)
+class PackedAllToAllLayout:
+    send_splits: torch.Tensor  # [world_size (src), num_tot_experts] rows src sends to each expert
+
+    @property
+    def world_size(self) -> int:
+        return self.send_splits.shape[0]
+
+    @property
+    def experts_per_rank(self) -> int:
+        return self.send_splits.shape[1] // self.world_size
+
+    @property
+    def tokens_per_pair(self) -> torch.Tensor:
+        """ [src, dst] rows src sends to dst """
+        return self.send_splits.view(self.world_size, self.world_size, self.experts_per_rank).sum(dim=2)
+
+    def send_offsets(self, src: int) -> torch.Tensor:
+        """ [world_size + 1] rows of src's send tensor for each dst start at send_offsets[dst] """
+        return _exclusive_cumsum(self.tokens_per_pair[src])
+
+    def recv_offsets(self, dst: int) -> torch.Tensor:
+        """ [world_size + 1] rows from each src start at recv_offsets[src] in dst's packed recv buffer """
+        return _exclusive_cumsum(self.tokens_per_pair[:, dst])
+
+    def recv_splits(self, dst: int) -> torch.Tensor:
+        """ [world_size (src), experts_per_rank] rows dst receives for each of its local experts """
+        epr = self.experts_per_rank
+        return self.send_splits[:, dst * epr:(dst + 1) * epr]
+
+    def dst_offset(self, src: int, dst: int) -> int:
+        """ where src writes its rows in dst's packed recv buffer. what the kernel computes on device. """
+        return int(self.tokens_per_pair[:src, dst].sum().item())
+
+    def max_recv_tokens(self) -> int:
+        return int(self.tokens_per_pair.sum(dim=0).max().item())
+
+
+def _exclusive_cumsum(x: torch.Tensor) -> torch.Tensor:
+    out = torch.zeros((x.shape[0] + 1, ), dtype=x.dtype, device=x.device)
+    torch.cumsum(x, 0, out=out[1:])
+    return out
+
+
+def packed_all_to_all_reference(send_tensors: List[torch.Tensor], send_splits: torch.Tensor) -> List[torch.Tensor]:
+    """ the packed recv buffer of each rank: rows from src 0, src 1, ... back to back.
+
+    Args:
+        send_tensors: send_tensors[src] of [sum(send_splits[src]), hidden], rows grouped by expert.
+        send_splits: [world_size, num_tot_experts]
+    """
+    layout = PackedAllToAllLayout(send_splits)
+    world_size = layout.world_size
+    outputs = []
+    for dst in range(world_size):
+        pieces = []
+        for src in range(world_size):
+            send_offsets = layout.send_offsets(src)
+            pieces.append(send_tensors[src][send_offsets[dst]:send_offsets[dst + 1]])
+        outputs.append(torch.cat(pieces))
+    return outputs
@@ -0,0 +1,113 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" host-side copy plans for the KV all-gather of sequence-parallel attention (sp_ag_attention_*).
+
+sequence i owns tokens [cu_seqlens_k[i], cu_seqlens_k[i + 1]) of the all-gathered buffer, split into world_size equal
+chunks, one per rank. on each rank, the local shard holds its chunk of sequence i at cu_seqlens_k[i] // world_size.
+
+a plan is built once per cu_seqlens_k signature from host integers, so the producer never reads cu_seqlens_k back
+from the device. copies adjacent in both source and destination are merged. with the chunked layout above that
+only happens across empty sequences or with world_size 1, so to_descriptor_table also lets all copies go out as one
+batched copy kernel instead of one cudaMemcpyAsync each.
+"""
+import dataclasses
+import functools
+from typing import List, Sequence, Tuple
+
+import torch
+
+# KVCopy.src_rank of copies from this rank's own k/v shard rather than a peer's all-gather buffer
+LOCAL_SHARD = -1
+
+
+@dataclasses.dataclass(frozen=True)
+class KVCopy:
+    src_rank: int  # LOCAL_SHARD or the rank whose all-gather buffer is read
+    src_offset: int  # in tokens
+    dst_offset: int  # in tokens, into this rank's all-gather buffer
+    num_tokens: int
+
+
+@dataclasses.dataclass(frozen=True)
+class KVAllGatherCopyPlan:
+    rank: int
+    world_size: int
+    local_copies: Tuple[KVCopy, ...]  # local shard => own all-gather buffer, before the barrier
+    peer_copies: Tuple[KVCopy, ...]  # peer all-gather buffers => own all-gather buffer, after the barrier
+
+    @property
+    def num_copies(self) -> int:
+        return len(self.local_copies) + len(self.peer_copies)
+
+    @staticmethod
+    def to_descriptor_table(copies: Sequence[KVCopy], device="cpu") -> torch.Tensor:
+        """ [num_copies, 4] int64 of (src_rank, src_offset, dst_offset, num_tokens) """
+        table = torch.tensor([dataclasses.astuple(c) for c in copies], dtype=torch.int64).view(-1, 4)
+        return table.to(device)
+
+
+def _coalesce(copies: List[KVCopy]) -> List[KVCopy]:
+    merged: List[KVCopy] = []
+    for copy in copies:
+        if copy.num_tokens == 0:
+            continue
+        if merged:
+            last = merged[-1]
+            if (last.src_rank == copy.src_rank and last.src_offset + last.num_tokens == copy.src_offset
+                    and last.dst_offset + last.num_tokens == copy.dst_offset):
+                merged[-1] = dataclasses.replace(last, num_tokens=last.num_tokens + copy.num_tokens)
+                continue
+        merged.append(copy)
+    return merged
+
+
+def build_kv_all_gather_copy_plan(cu_seqlens_k: Sequence[int], rank: int, world_size: int) -> KVAllGatherCopyPlan:
+    """ cu_seqlens_k: host integers, e.g. cu_seqlens_k.tolist(). same ranges as the per-sequence copy loops. """
+    if not 0 <= rank < world_size:
+        raise ValueError(f"rank {rank} is out of bounds for world size {world_size}.")
+    cu_seqlens_k = [int(x) for x in cu_seqlens_k]
+    chunks = []  # (sequence start, tokens per rank)
+    for start, end in zip(cu_seqlens_k[:-1], cu_seqlens_k[1:]):
+        if end < start:
+            raise ValueError(f"cu_seqlens_k must be non-decreasing, got {cu_seqlens_k}")
+        chunks.append((start, (end - start) // world_size))
+
+    local_copies = _coalesce(
+        [KVCopy(LOCAL_SHARD, start // world_size, start + rank * shard_len, shard_len) for start, shard_len in chunks])
+    peer_copies = []
+    # same ring order as the copy loops: rank + 1 first
+    for offset in range(1, world_size):
+        src_rank = (rank + offset) % world_size
+        peer_copies += _coalesce([
+            KVCopy(src_rank, start + src_rank * shard_len, start + src_rank * shard_len, shard_len)
+            for start, shard_len in chunks
+        ])
+    return KVAllGatherCopyPlan(rank, world_size, tuple(local_copies), tuple(peer_copies))
+
+
+@functools.lru_cache(maxsize=64)
+def get_kv_all_gather_copy_plan(cu_seqlens_k: Tuple[int, ...], rank: int, world_size: int) -> KVAllGatherCopyPlan:
+    """ cached by the seqlen signature: repeated batch shapes reuse the plan """
+    return build_kv_all_gather_copy_plan(cu_seqlens_k, rank, world_size)
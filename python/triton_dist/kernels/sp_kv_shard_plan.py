@@ -0,0 +1,222 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" load-balanced placement of KV pages across the ranks of sequence-parallel flash decode (SpGQAFlashDecodeAttention).
+
+each rank runs split-KV decode over its own pages, and the ranks' partial results are combined by their log-sum-exp, so
+any page may live on any rank: decode attention does not depend on token order, and ranks holding no token of a
+sequence (kv_len 0) are skipped by the combine. the step is bounded by the rank with the most KV bytes, so pages are
+placed to even out the tokens of each rank over the whole batch, instead of splitting each sequence evenly.
+
+pages are page_size tokens. only the last page of a sequence (its tail) is partial, and appended tokens go to it, so on
+each rank the pages of a sequence are full but the last one, as the paged kernels expect. a tail page is counted as
+full (count_growth): it fills up as the sequence grows. once full, the next page goes to the least loaded rank, and
+rebalance() moves full pages from the most to the least loaded rank when they drift apart by more than a page.
+"""
+import dataclasses
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import torch
+
+
+@dataclasses.dataclass(frozen=True)
+class PageMove:
+    """ copy page src_page of src_rank into page dst_page of dst_rank (both k and v caches) """
+    seq_id: Hashable
+    src_rank: int
+    src_page: int
+    dst_rank: int
+    dst_page: int
+
+
+@dataclasses.dataclass(frozen=True)
+class KVShardPlan:
+    seq_ids: Tuple[Hashable, ...]
+    kv_lens: torch.Tensor  # int32 [num_ranks, batch], the global_kv_lens of SpGQAFlashDecodeAttention.forward
+    block_tables: torch.Tensor  # int32 [num_ranks, batch, max_pages], padded with 0
+    rank_tokens: Tuple[int, ...]
+    bytes_per_token: int
+
+    @property
+    def rank_bytes(self) -> Tuple[int, ...]:
+        return tuple(tokens * self.bytes_per_token for tokens in self.rank_tokens)
+
+    @property
+    def imbalance(self) -> float:
+        """ the most loaded rank over the mean, 1.0 when balanced """
+        mean = sum(self.rank_tokens) / len(self.rank_tokens)
+        return max(self.rank_tokens) / mean if mean > 0 else 1.0
+
+    def max_kv_len(self, rank: int) -> int:
+        """ host side hint of kv_lens[rank] for the kv split planner """
+        return max(self.kv_lens[rank].tolist(), default=0)
+
+    def mean_kv_len(self, rank: int) -> float:
+        lens = self.kv_lens[rank].tolist()
+        return sum(lens) / len(lens) if lens else 0.0
+
+
+class _Page:
+    __slots__ = ("rank", "page")
+
+    def __init__(self, rank: int, page: int):
+        self.rank = rank
+        self.page = page
+
+
+class _Sequence:
+
+    def __init__(self):
+        self.kv_len = 0
+        self.pages: List[_Page] = []  # in token order, the last one is the tail
+
+
+class KVShardPlanner:
+    """ pages of each rank are indices into its [num_pages_per_rank, page_size, kv_heads, head_dim] caches.
+
+    bytes_per_token: KV bytes of a token on a rank (k and v, all layers), for rank_bytes
+    count_growth: count tail pages as full, for the tokens they will take as their sequence grows
+    """
+
+    def __init__(self, num_ranks: int, page_size: int, num_pages_per_rank: int, bytes_per_token: int = 1,
+                 count_growth: bool = True):
+        assert num_ranks > 0 and page_size > 0 and num_pages_per_rank > 0
+        self.num_ranks = num_ranks
+        self.page_size = page_size
+        self.num_pages_per_rank = num_pages_per_rank
+        self.bytes_per_token = bytes_per_token
+        self.count_growth = count_growth
+        # popped from the end: the lowest page first
+        self.free_pages: List[List[int]] = [list(range(num_pages_per_rank - 1, -1, -1)) for _ in range(num_ranks)]
+        self.sequences: Dict[Hashable, _Sequence] = {}
+        self.rank_tokens = [0] * num_ranks
+        self.rank_load = [0] * num_ranks  # rank_tokens, plus the room left in tail pages with count_growth
+
+    def _tail_room(self, seq: _Sequence) -> int:
+        return len(seq.pages) * self.page_size - seq.kv_len
+
+    def _charge(self, rank: int, tokens: int, room: int):
+        self.rank_tokens[rank] += tokens
+        self.rank_load[rank] += tokens + (room if self.count_growth else 0)
+
+    def _least_loaded_rank(self) -> int:
+        ranks = [r for r in range(self.num_ranks) if self.free_pages[r]]
+        if not ranks:
+            raise RuntimeError(f"out of KV pages on all {self.num_ranks} ranks")
+        return min(ranks, key=lambda r: (self.rank_load[r], r))
+
+    def _add_pages(self, seq: _Sequence, num_tokens: int):
+        """ num_tokens tokens in new pages, each on the least loaded rank """
+        while num_tokens > 0:
+            rank = self._least_loaded_rank()
+            tokens = min(num_tokens, self.page_size)
+            seq.pages.append(_Page(rank, self.free_pages[rank].pop()))
+            self._charge(rank, tokens, self.page_size - tokens)
+            seq.kv_len += tokens
+            num_tokens -= tokens
+
+    def add_sequence(self, seq_id: Hashable, kv_len: int):
+        """ places the pages of a prefilled sequence """
+        assert seq_id not in self.sequences, f"sequence {seq_id} already exists"
+        assert kv_len >= 0
+        seq = _Sequence()
+        self.sequences[seq_id] = seq
+        self._add_pages(seq, kv_len)
+
+    def remove_sequence(self, seq_id: Hashable):
+        seq = self.sequences.pop(seq_id)
+        room = self._tail_room(seq)
+        for i, page in enumerate(seq.pages):
+            tokens = self.page_size - (room if i == len(seq.pages) - 1 else 0)
+            self._charge(page.rank, -tokens, -(self.page_size - tokens))
+            self.free_pages[page.rank].append(page.page)
+
+    def append(self, seq_id: Hashable, num_tokens: int = 1) -> bool:
+        """ grows a sequence by num_tokens decoded tokens. returns True if it took new pages """
+        seq = self.sequences[seq_id]
+        room = self._tail_room(seq)
+        in_tail = min(room, num_tokens)
+        if in_tail > 0:
+            self._charge(seq.pages[-1].rank, in_tail, -in_tail)
+            seq.kv_len += in_tail
+        self._add_pages(seq, num_tokens - in_tail)
+        return num_tokens > in_tail
+
+    def kv_len(self, seq_id: Hashable) -> int:
+        return self.sequences[seq_id].kv_len
+
+    def rank_pages(self, seq_id: Hashable, rank: int) -> List[int]:
+        return [page.page for page in self.sequences[seq_id].pages if page.rank == rank]
+
+    def _rank_kv_len(self, seq: _Sequence, rank: int) -> int:
+        num_pages = sum(page.rank == rank for page in seq.pages)
+        if num_pages and seq.pages[-1].rank == rank:
+            return num_pages * self.page_size - self._tail_room(seq)
+        return num_pages * self.page_size
+
+    def rebalance(self, max_moves: Optional[int] = None) -> List[PageMove]:
+        """ moves full pages from the most to the least loaded rank while their loads differ by more than a page.
+
+        the caller copies each move's page between the ranks' caches before the next plan(). tail pages stay put,
+        so sequences can keep appending during the copies.
+        """
+        moves: List[PageMove] = []
+        # (page index, sequence) of the full pages of each rank
+        candidates: List[List[Tuple[int, Hashable]]] = [[] for _ in range(self.num_ranks)]
+        for seq_id, seq in self.sequences.items():
+            for i, page in enumerate(seq.pages[:-1]):
+                candidates[page.rank].append((i, seq_id))
+        while max_moves is None or len(moves) < max_moves:
+            src = max(range(self.num_ranks), key=lambda r: (self.rank_load[r], -r))
+            dst = min((r for r in range(self.num_ranks) if self.free_pages[r]),
+                      key=lambda r: (self.rank_load[r], r), default=None)
+            if dst is None or self.rank_load[src] - self.rank_load[dst] <= self.page_size or not candidates[src]:
+                break
+            i, seq_id = candidates[src].pop()
+            page = self.sequences[seq_id].pages[i]
+            dst_page = self.free_pages[dst].pop()
+            moves.append(PageMove(seq_id, src, page.page, dst, dst_page))
+            self.free_pages[src].append(page.page)
+            page.rank, page.page = dst, dst_page
+            self._charge(src, -self.page_size, 0)
+            self._charge(dst, self.page_size, 0)
+        return moves
+
+    def plan(self, seq_ids: Sequence[Hashable], max_pages: Optional[int] = None, device="cpu") -> KVShardPlan:
+        """ per rank kv_lens and block tables of the batch seq_ids, in that order """
+        seqs = [self.sequences[seq_id] for seq_id in seq_ids]
+        kv_lens = [[self._rank_kv_len(seq, rank) for seq in seqs] for rank in range(self.num_ranks)]
+        tables = [[[page.page for page in seq.pages if page.rank == rank] for seq in seqs]
+                  for rank in range(self.num_ranks)]
+        longest = max((len(table) for rank_tables in tables for table in rank_tables), default=0)
+        max_pages = longest if max_pages is None else max_pages
+        assert longest <= max_pages, f"a rank holds {longest} pages of a sequence > max_pages {max_pages}"
+        block_tables = torch.zeros((self.num_ranks, len(seqs), max_pages), dtype=torch.int32)
+        for rank, rank_tables in enumerate(tables):
+            for i, table in enumerate(rank_tables):
+                block_tables[rank, i, :len(table)] = torch.tensor(table, dtype=torch.int32)
+        rank_tokens = tuple(sum(lens) for lens in kv_lens)
+        kv_lens_tensor = torch.tensor(kv_lens, dtype=torch.int32).reshape(self.num_ranks, len(seqs))
+        return KVShardPlan(tuple(seq_ids), kv_lens_tensor.to(device), block_tables.to(device),
+                           rank_tokens, self.bytes_per_token)
@@ -0,0 +1,133 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" block schedule of ring attention prefill (sp_ag_attention_intra_node.fused_sp_ring_attn_intra_node).
+
+instead of all-gathering the KV of all ranks, each rank keeps its online softmax state (acc, m, l) for its own q shard
+and passes KV shards around the ring: at step s it holds the shard of rank (rank - s) % world_size and pulls the next
+one from rank - 1 into the other half of a double buffer. the KV memory per rank is 2 shards instead of the full
+sequence.
+
+shards follow the all-gather kernels: with zig-zag the sequence is cut into 2 * world_size blocks and rank r holds
+blocks r and 2 * world_size - 1 - r, so every rank does the same causal work at every step. q tokens are the last q_len
+of the kv_len tokens (a prefix of kv_len - q_len tokens is visible to all of them).
+
+a (BLOCK_M x BLOCK_N) tile of q rows starting at global position d and keys [n, n + BLOCK_N) is
+    full: n + BLOCK_N <= d (stage 1 of _flash_attn_forward_inner), or any tile without causal mask
+    masked: keys on the diagonal block [d, d + BLOCK_M) (stage 2)
+    skipped: n >= d + BLOCK_M, all keys after all rows
+the kernel walks the same ranges, so the schedule is the host side reference of its work.
+"""
+import dataclasses
+from typing import Tuple
+
+
+def ring_src_rank(rank: int, step: int, world_size: int) -> int:
+    """ the rank whose KV shard this rank holds at step """
+    return (rank - step) % world_size
+
+
+def shard_ranges(seq_len: int, rank: int, world_size: int, zig_zag: bool = True) -> Tuple[Tuple[int, int], ...]:
+    """ global [start, end) token ranges of rank's shard, in the order they are stored in the shard """
+    if not zig_zag:
+        block = seq_len // world_size
+        return ((rank * block, (rank + 1) * block), )
+    block = seq_len // (2 * world_size)
+    return ((rank * block, (rank + 1) * block), ((2 * world_size - 1 - rank) * block, (2 * world_size - rank) * block))
+
+
+@dataclasses.dataclass(frozen=True)
+class RingTile:
+    q_start: int  # row of the local q shard
+    q_pos: int  # global position of that row, prefix included
+    kv_start: int  # global position of the first key
+    kv_offset: int  # position of that key in the KV shard of the step
+    masked: bool
+
+
+@dataclasses.dataclass(frozen=True)
+class RingStep:
+    step: int
+    src_rank: int
+    recv_rank: int  # the rank whose buffer is pulled for the next step, -1 at the last step
+    tiles: Tuple[RingTile, ...]
+    num_skipped: int
+
+
+@dataclasses.dataclass(frozen=True)
+class RingSchedule:
+    rank: int
+    world_size: int
+    steps: Tuple[RingStep, ...]
+
+    @property
+    def num_tiles(self) -> int:
+        return sum(len(step.tiles) for step in self.steps)
+
+    @property
+    def num_masked(self) -> int:
+        return sum(tile.masked for step in self.steps for tile in step.tiles)
+
+    @property
+    def num_skipped(self) -> int:
+        return sum(step.num_skipped for step in self.steps)
+
+
+def build_ring_schedule(rank: int, world_size: int, q_len: int, kv_len: int, is_causal: bool = True,
+                        zig_zag: bool = True, block_m: int = 128, block_n: int = 64) -> RingSchedule:
+    """ tiles of one sequence on rank, per ring step. q_len / kv_len are the full (unsharded) lengths """
+    if not 0 <= rank < world_size:
+        raise ValueError(f"rank {rank} is out of bounds for world size {world_size}.")
+    if q_len > kv_len:
+        raise ValueError(f"q_len {q_len} > kv_len {kv_len}")
+    num_blocks = 2 * world_size if zig_zag else world_size
+    # tiles never straddle two blocks of a shard, nor the diagonal
+    if q_len % (num_blocks * block_m) or kv_len % (num_blocks * block_n) or (kv_len - q_len) % block_n:
+        raise ValueError(f"q_len {q_len} / kv_len {kv_len} must split into {num_blocks} blocks of whole "
+                         f"{block_m} / {block_n} tiles")
+    prefix_len = kv_len - q_len
+    q_tiles = []
+    q_start = 0
+    for begin, end in shard_ranges(q_len, rank, world_size, zig_zag):
+        for pos in range(begin, end, block_m):
+            q_tiles.append((q_start + pos - begin, prefix_len + pos))
+        q_start += end - begin
+
+    steps = []
+    for step in range(world_size):
+        src = ring_src_rank(rank, step, world_size)
+        tiles, num_skipped = [], 0
+        for q_row, q_pos in q_tiles:
+            kv_offset = 0
+            for begin, end in shard_ranges(kv_len, src, world_size, zig_zag):
+                for n in range(begin, end, block_n):
+                    if is_causal and n >= q_pos + block_m:
+                        num_skipped += 1
+                    else:
+                        masked = is_causal and n + block_n > q_pos
+                        tiles.append(RingTile(q_row, q_pos, n, kv_offset + n - begin, masked))
+                kv_offset += end - begin
+        recv_rank = (rank - 1) % world_size if step + 1 < world_size else -1
+        steps.append(RingStep(step, src, recv_rank, tuple(tiles), num_skipped))
+    return RingSchedule(rank, world_size, tuple(steps))
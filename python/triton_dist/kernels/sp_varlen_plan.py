@@ -0,0 +1,191 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" varlen batches for causal sequence-parallel attention (fused_sp_ag_attn_*, fused_sp_ring_attn_intra_node).
+
+the kernels cut each sequence into world_size (or 2 * world_size with zig-zag) equal chunks: rank r holds chunk r, and
+with zig-zag chunk 2 * world_size - 1 - r too, so that every rank gets as much causal work. a length that does not
+divide leaves its remainder tokens out. plan_sp_varlen_batch pads each sequence at its end to a multiple of the chunk
+count (times block_size, e.g. the BLOCK_M of the kernels): with a causal mask, padded keys come after every real query
+and are never seen, and the outputs of padded queries are dropped.
+
+the plan holds the tables the kernels take (cu_seqlens_q of the q shards, cu_seqlens_k of the padded sequences), the
+rows of the packed batch that make up each rank's q / kv shard, and the causal (q, k) pairs each rank computes.
+"""
+import dataclasses
+from typing import List, Sequence, Tuple
+
+import torch
+
+# row index of padding in SPVarlenPlan.q_rows / kv_rows
+PAD = -1
+
+
+def _chunks(seq_len: int, rank: int, world_size: int, zig_zag: bool) -> List[Tuple[int, int]]:
+    if not zig_zag:
+        chunk = seq_len // world_size
+        return [(rank * chunk, (rank + 1) * chunk)]
+    chunk = seq_len // (2 * world_size)
+    return [(rank * chunk, (rank + 1) * chunk), ((2 * world_size - 1 - rank) * chunk, (2 * world_size - rank) * chunk)]
+
+
+def _cumsum(values):
+    total = 0
+    for value in values:
+        total += value
+        yield total
+
+
+def _causal_pairs(q_begin: int, q_end: int, prefix_len: int, kv_len: int) -> int:
+    """ sum over queries i in [q_begin, q_end) of the keys they see, min(kv_len, prefix_len + i + 1) """
+    # queries up to kv_len - prefix_len - 1 see prefix_len + i + 1 keys, the others all kv_len
+    split = min(max(kv_len - prefix_len, q_begin), q_end)
+    below = (split - q_begin) * prefix_len + (q_begin + 1 + split) * (split - q_begin) // 2
+    return below + (q_end - split) * kv_len
+
+
+@dataclasses.dataclass(frozen=True)
+class SPVarlenPlan:
+    world_size: int
+    zig_zag: bool
+    is_causal: bool
+    seqlens_q: Tuple[int, ...]
+    seqlens_k: Tuple[int, ...]
+    padded_seqlens_q: Tuple[int, ...]
+    padded_seqlens_k: Tuple[int, ...]
+    # (q, k) pairs computed by each rank, padding included, and the ones of real tokens only
+    rank_pairs: Tuple[int, ...]
+    rank_useful_pairs: Tuple[int, ...]
+
+    @property
+    def cu_seqlens_q(self) -> List[int]:
+        """ cu_seqlens_q of the kernels: offsets of the sequences in each rank's q shard """
+        return [0] + list(_cumsum(n // self.world_size for n in self.padded_seqlens_q))
+
+    @property
+    def cu_seqlens_k(self) -> List[int]:
+        """ cu_seqlens_k of the kernels: offsets of the padded sequences. kv shards are at cu_seqlens_k // world_size
+        """
+        return [0] + list(_cumsum(self.padded_seqlens_k))
+
+    @property
+    def max_seqlen_q(self) -> int:
+        return max(self.padded_seqlens_q, default=0)
+
+    @property
+    def max_seqlen_k(self) -> int:
+        return max(self.padded_seqlens_k, default=0)
+
+    @property
+    def num_pad_tokens(self) -> int:
+        return sum(self.padded_seqlens_k) - sum(self.seqlens_k)
+
+    @property
+    def imbalance(self) -> float:
+        """ pairs of the busiest rank over the mean, 1.0 when balanced """
+        mean = sum(self.rank_pairs) / self.world_size
+        return max(self.rank_pairs) / mean if mean > 0 else 1.0
+
+    def rank_flops(self, q_head: int, head_dim: int) -> Tuple[int, ...]:
+        """ forward FLOPs of each rank: QK^T and PV, 2 * head_dim each per (q, k) pair and head """
+        return tuple(4 * pairs * q_head * head_dim for pairs in self.rank_pairs)
+
+    def _rows(self, rank: int, seqlens: Sequence[int], padded: Sequence[int]) -> List[int]:
+        rows, start = [], 0
+        for seq_len, padded_len in zip(seqlens, padded):
+            for begin, end in _chunks(padded_len, rank, self.world_size, self.zig_zag):
+                rows += [start + i if i < seq_len else PAD for i in range(begin, end)]
+            start += seq_len
+        return rows
+
+    def q_rows(self, rank: int) -> List[int]:
+        """ row of the packed q of each row of rank's q shard, PAD for padding """
+        return self._rows(rank, self.seqlens_q, self.padded_seqlens_q)
+
+    def kv_rows(self, rank: int) -> List[int]:
+        """ row of the packed k / v of each row of rank's kv shard, PAD for padding """
+        return self._rows(rank, self.seqlens_k, self.padded_seqlens_k)
+
+    def tables(self, device="cpu"):
+        """ int32 cu_seqlens_q and cu_seqlens_k on device, for the kernels """
+        return (torch.tensor(self.cu_seqlens_q, dtype=torch.int32, device=device),
+                torch.tensor(self.cu_seqlens_k, dtype=torch.int32, device=device))
+
+
+def plan_sp_varlen_batch(seqlens_q: Sequence[int], seqlens_k: Sequence[int], world_size: int, zig_zag: bool = True,
+                         is_causal: bool = True, block_size: int = 1) -> SPVarlenPlan:
+    """ pads each sequence at its end so that it cuts into equal chunks of whole blocks of block_size tokens.
+
+    q and kv of a sequence take the same padding, to keep its prefix (seqlen_k - seqlen_q) visible to all queries,
+    so the prefix must already be a multiple of the chunk size. without causal mask, padded keys would be seen:
+    lengths must divide then.
+    """
+    if len(seqlens_q) != len(seqlens_k):
+        raise ValueError(f"{len(seqlens_q)} q lengths for {len(seqlens_k)} kv lengths")
+    num_chunks = 2 * world_size if zig_zag else world_size
+    multiple = num_chunks * block_size
+    padded_q, padded_k = [], []
+    for q_len, kv_len in zip(seqlens_q, seqlens_k):
+        if q_len > kv_len:
+            raise ValueError(f"seqlen_q {q_len} > seqlen_k {kv_len}")
+        pad = -q_len % multiple
+        if (kv_len + pad) % multiple:
+            raise ValueError(f"the prefix of {kv_len - q_len} tokens (seqlen_k {kv_len} - seqlen_q {q_len}) must be a "
+                             f"multiple of {multiple} to pad the sequence")
+        if pad and not is_causal:
+            raise ValueError(f"seqlen {q_len} / {kv_len} must be a multiple of {multiple} without causal mask")
+        padded_q.append(q_len + pad)
+        padded_k.append(kv_len + pad)
+
+    rank_pairs, rank_useful = [], []
+    for rank in range(world_size):
+        pairs = useful = 0
+        for q_len, kv_len, pq, pk in zip(seqlens_q, seqlens_k, padded_q, padded_k):
+            prefix_len = kv_len - q_len
+            for begin, end in _chunks(pq, rank, world_size, zig_zag):
+                if is_causal:
+                    pairs += _causal_pairs(begin, end, prefix_len, pk)
+                    if begin < q_len:
+                        useful += _causal_pairs(begin, min(end, q_len), prefix_len, kv_len)
+                else:
+                    pairs += (end - begin) * pk
+                    useful += (end - begin) * kv_len
+        rank_pairs.append(pairs)
+        rank_useful.append(useful)
+    return SPVarlenPlan(world_size, zig_zag, is_causal, tuple(seqlens_q), tuple(seqlens_k), tuple(padded_q),
+                        tuple(padded_k), tuple(rank_pairs), tuple(rank_useful))
+
+
+def gather_shard(x: torch.Tensor, rows: Sequence[int]) -> torch.Tensor:
+    """ rows of the packed x (PAD: zeros), e.g. gather_shard(q, plan.q_rows(rank)) """
+    index = torch.tensor(rows, dtype=torch.long, device=x.device)
+    shard = x[index.clamp_min(0)]
+    return shard.masked_fill((index == PAD).view((-1, ) + (1, ) * (x.dim() - 1)), 0)
+
+
+def scatter_shard(out: torch.Tensor, shard: torch.Tensor, rows: Sequence[int]):
+    """ writes the real rows of shard (e.g. the attention output of plan.q_rows(rank)) back into the packed out """
+    index = torch.tensor(rows, dtype=torch.long, device=shard.device)
+    keep = index != PAD
+    out[index[keep]] = shard[keep]
@@ -0,0 +1,227 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" sampled per-step latency breakdown of decode steps.
+
+every sample_every steps, StepTimer marks the step and the regions of each layer:
+    qkv: qkv projection (with the allgather of triton_dist)
+    attn: qk norm, RoPE, kv cache update and attention
+    o_proj: output projection with its AllReduce / ReduceScatter
+    mlp_gate_up: gate/up projection (with the allgather of triton_dist) and activation
+    mlp_down: down projection with its AllReduce / ReduceScatter
+marks are CUDA events by default, read once they completed so that no step waits on them, and CPU timestamps for
+tests. resolved steps go to a ring buffer of the last `capacity` records, aggregated as p50/p99/mean in ms.
+
+regions are only marked by eager steps: a CUDA graph replay marks the whole step.
+"""
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+CATEGORIES = ("qkv", "attn", "o_proj", "mlp_gate_up", "mlp_down")
+
+
+class CPUTimerBackend:
+
+    def mark(self):
+        return time.perf_counter()
+
+    def ready(self, mark) -> bool:
+        return True
+
+    def wait(self, mark):
+        pass
+
+    def elapsed_ms(self, start, end) -> float:
+        return (end - start) * 1e3
+
+    def release(self, mark):
+        pass
+
+
+class CUDAEventTimerBackend:
+    """ events are recorded on the current stream, and recycled once read """
+
+    def __init__(self):
+        self._free = []
+
+    def mark(self):
+        import torch
+        event = self._free.pop() if self._free else torch.cuda.Event(enable_timing=True)
+        event.record()
+        return event
+
+    def ready(self, mark) -> bool:
+        return mark.query()
+
+    def wait(self, mark):
+        mark.synchronize()
+
+    def elapsed_ms(self, start, end) -> float:
+        return start.elapsed_time(end)
+
+    def release(self, mark):
+        self._free.append(mark)
+
+
+@dataclass
+class StepRecord:
+    step: int
+    step_ms: float
+    # summed over layers
+    category_ms: Dict[str, float] = field(default_factory=dict)
+    layer_ms: Dict[Tuple[int, str], float] = field(default_factory=dict)
+
+
+class _NullRegion:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_REGION = _NullRegion()
+
+
+class _Region:
+
+    __slots__ = ("timer", "category", "layer", "start")
+
+    def __init__(self, timer: "StepTimer", category: str, layer: Optional[int]):
+        self.timer = timer
+        self.category = category
+        self.layer = layer
+
+    def __enter__(self):
+        self.start = self.timer.backend.mark()
+        return self
+
+    def __exit__(self, *args):
+        self.timer._marks.append((self.category, self.layer, self.start, self.timer.backend.mark()))
+        return False
+
+
+def percentile(values: List[float], q: float) -> float:
+    """ nearest rank. nan for no values """
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(q * len(values) + 0.5) - 1))]
+
+
+class StepTimer:
+
+    def __init__(self, backend=None, sample_every: int = 64, capacity: int = 1024):
+        assert sample_every > 0 and capacity > 0
+        self.backend = backend if backend is not None else CUDAEventTimerBackend()
+        self.sample_every = sample_every
+        self.records = deque(maxlen=capacity)
+        self.num_steps = 0
+        self.sampling = False
+        self._step_start = None
+        self._marks = []
+        # sampled steps whose marks may not have completed yet
+        self._pending = deque()
+
+    def begin_step(self):
+        self.sampling = self.num_steps % self.sample_every == 0
+        if self.sampling:
+            self._marks = []
+            self._step_start = self.backend.mark()
+
+    def region(self, category: str, layer: Optional[int] = None):
+        if not self.sampling:
+            return _NULL_REGION
+        return _Region(self, category, layer)
+
+    def end_step(self):
+        if self.sampling:
+            self._pending.append((self.num_steps, self._step_start, self.backend.mark(), self._marks))
+            self._marks = []
+            self.sampling = False
+        self.num_steps += 1
+        self._resolve(wait=False)
+
+    def flush(self):
+        """ waits for the marks of all sampled steps """
+        self._resolve(wait=True)
+
+    def _resolve(self, wait: bool):
+        backend = self.backend
+        while self._pending:
+            step, start, end, marks = self._pending[0]
+            if wait:
+                backend.wait(end)
+            elif not backend.ready(end):
+                return
+            self._pending.popleft()
+            record = StepRecord(step, backend.elapsed_ms(start, end))
+            for category, layer, region_start, region_end in marks:
+                ms = backend.elapsed_ms(region_start, region_end)
+                record.category_ms[category] = record.category_ms.get(category, 0.0) + ms
+                if layer is not None:
+                    record.layer_ms[(layer, category)] = record.layer_ms.get((layer, category), 0.0) + ms
+                backend.release(region_start)
+                backend.release(region_end)
+            backend.release(start)
+            backend.release(end)
+            self.records.append(record)
+
+    def summary(self, by_layer: bool = False) -> Dict[str, Dict[str, float]]:
+        """ {"step" / category / "layer{i}.{category}": {"p50_ms", "p99_ms", "mean_ms", "count"}} over the records """
+        series: Dict[str, List[float]] = {"step": [record.step_ms for record in self.records]}
+        for record in self.records:
+            for category, ms in record.category_ms.items():
+                series.setdefault(category, []).append(ms)
+            if by_layer:
+                for (layer, category), ms in record.layer_ms.items():
+                    series.setdefault(f"layer{layer}.{category}", []).append(ms)
+        return {
+            name: {
+                "p50_ms": percentile(values, 0.5),
+                "p99_ms": percentile(values, 0.99),
+                "mean_ms": sum(values) / len(values) if values else float("nan"),
+                "count": len(values),
+            }
+            for name, values in series.items()
+        }
+
+    def to_prometheus(self, name: str = "triton_dist_decode_step_latency_ms", by_layer: bool = False) -> str:
+        lines = [f"# HELP {name} decode step latency of sampled steps, and of the regions in them, in ms",
+                 f"# TYPE {name} summary"]
+        for region, stats in self.summary(by_layer).items():
+            labels = f'region="{region}"'
+            lines += [f'{name}{{{labels},quantile="0.5"}} {stats["p50_ms"]}',
+                      f'{name}{{{labels},quantile="0.99"}} {stats["p99_ms"]}',
+                      f'{name}_sum{{{labels}}} {stats["mean_ms"] * stats["count"] if stats["count"] else 0.0}',
+                      f'{name}_count{{{labels}}} {stats["count"]}']
+        return "\n".join(lines) + "\n"
+
+
+def timed(step_timer: Optional[StepTimer], category: str, layer: Optional[int] = None):
+    """ a region of step_timer, or a no-op without one """
+    return _NULL_REGION if step_timer is None else step_timer.region(category, layer)
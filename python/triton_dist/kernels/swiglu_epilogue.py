@@ -0,0 +1,68 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" interleaved gate/up layout of the fused SwiGLU epilogue in AG-GEMM, with NumPy references for CPU tests.
+
+gate_up rows are interleaved in groups of `group`: [gate[0:G], up[0:G], gate[G:2G], up[G:2G], ...]. any GEMM N-tile
+that is a multiple of 2 * group then holds whole (gate, up) pairs, and the epilogue writes SiLU(gate) * up for
+output columns [pid_n * BLOCK_N // 2, (pid_n + 1) * BLOCK_N // 2) without ever storing the [M, 2 * I] intermediate.
+"""
+import numpy as np
+
+# rows per gate/up group. divides BLOCK_SIZE_N // 2 of every matmul_get_configs() config.
+SWIGLU_INTERLEAVE_GROUP = 64
+
+
+def swiglu_interleave_index(intermediate_size: int, group: int = SWIGLU_INTERLEAVE_GROUP) -> np.ndarray:
+    """ [2 * intermediate_size] rows of cat([gate, up]) in interleaved order """
+    if intermediate_size % group != 0:
+        raise ValueError(f"intermediate size {intermediate_size} is not divisible by the interleave group {group}.")
+    groups = np.arange(intermediate_size).reshape(-1, 1, group)
+    return np.concatenate([groups, groups + intermediate_size], axis=1).reshape(-1)
+
+
+def interleave_gate_up_reference(gate: np.ndarray, up: np.ndarray, group: int = SWIGLU_INTERLEAVE_GROUP):
+    return np.concatenate([gate, up], axis=0)[swiglu_interleave_index(gate.shape[0], group)]
+
+
+def silu_reference(x: np.ndarray) -> np.ndarray:
+    return x / (1.0 + np.exp(-x))
+
+
+def swiglu_epilogue_reference(acc: np.ndarray, group: int = SWIGLU_INTERLEAVE_GROUP) -> np.ndarray:
+    """ [BLOCK_M, BLOCK_N] fp32 accumulator => [BLOCK_M, BLOCK_N // 2], with the reshape/permute/split of the kernel """
+    block_m, block_n = acc.shape
+    assert block_n % (2 * group) == 0, f"BLOCK_N {block_n} should be a multiple of 2 * group {group}"
+    acc = acc.reshape(block_m, block_n // (2 * group), 2, group).transpose(0, 1, 3, 2).reshape(block_m, block_n // 2, 2)
+    gate, up = acc[..., 0], acc[..., 1]
+    return silu_reference(gate) * up
+
+
+def fused_swiglu_gemm_reference(x: np.ndarray, w_interleaved: np.ndarray, block_n: int,
+                                group: int = SWIGLU_INTERLEAVE_GROUP) -> np.ndarray:
+    """ x: [M, K], w_interleaved: [2 * I, K] => [M, I], tile by tile along N as the kernels do """
+    acc = x.astype(np.float32) @ w_interleaved.astype(np.float32).T
+    N = acc.shape[1]
+    return np.concatenate(
+        [swiglu_epilogue_reference(acc[:, n:n + block_n], group) for n in range(0, N, block_n)], axis=1)
@@ -0,0 +1,173 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" precomputed tile orders of the multi-node GEMM-RS / AG-GEMM threadblock swizzles.
+
+threadblock_swizzle_gemm_reduce_scatter_kernel and threadblock_swizzle_allgather_gemm_kernel rebuild the per-node tile
+ranges and their prefix sums with warp shuffles for every tile. the order only depends on (M, rank, world_size, nnodes,
+BLOCK_M), so it is computed here once for all tiles with numpy and kept in a small LRU. the kernels take the uploaded
+table as swizzle_lut_ptr (USE_SWIZZLE_LUT=True) and swizzle with a single load: pid_m = lut[pid_m].
+"""
+import collections
+import functools
+
+import numpy as np
+
+GEMM_RS = "gemm_rs"
+AG_GEMM = "ag_gemm"
+SWIZZLE_KINDS = (GEMM_RS, AG_GEMM)
+
+
+def _cdiv(n, m):
+    return (n + m - 1) // m
+
+
+def _node_tile_sizes(kind: str, M: int, node_start: int, nnodes: int, block_m: int) -> np.ndarray:
+    """ tiles of each node, in swizzled order: entry i is node (i + node_start) % nnodes """
+    M_per_node = M // nnodes
+    sizes = np.empty(nnodes, dtype=np.int64)
+    for i in range(nnodes):
+        n = (i + node_start) % nnodes
+        M_node_start, M_node_end = M_per_node * n, M_per_node * (n + 1)
+        tiled_m_node_start = M_node_start // block_m
+        tiled_m_node_end = (M_node_end - 1) // block_m
+        # a tile that straddles two nodes is only counted once
+        overlaps_prev = M_node_start != 0 and (M_node_start - 1) // block_m == tiled_m_node_start
+        overlaps_next = M_node_end != M and M_node_end // block_m == tiled_m_node_end
+        if kind == GEMM_RS:
+            if i > 0 and overlaps_prev:
+                tiled_m_node_start += 1
+            if i == nnodes - 1 and overlaps_next:
+                tiled_m_node_end -= 1
+        else:
+            if i == 0 and overlaps_prev:
+                tiled_m_node_start += 1
+            if i == 0 and overlaps_next:
+                tiled_m_node_end -= 1
+            # the i == 0 adjustment above changes tiled_m_node_end, check again as the kernel does
+            if i != nnodes - 1 and M_node_end != M and M_node_end // block_m == tiled_m_node_end:
+                tiled_m_node_end -= 1
+        sizes[i] = tiled_m_node_end - tiled_m_node_start + 1
+    return sizes
+
+
+def _swizzle_lut(kind: str, M: int, rank: int, world_size: int, nnodes: int, block_m: int) -> np.ndarray:
+    if kind not in SWIZZLE_KINDS:
+        raise ValueError(f"unknown swizzle kind {kind!r}, expect one of {SWIZZLE_KINDS}")
+    assert world_size % nnodes == 0, f"world_size {world_size} is not a multiple of nnodes {nnodes}"
+    assert 0 <= rank < world_size, f"rank {rank} out of [0, {world_size})"
+    local_world_size = world_size // nnodes
+    node_id, local_rank = divmod(rank, local_world_size)
+    M_per_rank, M_per_node = M // world_size, M // nnodes
+    num_tiles = _cdiv(M, block_m)
+    # GEMM-RS starts with the next node, AG-GEMM with its own
+    node_start = node_id + 1 if kind == GEMM_RS else node_id
+
+    swizzled_sizes = _node_tile_sizes(kind, M, node_start, nnodes, block_m)
+    if swizzled_sizes.sum() != num_tiles or (swizzled_sizes < 0).any():
+        raise ValueError(f"{kind} swizzle of M={M} BLOCK_M={block_m} over {nnodes} nodes is not a permutation of "
+                         f"its {num_tiles} tiles: node tiles {swizzled_sizes.tolist()}")
+    swizzled_accum = np.concatenate(([0], np.cumsum(swizzled_sizes)))
+    sizes_accum = np.concatenate(([0], np.cumsum(np.roll(swizzled_sizes, node_start))))
+
+    tiled_m = np.arange(num_tiles, dtype=np.int64)
+    n = np.searchsorted(swizzled_accum, tiled_m, side="right") - 1
+    nid = (n + node_start) % nnodes
+    if kind == GEMM_RS:
+        tiled_m_start = (M_per_node * nid + M_per_rank * (local_rank + 1)) // block_m
+    else:
+        tiled_m_start = _cdiv(M_per_node * nid + M_per_rank * local_rank, block_m)
+    node_offset = sizes_accum[nid]
+    rank_offset = np.maximum(0, tiled_m_start - node_offset)
+    lut = node_offset + (tiled_m - swizzled_accum[n] + rank_offset) % swizzled_sizes[n]
+    if (np.bincount(lut, minlength=num_tiles) != 1).any():
+        raise ValueError(f"{kind} swizzle of M={M} BLOCK_M={block_m} on rank {rank} is not a permutation of its "
+                         f"{num_tiles} tiles")
+    lut = lut.astype(np.int32)
+    lut.flags.writeable = False
+    return lut
+
+
+@functools.lru_cache(maxsize=256)
+def gemm_rs_swizzle_lut(M: int, rank: int, world_size: int, nnodes: int, block_m: int) -> np.ndarray:
+    """ [cdiv(M, block_m)] int32, entry t is threadblock_swizzle_gemm_reduce_scatter(t, ...). read-only, cached. """
+    return _swizzle_lut(GEMM_RS, M, rank, world_size, nnodes, block_m)
+
+
+@functools.lru_cache(maxsize=256)
+def ag_gemm_swizzle_lut(M: int, rank: int, world_size: int, nnodes: int, block_m: int) -> np.ndarray:
+    """ [cdiv(M, block_m)] int32, entry t is threadblock_swizzle_allgather_gemm_kernel(t, ...). read-only, cached. """
+    return _swizzle_lut(AG_GEMM, M, rank, world_size, nnodes, block_m)
+
+
+def swizzle_lut(kind: str, M: int, rank: int, world_size: int, nnodes: int, block_m: int) -> np.ndarray:
+    if kind == GEMM_RS:
+        return gemm_rs_swizzle_lut(M, rank, world_size, nnodes, block_m)
+    if kind == AG_GEMM:
+        return ag_gemm_swizzle_lut(M, rank, world_size, nnodes, block_m)
+    raise ValueError(f"unknown swizzle kind {kind!r}, expect one of {SWIZZLE_KINDS}")
+
+
+# device tables by (kind, M, rank, world_size, nnodes, block_m, device), least recently used first
+_LUT_TENSORS = collections.OrderedDict()
+LUT_TENSOR_CACHE_SIZE = 256
+# tables a CUDA graph may have captured: never evicted, a replay reads them by address
+_PINNED_LUT_TENSORS = {}
+
+
+def get_swizzle_lut_tensor(kind: str, M: int, rank: int, world_size: int, nnodes: int, block_m: int, device="cuda",
+                           graph_safe: bool = False):
+    """ the swizzle table as an int32 tensor on device, or None to keep the in-kernel swizzle.
+
+    None if the shape has no table (the swizzle is no permutation), or if a new table would be uploaded while the
+    current stream captures a CUDA graph: run the shape once before capture. tables returned while capturing, or with
+    graph_safe=True, are pinned for the life of the process, others stay alive until LUT_TENSOR_CACHE_SIZE other
+    shapes were used after them.
+    """
+    import torch
+    if kind not in SWIZZLE_KINDS:
+        raise ValueError(f"unknown swizzle kind {kind!r}, expect one of {SWIZZLE_KINDS}")
+    key = (kind, M, rank, world_size, nnodes, block_m, str(torch.device(device)))
+    lut = _PINNED_LUT_TENSORS.get(key)
+    if lut is not None:
+        return lut
+    capturing = torch.cuda.is_available() and torch.cuda.is_current_stream_capturing()
+    lut = _LUT_TENSORS.get(key)
+    if lut is None:
+        if capturing:
+            return None
+        try:
+            table = swizzle_lut(kind, M, rank, world_size, nnodes, block_m)
+        except ValueError:
+            return None
+        lut = torch.from_numpy(table.copy()).to(key[-1])
+    if capturing or graph_safe:
+        _LUT_TENSORS.pop(key, None)
+        _PINNED_LUT_TENSORS[key] = lut
+        return lut
+    _LUT_TENSORS[key] = lut
+    _LUT_TENSORS.move_to_end(key)
+    while len(_LUT_TENSORS) > LUT_TENSOR_CACHE_SIZE:
+        _LUT_TENSORS.popitem(last=False)
+    return lut
@@ -29,6 +29,7 @@ import torch.distributed
 
 from triton_dist.kernels.amd.all_gather_gemm import create_ag_gemm_intra_node_context, ag_gemm_intra_node
 from triton_dist.kernels.amd.gemm_reduce_scatter import create_gemm_rs_intra_node_context, gemm_rs_intra_node
+from triton_dist.kernels.add_rmsnorm import add_rmsnorm_torch
 
 from flash_attn import flash_attn_with_kvcache
 import triton
@@ -59,6 +60,16 @@ def layer_norm(
                                   normalized_shape=(hidden_states.size(-1), ), weight=w, eps=eps).view_as(hidden_states)
 
 
+def add_layer_norm(
+    hidden_states: torch.Tensor,
+    residual: torch.Tensor,
+    eps: float,
+    w: torch.Tensor,
+):
+    """Fused `residual = hidden_states + residual` and RMS Normalization of it. Returns (normalized, residual)."""
+    return add_rmsnorm_torch(hidden_states, residual, w, eps)
+
+
 def _set_cos_sin_cache(inv_freq: torch.Tensor, max_length: int):
     """Precomputes cosine and sine cache for rotary position embeddings."""
     t = torch.arange(max_length, device="cuda", dtype=inv_freq.dtype)
@@ -207,6 +218,31 @@ class TP_Attn:
         if verbose:
             print(f"[RANK {self.rank}] Attn initialized with parameters: qkv ({self.wqkv.shape}, o ({self.wo.shape}))")
 
+    def _init_sharded_parameters(self, wqkv: torch.Tensor, wo: torch.Tensor, q_size: int, kv_size: int, q_norm=None,
+                                 k_norm=None, verbose=False):
+        """
+        Initializes from weights already sharded and fused for this rank, e.g. by Qwen3ShardedLoader.
+        wqkv: [q_size + 2 * kv_size, hidden_size], wo: [hidden_size, q_size], q_norm/k_norm: (weight, eps) or None.
+        """
+        if wqkv.shape[0] != q_size + 2 * kv_size:
+            raise ValueError(f"wqkv of shape {tuple(wqkv.shape)} does not match q_size {q_size} and kv_size {kv_size}.")
+        self.q_size = q_size
+        self.kv_size = kv_size
+        self.wqkv = wqkv.to("cuda", non_blocking=True)
+        self.wo = wo.to("cuda", non_blocking=True)
+
+        self.ag_N_per_rank = self.wqkv.shape[0]
+        self.K = self.wqkv.shape[1]
+        self.dtype = self.wqkv.dtype
+
+        if q_norm is not None:
+            self.q_norm_w, self.q_norm_eps = q_norm[0].to("cuda", non_blocking=True), q_norm[1]
+        if k_norm is not None:
+            self.k_norm_w, self.k_norm_eps = k_norm[0].to("cuda", non_blocking=True), k_norm[1]
+
+        if verbose:
+            print(f"[RANK {self.rank}] Attn initialized with parameters: qkv ({self.wqkv.shape}, o ({self.wo.shape}))")
+
     def _init_ctx(self, max_M, ag_intranode_stream, BLOCK_M, BLOCK_N, BLOCK_K, stages, serial=False,
                   ag_internode_stream=None):
         if serial:
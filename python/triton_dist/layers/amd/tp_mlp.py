@@ -86,6 +86,24 @@ class TP_MLP:
                 f"[RANK {self.rank}] MLP initialized with parameters: gate_up_proj shape: {self.gate_up_proj.shape}, down_proj shape: {self.down_proj.shape}"
             )
 
+    def _init_sharded_parameters(self, gate_up_proj: torch.Tensor, down_proj: torch.Tensor, act_fn, verbose=False):
+        """
+        Initializes from weights already sharded and fused for this rank, e.g. by Qwen3ShardedLoader.
+        gate_up_proj: [MLP_size * 2 // world_size, hidden_size], down_proj: [hidden_size, MLP_size // world_size].
+        """
+        self.gate_up_proj = gate_up_proj.to("cuda", non_blocking=True)
+        self.down_proj = down_proj.to("cuda", non_blocking=True)
+
+        self.act_fn = act_fn
+        self.ag_N_per_rank = self.gate_up_proj.shape[0]
+        self.K = self.gate_up_proj.shape[1]
+        self.dtype = self.gate_up_proj.dtype
+
+        if verbose:
+            print(
+                f"[RANK {self.rank}] MLP initialized with parameters: gate_up_proj shape: {self.gate_up_proj.shape}, down_proj shape: {self.down_proj.shape}"
+            )
+
     def _init_ctx(self, max_M, ag_intranode_stream, BLOCK_M, BLOCK_N, BLOCK_K, stages, serial=False,
                   ag_internode_stream=None):
         """Initializes contexts for triton_dist AllGather-GEMM and GEMM-ReduceScatter operations."""
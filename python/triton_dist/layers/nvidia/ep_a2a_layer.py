@@ -26,7 +26,9 @@
 import torch
 
 import ctypes
+from typing import Optional
 
+from triton_dist.kernels.expert_placement import ExpertMap
 from triton_dist.kernels.nvidia.ep_a2a import (
     kernel_combine_token,
     kernel_dispatch_token,
@@ -38,6 +40,10 @@ from triton_dist.utils import NVSHMEM_SIGNAL_DTYPE, nvshmem_barrier_all_on_strea
 
 
 class EPAll2AllLayer(torch.nn.Module):
+    """
+    num_tot_experts counts physical experts: with replicas planned by triton_dist.kernels.expert_placement, pass
+    ExpertPlacement.num_physical_experts and the rank's ExpertPlacement.expert_map to dispatch.
+    """
 
     def __init__(
         self,
@@ -192,7 +198,10 @@ class EPAll2AllLayer(torch.nn.Module):
         cur_output_token_num = ctypes.c_int32.from_address(base_ptr + self.rank * elem_size).value
         return self.output_buf[:cur_output_token_num]
 
-    def dispatch(self, input: torch.Tensor, exp_indices: torch.Tensor):
+    def dispatch(self, input: torch.Tensor, exp_indices: torch.Tensor, expert_map: Optional[ExpertMap] = None):
+        """ expert_map: logical -> physical experts of this rank, exp_indices are physical ones if None """
+        if expert_map is not None:
+            exp_indices = expert_map(exp_indices)
         current_stream = torch.cuda.current_stream()
         token_num, N = input.shape
         self.num_dispatch_token_cur_rank = token_num
@@ -213,6 +222,11 @@ class EPAll2AllLayer(torch.nn.Module):
         copy_out.copy_(output_buf)
         return copy_out
 
+    def routing_histogram(self):
+        """ [world_size, num_tot_experts] tokens each rank sent to each physical expert in the last dispatch, the
+        input of triton_dist.kernels.expert_placement (fold replicas with ExpertPlacement.to_logical_histogram) """
+        return self.full_splits_buf.clone()
+
     def combine_token_intra_node_and_send(self, input: torch.Tensor):
         grid = lambda meta: (self.num_sm, )
         BLOCK_SIZE = 1 << self.hidden.bit_length()
@@ -27,6 +27,7 @@ import os
 from triton_dist.kernels.nvidia import (create_fast_allgather_context, get_triton_combine_kv_algo_info,
                                         gqa_fwd_batch_decode_intra_rank_aot, gqa_fwd_batch_decode_intra_rank,
                                         kernel_inter_rank_gqa_fwd_batch_decode_combine_kv)
+from triton_dist.kernels.decode_workspace import DecodeWorkspace
 from triton_dist.utils import nvshmem_free_tensor_sync, nvshmem_create_tensor
 from .low_latency_allgather_layer import AllGatherLayer
 
@@ -44,7 +45,8 @@ if use_aot:
 class SpGQAFlashDecodeAttention(torch.nn.Module):
 
     def __init__(self, rank, node, num_ranks, num_nodes, num_q_heads, num_kv_heads, q_head_dim, v_head_dim, page_size=1,
-                 scale=1, soft_cap=0, max_allowed_batch=1, thrink_buffer_threshold=500, stages=20):
+                 scale=1, soft_cap=0, max_allowed_batch=1, thrink_buffer_threshold=500, stages=20,
+                 debug_workspace=False):
         super().__init__()
         self.rank = rank
         self.num_ranks = num_ranks
@@ -59,9 +61,13 @@ class SpGQAFlashDecodeAttention(torch.nn.Module):
         self.page_size = page_size
         self.soft_cap = soft_cap
         self.scale = scale
+        # the fixed split count, or the most splits the planner may pick if forward gets kv length hints
         self.kv_split = 32
         self.max_allowed_batch = max_allowed_batch
         self.stages = stages
+        # outputs for max_allowed_batch, allocated on the first forward with the dtype of q
+        self.decode_workspace = None
+        self.debug_workspace = debug_workspace
 
         # allgather
         self.max_allgather_buffer_size = self.num_ranks * self.num_q_heads * self.v_head_dim * 8  # bytes
@@ -80,34 +86,42 @@ class SpGQAFlashDecodeAttention(torch.nn.Module):
         self.ag_layer.finalize()
         nvshmem_free_tensor_sync(self.ag_buffer)
 
-    def forward(self, q, k_cache, v_cache, global_kv_lens, block_table):
+    def forward(self, q, k_cache, v_cache, global_kv_lens, block_table, max_kv_len=None, mean_kv_len=None):
         """
         q: each rank has the same q
         k_cache: each rank's shard of k_cache
         v_cache: each rank's shard of v_cache
         global_kv_lens: all the rank's kv shard's length
         block_table: each rank's kv shard's kv_table
+            (see triton_dist.kernels.sp_kv_shard_plan to place the pages of a batch evenly across the ranks)
+        max_kv_len, mean_kv_len: host side hints of global_kv_lens[rank], to plan the kv split of this rank's shard
+            (see get_kv_split_planner). self.kv_split splits without them
+        returns a view of the decode workspace, overwritten by the next forward
         """
         batch = q.shape[0]
         assert global_kv_lens.shape[0] == self.num_ranks
         assert global_kv_lens.shape[1] == batch
         assert batch <= self.max_allowed_batch, f"Only support {self.max_allowed_batch} queries decode now"
-        output_split = torch.empty([batch, self.num_q_heads, self.kv_split, self.v_head_dim + 1], dtype=q.dtype,
-                                   device=q.device)
-        output_combine = torch.empty([batch, self.num_q_heads, self.v_head_dim + 1], dtype=q.dtype, device=q.device)
-        final_output = torch.empty([batch, self.num_q_heads, self.v_head_dim], dtype=q.dtype, device=q.device)
+        if self.decode_workspace is None or not self.decode_workspace.matches(q.dtype, q.device):
+            self.decode_workspace = DecodeWorkspace(self.max_allowed_batch, self.num_q_heads, self.kv_split,
+                                                    self.v_head_dim, q.dtype, q.device, debug=self.debug_workspace)
+        views = self.decode_workspace.views(batch)
+        output_split, output_combine, final_output = views.output_split, views.output_combine, views.final_output
+
+        kv_split = self.kv_split if max_kv_len is None else -1
 
         current_stream = torch.cuda.current_stream()
         if use_aot:
-            gqa_fwd_batch_decode_intra_rank_aot(current_stream, q, k_cache, v_cache, self.workspace, [1] * q.shape[0],
+            gqa_fwd_batch_decode_intra_rank_aot(current_stream, q, k_cache, v_cache, self.workspace, views.q_lens,
                                                 global_kv_lens[self.rank], block_table, self.scale,
                                                 soft_cap=self.soft_cap, output_split=output_split,
-                                                output_combine=output_combine, kv_split=self.kv_split)
+                                                output_combine=output_combine, kv_split=kv_split,
+                                                max_kv_len=max_kv_len, mean_kv_len=mean_kv_len)
         else:
-            gqa_fwd_batch_decode_intra_rank(q, k_cache, v_cache, self.workspace, [1] * q.shape[0],
+            gqa_fwd_batch_decode_intra_rank(q, k_cache, v_cache, self.workspace, views.q_lens,
                                             global_kv_lens[self.rank], block_table, self.scale, soft_cap=self.soft_cap,
                                             output_split=output_split, output_combine=output_combine,
-                                            kv_split=self.kv_split)
+                                            kv_split=kv_split, max_kv_len=max_kv_len, mean_kv_len=mean_kv_len)
         ################
         # allgather part
         nbytes_per_rank = output_combine.nbytes
@@ -23,16 +23,21 @@
 #
 ################################################################################
 
+from typing import List
+
 import torch
 from torch import nn
 import torch.distributed
 import flashinfer
 
 from triton_dist.kernels.allreduce import AllReduceMethod
+from triton_dist.kernels.nvidia.add_rmsnorm import add_rmsnorm
 from triton_dist.kernels.nvidia.allgather_gemm import AllGatherGEMMTensorParallelContext, get_auto_all_gather_method, ag_gemm
 from triton_dist.kernels.nvidia import create_gemm_rs_context, gemm_rs
 from triton_dist.utils import nvshmem_barrier_all_on_stream
-from triton_dist.kernels.nvidia.allreduce import (create_allreduce_ctx, all_reduce)
+from triton_dist.kernels.nvidia.allreduce import (create_allreduce_ctx, all_reduce, allreduce_graph_hazards)
+from triton_dist.kernels.graph_safety import GraphHazard
+from triton_dist.kernels.step_timer import timed
 
 try:
     from flash_attn_interface import flash_attn_with_kvcache
@@ -66,6 +71,16 @@ def layer_norm(
     return flashinfer.norm.rmsnorm(hidden_states.view(-1, hidden_states.size(-1)), w, eps).view_as(hidden_states)
 
 
+def add_layer_norm(
+    hidden_states: torch.Tensor,
+    residual: torch.Tensor,
+    eps: float,
+    w: torch.Tensor,
+):
+    """Fused `residual = hidden_states + residual` and RMS Normalization of it. Returns (normalized, residual)."""
+    return add_rmsnorm(hidden_states, residual, w, eps)
+
+
 def _set_cos_sin_cache(inv_freq: torch.Tensor, max_length: int):
     """Precomputes cosine and sine cache for rotary position embeddings."""
     t = torch.arange(max_length, device="cuda", dtype=inv_freq.dtype)
@@ -93,6 +108,8 @@ class TP_Attn:
         self.ag_ctx = None
         self.rs_ctx = None
         self.ar_ctx = None
+        # set by Qwen3.set_step_timer
+        self.step_timer = None
 
     def _init_parameters(self, self_attn: nn.Module, verbose=False):
         self.q_size = self_attn.q_proj.weight.shape[0] // self.world_size
@@ -118,6 +135,31 @@ class TP_Attn:
         if verbose:
             print(f"[RANK {self.rank}] Attn initialized with parameters: qkv ({self.wqkv.shape}, o ({self.wo.shape}))")
 
+    def _init_sharded_parameters(self, wqkv: torch.Tensor, wo: torch.Tensor, q_size: int, kv_size: int, q_norm=None,
+                                 k_norm=None, verbose=False):
+        """
+        Initializes from weights already sharded and fused for this rank, e.g. by Qwen3ShardedLoader.
+        wqkv: [q_size + 2 * kv_size, hidden_size], wo: [hidden_size, q_size], q_norm/k_norm: (weight, eps) or None.
+        """
+        if wqkv.shape[0] != q_size + 2 * kv_size:
+            raise ValueError(f"wqkv of shape {tuple(wqkv.shape)} does not match q_size {q_size} and kv_size {kv_size}.")
+        self.q_size = q_size
+        self.kv_size = kv_size
+        self.wqkv = wqkv.to("cuda", non_blocking=True)
+        self.wo = wo.to("cuda", non_blocking=True)
+
+        self.ag_N_per_rank = self.wqkv.shape[0]
+        self.K = self.wqkv.shape[1]
+        self.dtype = self.wqkv.dtype
+
+        if q_norm is not None:
+            self.q_norm_w, self.q_norm_eps = q_norm[0].to("cuda", non_blocking=True), q_norm[1]
+        if k_norm is not None:
+            self.k_norm_w, self.k_norm_eps = k_norm[0].to("cuda", non_blocking=True), k_norm[1]
+
+        if verbose:
+            print(f"[RANK {self.rank}] Attn initialized with parameters: qkv ({self.wqkv.shape}, o ({self.wo.shape}))")
+
     def _init_ctx(self, max_M, ag_intranode_stream, ag_internode_stream, BLOCK_M, BLOCK_N, BLOCK_K, stages):
         self.ag_ctx = AllGatherGEMMTensorParallelContext(
             N_per_rank=self.ag_N_per_rank, K=self.K, tensor_dtype=self.dtype, rank=self.rank, num_ranks=self.world_size,
@@ -155,6 +197,15 @@ class TP_Attn:
         if self.ar_ctx:
             self.ar_ctx.finalize()
 
+    def graph_hazards(self, M: int, mode: str) -> List[GraphHazard]:
+        """ what breaks a captured fwd of M tokens in mode (see Qwen3Layer.set_fwd) """
+        if mode == 'triton_dist':
+            return self.ag_ctx.graph_hazards(M, persistent=False, autotune=True)
+        if mode == 'triton_dist_AR' and self.world_size > 1:
+            return allreduce_graph_hazards(self.ar_ctx, self.ar_method, M * self.K * self.dtype.itemsize,
+                                           self.dtype.itemsize)
+        return []
+
     @torch.inference_mode()
     def apply_rotary_pos_emb(self, q: torch.Tensor, k: torch.Tensor, position_ids: torch.Tensor,
                              cos_sin_cache: torch.Tensor):
@@ -174,29 +225,32 @@ class TP_Attn:
         x: input tensor, shape [batch_size, q_len, hidden_size_in] (replicated on each rank)
         """
         bsz, q_len, _ = x.size()
-        qkv = torch.nn.functional.linear(x, self.wqkv)
+        with timed(self.step_timer, "qkv", layer_idx):
+            qkv = torch.nn.functional.linear(x, self.wqkv)
 
         q, k, v = qkv.split([self.q_size, self.kv_size, self.kv_size], dim=-1)
         v = v.view(bsz, q_len, -1, self.head_dim)
 
-        # qk norm
-        if hasattr(self, 'q_norm_eps'):
-            q = layer_norm(q.contiguous().view(bsz, q_len, -1, self.head_dim), self.q_norm_eps,
-                           self.q_norm_w).view(bsz, q_len, -1)
-        if hasattr(self, 'k_norm_eps'):
-            k = layer_norm(k.contiguous().view(bsz, q_len, -1, self.head_dim), self.k_norm_eps,
-                           self.k_norm_w).view(bsz, q_len, -1)
-        # RoPE
-        q, k = self.apply_rotary_pos_emb(q, k, position_ids, cos_sin_cache)
-        k_cache, v_cache, kv_offset = kv_cache.update_kv_cache(k, v, layer_idx)
-
-        # FlashAttn
-        out = flash_attn_with_kvcache(q=q, k_cache=k_cache, v_cache=v_cache, k=k, v=v, cache_seqlens=kv_offset,
-                                      causal=True)
-
-        out = torch.nn.functional.linear(out.view(bsz, q_len, -1), self.wo)
-        if self.world_size > 1:
-            torch.distributed.all_reduce(out, torch.distributed.ReduceOp.SUM, group=self.group)
+        with timed(self.step_timer, "attn", layer_idx):
+            # qk norm
+            if hasattr(self, 'q_norm_eps'):
+                q = layer_norm(q.contiguous().view(bsz, q_len, -1, self.head_dim), self.q_norm_eps,
+                               self.q_norm_w).view(bsz, q_len, -1)
+            if hasattr(self, 'k_norm_eps'):
+                k = layer_norm(k.contiguous().view(bsz, q_len, -1, self.head_dim), self.k_norm_eps,
+                               self.k_norm_w).view(bsz, q_len, -1)
+            # RoPE
+            q, k = self.apply_rotary_pos_emb(q, k, position_ids, cos_sin_cache)
+            k_cache, v_cache, kv_offset = kv_cache.update_kv_cache(k, v, layer_idx)
+
+            # FlashAttn
+            out = flash_attn_with_kvcache(q=q, k_cache=k_cache, v_cache=v_cache, k=k, v=v, cache_seqlens=kv_offset,
+                                          causal=True)
+
+        with timed(self.step_timer, "o_proj", layer_idx):
+            out = torch.nn.functional.linear(out.view(bsz, q_len, -1), self.wo)
+            if self.world_size > 1:
+                torch.distributed.all_reduce(out, torch.distributed.ReduceOp.SUM, group=self.group)
         return out
 
     @torch.inference_mode()
@@ -210,30 +264,33 @@ class TP_Attn:
         bsz, q_len, d = x.size()
 
         # ag + gemm
-        qkv = ag_gemm(x.view(-1, d), self.wqkv, ctx=self.ag_ctx, persistent=ag_gemm_persistent,
-                      autotune=autotune).view(bsz * self.world_size, q_len, -1)
+        with timed(self.step_timer, "qkv", layer_idx):
+            qkv = ag_gemm(x.view(-1, d), self.wqkv, ctx=self.ag_ctx, persistent=ag_gemm_persistent,
+                          autotune=autotune).view(bsz * self.world_size, q_len, -1)
 
         q, k, v = qkv.split([self.q_size, self.kv_size, self.kv_size], dim=-1)
         v = v.view(bsz * self.world_size, q_len, -1, self.head_dim)
 
-        # qk norm
-        if hasattr(self, 'q_norm_eps'):
-            q = layer_norm(q.contiguous().view(bsz * self.world_size, q_len, -1, self.head_dim), self.q_norm_eps,
-                           self.q_norm_w).view(bsz * self.world_size, q_len, -1)
-        if hasattr(self, 'k_norm_eps'):
-            k = layer_norm(k.contiguous().view(bsz * self.world_size, q_len, -1, self.head_dim), self.k_norm_eps,
-                           self.k_norm_w).view(bsz * self.world_size, q_len, -1)
-        # RoPE
-        q, k = self.apply_rotary_pos_emb(q, k, position_ids, cos_sin_cache)
-        k_cache, v_cache, kv_offset = kv_cache.update_kv_cache(k, v, layer_idx)
-
-        # FlashAttn
-        out = flash_attn_with_kvcache(q=q, k_cache=k_cache, v_cache=v_cache, k=k, v=v, cache_seqlens=kv_offset,
-                                      causal=True)
+        with timed(self.step_timer, "attn", layer_idx):
+            # qk norm
+            if hasattr(self, 'q_norm_eps'):
+                q = layer_norm(q.contiguous().view(bsz * self.world_size, q_len, -1, self.head_dim), self.q_norm_eps,
+                               self.q_norm_w).view(bsz * self.world_size, q_len, -1)
+            if hasattr(self, 'k_norm_eps'):
+                k = layer_norm(k.contiguous().view(bsz * self.world_size, q_len, -1, self.head_dim), self.k_norm_eps,
+                               self.k_norm_w).view(bsz * self.world_size, q_len, -1)
+            # RoPE
+            q, k = self.apply_rotary_pos_emb(q, k, position_ids, cos_sin_cache)
+            k_cache, v_cache, kv_offset = kv_cache.update_kv_cache(k, v, layer_idx)
+
+            # FlashAttn
+            out = flash_attn_with_kvcache(q=q, k_cache=k_cache, v_cache=v_cache, k=k, v=v, cache_seqlens=kv_offset,
+                                          causal=True)
 
         # gemm + rs
-        out = gemm_rs(out.view(bsz * self.world_size * q_len, -1), self.wo, self.rs_ctx, persistent=gemm_rs_persistent,
-                      fuse_scatter=True).view(bsz, q_len, -1)
+        with timed(self.step_timer, "o_proj", layer_idx):
+            out = gemm_rs(out.view(bsz * self.world_size * q_len, -1), self.wo, self.rs_ctx,
+                          persistent=gemm_rs_persistent, fuse_scatter=True).view(bsz, q_len, -1)
         return out
 
     @torch.inference_mode()
@@ -244,30 +301,33 @@ class TP_Attn:
         x: input tensor, shape [batch_size, q_len, hidden_size_in] (replicated on each rank)
         """
         bsz, q_len, _ = x.size()
-        qkv = torch.nn.functional.linear(x, self.wqkv)
+        with timed(self.step_timer, "qkv", layer_idx):
+            qkv = torch.nn.functional.linear(x, self.wqkv)
 
         q, k, v = qkv.split([self.q_size, self.kv_size, self.kv_size], dim=-1)
         v = v.view(bsz, q_len, -1, self.head_dim)
 
-        # qk norm
-        if hasattr(self, 'q_norm_eps'):
-            q = layer_norm(q.contiguous().view(bsz, q_len, -1, self.head_dim), self.q_norm_eps,
-                           self.q_norm_w).view(bsz, q_len, -1)
-        if hasattr(self, 'k_norm_eps'):
-            k = layer_norm(k.contiguous().view(bsz, q_len, -1, self.head_dim), self.k_norm_eps,
-                           self.k_norm_w).view(bsz, q_len, -1)
-        # RoPE
-        q, k = self.apply_rotary_pos_emb(q, k, position_ids, cos_sin_cache)
-        k_cache, v_cache, kv_offset = kv_cache.update_kv_cache(k, v, layer_idx)
-
-        # FlashAttn
-        out = flash_attn_with_kvcache(q=q, k_cache=k_cache, v_cache=v_cache, k=k, v=v, cache_seqlens=kv_offset,
-                                      causal=True)
-
-        out = torch.nn.functional.linear(out.view(bsz, q_len, -1), self.wo).view(bsz * q_len, -1)
-        if self.world_size > 1:
-            out_allreduce = torch.empty_like(out)
-            out = all_reduce(x=out.contiguous(), output=out_allreduce, method=self.ar_method, ctx=self.ar_ctx)
+        with timed(self.step_timer, "attn", layer_idx):
+            # qk norm
+            if hasattr(self, 'q_norm_eps'):
+                q = layer_norm(q.contiguous().view(bsz, q_len, -1, self.head_dim), self.q_norm_eps,
+                               self.q_norm_w).view(bsz, q_len, -1)
+            if hasattr(self, 'k_norm_eps'):
+                k = layer_norm(k.contiguous().view(bsz, q_len, -1, self.head_dim), self.k_norm_eps,
+                               self.k_norm_w).view(bsz, q_len, -1)
+            # RoPE
+            q, k = self.apply_rotary_pos_emb(q, k, position_ids, cos_sin_cache)
+            k_cache, v_cache, kv_offset = kv_cache.update_kv_cache(k, v, layer_idx)
+
+            # FlashAttn
+            out = flash_attn_with_kvcache(q=q, k_cache=k_cache, v_cache=v_cache, k=k, v=v, cache_seqlens=kv_offset,
+                                          causal=True)
+
+        with timed(self.step_timer, "o_proj", layer_idx):
+            out = torch.nn.functional.linear(out.view(bsz, q_len, -1), self.wo).view(bsz * q_len, -1)
+            if self.world_size > 1:
+                out_allreduce = torch.empty_like(out)
+                out = all_reduce(x=out.contiguous(), output=out_allreduce, method=self.ar_method, ctx=self.ar_ctx)
         return out.view(bsz, q_len, -1)
 
     def fwd(self, x: torch.Tensor, position_ids: torch.Tensor, cos_sin_cache: torch.Tensor, kv_cache, layer_idx: int):
@@ -23,15 +23,21 @@
 #
 ################################################################################
 
+from typing import List
+
 import torch
 from torch import nn
 import torch.distributed
 
 from triton_dist.kernels.allreduce import AllReduceMethod
-from triton_dist.kernels.nvidia.allgather_gemm import AllGatherGEMMTensorParallelContext, get_auto_all_gather_method, ag_gemm
+from triton_dist.kernels.nvidia.allgather_gemm import (AllGatherGEMMTensorParallelContext, get_auto_all_gather_method,
+                                                       ag_gemm, interleave_gate_up_weight)
+from triton_dist.kernels.swiglu_epilogue import SWIGLU_INTERLEAVE_GROUP
 from triton_dist.kernels.nvidia import create_gemm_rs_context, gemm_rs
 from triton_dist.utils import nvshmem_barrier_all_on_stream
-from triton_dist.kernels.nvidia.allreduce import (create_allreduce_ctx, all_reduce)
+from triton_dist.kernels.nvidia.allreduce import (create_allreduce_ctx, all_reduce, allreduce_graph_hazards)
+from triton_dist.kernels.step_timer import timed
+from triton_dist.kernels.graph_safety import GraphHazard
 
 
 def shard_local(tensor: torch.Tensor, world_size: int, dim: int, local_rank: int):
@@ -66,6 +72,11 @@ class TP_MLP:
         self.ag_ctx = None
         self.rs_ctx = None
         self.ar_ctx = None
+        # set by enable_fused_swiglu: gate_up_proj rows are interleaved in groups of this size
+        self.swiglu_group = None
+        # set by Qwen3.set_step_timer
+        self.step_timer = None
+        self.layer_idx = None
 
     def _init_parameters(self, mlp: nn.Module, verbose=False):
         """
@@ -92,6 +103,43 @@ class TP_MLP:
                 f"[RANK {self.rank}] MLP initialized with parameters: gate_up_proj shape: {self.gate_up_proj.shape}, down_proj shape: {self.down_proj.shape}"
             )
 
+    def _init_sharded_parameters(self, gate_up_proj: torch.Tensor, down_proj: torch.Tensor, act_fn, verbose=False):
+        """
+        Initializes from weights already sharded and fused for this rank, e.g. by Qwen3ShardedLoader.
+        gate_up_proj: [MLP_size * 2 // world_size, hidden_size], down_proj: [hidden_size, MLP_size // world_size].
+        """
+        self.gate_up_proj = gate_up_proj.to("cuda", non_blocking=True)
+        self.down_proj = down_proj.to("cuda", non_blocking=True)
+
+        self.act_fn = act_fn
+        self.ag_N_per_rank = self.gate_up_proj.shape[0]
+        self.K = self.gate_up_proj.shape[1]
+        self.dtype = self.gate_up_proj.dtype
+
+        if verbose:
+            print(
+                f"[RANK {self.rank}] MLP initialized with parameters: gate_up_proj shape: {self.gate_up_proj.shape}, down_proj shape: {self.down_proj.shape}"
+            )
+
+    def enable_fused_swiglu(self):
+        """
+        Re-lays gate_up_proj out as interleaved gate/up groups so that dist_triton_fwd computes SiLU(gate) * up in
+        the AG-GEMM epilogue and never writes the [M, MLP_size * 2 // world_size] intermediate.
+        """
+        assert isinstance(self.act_fn, nn.SiLU), f"fused SwiGLU needs a SiLU activation, got {self.act_fn}"
+        if self.swiglu_group is not None:
+            return
+        gate, up = torch.chunk(self.gate_up_proj, 2, dim=0)
+        self.gate_up_proj = interleave_gate_up_weight(gate, up)
+        self.swiglu_group = SWIGLU_INTERLEAVE_GROUP
+
+    def _act_and_mul(self, out_fused: torch.Tensor):
+        if self.swiglu_group is not None:
+            wg, w1 = out_fused.unflatten(-1, (-1, 2, self.swiglu_group)).unbind(-2)
+            return (self.act_fn(wg) * w1).flatten(-2)
+        wg, w1 = torch.chunk(out_fused, 2, dim=-1)
+        return self.act_fn(wg) * w1
+
     def _init_ctx(self, max_M, ag_intranode_stream, ag_internode_stream, BLOCK_M, BLOCK_N, BLOCK_K, stages):
         # TODO(houqi.1993) BLOCK_SIZE should not be part of arguments, but be determined on forward.
         """Initializes contexts for triton_dist AllGather-GEMM and GEMM-ReduceScatter operations."""
@@ -124,6 +172,16 @@ class TP_MLP:
         if self.ar_ctx:
             self.ar_ctx.finalize()
 
+    def graph_hazards(self, M: int, mode: str) -> List[GraphHazard]:
+        """ what breaks a captured fwd of M tokens in mode (see Qwen3Layer.set_fwd) """
+        if mode == 'triton_dist':
+            return self.ag_ctx.graph_hazards(M, persistent=False, autotune=True,
+                                             fuse_swiglu=self.swiglu_group is not None)
+        if mode == 'triton_dist_AR' and self.world_size > 1:
+            return allreduce_graph_hazards(self.ar_ctx, self.ar_method, M * self.K * self.dtype.itemsize,
+                                           self.dtype.itemsize)
+        return []
+
     @torch.inference_mode()
     def torch_fwd(self, x):
         '''
@@ -131,12 +189,13 @@ class TP_MLP:
         Final output is AllReduced.
         x: input tensor, shape [batch_size * seq_len, hidden_size] or [batch_size, seq_len, hidden_size]
         '''
-        out_fused = torch.nn.functional.linear(x, self.gate_up_proj)
-        wg, w1 = torch.chunk(out_fused, 2, dim=-1)
-        out = self.act_fn(wg) * w1
-        out = torch.nn.functional.linear(out, self.down_proj)
-        if self.world_size > 1:
-            torch.distributed.all_reduce(out, torch.distributed.ReduceOp.SUM, group=self.group)
+        with timed(self.step_timer, "mlp_gate_up", self.layer_idx):
+            out_fused = torch.nn.functional.linear(x, self.gate_up_proj)
+            out = self._act_and_mul(out_fused)
+        with timed(self.step_timer, "mlp_down", self.layer_idx):
+            out = torch.nn.functional.linear(out, self.down_proj)
+            if self.world_size > 1:
+                torch.distributed.all_reduce(out, torch.distributed.ReduceOp.SUM, group=self.group)
         return out
 
     @torch.inference_mode()
@@ -155,11 +214,17 @@ class TP_MLP:
             is_3d_input = False
 
         # ag + gemm
-        out_fused = ag_gemm(x, self.gate_up_proj, ctx=self.ag_ctx, persistent=ag_gemm_persistent, autotune=autotune)
-        wg, w1 = torch.chunk(out_fused, 2, dim=-1)
-        out = self.act_fn(wg) * w1
+        with timed(self.step_timer, "mlp_gate_up", self.layer_idx):
+            if self.swiglu_group is not None:
+                out = ag_gemm(x, self.gate_up_proj, ctx=self.ag_ctx, persistent=ag_gemm_persistent,
+                              autotune=autotune, fuse_swiglu=True)
+            else:
+                out_fused = ag_gemm(x, self.gate_up_proj, ctx=self.ag_ctx, persistent=ag_gemm_persistent,
+                                    autotune=autotune)
+                out = self._act_and_mul(out_fused)
         # gemm + rs
-        out = gemm_rs(out, self.down_proj, self.rs_ctx, persistent=gemm_rs_persistent, fuse_scatter=True)
+        with timed(self.step_timer, "mlp_down", self.layer_idx):
+            out = gemm_rs(out, self.down_proj, self.rs_ctx, persistent=gemm_rs_persistent, fuse_scatter=True)
 
         if is_3d_input:
             out = out.view(bsz, seq, -1)
@@ -180,14 +245,15 @@ class TP_MLP:
         This version uses gemm + gemm + AllReduce
         x: input tensor, shape [batch_size, seq_len, hidden_size] or [batch_size * seq_len, hidden_size]
         """
-        out_fused = torch.nn.functional.linear(x, self.gate_up_proj)
-        wg, w1 = torch.chunk(out_fused, 2, dim=-1)
-        out = self.act_fn(wg) * w1
-        out = torch.nn.functional.linear(out, self.down_proj).view_as(x)
-        if self.world_size > 1:
-            out_ar = torch.empty_like(out)
-            assert self.ar_ctx is not None, "AllReduce context is not initialized."
-            out = all_reduce(out.contiguous(), out_ar, method=self.ar_method, ctx=self.ar_ctx)
+        with timed(self.step_timer, "mlp_gate_up", self.layer_idx):
+            out_fused = torch.nn.functional.linear(x, self.gate_up_proj)
+            out = self._act_and_mul(out_fused)
+        with timed(self.step_timer, "mlp_down", self.layer_idx):
+            out = torch.nn.functional.linear(out, self.down_proj).view_as(x)
+            if self.world_size > 1:
+                out_ar = torch.empty_like(out)
+                assert self.ar_ctx is not None, "AllReduce context is not initialized."
+                out = all_reduce(out.contiguous(), out_ar, method=self.ar_method, ctx=self.ar_ctx)
         return out.view_as(x)
 
     @torch.inference_mode()
@@ -23,6 +23,9 @@
 #
 ################################################################################
 
+import json
+import os
+
 from transformers import AutoTokenizer as HFTokenizer
 
 from .config import ModelConfig
@@ -35,11 +38,23 @@ class AutoLLM:
         "Qwen/Qwen3-14B": Qwen3,
         "Qwen/Qwen3-32B": Qwen3,
     }
+    architecture_mapping = {
+        "Qwen3ForCausalLM": Qwen3,
+    }
 
     @staticmethod
     def from_pretrained(config: ModelConfig, group=None):
         if config.model_name in AutoLLM.model_mapping:
             return AutoLLM.model_mapping[config.model_name](config, group)
+        elif os.path.isdir(config.model_name):
+            # local checkpoints, e.g. exported by triton_dist.models.presharded_checkpoint
+            with open(os.path.join(config.model_name, "config.json")) as f:
+                architectures = json.load(f).get("architectures", [])
+            for arch in architectures:
+                if arch in AutoLLM.architecture_mapping:
+                    return AutoLLM.architecture_mapping[arch](config, group)
+            raise ValueError(f"Architectures {architectures} of {config.model_name} not supported, "
+                             f"available architectures: {AutoLLM.architecture_mapping.keys()}")
         else:
             raise ValueError(f"Model {config.model_name} not found in model mapping, "
                              f"available models: {AutoLLM.model_mapping.keys()}")
@@ -35,3 +35,6 @@ class ModelConfig:
     local_only: bool = False
     rank: int = 0
     world_size: int = 8
+    # "hf": from_pretrained then shard; "safetensors": each rank mmaps only its own shards;
+    # "presharded": model_name is a directory exported by triton_dist.models.presharded_checkpoint
+    load_format: str = "hf"
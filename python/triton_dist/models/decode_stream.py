@@ -0,0 +1,241 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" host side of the decode loop, off the critical path of the GPU.
+
+each step, Engine.serve pushes the sampled tokens into a TokenRing: an async D2H copy into a pinned slot plus an event,
+so the loop never waits for the copy. a DecodeStreamWorker thread pops the slots in order and feeds a StopChecker,
+which does EOS / stop string / length checks and streaming detokenization per sequence. finished sequences are
+reported back to the loop through StopChecker.finished.
+"""
+import threading
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import torch
+
+
+class TokenRing:
+    """ `capacity` host slots of [batch_size] token ids, filled asynchronously from device in push order """
+
+    def __init__(self, capacity: int, batch_size: int, pin_memory: bool = True):
+        assert capacity > 0 and batch_size > 0
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.slots = torch.empty((capacity, batch_size), dtype=torch.long, pin_memory=pin_memory)
+        self.events: List[Optional[torch.cuda.Event]] = [None] * capacity
+        self.num_pushed = 0
+        self.num_popped = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def push(self, tokens: torch.Tensor):
+        """ tokens: [batch_size] or [batch_size, 1] on any device. blocks only if the consumer is `capacity` steps
+        behind.
+        """
+        assert tokens.numel() == self.batch_size, f"expect {self.batch_size} tokens, got {tuple(tokens.shape)}"
+        with self.cond:
+            assert not self.closed, "push to a closed TokenRing"
+            while self.num_pushed - self.num_popped >= self.capacity:
+                self.cond.wait()
+            slot = self.num_pushed % self.capacity
+        self.slots[slot].copy_(tokens.view(-1), non_blocking=True)
+        event = None
+        if tokens.is_cuda:
+            event = torch.cuda.Event()
+            event.record()
+        with self.cond:
+            self.events[slot] = event
+            self.num_pushed += 1
+            self.cond.notify_all()
+
+    def pop(self, timeout: Optional[float] = None) -> Optional[Tuple[int, List[int]]]:
+        """ (step, tokens) in push order. None once closed and drained, or on timeout """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.num_pushed > self.num_popped or self.closed, timeout=timeout):
+                return None
+            if self.num_pushed == self.num_popped:
+                return None
+            step = self.num_popped
+            slot = step % self.capacity
+            event = self.events[slot]
+        if event is not None:
+            event.synchronize()
+        tokens = self.slots[slot].tolist()
+        with self.cond:
+            self.events[slot] = None
+            self.num_popped += 1
+            self.cond.notify_all()
+        return step, tokens
+
+    def close(self):
+        """ pop() drains the pushed slots, then returns None """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class StopChecker:
+    """ per sequence stop checks and streaming detokenization.
+
+    a sequence finishes on one of eos_token_ids (not kept), once its text contains one of stop_strings (cut before
+    it), or after max_new_tokens tokens. tokens of a finished sequence are ignored. text that may begin a stop string
+    is held back from streaming until it is known not to.
+
+    decode_fn: token ids => text, e.g. partial(tokenizer.decode, skip_special_tokens=True). without it, stop_strings
+        can not be checked and no text is streamed.
+    """
+
+    def __init__(self, batch_size: int, eos_token_ids: Sequence[int] = (), stop_strings: Sequence[str] = (),
+                 max_new_tokens: Optional[int] = None, decode_fn: Optional[Callable[[List[int]], str]] = None):
+        assert decode_fn is not None or not stop_strings, "stop_strings need a decode_fn"
+        self.batch_size = batch_size
+        self.eos_token_ids = set(eos_token_ids)
+        self.stop_strings = list(stop_strings)
+        self.max_new_tokens = max_new_tokens
+        self.decode_fn = decode_fn
+        self.tokens: List[List[int]] = [[] for _ in range(batch_size)]
+        self.texts: List[str] = [""] * batch_size
+        # streaming detokenization window of each sequence
+        self.prefix_offsets: List[int] = [0] * batch_size
+        self.read_offsets: List[int] = [0] * batch_size
+        self.streamed_lens: List[int] = [0] * batch_size
+        self.finished: List[bool] = [False] * batch_size
+
+    @property
+    def all_finished(self) -> bool:
+        return all(self.finished)
+
+    def free_slots(self) -> List[int]:
+        return [i for i, finished in enumerate(self.finished) if finished]
+
+    def _detokenize(self, i: int) -> str:
+        """ text appended to sequence i since the last call.
+
+        decodes a window from prefix_offset, and takes what it adds over tokens[prefix_offset:read_offset], so the
+        cost does not grow with the sequence, and tokens merging with the ones before them decode right.
+        """
+        tokens = self.tokens[i]
+        prefix_text = self.decode_fn(tokens[self.prefix_offsets[i]:self.read_offsets[i]])
+        text = self.decode_fn(tokens[self.prefix_offsets[i]:])
+        # an incomplete multi-byte character: wait for its next token
+        if len(text) <= len(prefix_text) or text.endswith("\ufffd"):
+            return ""
+        delta = text[len(prefix_text):]
+        self.prefix_offsets[i] = self.read_offsets[i]
+        self.read_offsets[i] = len(tokens)
+        self.texts[i] += delta
+        return delta
+
+    def _find_stop_string(self, i: int, delta: str) -> int:
+        """ index of the first stop string in texts[i] that ends inside delta, or -1 """
+        text = self.texts[i]
+        begin = len(text) - len(delta)
+        found = -1
+        for stop in self.stop_strings:
+            pos = text.find(stop, max(0, begin - len(stop) + 1))
+            if pos >= 0 and (found < 0 or pos < found):
+                found = pos
+        return found
+
+    def _held_back(self, i: int) -> int:
+        """ length of the longest end of texts[i] that is the beginning of a stop string """
+        text = self.texts[i]
+        for n in range(min(len(text), max((len(stop) - 1 for stop in self.stop_strings), default=0)), 0, -1):
+            if any(stop.startswith(text[-n:]) for stop in self.stop_strings):
+                return n
+        return 0
+
+    def _stream(self, i: int) -> str:
+        end = len(self.texts[i]) if self.finished[i] else len(self.texts[i]) - self._held_back(i)
+        delta = self.texts[i][self.streamed_lens[i]:end]
+        self.streamed_lens[i] = max(self.streamed_lens[i], end)
+        return delta
+
+    def update(self, step_tokens: Sequence[int]) -> Tuple[List[int], List[Tuple[int, str]]]:
+        """ one token per sequence => (sequences finished by this step, [(sequence, new text)]) """
+        assert len(step_tokens) == self.batch_size
+        newly_finished, deltas = [], []
+        for i, token in enumerate(step_tokens):
+            if self.finished[i]:
+                continue
+            if token in self.eos_token_ids:
+                self.finished[i] = True
+            else:
+                self.tokens[i].append(token)
+                if self.decode_fn is not None:
+                    stop_pos = self._find_stop_string(i, self._detokenize(i))
+                    if stop_pos >= 0:
+                        self.texts[i] = self.texts[i][:stop_pos]
+                        self.finished[i] = True
+                if len(self.tokens[i]) == self.max_new_tokens:
+                    self.finished[i] = True
+            delta = self._stream(i)
+            if delta:
+                deltas.append((i, delta))
+            if self.finished[i]:
+                newly_finished.append(i)
+        return newly_finished, deltas
+
+
+class DecodeStreamWorker(threading.Thread):
+    """ pops a TokenRing into a StopChecker until the ring is closed.
+
+    on_text(sequence, text): called with each piece of streamed text, on this thread
+    on_finish(sequence): called when a sequence finishes, on this thread
+    """
+
+    def __init__(self, ring: TokenRing, checker: StopChecker, on_text: Optional[Callable[[int, str], None]] = None,
+                 on_finish: Optional[Callable[[int], None]] = None):
+        super().__init__(daemon=True)
+        assert ring.batch_size == checker.batch_size
+        self.ring = ring
+        self.checker = checker
+        self.on_text = on_text
+        self.on_finish = on_finish
+        self.error: Optional[BaseException] = None
+
+    def run(self):
+        try:
+            while (item := self.ring.pop()) is not None:
+                _, tokens = item
+                newly_finished, deltas = self.checker.update(tokens)
+                if self.on_text is not None:
+                    for i, text in deltas:
+                        self.on_text(i, text)
+                if self.on_finish is not None:
+                    for i in newly_finished:
+                        self.on_finish(i)
+        except BaseException as e:  # re-raised by finish() on the decode loop
+            self.error = e
+            # keep popping so that the decode loop never blocks on a full ring
+            while self.ring.pop() is not None:
+                pass
+
+    def finish(self) -> StopChecker:
+        """ closes the ring, waits for the checks of all pushed steps, and returns the checker """
+        self.ring.close()
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.checker
@@ -27,8 +27,12 @@ import torch
 import torch.distributed
 from tqdm import tqdm
 from datetime import datetime
+from functools import partial
 
 from triton_dist.kernels.allreduce import AllReduceMethod
+from triton_dist.kernels.graph_safety import copy_padded, format_graph_hazards, graph_batch_buckets, select_graph_bucket
+from triton_dist.kernels.step_timer import CATEGORIES, StepTimer
+from triton_dist.models.decode_stream import DecodeStreamWorker, StopChecker, TokenRing
 from triton_dist.models.kv_cache import KV_Cache
 from triton_dist.models import AutoLLM, AutoTokenizer, ModelConfig
 from triton_dist.models.utils import logger, sample_token
@@ -52,6 +56,17 @@ class Engine:
         self.no_graph = False
         self.backend = 'torch'
 
+        # decode loop, see triton_dist.models.decode_stream
+        self.ignore_eos = False
+        self.stop_strings = []
+        self.on_text = None  # on_text(sequence, text) streams the decoded text, on a background thread
+        self.stop_check_interval = 16  # steps between two checks of finished sequences
+        self.token_ring_capacity = 64
+
+        # sampled decode step latency, see enable_step_timer
+        self.step_timer = None
+        self.step_timer_eager = False
+
     def _init_model(self):
         self.logger.log(f"Initializing model {self.model_config}...", "info")
         self.model = AutoLLM.from_pretrained(self.model_config, self.group)
@@ -72,14 +87,48 @@ class Engine:
         )
         self.logger.log("KV Cache initialized!", "success")
 
-    def _init_cuda_graph(self, bsz: int = 1):
-        # we only init cuda graph for decoding, not for prefilling
-        self.logger.log("Capturing CUDA Graph...", "info")
-        self.mempool = torch.cuda.graphs.graph_pool_handle()
-        static_input_ids = torch.full(
-            (bsz, 1), 1225, dtype=torch.long).cuda() if self.backend != 'triton_dist' else torch.full(
-                (bsz // self.model.world_size, 1), 1225, dtype=torch.long).cuda()
-        static_position_ids = torch.full((bsz, 1), 1225, dtype=torch.long).cuda()
+    def _eager_decode_step(self, input_ids, position_ids):
+        return self.model.inference(input_ids=input_ids, position_ids=position_ids, kv_cache=self.kv_cache)
+
+    def enable_step_timer(self, sample_every: int = 64, capacity: int = 1024, eager: bool = False):
+        """ times every sample_every-th decode step, see triton_dist.kernels.step_timer. CUDA graph replays only give
+        the step latency: with eager, sampled steps run eagerly to break it down per layer and op, at the cost of
+        slower sampled steps.
+        """
+        self.step_timer = StepTimer(sample_every=sample_every, capacity=capacity)
+        self.step_timer_eager = eager
+        self.model.set_step_timer(self.step_timer)
+
+    def _timed_decode_step(self, input_ids, position_ids):
+        if self.step_timer is None:
+            return self.model_launch(input_ids, position_ids)
+        self.step_timer.begin_step()
+        if self.step_timer.sampling and self.step_timer_eager:
+            logits = self._eager_decode_step(input_ids, position_ids)
+        else:
+            logits = self.model_launch(input_ids, position_ids)
+        self.step_timer.end_step()
+        return logits
+
+    def _log_step_latency(self):
+        self.step_timer.flush()
+        summary = self.step_timer.summary()
+        if summary["step"]["count"] == 0:
+            return
+        breakdown = ", ".join(f"{name} {summary[name]['p50_ms']:.3f}" for name in CATEGORIES if name in summary)
+        self.logger.log(
+            f"Decode step latency over {summary['step']['count']} sampled steps: p50 {summary['step']['p50_ms']:.3f} ms"
+            f", p99 {summary['step']['p99_ms']:.3f} ms" + (f". p50 ms per op: {breakdown}" if breakdown else ""),
+            "info")
+
+    def _capture_decode_step(self, bsz: int):
+        """ captures a decode step of bsz sequences into self.mempool. returns a function running it for any batch of
+        at most bsz sequences, or None if an op of the step would break replay.
+        """
+        # triton_dist takes the input_ids of this rank's share of the batch
+        local_bsz = bsz // self.model.world_size if self.backend == 'triton_dist' else bsz
+        static_input_ids = torch.zeros((local_bsz, 1), dtype=torch.long, device="cuda")
+        static_position_ids = torch.zeros((bsz, 1), dtype=torch.long, device="cuda")
 
         s = torch.cuda.Stream()
         s.wait_stream(torch.cuda.current_stream())
@@ -90,23 +139,66 @@ class Engine:
             s.synchronize()
         torch.cuda.current_stream().wait_stream(s)
 
+        hazards = self.model.graph_hazards(M=bsz)
+        if hazards:
+            # same on all ranks, so no rank is left waiting in a capture the others skip
+            self.logger.log(
+                f"Skip CUDA Graph, {len(hazards)} op(s) of batch {bsz} would break replay:\n"
+                f"{format_graph_hazards(hazards)}", "warning")
+            return None
+
         graph = torch.cuda.CUDAGraph()
         with torch.cuda.graph(graph, pool=self.mempool):
             logits = self.model.inference(input_ids=static_input_ids, position_ids=static_position_ids,
                                           kv_cache=self.kv_cache)
 
         def run(input_ids, position_ids):
-            static_input_ids.copy_(input_ids)
-            static_position_ids.copy_(position_ids)
+            copy_padded(static_input_ids, input_ids)
+            copy_padded(static_position_ids, position_ids)
             graph.replay()
-            return logits.clone()
+            return logits[:input_ids.shape[0]].clone()
 
-        self.logger.log("CUDA Graph Captured!", "success")
         return run
 
-    def get_ctx(self, input_ids: torch.LongTensor):
+    def _init_cuda_graph(self, bsz: int = 1):
+        """ captures decode steps for batch sizes 1, 2, 4, ..., bsz into one memory pool. a batch runs the graph of
+        the smallest batch size that fits, padded. triton_dist only captures bsz.
+        """
+        # we only init cuda graph for decoding, not for prefilling
+        if self.backend == 'triton_dist':
+            # each rank pads its share of the batch, so a smaller batch would put its sequences in other rows than
+            # the position ids and the kv cache rows of the graph
+            buckets = [bsz]
+        else:
+            buckets = graph_batch_buckets(bsz)
+        self.logger.log(f"Capturing CUDA Graph for batch sizes {buckets}...", "info")
+        self.mempool = torch.cuda.graphs.graph_pool_handle()
+        # device side phase/signal counters, and autotune frozen by the warmup of each batch size
+        self.model.enable_graph_safe()
+
+        torch.cuda.synchronize()
+        start_time = datetime.now()
+        reserved_bytes = torch.cuda.memory_reserved()
+        graphs = {}
+        # largest first, so that smaller batch sizes reuse the blocks it leaves in the pool
+        for bucket in reversed(buckets):
+            graphs[bucket] = self._capture_decode_step(bucket)
+            if graphs[bucket] is None:
+                return self._eager_decode_step
+        torch.cuda.synchronize()
+        capture_time = (datetime.now() - start_time).total_seconds()
+        pool_mb = (torch.cuda.memory_reserved() - reserved_bytes) / 1024**2
+
+        def run(input_ids, position_ids):
+            return graphs[select_graph_bucket(position_ids.shape[0], buckets)](input_ids, position_ids)
+
+        self.logger.log(f"CUDA Graph Captured! {len(buckets)} batch sizes in {capture_time:.2f} s, "
+                        f"graph pool {pool_mb:.1f} MB", "success")
+        return run
+
+    def get_ctx(self, input_ids: torch.LongTensor, kv_cache=None):
         input_len = input_ids.size(1)
-        past_len = self.kv_cache.get_kv_len()
+        past_len = (self.kv_cache if kv_cache is None else kv_cache).get_kv_len()
         position_ids = past_len[:, None].long() + torch.arange(input_len).long().cuda()
         return position_ids
 
@@ -132,15 +224,25 @@ class Engine:
             self.model.init_triton_dist_AR_ctx(max_M=bsz, ar_method=AllReduceMethod.TwoShot_Multimem)
 
         if self.no_graph:
-
-            def run(input_ids, position_ids):
-                return self.model.inference(input_ids=input_ids, position_ids=position_ids, kv_cache=self.kv_cache)
-
-            self.model_launch = run
+            self.model_launch = self._eager_decode_step
         else:
             self.model_launch = self._init_cuda_graph(bsz)
 
-        output_ids = []
+        # sampled tokens go to a background thread for stop checks and detokenization. finished sequences are fed
+        # pad tokens and stop growing their kv cache, and the loop ends once all sequences on all ranks finished.
+        local_bsz = next_token.shape[0]
+        eos_token_ids = [] if self.ignore_eos or self.tokenizer.eos_token_id is None else [self.tokenizer.eos_token_id]
+        pad_token_id = self.tokenizer.pad_token_id or self.tokenizer.eos_token_id or 0
+        checker = StopChecker(local_bsz, eos_token_ids=eos_token_ids, stop_strings=self.stop_strings,
+                              decode_fn=partial(self.tokenizer.decode, skip_special_tokens=True))
+        worker = DecodeStreamWorker(TokenRing(self.token_ring_capacity, local_bsz), checker, on_text=self.on_text)
+        worker.start()
+        worker.ring.push(next_token)
+        active = torch.ones((local_bsz, 1), dtype=torch.bool, device="cuda")
+        kv_step = torch.ones(bsz, dtype=torch.int32, device="cuda")
+        # with triton_dist, each rank holds the kv cache rows of all ranks' sequences: they all need the same kv_step
+        gather_kv_step = self.backend == 'triton_dist' and self.model.world_size > 1
+        all_finished, all_finished_event = None, None
 
         # decode
         step_counter = 0
@@ -161,12 +263,37 @@ class Engine:
             )
             profiler.__enter__()
 
-        for _ in tqdm(range(gen_len), desc="Decoding", disable=not hasattr(self, "enable_profile")):
+        num_steps = 0
+        for step in tqdm(range(gen_len), desc="Decoding", disable=not hasattr(self, "enable_profile")):
             position_ids = self.get_ctx(next_token)
-            logits = self.model_launch(next_token, position_ids)
+            logits = self._timed_decode_step(next_token, position_ids)
             next_token = sample_token(logits[:, -1, :], temperature=self.temperature, top_p=self.top_p)
-            self.kv_cache.inc_offset()
-            output_ids.append(next_token)
+            next_token = torch.where(active, next_token, pad_token_id)
+            self.kv_cache.inc_offset(kv_step)
+            worker.ring.push(next_token)
+            num_steps += 1
+
+            if (step + 1) % self.stop_check_interval == 0:
+                # issued stop_check_interval steps ago, so this does not stall the stream. the same step on all ranks
+                if all_finished_event is not None:
+                    all_finished_event.synchronize()
+                    if all_finished.item():
+                        break
+                finished = checker.finished[:]
+                active.copy_(torch.tensor([[not f] for f in finished]).pin_memory(), non_blocking=True)
+                if gather_kv_step:
+                    torch.distributed.all_gather_into_tensor(kv_step, active.view(-1).to(torch.int32),
+                                                             group=self.group)
+                else:
+                    kv_step.copy_(active.view(-1))
+                all_finished_device = torch.full((1, ), int(all(finished)), dtype=torch.int32, device="cuda")
+                if self.model.world_size > 1:
+                    torch.distributed.all_reduce(all_finished_device, op=torch.distributed.ReduceOp.MIN,
+                                                 group=self.group)
+                all_finished = torch.empty((1, ), dtype=torch.int32, pin_memory=True)
+                all_finished.copy_(all_finished_device, non_blocking=True)
+                all_finished_event = torch.cuda.Event()
+                all_finished_event.record()
 
             if hasattr(self, "enable_profile") and self.enable_profile:
                 step_counter += 1
@@ -179,9 +306,60 @@ class Engine:
         torch.cuda.synchronize()
         torch.distributed.barrier()
         total_latency = (datetime.now() - start_time).total_seconds()
-        self.logger.log(f"Decoding finished! Total latency: {total_latency:.2f} s")
-        output_ids = torch.cat(output_ids, dim=1).cpu()
+        checker = worker.finish()
+        self.logger.log(f"Decoding finished! {num_steps} steps, total latency: {total_latency:.2f} s")
+        if self.step_timer is not None:
+            self._log_step_latency()
         if self.verbose:
-            print(self.tokenizer.batch_decode(output_ids, skip_special_tokens=True))
+            print(checker.texts)
 
         del self.model_launch
+
+    def init_serving(self, max_batch_size: int):
+        """ makes this engine a step model of max_batch_size slots for triton_dist.models.server. with more than one
+        rank, every rank has to be driven with the same requests in the same order.
+        """
+        assert self.backend in ('torch', 'triton_dist_AR'), \
+            f"serving needs the whole batch on every rank, got backend {self.backend}"
+        self.max_batch_size = max_batch_size
+        self._init_kv_cache(bsz=max_batch_size)
+        self.kv_cache.clear()
+        if self.backend == 'triton_dist_AR':
+            self.model.set_fwd(mode='triton_dist_AR')
+            self.model.init_triton_dist_AR_ctx(max_M=max_batch_size, ar_method=AllReduceMethod.TwoShot_Multimem)
+        self.model_launch = self._eager_decode_step if self.no_graph else self._init_cuda_graph(max_batch_size)
+        self.decode_mode = self.model.fwd_mode
+
+    @torch.inference_mode()
+    def prefill(self, slot: int, prompt_ids) -> int:
+        input_ids = torch.tensor([list(prompt_ids)], dtype=torch.long, device="cuda")
+        kv_slot = self.kv_cache.slot(slot)
+        kv_slot.get_kv_len().zero_()
+        # prefill with torch fwd, as serve does
+        self.model.set_fwd(mode='torch')
+        logits = self.model.inference(input_ids=input_ids, position_ids=self.get_ctx(input_ids, kv_slot),
+                                      kv_cache=kv_slot)
+        self.model.set_fwd(mode=self.decode_mode)
+        kv_slot.get_kv_len().fill_(input_ids.shape[-1])
+        return sample_token(logits[:, -1, :], temperature=self.temperature, top_p=self.top_p).item()
+
+    @torch.inference_mode()
+    def decode(self, slots, tokens):
+        """ one decode step of the first max(slots) + 1 rows. rows not in slots are fed pad tokens and keep their
+        kv length, so they do not change.
+        """
+        num_rows = max(slots) + 1
+        rows = torch.tensor(slots, dtype=torch.long, device="cuda")
+        pad_token_id = self.tokenizer.pad_token_id or self.tokenizer.eos_token_id or 0
+        input_ids = torch.full((num_rows, 1), pad_token_id, dtype=torch.long, device="cuda")
+        input_ids[rows, 0] = torch.tensor(tokens, dtype=torch.long, device="cuda")
+        position_ids = self.kv_cache.get_kv_len()[:num_rows, None].long()
+        logits = self._timed_decode_step(input_ids, position_ids)
+        next_token = sample_token(logits[:, -1, :], temperature=self.temperature, top_p=self.top_p)
+        kv_step = torch.zeros(self.max_batch_size, dtype=torch.int32, device="cuda")
+        kv_step[rows] = 1
+        self.kv_cache.inc_offset(kv_step)
+        return next_token.view(-1)[rows].tolist()
+
+    def release(self, slot: int):
+        self.kv_cache.slot(slot).get_kv_len().zero_()
@@ -47,7 +47,12 @@ class KV_Cache:
         self.kv_offset = torch.zeros(batch_size, dtype=torch.int32, device="cuda")
 
     def update_kv_cache(self, new_k_cache: torch.Tensor, new_v_cache: torch.Tensor, layer_idx: int):
-        return self.k_cache[layer_idx], self.v_cache[layer_idx], self.kv_offset
+        # a batch smaller than batch_size (e.g. a smaller CUDA graph bucket) uses the first slots
+        bsz = new_k_cache.shape[0]
+        return self.k_cache[layer_idx, :bsz], self.v_cache[layer_idx, :bsz], self.kv_offset[:bsz]
+
+    def slot(self, index: int) -> "KV_CacheSlot":
+        return KV_CacheSlot(self, index)
 
     def rand_fill_kv_cache(self, offset: int):
         kv_shape = self.k_cache[:, :, :offset].size()
@@ -56,11 +61,30 @@ class KV_Cache:
         self.k_cache[:, :, :offset].copy_(k)
         self.v_cache[:, :, :offset].copy_(v)
 
-    def inc_offset(self):
-        self.kv_offset += 1
+    def inc_offset(self, step: torch.Tensor = None):
+        """ step: [batch_size] int32 on device, e.g. 0 for finished sequences so that they stop growing """
+        self.kv_offset += 1 if step is None else step
 
     def clear(self):
         self.kv_offset.zero_()
 
     def get_kv_len(self):
         return self.kv_offset
+
+
+class KV_CacheSlot:
+    """ one sequence of a KV_Cache, e.g. to prefill a sequence while the others are decoding """
+
+    def __init__(self, kv_cache: KV_Cache, index: int) -> None:
+        assert 0 <= index < kv_cache.batch_size
+        self.kv_cache = kv_cache
+        self.index = index
+
+    def update_kv_cache(self, new_k_cache: torch.Tensor, new_v_cache: torch.Tensor, layer_idx: int):
+        assert new_k_cache.shape[0] == 1
+        rows = slice(self.index, self.index + 1)
+        return (self.kv_cache.k_cache[layer_idx, rows], self.kv_cache.v_cache[layer_idx, rows],
+                self.kv_cache.kv_offset[rows])
+
+    def get_kv_len(self):
+        return self.kv_cache.kv_offset[self.index:self.index + 1]
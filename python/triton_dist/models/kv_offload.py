@@ -0,0 +1,343 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" two-tier KV pages: a device pool that the decode kernels read, backed by a pinned host pool.
+
+each sequence has a list of logical pages, each on device or on host. when the device pool is full, pages of the
+coldest sequences are evicted to host: lowest priority first, then least recently used. prefetch() and append_page()
+keep the sequences of the last acquire() on device, as they are likely to run again. evictions are ordered after the
+work already queued on the current stream, so a step in flight still reads its pages.
+
+a step:
+    cache.prefetch(next_seqs)         # async H2D of their host pages on the copy engine, before they are needed
+    block_table = cache.acquire(seqs)  # waits for their in-flight pages (a stall) and fetches the rest (a miss)
+    ... decode with block_table ...
+
+the device pool is any set of tensors with pages on dim 0, e.g. the k / v caches of flash_decode.gqa_fwd_batch_decode
+([num_pages, page_size, kv_heads, head_dim]) and their kv_quant scales. the policy, page tables and prefetch
+scheduling are host side only: with SyncCopyEngine and host tensors as the device pool it runs on CPU.
+"""
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence
+
+import torch
+
+
+class SyncCopyEngine:
+    """ copies at issue, e.g. for host tensors standing in for device pages """
+
+    def copy(self, dsts: Sequence[torch.Tensor], srcs: Sequence[torch.Tensor]) -> Any:
+        for dst, src in zip(dsts, srcs):
+            dst.copy_(src)
+        return None
+
+    def done(self, handle) -> bool:
+        return True
+
+    def synchronize(self, handle):
+        pass
+
+    def wait(self, handle):
+        pass
+
+
+class CUDACopyEngine:
+    """ copies on a side stream, after the work already queued on the current stream.
+
+    copies run in issue order, so a page evicted then refilled by a fetch is never overwritten early. wait() orders the
+    current stream after a copy, without blocking the host.
+    """
+
+    def __init__(self, stream: Optional[torch.cuda.Stream] = None):
+        self.stream = stream if stream is not None else torch.cuda.Stream()
+
+    def copy(self, dsts: Sequence[torch.Tensor], srcs: Sequence[torch.Tensor]) -> torch.cuda.Event:
+        self.stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(self.stream):
+            for dst, src in zip(dsts, srcs):
+                dst.copy_(src, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record()
+        return event
+
+    def done(self, handle: torch.cuda.Event) -> bool:
+        return handle.query()
+
+    def synchronize(self, handle: torch.cuda.Event):
+        handle.synchronize()
+
+    def wait(self, handle: torch.cuda.Event):
+        torch.cuda.current_stream().wait_event(handle)
+
+
+@dataclass
+class OffloadStats:
+    evicted_pages: int = 0
+    fetched_pages: int = 0
+    bytes_d2h: int = 0
+    bytes_h2d: int = 0
+    # pages of acquire() already on device, prefetched and done, prefetched and still in flight, or not prefetched
+    resident_hits: int = 0
+    prefetch_hits: int = 0
+    prefetch_stalls: int = 0
+    demand_fetches: int = 0
+    stall_s: float = 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return dict(self.__dict__)
+
+
+class _Page:
+    __slots__ = ("device", "host", "fetch", "fetch_pending")
+
+    def __init__(self, device: int = -1, host: int = -1):
+        self.device = device
+        self.host = host
+        # copy handle of a fetch into self.device. until acquire() waits for it, the host page is kept
+        self.fetch = None
+        self.fetch_pending = False
+
+    @property
+    def on_device(self) -> bool:
+        return self.device >= 0
+
+
+class _Sequence:
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self.last_used = -1
+        self.pages: List[_Page] = []
+
+
+class TieredKVCache:
+    """ pages of device_pools (tensors with pages on dim 0) backed by num_host_pages pages of host memory.
+
+    priority: a sequence of higher priority is evicted after the ones of lower priority, whatever their use.
+    """
+
+    def __init__(self, device_pools: Sequence[torch.Tensor], num_host_pages: int, copy_engine=None,
+                 pin_memory: bool = True, clock: Callable[[], float] = time.perf_counter):
+        assert len(device_pools) > 0
+        self.num_device_pages = device_pools[0].shape[0]
+        assert all(pool.shape[0] == self.num_device_pages for pool in device_pools)
+        self.device_pools = list(device_pools)
+        self.host_pools = [
+            torch.empty((num_host_pages, ) + tuple(pool.shape[1:]), dtype=pool.dtype, pin_memory=pin_memory)
+            for pool in device_pools
+        ]
+        self.num_host_pages = num_host_pages
+        self.page_bytes = sum(pool[0].nbytes for pool in device_pools)
+        self.copy_engine = copy_engine if copy_engine is not None else SyncCopyEngine()
+        self.clock = clock
+        self.stats = OffloadStats()
+
+        # popped from the end: the lowest page first
+        self.free_device: List[int] = list(range(self.num_device_pages - 1, -1, -1))
+        self.free_host: List[int] = list(range(num_host_pages - 1, -1, -1))
+        # copy handle of the eviction out of a free device page, to order its next writer after it
+        self.device_evictions: Dict[int, Any] = {}
+        self.sequences: Dict[Hashable, _Sequence] = {}
+        self.active: List[Hashable] = []
+        self.step = 0
+
+    # sequences
+
+    def add_sequence(self, seq_id: Hashable, priority: int = 0):
+        assert seq_id not in self.sequences, f"sequence {seq_id} already exists"
+        self.sequences[seq_id] = _Sequence(priority)
+
+    def remove_sequence(self, seq_id: Hashable):
+        seq = self.sequences.pop(seq_id)
+        for page in seq.pages:
+            if page.on_device:
+                if page.fetch_pending:
+                    self.device_evictions[page.device] = page.fetch
+                self.free_device.append(page.device)
+            if page.host >= 0:
+                self.free_host.append(page.host)
+        if seq_id in self.active:
+            self.active.remove(seq_id)
+
+    def set_priority(self, seq_id: Hashable, priority: int):
+        self.sequences[seq_id].priority = priority
+
+    def num_pages(self, seq_id: Hashable) -> int:
+        return len(self.sequences[seq_id].pages)
+
+    def num_host_resident(self, seq_id: Hashable) -> int:
+        return sum(not page.on_device for page in self.sequences[seq_id].pages)
+
+    def append_page(self, seq_id: Hashable) -> int:
+        """ a new device page at the end of the sequence, returns its index in the device pools """
+        seq = self.sequences[seq_id]
+        device = self._alloc_device(1, protected=set(self.active) | {seq_id})[0]
+        self._wait_eviction(device)
+        seq.pages.append(_Page(device=device))
+        return device
+
+    # eviction
+
+    def _eviction_order(self, protected) -> List[_Page]:
+        """ device pages that may be evicted, coldest first: by priority, then last use, then page order """
+        order = sorted((seq for seq_id, seq in self.sequences.items() if seq_id not in protected),
+                       key=lambda seq: (seq.priority, seq.last_used))
+        return [page for seq in order for page in seq.pages if page.on_device]
+
+    def _evict(self, pages: List[_Page]):
+        if not pages:
+            return
+        # prefetched but not used yet: the host page is still valid, only the device page is dropped
+        clean = [page for page in pages if page.fetch_pending]
+        dirty = [page for page in pages if not page.fetch_pending]
+        if len(self.free_host) < len(dirty):
+            raise RuntimeError(f"out of host KV pages: evicting {len(dirty)}, {len(self.free_host)} free")
+        for page in clean:
+            self.device_evictions[page.device] = page.fetch
+            self.free_device.append(page.device)
+            page.device = -1
+            page.fetch = None
+            page.fetch_pending = False
+        if not dirty:
+            return
+        dsts, srcs, devices = [], [], []
+        for page in dirty:
+            page.host = self.free_host.pop()
+            for host_pool, device_pool in zip(self.host_pools, self.device_pools):
+                dsts.append(host_pool[page.host])
+                srcs.append(device_pool[page.device])
+            devices.append(page.device)
+            page.device = -1
+        handle = self.copy_engine.copy(dsts, srcs)
+        for device in devices:
+            self.device_evictions[device] = handle
+            self.free_device.append(device)
+        self.stats.evicted_pages += len(dirty)
+        self.stats.bytes_d2h += len(dirty) * self.page_bytes
+
+    def _alloc_device(self, n: int, protected) -> List[int]:
+        if len(self.free_device) < n:
+            victims = self._eviction_order(protected)[:n - len(self.free_device)]
+            self._evict(victims)
+        if len(self.free_device) < n:
+            raise RuntimeError(f"out of device KV pages: need {n}, {len(self.free_device)} free or evictable")
+        return [self.free_device.pop() for _ in range(n)]
+
+    def _wait_eviction(self, device: int):
+        """ the current stream writes a page only after the eviction that freed it has read it """
+        handle = self.device_evictions.pop(device, None)
+        if handle is not None:
+            self.copy_engine.wait(handle)
+
+    def evict(self, seq_id: Hashable):
+        """ offloads all device pages of an idle sequence """
+        assert seq_id not in self.active, f"sequence {seq_id} is in use by the last step"
+        self._evict([page for page in self.sequences[seq_id].pages if page.on_device])
+
+    # fetch
+
+    def _fetch(self, pages: List[_Page], devices: List[int]):
+        dsts, srcs = [], []
+        for page, device in zip(pages, devices):
+            self.device_evictions.pop(device, None)  # ordered by the copy engine
+            page.device = device
+            for host_pool, device_pool in zip(self.host_pools, self.device_pools):
+                dsts.append(device_pool[device])
+                srcs.append(host_pool[page.host])
+        handle = self.copy_engine.copy(dsts, srcs)
+        for page in pages:
+            page.fetch = handle
+            page.fetch_pending = True
+        self.stats.fetched_pages += len(pages)
+        self.stats.bytes_h2d += len(pages) * self.page_bytes
+
+    def _release_host(self, page: _Page):
+        self.free_host.append(page.host)
+        page.host = -1
+        page.fetch = None
+        page.fetch_pending = False
+
+    def prefetch(self, seq_ids: Sequence[Hashable], max_pages: Optional[int] = None) -> int:
+        """ starts fetching the host pages of seq_ids, e.g. the sequences of the next step, so that acquire() finds
+        them on device. evicts other sequences than seq_ids and the last step's to make room, and fetches what fits.
+        returns the number of pages fetched.
+        """
+        protected = set(self.active) | set(seq_ids)
+        pages = [page for seq_id in seq_ids for page in self.sequences[seq_id].pages if not page.on_device]
+        if max_pages is not None:
+            pages = pages[:max_pages]
+        evictable = len(self._eviction_order(protected))
+        pages = pages[:len(self.free_device) + min(evictable, len(self.free_host))]
+        if pages:
+            self._fetch(pages, self._alloc_device(len(pages), protected))
+        return len(pages)
+
+    def acquire(self, seq_ids: Sequence[Hashable]) -> List[List[int]]:
+        """ device page indices of each sequence, for the step that reads seq_ids. in-flight prefetches are waited for
+        and host pages that were not prefetched are fetched now, both counted as stall time. seq_ids then stay on
+        device until the next acquire().
+        """
+        self.step += 1
+        protected = set(seq_ids)
+        missing = []
+        for seq_id in seq_ids:
+            seq = self.sequences[seq_id]
+            seq.last_used = self.step
+            for page in seq.pages:
+                if not page.on_device:
+                    missing.append(page)
+                elif page.fetch_pending:
+                    if self.copy_engine.done(page.fetch):
+                        self.stats.prefetch_hits += 1
+                    else:
+                        self.stats.prefetch_stalls += 1
+                else:
+                    self.stats.resident_hits += 1
+        start = self.clock()
+        if missing:
+            self.stats.demand_fetches += len(missing)
+            self._fetch(missing, self._alloc_device(len(missing), protected))
+        for seq_id in seq_ids:
+            for page in self.sequences[seq_id].pages:
+                if page.fetch_pending:
+                    if not self.copy_engine.done(page.fetch):
+                        self.copy_engine.synchronize(page.fetch)
+                    self.copy_engine.wait(page.fetch)
+                    self._release_host(page)
+        self.stats.stall_s += self.clock() - start
+        self.active = list(seq_ids)
+        return [[page.device for page in self.sequences[seq_id].pages] for seq_id in seq_ids]
+
+    def block_table(self, seq_ids: Sequence[Hashable], max_pages: Optional[int] = None,
+                    device=None) -> torch.Tensor:
+        """ acquire() as an int32 [len(seq_ids), max_pages] block table (padded with 0) for flash_decode """
+        tables = self.acquire(seq_ids)
+        max_pages = max_pages if max_pages is not None else max((len(t) for t in tables), default=0)
+        block_table = torch.zeros((len(seq_ids), max_pages), dtype=torch.int32)
+        for i, table in enumerate(tables):
+            assert len(table) <= max_pages, f"sequence {seq_ids[i]} has {len(table)} pages > {max_pages}"
+            block_table[i, :len(table)] = torch.tensor(table, dtype=torch.int32)
+        device = device if device is not None else self.device_pools[0].device
+        return block_table.to(device, non_blocking=True)
@@ -0,0 +1,202 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" per-rank Qwen3 checkpoints that are already sharded, fused and cast for one TP layout.
+
+export once with
+    python -m triton_dist.models.presharded_checkpoint --model Qwen/Qwen3-32B --output ./qwen3-32b-tp8 --world_size 8
+then start with ModelConfig(model_name="./qwen3-32b-tp8", load_format="presharded").
+on load, a rank mmaps its own file, copies the data section into one pinned buffer, and issues a single H2D copy.
+"""
+import argparse
+import json
+import mmap
+import os
+import shutil
+import struct
+from typing import Dict, Optional
+
+import torch
+from safetensors.torch import save_file
+
+from triton_dist.models.safetensors_loader import (SAFETENSORS_INDEX_FILE, Qwen3ShardedLoader, resolve_model_path)
+
+PRESHARDED_MANIFEST_FILE = "presharded_manifest.json"
+PRESHARDED_FORMAT_VERSION = 1
+# how each per-layer tensor is laid out, as TP_Attn/TP_MLP._init_sharded_parameters expect it
+PRESHARDED_LAYOUT = {
+    "wqkv": "cat([q_proj, k_proj, v_proj] sharded on dim 0)",
+    "wo": "o_proj sharded on dim 1",
+    "gate_up_proj": "cat([gate_proj, up_proj] sharded on dim 0)",
+    "down_proj": "down_proj sharded on dim 1",
+    "input_norm_w": "replicated",
+    "post_norm_w": "replicated",
+    "q_norm_w": "replicated",
+    "k_norm_w": "replicated",
+}
+_SAFETENSORS_DTYPES = {torch.float32: "F32", torch.float16: "F16", torch.bfloat16: "BF16"}
+
+
+def _dtype_name(dtype: torch.dtype) -> str:
+    return str(dtype).replace("torch.", "")
+
+
+def presharded_rank_file(rank: int, world_size: int) -> str:
+    return f"rank-{rank:05d}-of-{world_size:05d}.safetensors"
+
+
+def export_presharded_checkpoint(model_path: str, output_dir: str, world_size: int, dtype: torch.dtype,
+                                 num_layers: Optional[int] = None) -> dict:
+    """ writes one safetensors file per rank plus the manifest, and copies config/tokenizer files alongside """
+    if dtype not in _SAFETENSORS_DTYPES:
+        raise ValueError(f"Unsupported dtype: {dtype}, choose from {list(_SAFETENSORS_DTYPES)}")
+    os.makedirs(output_dir, exist_ok=True)
+    if num_layers is None:
+        with open(os.path.join(model_path, "config.json")) as f:
+            num_layers = json.load(f)["num_hidden_layers"]
+
+    tie_word_embeddings = False
+    for rank in range(world_size):
+        loader = Qwen3ShardedLoader(model_path, rank, world_size, dtype, device="cpu")
+        try:
+            tie_word_embeddings = not loader.has_tensor("lm_head.weight")
+            tensors = loader.load_globals()
+            if tie_word_embeddings:
+                # safetensors refuses shared storage, and the loader re-ties it anyway
+                tensors.pop("lm_head")
+            for idx, layer in loader.iter_layers(num_layers):
+                tensors.update({f"layers.{idx}.{key}": value for key, value in layer.items()})
+        finally:
+            loader.close()
+        save_file(tensors, os.path.join(output_dir, presharded_rank_file(rank, world_size)))
+
+    for file in os.listdir(model_path):
+        if file.endswith(".safetensors") or file == SAFETENSORS_INDEX_FILE:
+            continue
+        if os.path.isfile(os.path.join(model_path, file)):
+            shutil.copy(os.path.join(model_path, file), os.path.join(output_dir, file))
+
+    manifest = {
+        "format_version": PRESHARDED_FORMAT_VERSION,
+        "world_size": world_size,
+        "dtype": _dtype_name(dtype),
+        "num_layers": num_layers,
+        "tie_word_embeddings": tie_word_embeddings,
+        "layout": PRESHARDED_LAYOUT,
+        "files": [presharded_rank_file(rank, world_size) for rank in range(world_size)],
+    }
+    with open(os.path.join(output_dir, PRESHARDED_MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_presharded_manifest(path: str) -> dict:
+    manifest_file = os.path.join(path, PRESHARDED_MANIFEST_FILE)
+    if not os.path.exists(manifest_file):
+        raise FileNotFoundError(f"{PRESHARDED_MANIFEST_FILE} not found in {path}, export it with "
+                                f"python -m triton_dist.models.presharded_checkpoint")
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def validate_presharded_manifest(manifest: dict, world_size: int, dtype: torch.dtype):
+    """ raises ValueError if the checkpoint was exported for another TP layout """
+    if manifest.get("format_version") != PRESHARDED_FORMAT_VERSION:
+        raise ValueError(f"presharded format_version {manifest.get('format_version')} is not supported, "
+                         f"expected {PRESHARDED_FORMAT_VERSION}. Please re-export.")
+    if manifest["world_size"] != world_size:
+        raise ValueError(f"presharded checkpoint is for world_size {manifest['world_size']}, got {world_size}.")
+    if manifest["dtype"] != _dtype_name(dtype):
+        raise ValueError(f"presharded checkpoint is in {manifest['dtype']}, got {_dtype_name(dtype)}.")
+    if manifest["layout"] != PRESHARDED_LAYOUT:
+        raise ValueError("presharded checkpoint layout does not match this version of TP_Attn/TP_MLP. Please re-export.")
+    if len(manifest["files"]) != world_size:
+        raise ValueError(f"presharded manifest lists {len(manifest['files'])} files for world_size {world_size}.")
+
+
+def _read_rank_file(file: str, dtype: torch.dtype, device: torch.device) -> Dict[str, torch.Tensor]:
+    with open(file, "rb") as f:
+        (header_size, ) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_size))
+        data_begin = 8 + header_size
+        # ACCESS_COPY gives a writable (copy-on-write) view, which torch.frombuffer wants
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) as mm:
+            data = torch.frombuffer(mm, dtype=torch.uint8, offset=data_begin)
+            if device.type == "cpu":
+                buffer = data.clone()
+            else:
+                buffer = torch.empty(data.numel(), dtype=torch.uint8, pin_memory=True)
+                buffer.copy_(data)
+            del data
+    if device.type != "cpu":
+        buffer = buffer.to(device, non_blocking=True)
+
+    elem_size = torch.tensor([], dtype=dtype).element_size()
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        if info["dtype"] != _SAFETENSORS_DTYPES[dtype]:
+            raise ValueError(f"{name} is stored as {info['dtype']} in {file}, expected {_SAFETENSORS_DTYPES[dtype]}.")
+        begin, end = info["data_offsets"]
+        assert begin % elem_size == 0, f"{name} at byte {begin} is not aligned to {dtype}"
+        tensors[name] = buffer[begin:end].view(dtype).view(info["shape"])
+    return tensors
+
+
+def load_presharded_rank(path: str, rank: int, world_size: int, dtype: torch.dtype, device="cuda") -> dict:
+    """
+    Returns:
+        dict with embed_tokens, lm_head, norm_weight and "layers", a list of per-layer dicts keyed as
+        Qwen3ShardedLoader.load_layer. all tensors are views into one device buffer.
+    """
+    manifest = read_presharded_manifest(path)
+    validate_presharded_manifest(manifest, world_size, dtype)
+    flat = _read_rank_file(os.path.join(path, manifest["files"][rank]), dtype, torch.device(device))
+
+    layers = [{} for _ in range(manifest["num_layers"])]
+    out = {"layers": layers}
+    for name, tensor in flat.items():
+        if name.startswith("layers."):
+            _, idx, key = name.split(".", 2)
+            layers[int(idx)][key] = tensor
+        else:
+            out[name] = tensor
+    if manifest["tie_word_embeddings"]:
+        out["lm_head"] = out["embed_tokens"]
+    return out
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="export a Qwen3 checkpoint pre-sharded for tensor parallel")
+    p.add_argument("--model", type=str, required=True, help="HF model name or local directory")
+    p.add_argument("--output", type=str, required=True)
+    p.add_argument("--world_size", type=int, required=True)
+    p.add_argument("--dtype", default="bfloat16", type=str, choices=["bfloat16", "float16", "float32"])
+    p.add_argument("--local_only", action="store_true")
+    args = p.parse_args()
+
+    model_path = resolve_model_path(args.model, local_only=args.local_only)
+    export_presharded_checkpoint(model_path, args.output, args.world_size, getattr(torch, args.dtype))
+    print(f"exported {args.model} for world_size {args.world_size} to {args.output}")
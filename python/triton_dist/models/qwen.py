@@ -26,23 +26,27 @@
 import torch
 import torch.nn.functional as F
 import gc
+from typing import List
 
 from transformers import Qwen3ForCausalLM, Qwen3Config
+from transformers.activations import ACT2FN
+from transformers.modeling_rope_utils import ROPE_INIT_FUNCTIONS
 from transformers.models.qwen3.modeling_qwen3 import Qwen3DecoderLayer
 
 from triton_dist.kernels.allreduce import AllReduceMethod
+from triton_dist.kernels.graph_safety import GraphHazard, collect_graph_hazards
 
 if not torch.cuda.is_available():
     raise RuntimeError("CUDA is not available. Please ensure you have a compatible GPU and CUDA installed.")
 try:
     if torch.version.cuda:
         from triton_dist.layers.nvidia.tp_mlp import TP_MLP
-        from triton_dist.layers.nvidia.tp_attn import TP_Attn, layer_norm, _set_cos_sin_cache
+        from triton_dist.layers.nvidia.tp_attn import TP_Attn, add_layer_norm, _set_cos_sin_cache
         from triton_dist.models.kv_cache import KV_Cache
         PLATFORM = 'nvidia'
     elif torch.version.hip:
         from triton_dist.layers.amd.tp_mlp import TP_MLP
-        from triton_dist.layers.amd.tp_attn import TP_Attn, layer_norm, _set_cos_sin_cache
+        from triton_dist.layers.amd.tp_attn import TP_Attn, add_layer_norm, _set_cos_sin_cache
         from triton_dist.models.kv_cache import KV_Cache
         PLATFORM = 'amd'
 except ImportError as e:
@@ -82,6 +86,24 @@ class Qwen3Layer:
         self.post_norm_eps = hf_layer.post_attention_layernorm.variance_epsilon
         self.post_norm_w = hf_layer.post_attention_layernorm.weight.detach().cuda()
 
+    def init_sharded_parameters(self, tensors: dict, config: Qwen3Config, rank: int, world_size: int):
+        """ from the rank-local tensors of Qwen3ShardedLoader.load_layer """
+        self.mlp = TP_MLP(rank=rank, world_size=world_size, group=self.group)
+        self.mlp._init_sharded_parameters(tensors["gate_up_proj"], tensors["down_proj"], ACT2FN[config.hidden_act])
+
+        eps = config.rms_norm_eps
+        self.attn = TP_Attn(rank=rank, world_size=world_size, group=self.group)
+        self.attn._init_sharded_parameters(
+            tensors["wqkv"], tensors["wo"], q_size=config.num_attention_heads * config.head_dim // world_size,
+            kv_size=config.num_key_value_heads * config.head_dim // world_size,
+            q_norm=(tensors["q_norm_w"], eps) if "q_norm_w" in tensors else None,
+            k_norm=(tensors["k_norm_w"], eps) if "k_norm_w" in tensors else None)
+
+        self.input_norm_eps = eps
+        self.input_norm_w = tensors["input_norm_w"]
+        self.post_norm_eps = eps
+        self.post_norm_w = tensors["post_norm_w"]
+
     def set_fwd(self, mode: str = 'torch'):
         if mode == 'triton_dist':
             self.attn.fwd = self.attn.dist_triton_fwd
@@ -97,19 +119,19 @@ class Qwen3Layer:
 
     @torch.inference_mode()
     def fwd(self, hidden_states: torch.Tensor, position_ids: torch.Tensor, cos_sin_cache: torch.Tensor,
-            kv_cache: KV_Cache):
-        residual = hidden_states
+            kv_cache: KV_Cache, residual: torch.Tensor = None):
+        """
+        residual is None for the first layer. Returns (mlp output, residual) without adding them: the add is fused
+        into the next layer's input norm, or the final norm.
+        """
         # self-attention
-        hidden_states = layer_norm(hidden_states, self.input_norm_eps, self.input_norm_w)
+        hidden_states, residual = add_layer_norm(hidden_states, residual, self.input_norm_eps, self.input_norm_w)
         hidden_states = self.attn.fwd(hidden_states, position_ids, cos_sin_cache, kv_cache, self.layer_idx)
-        hidden_states = residual + hidden_states
 
-        residual = hidden_states
         # mlp
-        hidden_states = layer_norm(hidden_states, self.post_norm_eps, self.post_norm_w)
+        hidden_states, residual = add_layer_norm(hidden_states, residual, self.post_norm_eps, self.post_norm_w)
         hidden_states = self.mlp.fwd(hidden_states)
-        hidden_states = residual + hidden_states
-        return hidden_states
+        return hidden_states, residual
 
 
 class Qwen3:
@@ -123,6 +145,8 @@ class Qwen3:
         self.dtype = model_config.dtype
         self.config = Qwen3Config.from_pretrained(model_config.model_name, local_files_only=model_config.local_only)
         self.model_name = model_config.model_name
+        self.local_only = model_config.local_only
+        self.load_format = model_config.load_format
         self.max_length = model_config.max_length
         self.hidden_size = self.config.hidden_size
         self.num_heads = self.config.num_attention_heads
@@ -135,6 +159,7 @@ class Qwen3:
         self.rank = model_config.rank
         self.world_size = model_config.world_size
         self.group = group
+        self.fwd_mode = 'torch'
 
         self.init_parameters()
         self.set_fwd()
@@ -143,8 +168,16 @@ class Qwen3:
     def set_fwd(self, mode: str = 'torch'):
         for layer in self.layers:
             layer.set_fwd(mode)
+        self.fwd_mode = mode
 
     def init_parameters(self):
+        if self.load_format == "safetensors":
+            return self.init_sharded_parameters()
+        if self.load_format == "presharded":
+            return self.init_presharded_parameters()
+        if self.load_format != "hf":
+            raise ValueError(
+                f"Unsupported load_format: {self.load_format}, choose from ['hf', 'safetensors', 'presharded']")
         hf_model = Qwen3ForCausalLM.from_pretrained(self.model_name, torch_dtype=self.dtype)
         self.embed_tokens = hf_model.model.embed_tokens.weight.detach().cuda()
         self.lm_head = hf_model.lm_head.weight.detach().cuda()
@@ -163,7 +196,61 @@ class Qwen3:
 
         self.num_layers = len(self.layers)
 
-    def init_triton_dist_ctx(self, max_M: int = 4096):
+    def _init_cos_sin_cache(self):
+        # without the HF model at hand, rebuild rotary_emb.inv_freq from the config
+        rope_type = (self.config.rope_scaling or {}).get("rope_type", "default")
+        inv_freq, _ = ROPE_INIT_FUNCTIONS[rope_type](self.config, torch.device("cuda"))
+        return _set_cos_sin_cache(inv_freq, max_length=self.max_length)
+
+    def init_presharded_parameters(self):
+        """ loads this rank's file of a checkpoint exported by triton_dist.models.presharded_checkpoint """
+        from triton_dist.models.presharded_checkpoint import load_presharded_rank
+        tensors = load_presharded_rank(self.model_name, rank=self.rank, world_size=self.world_size, dtype=self.dtype)
+        self.embed_tokens = tensors["embed_tokens"]
+        self.lm_head = tensors["lm_head"]
+        self.norm_weight = tensors["norm_weight"]
+        self.norm_variance_epsilon = self.config.rms_norm_eps
+        self.cos_sin_cache = self._init_cos_sin_cache()
+
+        self.layers: list[Qwen3Layer] = []
+        for idx, layer_tensors in enumerate(tensors["layers"]):
+            layer = Qwen3Layer(idx, self.group)
+            layer.init_sharded_parameters(layer_tensors, self.config, rank=self.rank, world_size=self.world_size)
+            self.layers.append(layer)
+
+        self.num_layers = len(self.layers)
+
+    def init_sharded_parameters(self):
+        """ loads only this rank's shards from memory-mapped safetensors, layer by layer with read-ahead """
+        from triton_dist.models.safetensors_loader import Qwen3ShardedLoader, resolve_model_path
+        model_path = resolve_model_path(self.model_name, local_only=self.local_only)
+        loader = Qwen3ShardedLoader(model_path, rank=self.rank, world_size=self.world_size, dtype=self.dtype,
+                                    device=torch.device("cuda", torch.cuda.current_device()))
+        try:
+            global_tensors = loader.load_globals()
+            self.embed_tokens = global_tensors["embed_tokens"]
+            self.lm_head = global_tensors["lm_head"]
+            self.norm_weight = global_tensors["norm_weight"]
+            self.norm_variance_epsilon = self.config.rms_norm_eps
+            self.cos_sin_cache = self._init_cos_sin_cache()
+
+            self.layers: list[Qwen3Layer] = []
+            for idx, tensors in loader.iter_layers(self.config.num_hidden_layers):
+                layer = Qwen3Layer(idx, self.group)
+                layer.init_sharded_parameters(tensors, self.config, rank=self.rank, world_size=self.world_size)
+                self.layers.append(layer)
+        finally:
+            loader.close()
+
+        self.num_layers = len(self.layers)
+
+    def init_triton_dist_ctx(self, max_M: int = 4096, fuse_swiglu: bool = False):
+        """ fuse_swiglu: compute SiLU(gate) * up in the AG-GEMM epilogue of every MLP (nvidia only) """
+        if fuse_swiglu:
+            if PLATFORM != 'nvidia':
+                raise RuntimeError(f"fuse_swiglu is not supported on {PLATFORM}")
+            for layer in self.layers:
+                layer.mlp.enable_fused_swiglu()
         # init ctx
         BLOCK_M = 128
         BLOCK_N = 128
@@ -201,6 +288,30 @@ class Qwen3:
             layer.mlp.ar_method = self.layers[0].mlp.ar_method
         self.use_ar = True
 
+    def set_step_timer(self, step_timer):
+        """ regions of each layer go to step_timer (triton_dist.kernels.step_timer), None to stop timing """
+        for layer in self.layers:
+            layer.attn.step_timer = step_timer
+            layer.mlp.step_timer = step_timer
+            layer.mlp.layer_idx = layer.layer_idx
+
+    def enable_graph_safe(self):
+        """ switches the contexts of the current fwd mode to their CUDA graph safe mode before capture.
+        see triton_dist.kernels.graph_safety
+        """
+        if self.fwd_mode == 'triton_dist' and PLATFORM == 'nvidia':
+            # all layers share the contexts of layer 0
+            self.layers[0].attn.ag_ctx.enable_graph_safe()
+            self.layers[0].mlp.ag_ctx.enable_graph_safe()
+
+    def graph_hazards(self, M: int) -> List[GraphHazard]:
+        """ ops of a forward of M tokens over all ranks that would break CUDA graph replay """
+        if self.fwd_mode == 'torch':
+            return []
+        if PLATFORM != 'nvidia':
+            return [GraphHazard(f"{self.fwd_mode} fwd", f"graph safety is not tracked on {PLATFORM}")]
+        return collect_graph_hazards([self.layers[0].attn, self.layers[0].mlp], M=M, mode=self.fwd_mode)
+
     def finalize(self):
         self.layers[0].attn.finalize()
         self.layers[0].mlp.finalize()
@@ -211,15 +322,17 @@ class Qwen3:
 
         bsz, seq_len = input_ids.size()
         hidden_states = F.embedding(input_ids, self.embed_tokens)
+        residual = None
         for idx in range(self.num_layers):
-            hidden_states = self.layers[idx].fwd(
+            hidden_states, residual = self.layers[idx].fwd(
                 hidden_states=hidden_states,
                 position_ids=position_ids,
                 cos_sin_cache=self.cos_sin_cache,
                 kv_cache=kv_cache,
+                residual=residual,
             )
 
-        hidden_states = layer_norm(hidden_states, w=self.norm_weight, eps=self.norm_variance_epsilon)
+        hidden_states, _ = add_layer_norm(hidden_states, residual, w=self.norm_weight, eps=self.norm_variance_epsilon)
 
         if seq_len > 1:  # prefill
             hidden_states = hidden_states[:, -1:]
@@ -0,0 +1,182 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" rank-local Qwen3 weight loading from memory-mapped safetensors.
+
+each rank reads only its own slices: column-parallel q/k/v and gate/up by rows, row-parallel o and down by columns.
+q/k/v and gate/up are fused while loading, in the layout TP_Attn/TP_MLP use. the full model is never materialized.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+import torch
+from safetensors import safe_open
+
+SAFETENSORS_INDEX_FILE = "model.safetensors.index.json"
+SAFETENSORS_SINGLE_FILE = "model.safetensors"
+
+
+def resolve_model_path(model_name: str, local_only: bool = False) -> str:
+    """ a local directory of *.safetensors: model_name itself, or the HF hub snapshot of it """
+    if os.path.isdir(model_name):
+        return model_name
+    from huggingface_hub import snapshot_download
+    return snapshot_download(model_name, allow_patterns=["*.safetensors", "*.json"], local_files_only=local_only)
+
+
+def _shard_range(dim_size: int, world_size: int, rank: int) -> Tuple[int, int]:
+    if dim_size % world_size != 0:
+        raise ValueError(f"Tensor dimension {dim_size} is not divisible by world size {world_size}.")
+    if rank < 0 or rank >= world_size:
+        raise ValueError(f"Local rank {rank} is out of bounds for world size {world_size}.")
+    size = dim_size // world_size
+    return rank * size, (rank + 1) * size
+
+
+class Qwen3ShardedLoader:
+    """
+    Args:
+        model_path (str): directory with model.safetensors.index.json or a single model.safetensors.
+        device (str): where tensors go. "cpu" for tests. a bare "cuda" means the current device. for cuda, reads
+            are staged in pinned memory and copied asynchronously, so disk reads of one tensor overlap with H2D
+            copies of others.
+        num_threads (int): tensors read in parallel.
+        prefetch_layers (int): layers iter_layers reads ahead of the consumer.
+    """
+
+    def __init__(self, model_path: str, rank: int, world_size: int, dtype: torch.dtype, device="cuda",
+                 num_threads: int = 8, prefetch_layers: int = 2):
+        self.model_path = model_path
+        self.rank = rank
+        self.world_size = world_size
+        self.dtype = dtype
+        self.device = torch.device(device)
+        if self.device.type == "cuda" and self.device.index is None:
+            # workers start on cuda:0, so a bare "cuda" must be pinned to the caller's device here
+            self.device = torch.device("cuda", torch.cuda.current_device())
+        self.prefetch_layers = prefetch_layers
+        self.weight_map = self._read_weight_map(model_path)
+        self._executor = ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix="qwen3_loader",
+                                            initializer=self._init_worker)
+        self._local = threading.local()
+
+    def _init_worker(self):
+        if self.device.type == "cuda":
+            torch.cuda.set_device(self.device)
+
+    @staticmethod
+    def _read_weight_map(model_path: str) -> Dict[str, str]:
+        index_file = os.path.join(model_path, SAFETENSORS_INDEX_FILE)
+        if os.path.exists(index_file):
+            with open(index_file) as f:
+                return json.load(f)["weight_map"]
+        single_file = os.path.join(model_path, SAFETENSORS_SINGLE_FILE)
+        if not os.path.exists(single_file):
+            raise FileNotFoundError(f"neither {SAFETENSORS_INDEX_FILE} nor {SAFETENSORS_SINGLE_FILE} in {model_path}")
+        with safe_open(single_file, framework="pt") as f:
+            return {name: SAFETENSORS_SINGLE_FILE for name in f.keys()}
+
+    def _handle(self, name: str):
+        # one mmap handle per file per thread
+        handles = getattr(self._local, "handles", None)
+        if handles is None:
+            handles = self._local.handles = {}
+        file = self.weight_map[name]
+        if file not in handles:
+            handles[file] = safe_open(os.path.join(self.model_path, file), framework="pt")
+        return handles[file]
+
+    def has_tensor(self, name: str) -> bool:
+        return name in self.weight_map
+
+    def read(self, name: str, shard_dim: Optional[int] = None) -> torch.Tensor:
+        """ this rank's slice of `name` along shard_dim (None for the full tensor), on CPU in self.dtype """
+        tensor_slice = self._handle(name).get_slice(name)
+        if shard_dim is None:
+            tensor = tensor_slice[:]
+        else:
+            begin, end = _shard_range(tensor_slice.get_shape()[shard_dim], self.world_size, self.rank)
+            tensor = tensor_slice[begin:end] if shard_dim == 0 else tensor_slice[:, begin:end]
+        return tensor.to(self.dtype).contiguous()
+
+    def _to_device(self, tensor: torch.Tensor) -> torch.Tensor:
+        if self.device.type == "cpu":
+            return tensor
+        return tensor.pin_memory().to(self.device, non_blocking=True)
+
+    def _load_fused(self, names, shard_dim: int) -> torch.Tensor:
+        return self._to_device(torch.cat([self.read(name, shard_dim) for name in names], dim=0))
+
+    def _load(self, name: str, shard_dim: Optional[int] = None) -> torch.Tensor:
+        return self._to_device(self.read(name, shard_dim))
+
+    def _submit_layer(self, idx: int):
+        prefix = f"model.layers.{idx}."
+        jobs = {
+            # [(q_size + 2 * kv_size) // world_size, hidden_size], as TP_Attn.wqkv
+            "wqkv": (self._load_fused, [prefix + f"self_attn.{p}_proj.weight" for p in "qkv"], 0),
+            "wo": (self._load, prefix + "self_attn.o_proj.weight", 1),
+            # [MLP_size * 2 // world_size, hidden_size], as TP_MLP.gate_up_proj
+            "gate_up_proj": (self._load_fused, [prefix + f"mlp.{p}_proj.weight" for p in ["gate", "up"]], 0),
+            "down_proj": (self._load, prefix + "mlp.down_proj.weight", 1),
+            "input_norm_w": (self._load, prefix + "input_layernorm.weight", None),
+            "post_norm_w": (self._load, prefix + "post_attention_layernorm.weight", None),
+        }
+        for key in ["q_norm", "k_norm"]:
+            if self.has_tensor(prefix + f"self_attn.{key}.weight"):
+                jobs[f"{key}_w"] = (self._load, prefix + f"self_attn.{key}.weight", None)
+        return {key: self._executor.submit(fn, *args) for key, (fn, *args) in jobs.items()}
+
+    def load_layer(self, idx: int) -> Dict[str, torch.Tensor]:
+        return {key: future.result() for key, future in self._submit_layer(idx).items()}
+
+    def iter_layers(self, num_layers: int) -> Iterator[Tuple[int, Dict[str, torch.Tensor]]]:
+        """ yields (idx, tensors of layer idx), with the next prefetch_layers layers already being read """
+        pending = {}
+        for idx in range(num_layers):
+            for ahead in range(idx, min(idx + self.prefetch_layers + 1, num_layers)):
+                if ahead not in pending:
+                    pending[ahead] = self._submit_layer(ahead)
+            yield idx, {key: future.result() for key, future in pending.pop(idx).items()}
+
+    def load_globals(self) -> Dict[str, torch.Tensor]:
+        """ embed_tokens, lm_head and the final norm, replicated on all ranks """
+        tensors = {
+            "embed_tokens": self._executor.submit(self._load, "model.embed_tokens.weight"),
+            "norm_weight": self._executor.submit(self._load, "model.norm.weight"),
+        }
+        if self.has_tensor("lm_head.weight"):
+            tensors["lm_head"] = self._executor.submit(self._load, "lm_head.weight")
+        tensors = {key: future.result() for key, future in tensors.items()}
+        # tie_word_embeddings
+        tensors.setdefault("lm_head", tensors["embed_tokens"])
+        return tensors
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
@@ -0,0 +1,286 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+""" asyncio front-end over a step model, e.g. Engine after Engine.init_serving.
+
+a step model has max_batch_size slots and:
+    prefill(slot, prompt_ids) -> first token of the sequence in slot
+    decode(slots, tokens) -> next token of each sequence in slots, given its last token
+    release(slot): the sequence in slot is done
+
+AsyncGenerationServer admits requests into free slots in arrival order, and runs prefill/decode on one worker thread
+so the event loop stays responsive. tokens go to each request's async iterator as they are produced.
+    - backpressure: generate() waits while max_queue_size requests are queued, and a request whose consumer is
+      max_pending_tokens tokens behind sits out decode steps until it catches up
+    - cancellation: closing (aclose, or contextlib.aclosing around an early break) or cancelling the iterator
+      frees the slot at the next step
+queue time, TTFT and inter-token latency go to ServerMetrics histograms, exported as a dict or Prometheus text.
+"""
+import asyncio
+import bisect
+import concurrent.futures
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+from triton_dist.models.decode_stream import StopChecker
+
+# seconds
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class LatencyHistogram:
+    """ Prometheus style histogram: counts of observations <= each bucket bound, plus their sum """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        assert list(buckets) == sorted(buckets) and len(buckets) > 0
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """ interpolated within the bucket as Prometheus histogram_quantile does. nan without observations """
+        if self.count == 0:
+            return float("nan")
+        rank = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            if cumulative + n >= rank and n > 0:
+                if i == len(self.buckets):  # +Inf bucket
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / n
+            cumulative += n
+        return self.buckets[-1]
+
+    def to_prometheus(self, name: str, help: str) -> List[str]:
+        lines = [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, n in zip(self.buckets + ["+Inf"], self.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines += [f"{name}_sum {self.sum}", f"{name}_count {self.count}"]
+        return lines
+
+
+class ServerMetrics:
+
+    HISTOGRAMS = {
+        "queue_time": "seconds from submission to admission into a slot",
+        "ttft": "seconds from submission to the first token",
+        "inter_token_latency": "seconds between two tokens of a request",
+    }
+    COUNTERS = {
+        "requests": "requests submitted",
+        "finished_requests": "requests finished by EOS, stop string or max_new_tokens",
+        "cancelled_requests": "requests cancelled by their consumer",
+        "generated_tokens": "tokens streamed to consumers",
+    }
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.histograms = {name: LatencyHistogram(buckets) for name in self.HISTOGRAMS}
+        self.counters = {name: 0 for name in self.COUNTERS}
+
+    def summary(self) -> Dict[str, float]:
+        """ counters, and p50 / p99 / mean of each histogram """
+        out = dict(self.counters)
+        for name, hist in self.histograms.items():
+            out[f"{name}_p50"] = hist.quantile(0.5)
+            out[f"{name}_p99"] = hist.quantile(0.99)
+            out[f"{name}_mean"] = hist.sum / hist.count if hist.count else float("nan")
+        return out
+
+    def to_prometheus(self, prefix: str = "triton_dist_") -> str:
+        lines = []
+        for name, help in self.COUNTERS.items():
+            lines += [f"# HELP {prefix}{name}_total {help}", f"# TYPE {prefix}{name}_total counter",
+                      f"{prefix}{name}_total {self.counters[name]}"]
+        for name, help in self.HISTOGRAMS.items():
+            lines += self.histograms[name].to_prometheus(f"{prefix}{name}_seconds", help)
+        return "\n".join(lines) + "\n"
+
+
+class _Request:
+
+    def __init__(self, prompt_ids: List[int], checker: StopChecker, submit_time: float):
+        self.prompt_ids = prompt_ids
+        self.checker = checker
+        self.submit_time = submit_time
+        self.last_token_time: Optional[float] = None
+        self.slot: Optional[int] = None
+        self.last_token: Optional[int] = None
+        self.stream: asyncio.Queue = asyncio.Queue()  # tokens, then _END or an exception
+        self.cancelled = False
+        self.done = False
+
+
+_END = object()
+
+
+class AsyncGenerationServer:
+
+    def __init__(self, model, max_queue_size: int = 0, max_pending_tokens: int = 64,
+                 clock: Callable[[], float] = time.monotonic, metrics: Optional[ServerMetrics] = None):
+        """
+        max_queue_size: requests waiting for a slot before generate() waits. 0 for no limit
+        max_pending_tokens: tokens a consumer may fall behind before its request is paused
+        """
+        assert max_pending_tokens > 0
+        self.model = model
+        self.max_pending_tokens = max_pending_tokens
+        self.clock = clock
+        self.metrics = metrics or ServerMetrics()
+        self._waiting: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._running: List[_Request] = []
+        self._free_slots = list(range(model.max_batch_size))
+        self._wakeup = asyncio.Event()
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """ may be called again after stop() """
+        assert self._task is None, "server already started"
+        # one thread: the model is not thread safe, and its steps run in order
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="step_model")
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        """ ends the streams of all requests, and waits for the step in flight """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # cancelling the loop does not stop a step already running in the executor: let it end before any release
+        if self._executor is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+            self._executor = None
+        for req in self._running:
+            self._finish(req, cancelled=True)
+        self._running = []
+        while not self._waiting.empty():
+            self._waiting.get_nowait().stream.put_nowait(_END)
+
+    async def generate(self, prompt_ids: Sequence[int], max_new_tokens: int, eos_token_ids: Sequence[int] = (),
+                       stop_strings: Sequence[str] = (), decode_fn=None) -> AsyncIterator[int]:
+        """ yields the generated tokens of one request. EOS is not yielded. see StopChecker for the stop options """
+        assert self._task is not None, "start() the server first"
+        checker = StopChecker(1, eos_token_ids=eos_token_ids, stop_strings=stop_strings,
+                              max_new_tokens=max_new_tokens, decode_fn=decode_fn)
+        req = _Request(list(prompt_ids), checker, self.clock())
+        self.metrics.counters["requests"] += 1
+        await self._waiting.put(req)
+        self._wakeup.set()
+        try:
+            while True:
+                item = await req.stream.get()
+                # the request may be paused on this consumer
+                self._wakeup.set()
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            if not req.done:
+                req.cancelled = True
+                self._wakeup.set()
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _emit(self, req: _Request, token: int):
+        now = self.clock()
+        num_tokens = len(req.checker.tokens[0])
+        req.checker.update([token])
+        req.last_token = token
+        if len(req.checker.tokens[0]) > num_tokens:
+            if req.last_token_time is None:
+                self.metrics.histograms["ttft"].observe(now - req.submit_time)
+            else:
+                self.metrics.histograms["inter_token_latency"].observe(now - req.last_token_time)
+            req.last_token_time = now
+            self.metrics.counters["generated_tokens"] += 1
+            req.stream.put_nowait(token)
+        if req.checker.all_finished:
+            self._finish(req)
+
+    def _finish(self, req: _Request, cancelled: bool = False, error: Optional[BaseException] = None):
+        if req.done:
+            return
+        req.done = True
+        self.metrics.counters["cancelled_requests" if cancelled else "finished_requests"] += 1
+        req.stream.put_nowait(error if error is not None else _END)
+        if req.slot is not None:
+            self.model.release(req.slot)
+            self._free_slots.append(req.slot)
+            req.slot = None
+
+    async def _admit(self):
+        while self._free_slots and not self._waiting.empty():
+            req = self._waiting.get_nowait()
+            if req.cancelled:
+                self._finish(req, cancelled=True)
+                continue
+            # lowest first, so that a step model may run only the first max(slots) + 1 rows
+            req.slot = min(self._free_slots)
+            self._free_slots.remove(req.slot)
+            self.metrics.histograms["queue_time"].observe(self.clock() - req.submit_time)
+            self._running.append(req)
+            self._emit(req, await self._call(self.model.prefill, req.slot, req.prompt_ids))
+
+    async def _loop(self):
+        while True:
+            try:
+                # cleared before looking at the state, so a wakeup during this iteration is not lost
+                self._wakeup.clear()
+                await self._admit()
+                for req in self._running:
+                    if req.cancelled:
+                        self._finish(req, cancelled=True)
+                self._running = [req for req in self._running if not req.done]
+                # paused: its consumer is max_pending_tokens behind
+                runnable = [req for req in self._running if req.stream.qsize() < self.max_pending_tokens]
+                if not runnable:
+                    await self._wakeup.wait()
+                    continue
+                tokens = await self._call(self.model.decode, [req.slot for req in runnable],
+                                          [req.last_token for req in runnable])
+                for req, token in zip(runnable, tokens):
+                    if not req.done:
+                        self._emit(req, token)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # a failed step fails the requests in flight, and the server goes on with the others
+                for req in self._running:
+                    self._finish(req, error=e)
+                self._running = []
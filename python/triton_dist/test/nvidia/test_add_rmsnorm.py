@@ -0,0 +1,116 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import torch
+
+from triton_dist.kernels.add_rmsnorm import add_rmsnorm_torch
+
+EPS = 1e-6
+TOL = {torch.float32: (1e-5, 1e-5), torch.bfloat16: (1.6e-2, 1e-2), torch.float16: (1e-3, 1e-3)}
+
+
+def layer_norm(hidden_states, eps, w):
+    # the unfused layer_norm of layers/amd/tp_attn.py; flashinfer.norm.rmsnorm has the same math on nvidia
+    return torch.nn.functional.rms_norm(hidden_states, normalized_shape=(hidden_states.size(-1), ), weight=w, eps=eps)
+
+
+def test_matches_composition(shape, dtype):
+    x = torch.randn(shape, dtype=dtype)
+    residual = torch.randn(shape, dtype=dtype)
+    w = torch.randn(shape[-1], dtype=dtype)
+    out, new_residual = add_rmsnorm_torch(x, residual, w, EPS)
+    # the residual is bit exact: it is what `residual + hidden_states` was
+    assert torch.equal(new_residual, residual + x)
+    atol, rtol = TOL[dtype]
+    torch.testing.assert_close(out, layer_norm(residual + x, EPS, w), atol=atol, rtol=rtol)
+
+    out, first = add_rmsnorm_torch(x, None, w, EPS)
+    assert first is x
+    torch.testing.assert_close(out, layer_norm(x, EPS, w), atol=atol, rtol=rtol)
+
+    # rows are independent: normalizing a reduce-scattered row slice is the slice of the full result
+    rows = x.reshape(-1, shape[-1]).shape[0]
+    if rows > 1:
+        x_2d, r_2d = x.reshape(rows, -1), residual.reshape(rows, -1)
+        full, _ = add_rmsnorm_torch(x_2d, r_2d, w, EPS)
+        half, _ = add_rmsnorm_torch(x_2d[rows // 2:], r_2d[rows // 2:], w, EPS)
+        assert torch.equal(half, full[rows // 2:])
+
+
+def test_layer_chain(num_layers, dtype):
+    """ Qwen3Layer.fwd before (add, then norm) and after (add folded into the next norm) over a stack of layers """
+    torch.manual_seed(0)
+    hidden = 64
+    layers = [(torch.randn(hidden, hidden, dtype=dtype) / hidden**0.5, torch.randn(hidden, hidden, dtype=dtype) /
+               hidden**0.5, torch.randn(hidden, dtype=dtype), torch.randn(hidden, dtype=dtype))
+              for _ in range(num_layers)]
+    final_w = torch.randn(hidden, dtype=dtype)
+    x = torch.randn(3, 5, hidden, dtype=dtype)
+
+    h = x
+    for wa, wm, in_w, post_w in layers:
+        residual = h
+        h = layer_norm(h, EPS, in_w) @ wa
+        h = residual + h
+        residual = h
+        h = layer_norm(h, EPS, post_w) @ wm
+        h = residual + h
+    expected = layer_norm(h, EPS, final_w)
+
+    h, residual = x, None
+    for wa, wm, in_w, post_w in layers:
+        h, residual = add_rmsnorm_torch(h, residual, in_w, EPS)
+        h = h @ wa
+        h, residual = add_rmsnorm_torch(h, residual, post_w, EPS)
+        h = h @ wm
+    out, _ = add_rmsnorm_torch(h, residual, final_w, EPS)
+    atol, rtol = TOL[dtype]
+    torch.testing.assert_close(out, expected, atol=atol * num_layers, rtol=rtol * num_layers)
+
+
+def test_triton(shape, dtype):
+    from triton_dist.kernels.nvidia.add_rmsnorm import add_rmsnorm
+    x = torch.randn(shape, dtype=dtype, device="cuda")
+    residual = torch.randn(shape, dtype=dtype, device="cuda")
+    w = torch.randn(shape[-1], dtype=dtype, device="cuda")
+    for r in [residual, None]:
+        out, new_residual = add_rmsnorm(x, r, w, EPS)
+        out_ref, residual_ref = add_rmsnorm_torch(x, r, w, EPS)
+        assert torch.equal(new_residual, residual_ref)
+        atol, rtol = TOL[dtype]
+        torch.testing.assert_close(out, out_ref, atol=atol, rtol=rtol)
+
+
+if __name__ == "__main__":
+    torch.manual_seed(42)
+    shapes = [(1, 5120), (4, 1, 5120), (2, 7, 4096), (3, 100)]
+    for dtype in [torch.float32, torch.bfloat16, torch.float16]:
+        for shape in shapes:
+            test_matches_composition(shape, dtype)
+        test_layer_chain(4, dtype)
+    if torch.cuda.is_available():
+        for dtype in [torch.bfloat16, torch.float16]:
+            for shape in shapes:
+                test_triton(shape, dtype)
+    print("✅ fused add + RMSNorm passes")
@@ -0,0 +1,153 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import argparse
+import bisect
+import random
+import time
+
+import numpy as np
+
+from triton_dist.kernels.ag_moe_swizzle_schedule import ag_moe_swizzle_schedule
+
+
+def _cdiv(x, y):
+    return (x + y - 1) // y
+
+
+def _kernel_reference(rank, tp_size, local_tp_size, block_size_m, ntokens_by_rank_by_expert):
+    """ threadblock_swizzle_ag_moe_kernel tile by tile, atomic counters taken in thread order """
+    nexperts = len(ntokens_by_rank_by_expert[0])
+    nnodes = tp_size // local_tp_size
+    acc_by_expert = [np.cumsum([ntokens_by_rank_by_expert[r][e] for r in range(tp_size)]).tolist()
+                     for e in range(nexperts)]
+    ntiles_by_expert = [_cdiv(acc[-1], block_size_m) for acc in acc_by_expert]
+    ntiles_by_expert_acc = np.cumsum(ntiles_by_expert).tolist()
+    ntiles = ntiles_by_expert_acc[-1]
+
+    tiles = []
+    counter = [[0] * tp_size for _ in range(nexperts)]
+    for tile_index in range(ntiles):
+        expert_id = bisect.bisect_right(ntiles_by_expert_acc, tile_index)
+        tiled_m = tile_index - (ntiles_by_expert_acc[expert_id] - ntiles_by_expert[expert_id])
+        acc = acc_by_expert[expert_id]
+        global_m_start = 0 if rank == 0 else acc[rank - 1]
+        global_tiled_m_start = _cdiv(global_m_start, block_size_m)
+        m_start = tiled_m * block_size_m
+        m_end = min(m_start + block_size_m, acc[-1]) - 1
+        segment_start = bisect.bisect_right(acc, m_start)
+        segment_end = bisect.bisect_right(acc, m_end)
+        off_node = (segment_end // local_tp_size - rank // local_tp_size + nnodes) % nnodes
+        stage = off_node * local_tp_size + (segment_end - rank + local_tp_size) % local_tp_size
+        if tiled_m == global_tiled_m_start - 1 and global_tiled_m_start % block_size_m != 0:
+            stage = tp_size - 1
+        tiles.append((tile_index, expert_id, stage, segment_start, segment_end, counter[expert_id][stage]))
+        counter[expert_id][stage] += 1
+
+    out = [None] * ntiles
+    for tile_index, expert_id, stage, segment_start, segment_end, off_in_stage in tiles:
+        off_by_expert = ntiles_by_expert_acc[expert_id] - ntiles_by_expert[expert_id]
+        pos = off_by_expert + sum(counter[expert_id][:stage]) + off_in_stage
+        out[pos] = (expert_id, tile_index, segment_start, segment_end, stage)
+    return out
+
+
+def _uniform(ntokens_per_rank, nexperts, tp_size):
+    return np.full((tp_size, nexperts), ntokens_per_rank // nexperts, dtype=np.int32)
+
+
+def _random(ntokens_per_rank, nexperts, tp_size, zero_rate=0.0):
+    weight = np.array([0 if random.random() < zero_rate else random.random() for _ in range(nexperts)]) + 1e-5
+    return np.array([np.random.multinomial(ntokens_per_rank, weight / weight.sum()) for _ in range(tp_size)])
+
+
+def _check(ntokens, tp_size, local_tp_size, block_size_m):
+    for rank in range(tp_size):
+        schedule = ag_moe_swizzle_schedule(rank, tp_size, local_tp_size, block_size_m, ntokens)
+        got = list(
+            zip(schedule.expert_idx.tolist(), schedule.tile_index.tolist(), schedule.segment_start.tolist(),
+                schedule.segment_end.tolist(), schedule.stage.tolist()))
+        expected = _kernel_reference(rank, tp_size, local_tp_size, block_size_m, ntokens.tolist())
+        assert got == expected, f"rank {rank} {ntokens.tolist()}"
+        # every tile of every expert once
+        tiled_m = schedule.tiled_m()
+        for expert_id, n in enumerate(schedule.ntiles_by_expert.tolist()):
+            assert sorted(tiled_m[schedule.expert_idx == expert_id].tolist()) == list(range(n))
+
+
+def test_uniform():
+    block_size_m = 128
+    for nexperts, tp_size, local_tp_size in [(2, 4, 4), (8, 8, 8), (8, 8, 4), (16, 16, 8)]:
+        for ntokens_per_expert in [block_size_m, block_size_m - 1, block_size_m + 1]:
+            ntokens = _uniform(ntokens_per_expert * nexperts, nexperts, tp_size)
+            _check(ntokens, tp_size, local_tp_size, block_size_m)
+
+
+def test_random():
+    random.seed(0)
+    np.random.seed(0)
+    for nexperts, tp_size, local_tp_size in [(2, 4, 4), (32, 8, 8), (32, 8, 4), (64, 16, 8)]:
+        for block_size_m in [64, 128]:
+            for zero_rate in [0.0, 0.3]:
+                for _ in range(3):
+                    ntokens = _random(block_size_m * nexperts, nexperts, tp_size, zero_rate)
+                    _check(ntokens, tp_size, local_tp_size, block_size_m)
+
+
+def bench(nexperts=64, tp_size=8, local_tp_size=8, block_size_m=128, iters=20):
+    np.random.seed(0)
+    ntokens = _random(block_size_m * nexperts, nexperts, tp_size)
+    ntokens_list = ntokens.tolist()
+    start = time.perf_counter()
+    for _ in range(iters):
+        for rank in range(tp_size):
+            ag_moe_swizzle_schedule(rank, tp_size, local_tp_size, block_size_m, ntokens)
+    vectorized_ms = (time.perf_counter() - start) / iters * 1000
+    start = time.perf_counter()
+    for rank in range(tp_size):
+        _kernel_reference(rank, tp_size, local_tp_size, block_size_m, ntokens_list)
+    per_tile_ms = (time.perf_counter() - start) * 1000
+    # the python model of threadblock_swizzle_ag_moe answers a single tile per call, timed on rank 0 only
+    from triton_dist.kernels.nvidia.threadblock_swizzle_ag_moe import threadblock_swizzle_ag_moe
+    ntiles = int(_cdiv(ntokens.sum(axis=0), block_size_m).sum())
+    start = time.perf_counter()
+    for tiled_m in range(ntiles):
+        threadblock_swizzle_ag_moe(tiled_m, 0, nexperts, tp_size, block_size_m, ntokens_list)
+    per_query_ms = (time.perf_counter() - start) * 1000 * tp_size
+    print(f"AG-MoE swizzle schedules of {tp_size} ranks, {nexperts} experts, {ntiles} tiles: "
+          f"numpy {vectorized_ms:.2f} ms, per tile {per_tile_ms:.2f} ms, per query ~{per_query_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nexperts", default=64, type=int)
+    parser.add_argument("--tp_size", "--tp-size", default=8, type=int)
+    parser.add_argument("--local_tp_size", "--local-tp-size", default=8, type=int)
+    parser.add_argument("--block_size_m", default=128, type=int)
+    args = parser.parse_args()
+
+    test_uniform()
+    test_random()
+    print("✅ ag moe swizzle schedule passes")
+    bench(args.nexperts, args.tp_size, args.local_tp_size, args.block_size_m)
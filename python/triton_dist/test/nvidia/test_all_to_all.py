@@ -36,7 +36,9 @@ from tabulate import tabulate
 import nvshmem.core
 
 from triton_dist.utils import group_profile, init_nvshmem_by_torch_process_group, sleep_async
-from triton_dist.kernels.nvidia import create_all_to_all_context, fast_all_to_all, all_to_all_post_process
+from triton_dist.kernels.nvidia import (create_all_to_all_context, fast_all_to_all, all_to_all_post_process,
+                                       create_packed_all_to_all_context, fast_all_to_all_packed,
+                                       all_to_all_packed_post_process)
 
 
 def splits_to_cumsum(splits: torch.Tensor):
@@ -372,6 +374,32 @@ def perf_triton(input: torch.Tensor, scale_tensor: torch.Tensor, exp_indices: to
     return dispatch_token, dispatch_scale, avg_time
 
 
+def check_triton_packed(input: torch.Tensor, scale_tensor: torch.Tensor, exp_indices: torch.Tensor,
+                        ref_out: torch.Tensor, ref_scale: torch.Tensor):
+    splits_gpu_cur_rank = torch.bincount(exp_indices.view(-1), minlength=args.G).to(torch.int32)
+    split_cumsum = splits_to_cumsum(splits_gpu_cur_rank)
+    scatter_idx_cur_rank = calc_scatter_index_stable(exp_indices)
+    gather_idx_cur_rank, _ = calc_gather_index(scatter_idx_cur_rank, 0, token_num * args.topk)
+
+    # scatter straight into the symmetric send buffer: sent in place
+    num_rows = token_num * args.topk
+    scattered_input = packed_all_to_all_ctx.send_buf[:num_rows]
+    torch.index_select(input, dim=0, index=gather_idx_cur_rank, out=scattered_input)
+    scattered_scale_tensor = torch.index_select(scale_tensor, dim=0, index=gather_idx_cur_rank)
+
+    for _ in range(3):  # cover both stages of the double buffer
+        recv_splits, recv_offsets, recv_buf, recv_scale = fast_all_to_all_packed(
+            packed_all_to_all_ctx, scattered_input, split_cumsum, scattered_scale_tensor if args.with_scale else None)
+        packed_out, packed_scale = all_to_all_packed_post_process(packed_all_to_all_ctx, recv_offsets, recv_buf,
+                                                                  recv_scale)
+        torch.testing.assert_close(packed_out, ref_out, rtol=0, atol=0)
+        if args.with_scale:
+            torch.testing.assert_close(packed_scale, ref_scale, rtol=0, atol=0)
+        assert recv_splits.shape == (WORLD_SIZE, experts_per_rank)
+    print(f"✅ Rank-{RANK}: packed all-to-all receives {packed_out.shape[0]} rows, "
+          f"{packed_all_to_all_ctx.max_recv_m} reserved")
+
+
 if __name__ == "__main__":
     args = parse_args()
     if args.enable_flux:
@@ -394,6 +422,16 @@ if __name__ == "__main__":
         DTYPE_MAP[args.dtype],
         torch.float,
     )
+    packed_all_to_all_ctx = create_packed_all_to_all_context(
+        args.M * args.topk,
+        args.N,
+        RANK,
+        args.G,
+        WORLD_SIZE,
+        experts_per_rank,
+        dtype=DTYPE_MAP[args.dtype],
+        scale_dtype=torch.float,
+    )
     if args.enable_flux:
         flux_op = flux.All2AllInference(
             args.M * args.topk,
@@ -421,6 +459,8 @@ if __name__ == "__main__":
             torch.cuda.synchronize()
             triton_out, triton_scale, triton_time = perf_triton(input, scale_tensor, exp_indices)
             torch.cuda.synchronize()
+            check_triton_packed(input, scale_tensor, exp_indices, triton_out, triton_scale)
+            torch.cuda.synchronize()
             if args.enable_flux:
                 flux_out, flux_scale, flux_time = perf_flux(input, scale_tensor, exp_indices)
                 torch.cuda.synchronize()
@@ -475,5 +515,6 @@ if __name__ == "__main__":
                 _check(flux_scale, ref_scale, "Flux scale")
 
     all_to_all_ctx.finalize()
+    packed_all_to_all_ctx.finalize()
     nvshmem.core.finalize()
     torch.distributed.destroy_process_group(EP_GROUP)
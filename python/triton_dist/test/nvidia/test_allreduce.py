@@ -142,7 +142,7 @@ def _is_one_shot(method):
 
 def run_perf(dtype: torch.dtype, method: AllReduceMethod, warmup=5, iters=10):
     bytes_per_elem = torch.finfo(dtype).bits // 8
-    if method in ["double_tree", "one_shot", "one_shot_tma"]:
+    if method in ["double_tree", "one_shot", "one_shot_tma", "one_shot_ll"]:
         available_ds = DATA_SIZES[:13]
     else:
         available_ds = DATA_SIZES
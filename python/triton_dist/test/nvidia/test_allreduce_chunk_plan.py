@@ -0,0 +1,108 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import argparse
+import random
+
+from triton_dist.kernels.allreduce import plan_allreduce_chunks
+
+
+def _check_plan_covers(numel, itemsize, workspace_nbytes, world_size, num_slots):
+    plan = plan_allreduce_chunks(numel, itemsize, workspace_nbytes, world_size, num_slots=num_slots)
+    assert plan.chunk_numel * itemsize % 16 == 0
+    assert plan.chunk_numel * itemsize * world_size * num_slots <= workspace_nbytes
+    offset = 0
+    for n, (start, size) in enumerate(plan.chunks()):
+        assert start == offset and 0 < size <= plan.chunk_numel, f"chunk {n}: ({start}, {size})"
+        assert plan.slot(n) == n % num_slots
+        offset += size
+    assert offset == numel
+    return plan
+
+
+def _simulate_pipeline(plan, world_size, rng: random.Random):
+    """ run the per-rank schedules with a random interleaving, and check that no slot is overwritten before all
+    ranks have reduced it, and that every rank reduces exactly the chunk it expects. """
+    schedule = plan.pipeline_schedule()
+    pc = [0] * world_size
+    # slot_owner[rank][slot][src]: chunk currently written by src in rank's slot
+    slot_owner = [[[-1] * world_size for _ in range(plan.num_slots)] for _ in range(world_size)]
+    data_signal = [[0] * world_size for _ in range(world_size)]
+    ack_signal = [[0] * world_size for _ in range(world_size)]
+    reduced = [set() for _ in range(world_size)]
+
+    def _runnable(rank):
+        if pc[rank] == len(schedule):
+            return False
+        op, n = schedule[pc[rank]]
+        if op == "wait_ack":
+            return all(ack_signal[rank][peer] >= n + 1 for peer in range(world_size))
+        if op == "reduce":
+            return all(data_signal[rank][peer] >= n + 1 for peer in range(world_size))
+        return True
+
+    while any(pc[rank] < len(schedule) for rank in range(world_size)):
+        candidates = [rank for rank in range(world_size) if _runnable(rank)]
+        assert candidates, f"deadlock at {pc}"
+        rank = rng.choice(candidates)
+        op, n = schedule[pc[rank]]
+        slot = plan.slot(n)
+        if op == "push":
+            for peer in range(world_size):
+                prev = slot_owner[peer][slot][rank]
+                assert prev == -1 or prev in reduced[peer], f"rank {rank} overwrites chunk {prev} on {peer}"
+                slot_owner[peer][slot][rank] = n
+                data_signal[peer][rank] = n + 1
+        elif op == "reduce":
+            assert all(slot_owner[rank][slot][src] == n for src in range(world_size))
+            reduced[rank].add(n)
+        elif op == "ack":
+            for peer in range(world_size):
+                ack_signal[peer][rank] = n + 1
+        pc[rank] += 1
+
+    for rank in range(world_size):
+        assert reduced[rank] == set(range(plan.nchunks))
+
+
+def test_allreduce_chunk_plan(seed=42, iters=200):
+    rng = random.Random(seed)
+    for _ in range(iters):
+        world_size = rng.choice([2, 4, 8])
+        itemsize = rng.choice([2, 4])
+        num_slots = rng.choice([1, 2, 3])
+        workspace_nbytes = rng.randint(1, 64) * 1024
+        numel = rng.randint(1, 256 * 1024)
+        plan = _check_plan_covers(numel, itemsize, workspace_nbytes * world_size, world_size, num_slots)
+        if plan.nchunks <= 64:
+            _simulate_pipeline(plan, world_size, rng)
+    print("✅ test_allreduce_chunk_plan passes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iters", type=int, default=200)
+    args = parser.parse_args()
+    test_allreduce_chunk_plan(args.seed, args.iters)
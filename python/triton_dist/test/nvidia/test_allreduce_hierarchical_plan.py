@@ -0,0 +1,95 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import argparse
+
+from triton_dist.kernels.allreduce import (AllReduceStageKind, build_hierarchical_allreduce_plans,
+                                           select_hierarchical_allreduce_plan)
+
+
+def _bandwidth_cost_fn(intranode_bw, internode_bw, latency_ms):
+    """ comm_perf_model.estimate_allreduce_stage_time_ms without full mesh NVLink, for CPU """
+
+    def _ring_time_ms(nbytes, world_size, local_world_size):
+        nnodes = world_size // local_world_size
+        intra_node_ms = nbytes / world_size * (local_world_size - 1) / 1e6 / intranode_bw
+        inter_node_ms = nbytes / world_size / 1e6 / internode_bw
+        return (intra_node_ms + inter_node_ms) * (nnodes - 1) + intra_node_ms
+
+    def _cost_fn(stage):
+        if stage.kind == AllReduceStageKind.LocalReduce:
+            return latency_ms * stage.num_sync_steps
+        return latency_ms * stage.num_sync_steps + _ring_time_ms(stage.nbytes, stage.world_size, stage.local_world_size)
+
+    return _cost_fn
+
+
+def test_build_plans(world_size, local_world_size):
+    nbytes = 1024 * world_size
+    plans = {plan.name: plan for plan in build_hierarchical_allreduce_plans(nbytes, world_size, local_world_size)}
+    assert set(plans.keys()) == {"ag_reduce", "rs_ag"}
+    assert [stage.kind for stage in plans["rs_ag"].stages
+            ] == [AllReduceStageKind.ReduceScatter, AllReduceStageKind.AllGather]
+    assert all(stage.nbytes == nbytes for stage in plans["rs_ag"].stages)
+    assert [stage.kind for stage in plans["ag_reduce"].stages
+            ] == [AllReduceStageKind.AllGather, AllReduceStageKind.LocalReduce]
+    assert plans["ag_reduce"].stages[0].nbytes == nbytes * world_size
+
+    # reduce-scatter needs world_size aligned pieces
+    plans = build_hierarchical_allreduce_plans(nbytes + 16, world_size, local_world_size)
+    assert [plan.name for plan in plans] == ["ag_reduce"]
+    plans = build_hierarchical_allreduce_plans(nbytes, world_size, local_world_size, alignment=nbytes)
+    assert [plan.name for plan in plans] == ["ag_reduce"]
+    print(f"✅ test_build_plans world_size={world_size} local_world_size={local_world_size} passes")
+
+
+def test_select_plan(world_size, local_world_size):
+    cost_fn = _bandwidth_cost_fn(intranode_bw=160, internode_bw=25, latency_ms=0.02)
+    small = select_hierarchical_allreduce_plan(16 * world_size, world_size, local_world_size, cost_fn)
+    assert small.name == "ag_reduce", small
+    large = select_hierarchical_allreduce_plan(64 * 1024 * 1024, world_size, local_world_size, cost_fn)
+    assert large.name == "rs_ag", large
+
+    # rs_ag is not allowed without a reduce-scatter context
+    forced = select_hierarchical_allreduce_plan(64 * 1024 * 1024, world_size, local_world_size, cost_fn, allowed=[])
+    assert forced.name == "ag_reduce"
+
+    # the selection flips exactly once as nbytes grows
+    names = [
+        select_hierarchical_allreduce_plan(2**n * world_size * 16, world_size, local_world_size, cost_fn).name
+        for n in range(24)
+    ]
+    flip = names.index("rs_ag")
+    assert all(name == "rs_ag" for name in names[flip:]), names
+    print(f"✅ test_select_plan world_size={world_size} local_world_size={local_world_size} "
+          f"switches to rs_ag at {2**flip * world_size * 16} bytes passes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    args = parser.parse_args()
+
+    for world_size, local_world_size in [(16, 8), (32, 8), (8, 4), (4, 1)]:
+        test_build_plans(world_size, local_world_size)
+        test_select_plan(world_size, local_world_size)
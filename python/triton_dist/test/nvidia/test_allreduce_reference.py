@@ -0,0 +1,81 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import argparse
+
+import torch
+
+from triton_dist.kernels.allreduce import AllReduceMethod, all_reduce_reference, ring_reduce_reference
+
+
+def _create_inputs(world_size, numel, dtype, generator):
+    return [torch.randn((numel, ), generator=generator).to(dtype) for _ in range(world_size)]
+
+
+def test_ring_reduce_order(dtype=torch.bfloat16):
+    # the order matters in low precision: 1 + eps/2 + eps/2 != eps/2 + eps/2 + 1
+    eps = torch.finfo(dtype).eps
+    segments = [torch.tensor([x], dtype=dtype) for x in [1.0, eps / 2, eps / 2]]
+    assert ring_reduce_reference(segments, 2).item() == 1.0  # 1 + eps/2 + eps/2
+    assert ring_reduce_reference(segments, 0).item() == 1.0 + eps  # eps/2 + eps/2 + 1
+    print("✅ test_ring_reduce_order passes")
+
+
+def test_all_reduce_reference(world_size, numel, dtype, seed):
+    generator = torch.Generator().manual_seed(seed)
+    inputs = _create_inputs(world_size, numel, dtype, generator)
+    golden = torch.stack([x.double() for x in inputs]).sum(0)
+    atol, rtol = {
+        torch.bfloat16: (3e-2, 3e-2),
+        torch.float16: (1e-2, 1e-2),
+        torch.float32: (1e-5, 1e-5),
+    }[dtype]
+
+    for method in [AllReduceMethod.OneShot, AllReduceMethod.OneShot_LL, AllReduceMethod.TwoShot]:
+        outputs = all_reduce_reference(inputs, method)
+        assert len(outputs) == world_size
+        for output in outputs:
+            assert output.dtype == dtype and output.shape == inputs[0].shape
+            torch.testing.assert_close(output.double(), golden, atol=atol * world_size, rtol=rtol)
+
+    # two-shot is reduced once and broadcast: bit-exact on all ranks
+    outputs = all_reduce_reference(inputs, AllReduceMethod.TwoShot)
+    for output in outputs[1:]:
+        assert torch.equal(output, outputs[0])
+    # one-shot of rank 0 reduces all segments of rank 0's two-shot share in the same order
+    one_shot = all_reduce_reference(inputs, AllReduceMethod.OneShot)
+    assert torch.equal(one_shot[0][:numel // world_size], outputs[0][:numel // world_size])
+    print(f"✅ test_all_reduce_reference world_size={world_size} numel={numel} dtype={dtype} passes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    test_ring_reduce_order(torch.bfloat16)
+    test_ring_reduce_order(torch.float16)
+    for dtype in [torch.bfloat16, torch.float16, torch.float32]:
+        for world_size in [2, 4, 8]:
+            test_all_reduce_reference(world_size, 1024 * world_size, dtype, args.seed)
@@ -0,0 +1,228 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import asyncio
+import contextlib
+import threading
+import time
+
+from triton_dist.models.server import AsyncGenerationServer, LatencyHistogram, ServerMetrics
+
+EOS = 0
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubModel:
+    """ each sequence counts down from the first token of its prompt to EOS """
+
+    def __init__(self, max_batch_size, clock, prefill_time=0.05, step_time=0.01):
+        self.max_batch_size = max_batch_size
+        self.clock = clock
+        self.prefill_time = prefill_time
+        self.step_time = step_time
+        self.slots = {}
+        self.decoded = []  # slots of each step
+        self.released = []
+        self.fail_on = None
+
+    def prefill(self, slot, prompt_ids):
+        assert slot not in self.slots and 0 <= slot < self.max_batch_size
+        self.clock.now += self.prefill_time
+        self.slots[slot] = prompt_ids[0]
+        return prompt_ids[0]
+
+    def decode(self, slots, tokens):
+        if self.fail_on is not None and self.fail_on in slots:
+            raise RuntimeError("step failed")
+        self.clock.now += self.step_time
+        self.decoded.append(list(slots))
+        return [max(token - 1, EOS) for token in tokens]
+
+    def release(self, slot):
+        del self.slots[slot]
+        self.released.append(slot)
+
+
+async def collect(server, first_token, **kwargs):
+    return [token async for token in server.generate([first_token, 7, 7], eos_token_ids=[EOS], **kwargs)]
+
+
+async def run_batching():
+    clock = FakeClock()
+    model = StubModel(max_batch_size=2, clock=clock)
+    server = AsyncGenerationServer(model, clock=clock)
+    await server.start()
+    outputs = await asyncio.gather(collect(server, 5, max_new_tokens=100), collect(server, 3, max_new_tokens=100),
+                                   collect(server, 4, max_new_tokens=2))
+    await server.stop()
+    assert outputs == [[5, 4, 3, 2, 1], [3, 2, 1], [4, 3]], outputs
+    # the third request waits for the slot of the second one
+    assert max(len(slots) for slots in model.decoded) == 2 and model.slots == {}
+    assert sorted(model.released) == [0, 1, 1], model.released
+
+    metrics = server.metrics.summary()
+    assert metrics["requests"] == 3 and metrics["finished_requests"] == 3 and metrics["cancelled_requests"] == 0
+    assert metrics["generated_tokens"] == 10
+    hists = server.metrics.histograms
+    assert hists["queue_time"].count == 3 and hists["ttft"].count == 3 and hists["inter_token_latency"].count == 7
+    # the first request starts at once, the third after the second finished (prefills and 3 decode steps)
+    assert hists["queue_time"].counts[0] == 1 and hists["queue_time"].sum > 0.15
+    assert hists["ttft"].sum >= 3 * 0.05
+    # the prefills of the second and third requests add to the inter-token latency of the running requests
+    assert abs(hists["inter_token_latency"].sum - (7 * 0.01 + 2 * 0.05)) < 1e-9, hists["inter_token_latency"].sum
+
+
+async def run_backpressure_and_cancel():
+    clock = FakeClock()
+    model = StubModel(max_batch_size=2, clock=clock)
+    server = AsyncGenerationServer(model, max_pending_tokens=2, clock=clock)
+    await server.start()
+
+    # a consumer that never reads: its request is paused with 2 tokens pending, the other one runs to the end
+    slow = server.generate([50], max_new_tokens=100, eos_token_ids=[EOS])
+    slow_first = asyncio.ensure_future(slow.__anext__())
+    # submitted first, so it takes slot 0
+    await asyncio.sleep(0)
+    fast = await collect(server, 20, max_new_tokens=100)
+    assert fast == list(range(20, 0, -1)), fast
+    assert await slow_first == 50
+    steps_of_slow = sum(0 in slots for slots in model.decoded)
+    assert steps_of_slow <= 3, steps_of_slow
+
+    # reading resumes it, and closing it cancels it and frees its slot
+    assert [await slow.__anext__() for _ in range(5)] == [49, 48, 47, 46, 45]
+    await slow.aclose()
+    async with contextlib.aclosing(server.generate([9], max_new_tokens=100, eos_token_ids=[EOS])) as gen:
+        async for token in gen:
+            if token == 7:
+                break
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert model.slots == {}, model.slots
+    assert server.metrics.counters["cancelled_requests"] == 2
+    await server.stop()
+
+
+async def run_failure():
+    clock = FakeClock()
+    model = StubModel(max_batch_size=2, clock=clock)
+    server = AsyncGenerationServer(model, clock=clock)
+    await server.start()
+    model.fail_on = 0
+    try:
+        await collect(server, 5, max_new_tokens=100)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("a failed step should fail its requests")
+    # the server goes on with the next requests
+    model.fail_on = None
+    assert await collect(server, 2, max_new_tokens=100) == [2, 1]
+    await server.stop()
+
+
+class SlowStepModel(StubModel):
+    """ decode runs long enough for stop() to be called in the middle of it """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_step = threading.Event()
+        self.step_running = False
+
+    def decode(self, slots, tokens):
+        self.step_running = True
+        self.in_step.set()
+        time.sleep(0.1)
+        out = super().decode(slots, tokens)
+        self.step_running = False
+        return out
+
+    def release(self, slot):
+        assert not self.step_running, "slot released while a step is running"
+        super().release(slot)
+
+
+async def run_stop_during_step():
+    clock = FakeClock()
+    model = SlowStepModel(max_batch_size=2, clock=clock)
+    server = AsyncGenerationServer(model, clock=clock)
+    await server.start()
+    consumer = asyncio.ensure_future(collect(server, 50, max_new_tokens=100))
+    await asyncio.get_running_loop().run_in_executor(None, model.in_step.wait)
+    await server.stop()
+    assert await consumer == [50], "stop() ends the stream after the first token"
+    assert model.released == [0] and model.slots == {}, (model.released, model.slots)
+
+
+async def run_restart():
+    clock = FakeClock()
+    model = StubModel(max_batch_size=2, clock=clock)
+    server = AsyncGenerationServer(model, clock=clock)
+    await server.start()
+    assert await collect(server, 3, max_new_tokens=100) == [3, 2, 1]
+    await server.stop()
+    # a stopped server starts again with a fresh step thread
+    await server.start()
+    assert await collect(server, 2, max_new_tokens=100) == [2, 1]
+    await server.stop()
+    assert model.slots == {} and server.metrics.counters["finished_requests"] == 2
+
+
+def test_histogram():
+    hist = LatencyHistogram(buckets=[0.1, 0.2, 0.4])
+    for value in [0.05] * 50 + [0.15] * 40 + [0.3] * 9 + [1.0]:
+        hist.observe(value)
+    assert hist.count == 100 and hist.counts == [50, 40, 9, 1]
+    assert abs(hist.quantile(0.5) - 0.1) < 1e-9
+    assert 0.1 < hist.quantile(0.7) < 0.2
+    assert hist.quantile(0.999) == 0.4
+    assert LatencyHistogram().quantile(0.5) != LatencyHistogram().quantile(0.5)  # nan
+
+    metrics = ServerMetrics(buckets=[0.1, 0.2])
+    metrics.histograms["ttft"].observe(0.15)
+    metrics.counters["requests"] += 1
+    text = metrics.to_prometheus()
+    assert "triton_dist_requests_total 1\n" in text
+    assert '# TYPE triton_dist_ttft_seconds histogram\n' in text
+    assert 'triton_dist_ttft_seconds_bucket{le="0.1"} 0\n' in text
+    assert 'triton_dist_ttft_seconds_bucket{le="+Inf"} 1\n' in text
+    assert "triton_dist_ttft_seconds_count 1\n" in text
+
+
+if __name__ == "__main__":
+    test_histogram()
+    asyncio.run(run_batching())
+    asyncio.run(run_backpressure_and_cancel())
+    asyncio.run(run_failure())
+    asyncio.run(run_stop_during_step())
+    asyncio.run(run_restart())
+    print("✅ async generation server passes")
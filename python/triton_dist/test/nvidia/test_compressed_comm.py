@@ -0,0 +1,124 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import argparse
+import datetime
+import os
+
+import nvshmem.core
+import torch
+import torch.distributed
+
+from triton_dist.kernels.compressed_comm import (CompressedWireConfig, all_gather_compressed_reference,
+                                                 reduce_scatter_compressed_reference)
+from triton_dist.kernels.nvidia.compressed_comm import (all_gather_compressed, create_compressed_comm_context,
+                                                        reduce_scatter_compressed)
+from triton_dist.utils import group_profile, init_nvshmem_by_torch_process_group, perf_func
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--numel", type=int, default=1024 * 1024, help="elements per rank of the output of RS")
+    parser.add_argument("--dtype", type=str, default="bfloat16", choices=["bfloat16", "float16", "float32"])
+    parser.add_argument("--wire_dtype", type=str, default="float8_e4m3fn", choices=["float8_e4m3fn", "int8"])
+    parser.add_argument("--block_size", type=int, default=128)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--profile", action="store_true", default=False)
+    return parser.parse_args()
+
+
+def _gather_inputs(x):
+    xs = [torch.empty_like(x) for _ in range(WORLD_SIZE)]
+    torch.distributed.all_gather(xs, x, group=TP_GROUP)
+    return [x.cpu() for x in xs]
+
+
+def test_reduce_scatter_compressed(ctx, numel, dtype):
+    x = torch.randn((numel * WORLD_SIZE, ), dtype=dtype, device="cuda")
+    output = reduce_scatter_compressed(ctx, x)
+    inputs = _gather_inputs(x)
+    golden = reduce_scatter_compressed_reference(inputs, ctx.config)[RANK]
+    # the same dequantized values accumulated in float32. a value on a rounding tie may go either way.
+    absmax = max(t.abs().max().item() for t in inputs)
+    torch.testing.assert_close(output.cpu().float(), golden.float(), atol=2 * ctx.config.wire_error_bound * absmax,
+                               rtol=1e-2)
+    exact = torch.empty_like(output)
+    torch.distributed.reduce_scatter_tensor(exact, x, group=TP_GROUP)
+    max_error = (output.float() - exact.float()).abs().max().item()
+    print(f"✅ RANK[{RANK}] reduce_scatter_compressed {ctx.config.wire_dtype} passes. "
+          f"max error vs exact: {max_error:.3e}")
+
+
+def test_all_gather_compressed(ctx, numel, dtype):
+    x = torch.randn((numel, ), dtype=dtype, device="cuda")
+    output = all_gather_compressed(ctx, x)
+    inputs = _gather_inputs(x)
+    golden = all_gather_compressed_reference(inputs, ctx.config)
+    absmax = max(t.abs().max().item() for t in inputs)
+    torch.testing.assert_close(output.cpu().float(), golden.float(), atol=2 * ctx.config.wire_error_bound * absmax,
+                               rtol=1e-2)
+    print(f"✅ RANK[{RANK}] all_gather_compressed {ctx.config.wire_dtype} passes")
+
+
+def perf(ctx, numel, dtype, warmup_iters, iters, profile):
+    x_rs = torch.randn((numel * WORLD_SIZE, ), dtype=dtype, device="cuda")
+    x_ag = torch.randn((numel, ), dtype=dtype, device="cuda")
+    with group_profile(f"compressed_comm_{numel}", do_prof=profile, group=TP_GROUP):
+        _, rs_ms = perf_func(lambda: reduce_scatter_compressed(ctx, x_rs), iters=iters, warmup_iters=warmup_iters)
+        _, ag_ms = perf_func(lambda: all_gather_compressed(ctx, x_ag), iters=iters, warmup_iters=warmup_iters)
+    print(f"RANK[{RANK}] {numel * WORLD_SIZE * x_rs.itemsize // 1024} KB reduce_scatter: {rs_ms * 1000:0.2f} us, "
+          f"all_gather: {ag_ms * 1000:0.2f} us")
+
+
+if __name__ == "__main__":
+    RANK = int(os.environ.get("RANK", 0))
+    LOCAL_RANK = int(os.environ.get("LOCAL_RANK", 0))
+    WORLD_SIZE = int(os.environ.get("WORLD_SIZE", 1))
+    LOCAL_WORLD_SIZE = int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+    torch.cuda.set_device(LOCAL_RANK)
+    torch.distributed.init_process_group(
+        backend="nccl",
+        world_size=WORLD_SIZE,
+        rank=RANK,
+        timeout=datetime.timedelta(seconds=1800),
+    )
+    assert torch.distributed.is_initialized()
+    TP_GROUP = torch.distributed.new_group(ranks=list(range(WORLD_SIZE)), backend="nccl")
+    args = parse_args()
+    dtype = getattr(torch, args.dtype)
+
+    torch.cuda.synchronize()
+    init_nvshmem_by_torch_process_group(TP_GROUP)
+
+    config = CompressedWireConfig(getattr(torch, args.wire_dtype), args.block_size)
+    ctx = create_compressed_comm_context(RANK, WORLD_SIZE, args.numel, config)
+    for numel in [args.block_size, args.numel // 3, args.numel]:
+        test_reduce_scatter_compressed(ctx, numel, dtype)
+        test_all_gather_compressed(ctx, numel, dtype)
+    perf(ctx, args.numel, dtype, args.warmup, args.iters, args.profile)
+
+    ctx.finalize()
+    nvshmem.core.finalize()
+    torch.distributed.destroy_process_group()
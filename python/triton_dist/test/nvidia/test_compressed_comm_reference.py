@@ -0,0 +1,130 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import argparse
+
+import torch
+
+from triton_dist.kernels.compressed_comm import (CompressedSegmentLayout, CompressedWireConfig,
+                                                 all_gather_compressed_reference, dequantize_blockwise_reference,
+                                                 measure_quantization_error, pack_segment_reference,
+                                                 quantize_blockwise_reference, reduce_scatter_compressed_reference,
+                                                 unpack_segment_reference)
+
+WIRE_DTYPES = [torch.float8_e4m3fn, torch.int8]
+
+
+def test_layout():
+    layout = CompressedSegmentLayout(numel=1000, block_size=128)
+    assert layout.num_blocks == 8
+    assert layout.scale_offset == 1008
+    assert layout.nbytes == 1008 + 32
+    # bf16 on the wire would be 2000 bytes
+    assert layout.nbytes < 1000 * 2
+    print("✅ test_layout passes")
+
+
+def test_config():
+    for wire_dtype in WIRE_DTYPES:
+        config = CompressedWireConfig(wire_dtype)
+        assert config.effective_error_bound == config.wire_error_bound
+        CompressedWireConfig(wire_dtype, error_bound=config.wire_error_bound * 2)
+        try:
+            CompressedWireConfig(wire_dtype, error_bound=config.wire_error_bound / 2)
+            raise AssertionError("a bound tighter than the wire dtype should be rejected")
+        except ValueError:
+            pass
+    for block_size in [8, 100]:
+        try:
+            CompressedWireConfig(block_size=block_size)
+            raise AssertionError(f"block_size {block_size} should be rejected")
+        except ValueError:
+            pass
+    print("✅ test_config passes")
+
+
+def test_quantize_roundtrip(wire_dtype, block_size, numel, seed):
+    generator = torch.Generator().manual_seed(seed)
+    config = CompressedWireConfig(wire_dtype, block_size)
+    # blocks of very different magnitude, and an all zero block
+    x = torch.randn((numel, ), generator=generator) * torch.logspace(-3, 3, numel).flip(0)
+    x[:block_size] = 0
+
+    q, scales = quantize_blockwise_reference(x, config)
+    assert q.dtype == wire_dtype and q.numel() == numel
+    assert scales.dtype == torch.float32 and scales.numel() == CompressedSegmentLayout(numel, block_size).num_blocks
+    assert scales[0] == 0 and (q[:block_size].float() == 0).all()
+    # absmax of each block maps to qmax exactly
+    assert q.float().abs().max() == config.qmax
+
+    x_hat = dequantize_blockwise_reference(q, scales, config)
+    report = measure_quantization_error(x, config)
+    assert report.within_bound, report
+    assert report.max_abs_error == (x_hat - x).abs().max().item()
+
+    # wire bytes restore the same values
+    segment = pack_segment_reference(x, config)
+    assert segment.numel() == CompressedSegmentLayout(numel, block_size).nbytes
+    assert torch.equal(unpack_segment_reference(segment, numel, config), x_hat)
+    print(f"✅ test_quantize_roundtrip wire_dtype={wire_dtype} block_size={block_size} numel={numel} "
+          f"max_rel_error={report.max_rel_error:.3e} <= {report.error_bound:.3e} passes")
+
+
+def test_collectives_reference(wire_dtype, world_size, numel, dtype, seed):
+    generator = torch.Generator().manual_seed(seed)
+    config = CompressedWireConfig(wire_dtype)
+    inputs = [torch.randn((numel * world_size, ), generator=generator).to(dtype) for _ in range(world_size)]
+
+    outputs = reduce_scatter_compressed_reference(inputs, config)
+    golden = torch.stack([x.double() for x in inputs]).sum(0).chunk(world_size)
+    # each rank contributes at most effective_error_bound * block absmax
+    atol = config.effective_error_bound * sum(x.abs().max().item() for x in inputs)
+    for rank in range(world_size):
+        assert outputs[rank].dtype == dtype and outputs[rank].numel() == numel
+        torch.testing.assert_close(outputs[rank].double(), golden[rank], atol=atol, rtol=1e-2)
+
+    gathered = all_gather_compressed_reference([x[:numel] for x in inputs], config)
+    assert gathered.dtype == dtype and gathered.numel() == numel * world_size
+    for rank in range(world_size):
+        x = inputs[rank][:numel]
+        atol = config.effective_error_bound * x.abs().max().item()
+        torch.testing.assert_close(gathered[rank * numel:(rank + 1) * numel].double(), x.double(), atol=atol,
+                                   rtol=1e-2)
+    print(f"✅ test_collectives_reference wire_dtype={wire_dtype} world_size={world_size} dtype={dtype} passes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    test_layout()
+    test_config()
+    for wire_dtype in WIRE_DTYPES:
+        for block_size in [32, 128]:
+            for numel in [block_size * 4, 1000]:
+                test_quantize_roundtrip(wire_dtype, block_size, numel, args.seed)
+        for world_size in [2, 8]:
+            for dtype in [torch.bfloat16, torch.float32]:
+                test_collectives_reference(wire_dtype, world_size, 1024, dtype, args.seed)
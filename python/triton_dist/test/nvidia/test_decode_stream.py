@@ -0,0 +1,157 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import threading
+
+import torch
+
+from triton_dist.models.decode_stream import DecodeStreamWorker, StopChecker, TokenRing
+
+# tokens are utf-8 bytes, plus an EOS token
+EOS = 256
+
+
+def decode_bytes(tokens):
+    return bytes(t for t in tokens if t < 256).decode("utf-8", errors="replace")
+
+
+def encode(text):
+    return list(text.encode("utf-8"))
+
+
+def test_token_ring():
+    ring = TokenRing(capacity=2, batch_size=3, pin_memory=False)
+    assert ring.pop(timeout=0.01) is None
+    max_in_flight = []
+
+    def produce():
+        for step in range(10):
+            ring.push(torch.full((3, 1), step))
+            max_in_flight.append(ring.num_pushed - ring.num_popped)
+        ring.close()
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    popped = []
+    while (item := ring.pop()) is not None:
+        popped.append(item)
+    producer.join()
+    assert popped == [(step, [step] * 3) for step in range(10)], popped
+    # the producer blocks instead of overwriting slots not popped yet
+    assert max(max_in_flight) <= 2, max_in_flight
+    assert ring.pop() is None
+
+    try:
+        ring.push(torch.zeros(3))
+    except AssertionError:
+        pass
+    else:
+        raise AssertionError("push to a closed ring should fail")
+
+
+def feed(checker, sequences):
+    """ steps over sequences of equal length, one token of each per step => (finish step of each, streamed text) """
+    finish_steps = {}
+    streamed = [""] * checker.batch_size
+    for step, step_tokens in enumerate(zip(*sequences)):
+        newly_finished, deltas = checker.update(list(step_tokens))
+        for i in newly_finished:
+            assert i not in finish_steps
+            finish_steps[i] = step
+        for i, text in deltas:
+            streamed[i] += text
+    return finish_steps, streamed
+
+
+def test_stop_checker():
+    texts = ["héllo wörld, this runs", "say STOP now", "日本語のテキスト", "abc"]
+    n = max(len(encode(t)) for t in texts) + 1
+    sequences = [(encode(t) + [EOS] * n)[:n] for t in texts]
+    # sequence 3 emits tokens after its EOS: they are ignored
+    sequences[3][4] = ord("x")
+    checker = StopChecker(4, eos_token_ids=[EOS], stop_strings=["STOP", "this"], decode_fn=decode_bytes)
+    finish_steps, streamed = feed(checker, sequences)
+
+    assert checker.texts == ["héllo wörld, ", "say ", "日本語のテキスト", "abc"], checker.texts
+    # streamed text never holds half of a multi-byte character, and adds up to the final text
+    assert streamed == checker.texts, streamed
+    assert checker.all_finished and checker.free_slots() == [0, 1, 2, 3]
+    # stop strings finish on their last token, EOS on the EOS token, which is not kept
+    assert finish_steps[0] == len(encode("héllo wörld, this")) - 1
+    assert finish_steps[1] == len(encode("say STOP")) - 1
+    assert finish_steps[2] == len(encode(texts[2])) and EOS not in checker.tokens[2]
+    assert checker.tokens[3] == encode("abc")
+
+    checker = StopChecker(2, eos_token_ids=[EOS], max_new_tokens=3)
+    finish_steps, streamed = feed(checker, [encode("abcdef"), [ord("a"), EOS] + encode("bcde")])
+    assert finish_steps == {0: 2, 1: 1} and checker.tokens == [encode("abc"), encode("a")]
+    # without decode_fn, nothing is streamed
+    assert streamed == ["", ""] and checker.texts == ["", ""]
+
+    try:
+        StopChecker(1, stop_strings=["x"])
+    except AssertionError:
+        pass
+    else:
+        raise AssertionError("stop strings without decode_fn should fail")
+
+
+def test_decode_stream_worker():
+    texts = ["the quick brown fox", "jumps ovér"]
+    n = max(len(encode(t)) for t in texts) + 1
+    sequences = [(encode(t) + [EOS] * n)[:n] for t in texts]
+    ring = TokenRing(capacity=4, batch_size=2, pin_memory=False)
+    checker = StopChecker(2, eos_token_ids=[EOS], stop_strings=["brown"], decode_fn=decode_bytes)
+    streamed, finished = ["", ""], []
+    worker = DecodeStreamWorker(ring, checker, on_text=lambda i, text: streamed.__setitem__(i, streamed[i] + text),
+                                on_finish=finished.append)
+    worker.start()
+    for step_tokens in zip(*sequences):
+        ring.push(torch.tensor(step_tokens).view(2, 1))
+    assert worker.finish() is checker
+    assert checker.texts == ["the quick ", "jumps ovér"] and streamed == checker.texts, streamed
+    assert finished == [1, 0], finished
+
+    # an error on the worker drains the ring, so the decode loop never blocks, and is raised by finish()
+    def fail(tokens):
+        raise ValueError("bad token")
+
+    ring = TokenRing(capacity=1, batch_size=1, pin_memory=False)
+    worker = DecodeStreamWorker(ring, StopChecker(1, decode_fn=fail))
+    worker.start()
+    for step in range(8):
+        ring.push(torch.tensor([step]))
+    try:
+        worker.finish()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("finish() should raise the error of the worker")
+
+
+if __name__ == "__main__":
+    test_token_ring()
+    test_stop_checker()
+    test_decode_stream_worker()
+    print("✅ decode stream ring buffer and stop checks pass")
@@ -0,0 +1,94 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import torch
+
+from triton_dist.kernels.decode_workspace import DecodeWorkspace
+
+
+def test_views():
+    ws = DecodeWorkspace(max_batch=8, num_q_heads=4, kv_split=32, v_head_dim=128, dtype=torch.float16, device="cpu")
+    assert ws.output_split.shape == (8, 4, 32, 129) and ws.output_combine.shape == (8, 4, 129)
+    assert ws.final_output.shape == (8, 4, 128)
+    assert ws.nbytes == (8 * 4 * 32 * 129 + 8 * 4 * 129 + 8 * 4 * 128) * 2
+
+    for batch in [1, 3, 8]:
+        views = ws.views(batch)
+        assert views.output_split.shape == (batch, 4, 32, 129) and views.output_split.is_contiguous()
+        assert views.output_combine.shape == (batch, 4, 129) and views.final_output.shape == (batch, 4, 128)
+        assert views.q_lens == [1] * batch
+        # views of the first rows: the same addresses for all batch sizes
+        assert views.output_split.data_ptr() == ws.output_split.data_ptr()
+        assert views.final_output.data_ptr() == ws.final_output.data_ptr()
+        # nbytes of the live batch, as the allgather of SpGQAFlashDecodeAttention sends
+        assert views.output_combine.nbytes == batch * 4 * 129 * 2
+    # the same tensors for the same batch size
+    assert ws.views(3) is ws.views(3) and ws.views(3).output_split is ws.views(3).output_split
+
+    for batch in [0, 9]:
+        try:
+            ws.views(batch)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"batch {batch} should be out of the workspace")
+
+    assert ws.matches(torch.float16, "cpu") and not ws.matches(torch.bfloat16, "cpu")
+
+
+def test_debug_guards():
+    ws = DecodeWorkspace(max_batch=4, num_q_heads=2, kv_split=8, v_head_dim=16, dtype=torch.bfloat16, device="cpu",
+                         debug=True)
+    # one guard row past max_batch
+    assert ws.output_split.shape[0] == 5
+    views = ws.views(2)
+    assert torch.isnan(views.final_output).all()
+    # a kernel writing its batch is fine
+    views.output_split.zero_()
+    views.output_combine.zero_()
+    views.final_output.zero_()
+    ws.check_guards()
+    # one writing past it is found, in the rows of a smaller batch as in the guard rows
+    ws.output_combine[2, 1, 3] = 1.0
+    try:
+        ws.check_guards()
+    except RuntimeError as e:
+        assert "output_combine" in str(e)
+    else:
+        raise AssertionError("a write past the batch should be found")
+    ws.views(4)
+    ws.check_guards()
+    ws.final_output[4, 0, 0] = 0.0
+    try:
+        ws.check_guards()
+    except RuntimeError as e:
+        assert "final_output" in str(e)
+    else:
+        raise AssertionError("a write past max_batch should be found")
+
+
+if __name__ == "__main__":
+    test_views()
+    test_debug_guards()
+    print("✅ decode workspace passes")
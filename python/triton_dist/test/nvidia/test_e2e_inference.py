@@ -47,6 +47,14 @@ def parse_args() -> Namespace:
     p.add_argument("--triton_dist", action="store_true", help="Use triton_dist for distributed inference")
     p.add_argument("--triton_dist_AR", action="store_true", help="Use triton_dist_AR for distributed inference")
     p.add_argument("--verbose", action="store_true", help="Enable verbose logging")
+    p.add_argument("--ignore_eos", action="store_true", help="Decode gen_len tokens even after EOS")
+    p.add_argument("--stop", type=str, nargs="*", default=[], help="Stop strings")
+    p.add_argument("--step_timer", type=int, default=0, help="Time every N-th decode step, 0 to disable")
+    p.add_argument("--step_timer_eager", action="store_true",
+                   help="Run timed steps eagerly to break them down per op")
+    p.add_argument("--load_format", default="hf", choices=["hf", "safetensors", "presharded"],
+                   help="safetensors: each rank reads only its own weight shards. "
+                   "presharded: --model is a per-rank checkpoint exported by triton_dist.models.presharded_checkpoint")
     return p.parse_args()
 
 
@@ -85,7 +93,7 @@ if __name__ == "__main__":
     DTYPE = DTYPE_MAP[args.dtype]
 
     model_config = ModelConfig(model_name=args.model, max_length=args.max_length, dtype=DTYPE, rank=RANK,
-                               world_size=WORLD_SIZE)
+                               world_size=WORLD_SIZE, load_format=args.load_format)
     bsz = args.bsz
     assert bsz % WORLD_SIZE == 0, "Batch size must be divisible by world size for distributed inference."
     engine = Engine(model_config, temperature=0.6, top_p=0.95, verbose=args.verbose)
@@ -95,6 +103,10 @@ if __name__ == "__main__":
     if args.no_graph:
         engine.no_graph = True
         engine.logger.log("❌ CUDA graph disabled!", "warning")
+    engine.ignore_eos = args.ignore_eos
+    engine.stop_strings = args.stop
+    if args.step_timer > 0:
+        engine.enable_step_timer(sample_every=args.step_timer, eager=args.step_timer_eager)
 
     prompt = "<|im_start|>user\nWhat is the capital of France?<|im_end|>\n<|im_start|>assistant\n<think>\n"
     input_ids = engine.tokenizer(prompt, return_tensors="pt").input_ids.cuda().repeat(bsz, 1)
@@ -0,0 +1,159 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import numpy as np
+import pytest
+import torch
+
+from triton_dist.kernels.expert_placement import ExpertPlacement, plan_expert_placement
+
+
+def _skewed_histogram(world_size, num_experts, tokens_per_rank, topk, alpha=1.2, seed=0):
+    """ [src_rank, expert] counts of zipf-like routing, each rank with its own hot experts order """
+    rng = np.random.default_rng(seed)
+    weight = 1.0 / np.arange(1, num_experts + 1)**alpha
+    hot = rng.permutation(num_experts)
+    histogram = np.zeros((world_size, num_experts), dtype=np.int64)
+    for rank in range(world_size):
+        # ranks mostly agree on the hot experts, with some noise
+        w = weight[np.argsort(hot)] * rng.uniform(0.5, 1.5, num_experts)
+        histogram[rank] = rng.multinomial(tokens_per_rank * topk, w / w.sum())
+    return histogram
+
+
+def _routed_indices(histogram, seed=0):
+    """ per src rank, a shuffled [n] array of logical experts realizing its histogram row """
+    rng = np.random.default_rng(seed)
+    return [rng.permutation(np.repeat(np.arange(len(row)), row)) for row in histogram]
+
+
+def _check_valid(placement: ExpertPlacement, num_experts, world_size, num_redundant):
+    assert placement.num_physical_experts == num_experts + num_redundant
+    assert placement.experts_per_rank * world_size == placement.num_physical_experts
+    assert set(placement.physical_to_logical) == set(range(num_experts))
+    for rank in range(world_size):
+        experts = placement.physical_to_logical[rank * placement.experts_per_rank:(rank + 1) *
+                                                placement.experts_per_rank]
+        assert len(set(experts)) == len(experts), f"rank {rank} holds an expert twice: {experts}"
+
+
+def test_contiguous():
+    placement = ExpertPlacement.contiguous(16, 8, 4)
+    assert placement.experts_per_rank == 2
+    expert_map = placement.expert_map(rank=5)
+    exp_indices = torch.randint(0, 16, (64, 4), dtype=torch.int32)
+    mapped = expert_map(exp_indices)
+    assert mapped.dtype == exp_indices.dtype and torch.equal(mapped, exp_indices)
+    if torch.cuda.is_available():
+        # a CPU map follows the device of exp_indices, as in EPAll2AllLayer.dispatch
+        mapped = expert_map(exp_indices.cuda())
+        assert mapped.is_cuda and torch.equal(mapped.cpu(), exp_indices)
+    histogram = np.ones((8, 16))
+    assert placement.rank_tokens(histogram).tolist() == [16.0] * 8
+    assert placement.imbalance(histogram) == 1.0
+
+
+def test_balances_skewed_histograms():
+    for world_size, local_world_size, num_experts, num_redundant in [(8, 8, 64, 0), (8, 8, 64, 8), (16, 8, 64, 16),
+                                                                     (32, 8, 256, 32), (8, 4, 32, 8)]:
+        histogram = _skewed_histogram(world_size, num_experts, tokens_per_rank=4096, topk=8, seed=world_size)
+        contiguous = ExpertPlacement.contiguous(num_experts, world_size, local_world_size)
+        placement = plan_expert_placement(histogram, world_size, local_world_size, num_redundant)
+        _check_valid(placement, num_experts, world_size, num_redundant)
+        tokens = placement.rank_tokens(histogram)
+        assert np.isclose(tokens.sum(), histogram.sum())
+        # never worse than the default layout, and close to the best possible: the mean, or a replica of the
+        # hottest expert when it alone is above the mean
+        assert tokens.max() <= contiguous.rank_tokens(histogram).max()
+        assert placement.imbalance(histogram) < contiguous.imbalance(histogram)
+        replicas = np.bincount(placement.physical_to_logical, minlength=num_experts)
+        lower_bound = max(tokens.mean(), (histogram.sum(axis=0) / replicas).max())
+        assert tokens.max() < 1.1 * lower_bound, (world_size, num_experts, num_redundant, tokens.max() / lower_bound)
+
+
+def test_replicas_go_to_hot_experts():
+    world_size, num_experts = 8, 16
+    histogram = np.ones((world_size, num_experts), dtype=np.int64)
+    histogram[:, 3] = 100
+    placement = plan_expert_placement(histogram, world_size, 4, num_redundant_experts=8)
+    _check_valid(placement, num_experts, world_size, 8)
+    assert len(placement.replicas(3)) == world_size
+    # the hot expert is on every rank, so every rank gets an equal share of it: ranks differ by cold experts only
+    tokens = placement.rank_tokens(histogram)
+    assert tokens.max() - tokens.min() <= world_size
+
+
+def test_intra_node_affinity():
+    world_size, local_world_size, num_experts = 16, 8, 32
+    histogram = _skewed_histogram(world_size, num_experts, tokens_per_rank=2048, topk=4)
+    placement = plan_expert_placement(histogram, world_size, local_world_size, num_redundant_experts=16)
+    contiguous = ExpertPlacement.contiguous(num_experts, world_size, local_world_size)
+    assert placement.internode_tokens(histogram) < contiguous.internode_tokens(histogram)
+    for rank in range(world_size):
+        expert_map = placement.expert_map(rank)
+        node = rank // local_world_size
+        for e in range(num_experts):
+            replicas = placement.replicas(e)
+            nodes = [p // (placement.experts_per_rank * local_world_size) for p in replicas]
+            local = [p for p, n in zip(replicas, nodes) if n == node]
+            # tokens stay in the node only if every node has as many replicas
+            node_local = all(nodes.count(n) == len(local) for n in range(world_size // local_world_size))
+            targets = expert_map.table[e, :expert_map.counts[e]].tolist()
+            assert sorted(targets) == sorted(local if node_local else replicas)
+
+
+def test_dispatch_matches_model():
+    world_size, local_world_size, num_experts = 8, 4, 32
+    histogram = _skewed_histogram(world_size, num_experts, tokens_per_rank=1024, topk=8, seed=3)
+    placement = plan_expert_placement(histogram, world_size, local_world_size, num_redundant_experts=8)
+    received = np.zeros(placement.num_physical_experts, dtype=np.int64)
+    for rank, indices in enumerate(_routed_indices(histogram)):
+        exp_indices = torch.from_numpy(indices).view(-1, 8).to(torch.int32)
+        physical = placement.expert_map(rank)(exp_indices)
+        assert [placement.physical_to_logical[p] for p in physical.view(-1).tolist()] == indices.tolist()
+        received += np.bincount(physical.view(-1).numpy(), minlength=placement.num_physical_experts)
+    # round robin over replicas: one token of error per (src rank, expert)
+    assert np.abs(received - placement.physical_tokens(histogram)).max() <= world_size
+    assert np.array_equal(placement.to_logical_histogram(received), histogram.sum(axis=0))
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        plan_expert_placement(np.ones((8, 16)), 8, 8, num_redundant_experts=3)
+    # 2 experts over 4 ranks: at most 3 replicas each, 6 redundant in all
+    with pytest.raises(ValueError):
+        plan_expert_placement(np.ones((4, 2)), 4, 4, num_redundant_experts=10)
+    plan_expert_placement(np.ones((4, 2)), 4, 4, num_redundant_experts=6)
+    with pytest.raises(AssertionError):
+        plan_expert_placement(np.ones((4, 16)), 8, 8)
+
+
+if __name__ == "__main__":
+    test_contiguous()
+    test_balances_skewed_histograms()
+    test_replicas_go_to_hot_experts()
+    test_intra_node_affinity()
+    test_dispatch_matches_model()
+    test_invalid()
+    print("✅ expert placement passes")
@@ -0,0 +1,136 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import torch
+
+from triton_dist.kernels.graph_safety import (GraphHazard, collect_graph_hazards, copy_padded, format_graph_hazards,
+                                              graph_batch_buckets, select_graph_bucket)
+
+
+class FakeCounterContext:
+    """ like AllToAllContext: a host side counter until enable_graph_safe """
+
+    def __init__(self, op):
+        self.op = op
+        self.graph_safe = False
+
+    def enable_graph_safe(self):
+        self.graph_safe = True
+
+    def graph_hazards(self, **kwargs):
+        return [] if self.graph_safe else [GraphHazard(self.op, "counter advances on the host")]
+
+
+class FakeAutotuneLayer:
+    """ like TP_MLP: hazards depend on the shape of the captured forward """
+
+    def __init__(self, frozen_M):
+        self.frozen_M = frozen_M
+
+    def graph_hazards(self, M, mode):
+        if mode == "triton_dist" and M not in self.frozen_M:
+            return [GraphHazard("ag_gemm", f"autotune of M={M} is not frozen")]
+        return []
+
+
+def assert_raises(exc_type, fn, *args):
+    try:
+        fn(*args)
+    except exc_type:
+        return
+    raise AssertionError(f"expected {exc_type.__name__} for {fn.__name__}{args}")
+
+
+def test_collect_graph_hazards():
+    shared = FakeCounterContext("ag_gemm")
+    components = [shared, object(), shared, FakeCounterContext("fast_all_to_all")]
+    hazards = collect_graph_hazards(components)
+    # shared contexts are reported once, components without graph_hazards are graph safe
+    assert hazards == [GraphHazard("ag_gemm", "counter advances on the host"),
+                       GraphHazard("fast_all_to_all", "counter advances on the host")], hazards
+    assert str(hazards[0]) == "ag_gemm: counter advances on the host"
+    assert format_graph_hazards(hazards).splitlines() == [f"  - {h}" for h in hazards]
+
+    for component in components:
+        if isinstance(component, FakeCounterContext):
+            component.enable_graph_safe()
+    assert collect_graph_hazards(components) == []
+    assert collect_graph_hazards([]) == []
+
+    # kwargs are passed through to every component
+    layers = [FakeAutotuneLayer({8, 16}), FakeAutotuneLayer({8})]
+    assert collect_graph_hazards(layers, M=8, mode="triton_dist") == []
+    hazards = collect_graph_hazards(layers, M=16, mode="triton_dist")
+    assert hazards == [GraphHazard("ag_gemm", "autotune of M=16 is not frozen")], hazards
+    assert collect_graph_hazards(layers, M=16, mode="torch") == []
+
+
+def test_graph_batch_buckets():
+    assert graph_batch_buckets(1) == [1]
+    assert graph_batch_buckets(8) == [1, 2, 4, 8]
+    assert graph_batch_buckets(12) == [1, 2, 4, 8, 12]
+    assert graph_batch_buckets(8, multiple_of=8) == [8]
+    assert graph_batch_buckets(48, multiple_of=8) == [8, 16, 32, 48]
+    for bad in [(0, ), (6, 4), (4, 8), (8, 0)]:
+        assert_raises(ValueError, graph_batch_buckets, *bad)
+
+
+def test_select_graph_bucket():
+    buckets = graph_batch_buckets(48, multiple_of=8)
+    assert [select_graph_bucket(bsz, buckets) for bsz in [1, 8, 9, 16, 17, 33, 48]] == [8, 8, 16, 16, 32, 48, 48]
+    for bsz in range(1, 49):
+        bucket = select_graph_bucket(bsz, buckets)
+        assert bucket >= bsz and all(b < bsz for b in buckets if b < bucket)
+    assert_raises(ValueError, select_graph_bucket, 49, buckets)
+    assert_raises(ValueError, select_graph_bucket, 1, [])
+
+
+def test_copy_padded():
+    buckets = graph_batch_buckets(8)
+    static = {bucket: torch.full((bucket, 1), -1, dtype=torch.long) for bucket in buckets}
+    for bsz in range(1, 9):
+        input_ids = torch.arange(bsz).view(bsz, 1) + 100
+        bucket = select_graph_bucket(bsz, buckets)
+        padded = copy_padded(static[bucket], input_ids)
+        assert padded is static[bucket]
+        assert torch.equal(padded[:bsz], input_ids) and bool((padded[bsz:] == 0).all()), (bsz, padded)
+        # what the graph computes for padded rows is sliced away
+        logits = padded.float() * 2
+        assert torch.equal(logits[:bsz], input_ids.float() * 2)
+
+    # a smaller batch after a larger one leaves no stale rows behind
+    dst = torch.zeros(4, 3)
+    copy_padded(dst, torch.ones(4, 3))
+    copy_padded(dst, torch.ones(1, 3) * 2, pad_value=-1)
+    assert torch.equal(dst, torch.tensor([[2.] * 3] + [[-1.] * 3] * 3))
+    for bad in [torch.ones(5, 3), torch.ones(2, 4)]:
+        assert_raises(AssertionError, copy_padded, dst, bad)
+
+
+if __name__ == "__main__":
+    test_collect_graph_hazards()
+    test_graph_batch_buckets()
+    test_select_graph_bucket()
+    test_copy_padded()
+    print("✅ CUDA graph safety validator and batch buckets pass")
@@ -0,0 +1,204 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import torch
+
+from triton_dist.models.kv_offload import SyncCopyEngine, TieredKVCache
+
+
+class DeferredCopyEngine(SyncCopyEngine):
+    """ copies complete at the next complete(), to check prefetch stalls """
+
+    def __init__(self):
+        self.pending = []
+        self.num_synchronized = 0
+
+    def copy(self, dsts, srcs):
+        handle = [list(zip(dsts, [src.clone() for src in srcs])), False]
+        self.pending.append(handle)
+        return handle
+
+    def complete(self):
+        for handle in self.pending:
+            self.synchronize(handle)
+        self.pending = []
+
+    def done(self, handle):
+        return handle[1]
+
+    def synchronize(self, handle):
+        if not handle[1]:
+            self.num_synchronized += 1
+            for dst, src in handle[0]:
+                dst.copy_(src)
+            handle[1] = True
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 0.5
+        return self.now
+
+
+def _make_cache(num_device_pages, num_host_pages, copy_engine=None, clock=None):
+    k = torch.zeros((num_device_pages, 4, 2, 8))
+    v = torch.zeros((num_device_pages, 4, 2, 8))
+    kwargs = {} if clock is None else dict(clock=clock)
+    return TieredKVCache([k, v], num_host_pages, copy_engine=copy_engine, pin_memory=False, **kwargs), k, v
+
+
+def _fill(cache, k, v, seq_id, num_pages):
+    """ page i of seq_id holds seq_id * 100 + i """
+    for i in range(num_pages):
+        page = cache.append_page(seq_id)
+        k[page].fill_(seq_id * 100 + i)
+        v[page].fill_(-(seq_id * 100 + i))
+
+
+def _check(cache, k, v, seq_ids):
+    for seq_id, table in zip(seq_ids, cache.acquire(seq_ids)):
+        for i, page in enumerate(table):
+            assert torch.all(k[page] == seq_id * 100 + i) and torch.all(v[page] == -(seq_id * 100 + i)), (seq_id, i)
+
+
+def test_evict_and_fetch_round_trip():
+    cache, k, v = _make_cache(num_device_pages=4, num_host_pages=8)
+    for seq_id in [1, 2]:
+        cache.add_sequence(seq_id)
+        _fill(cache, k, v, seq_id, 2)
+    cache.acquire([1, 2])
+    cache.add_sequence(3)
+    # 1 and 2 ran in the last step: no room for 3
+    try:
+        cache.append_page(3)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("the sequences of the last step should not be evicted")
+
+    cache.acquire([1])
+    _fill(cache, k, v, 3, 2)
+    assert cache.num_host_resident(2) == 2 and cache.num_host_resident(1) == 0
+    _check(cache, k, v, [3])
+    # the fetch of 2 evicts 1, the least recently used
+    _check(cache, k, v, [2])
+    assert cache.num_host_resident(1) == 2 and cache.num_host_resident(3) == 0
+    _check(cache, k, v, [1])
+
+    stats = cache.stats
+    page_bytes = 2 * 4 * 2 * 8 * 4
+    assert cache.page_bytes == page_bytes
+    assert stats.evicted_pages == 6 and stats.bytes_d2h == 6 * page_bytes
+    assert stats.fetched_pages == 4 and stats.bytes_h2d == 4 * page_bytes and stats.demand_fetches == 4
+    # every host page is back once fetched
+    assert len(cache.free_host) == 8 - 2
+
+
+def test_priority():
+    cache, k, v = _make_cache(num_device_pages=4, num_host_pages=8)
+    cache.add_sequence(1, priority=1)
+    cache.add_sequence(2, priority=0)
+    _fill(cache, k, v, 1, 2)
+    _fill(cache, k, v, 2, 2)
+    cache.acquire([1])
+    cache.acquire([2])
+    # 2 is more recent but of lower priority
+    cache.acquire([])
+    cache.add_sequence(3)
+    _fill(cache, k, v, 3, 1)
+    assert cache.num_host_resident(2) == 1 and cache.num_host_resident(1) == 0
+    cache.set_priority(2, 2)
+    cache.acquire([3])
+    cache.add_sequence(4)
+    _fill(cache, k, v, 4, 1)
+    assert cache.num_host_resident(1) == 1
+    cache.evict(2)
+    assert cache.num_host_resident(2) == 2
+    _check(cache, k, v, [1, 2])
+    assert cache.num_host_resident(3) == 1 and cache.num_host_resident(4) == 1
+    cache.remove_sequence(1)
+    cache.remove_sequence(2)
+    assert len(cache.free_device) == 4 and len(cache.free_host) == 6
+
+
+def test_prefetch():
+    engine = DeferredCopyEngine()
+    clock = FakeClock()
+    cache, k, v = _make_cache(num_device_pages=6, num_host_pages=8, copy_engine=engine, clock=clock)
+    for seq_id in [1, 2, 3]:
+        cache.add_sequence(seq_id)
+        _fill(cache, k, v, seq_id, 2)
+    cache.acquire([3])
+    cache.evict(1)
+    cache.evict(2)
+    engine.complete()
+    assert len(cache.free_device) == 4
+
+    # prefetched and done before the step: a hit, no stall
+    assert cache.prefetch([1]) == 2
+    engine.complete()
+    synchronized = engine.num_synchronized
+    _check(cache, k, v, [1])
+    assert cache.stats.prefetch_hits == 2 and cache.stats.prefetch_stalls == 0
+    assert engine.num_synchronized == synchronized
+
+    # prefetched but in flight: a stall waits for it
+    assert cache.prefetch([2], max_pages=1) == 1
+    _check(cache, k, v, [2])
+    assert cache.stats.prefetch_stalls == 1 and cache.stats.demand_fetches == 1
+    assert cache.stats.stall_s > 0
+
+    # a prefetch that is evicted before use keeps its host page and costs no D2H copy
+    cache.acquire([])
+    cache.evict(1)
+    engine.complete()
+    d2h = cache.stats.bytes_d2h
+    assert cache.prefetch([1]) == 2
+    cache.evict(1)
+    assert cache.stats.bytes_d2h == d2h and cache.num_host_resident(1) == 2
+    engine.complete()
+    _check(cache, k, v, [1, 2, 3])
+
+
+def test_block_table():
+    cache, k, v = _make_cache(num_device_pages=4, num_host_pages=4)
+    cache.add_sequence("a")
+    cache.add_sequence("b")
+    pages_a = [cache.append_page("a") for _ in range(3)]
+    pages_b = [cache.append_page("b")]
+    table = cache.block_table(["a", "b"], max_pages=4)
+    assert table.dtype == torch.int32 and table.shape == (2, 4)
+    assert table[0, :3].tolist() == pages_a and table[1].tolist() == pages_b + [0, 0, 0]
+
+
+if __name__ == "__main__":
+    test_evict_and_fetch_round_trip()
+    test_priority()
+    test_prefetch()
+    test_block_table()
+    print("✅ kv offload passes")
@@ -0,0 +1,155 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import numpy as np
+import torch
+
+from triton_dist.kernels.kv_quant import (FP8_E4M3_MAX, append_quantized_kv, create_kv_scales, dequantize_np,
+                                          dequantize_paged_kv, quantize_np, round_to_fp8_e4m3_np)
+
+
+def test_fp8_rounding_matches_torch():
+    rng = np.random.default_rng(0)
+    x = np.concatenate([rng.standard_normal(4096) * 10, rng.standard_normal(1024) * 1e-2, [0.0, 448.0, -448.0, 1e4]])
+    ref = torch.from_numpy(x.astype(np.float32)).to(torch.float8_e4m3fn).float().numpy()
+    # torch saturates out of range values, so does the reference
+    np.testing.assert_array_equal(round_to_fp8_e4m3_np(x), ref)
+
+
+def test_error_bounds():
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal((64, 128)) * rng.uniform(0.01, 100, size=(64, 1))
+
+    q, scale = quantize_np(x, "int8")
+    assert np.all(np.abs(q) <= 127) and np.all(q == np.round(q))
+    assert np.all(np.abs(x - dequantize_np(q, scale)) <= scale / 2 + 1e-12)
+
+    q, scale = quantize_np(x, "fp8")
+    assert np.all(np.abs(q) <= FP8_E4M3_MAX)
+    err = np.abs(x - dequantize_np(q, scale))
+    assert np.all((err <= np.abs(x) * 2**-4 + 1e-12) | (err <= scale * 2**-10 + 1e-12))
+
+
+def _reference_pages(tokens, dtype, page_size):
+    """ per-page running-amax quantization in numpy: requantize the page whenever its scale grows """
+    qmax = 127.0 if dtype == "int8" else FP8_E4M3_MAX
+    rnd = (lambda v: np.clip(np.round(v), -qmax, qmax)) if dtype == "int8" else round_to_fp8_e4m3_np
+    pages = []
+    for start in range(0, len(tokens), page_size):
+        q, scale = np.zeros((0, ) + tokens.shape[1:]), None
+        for tok in tokens[start:start + page_size]:
+            needed = np.maximum(np.abs(tok).max(-1), np.finfo(np.float32).tiny) / qmax  # [kv_heads]
+            new = needed if scale is None else np.maximum(scale, needed)
+            if scale is not None:
+                q = rnd(q * (scale / new)[None, :, None])
+            q = np.concatenate([q, rnd(tok / new[:, None])[None]])
+            scale = new
+        pages.append((q, scale))
+    return pages
+
+
+def test_append_per_page():
+    for dtype in ["int8", "fp8"]:
+        _check_append_per_page(dtype)
+
+
+def _check_append_per_page(dtype):
+    torch.manual_seed(0)
+    page_size, kv_heads, head_dim, seq_len, batch = 4, 2, 16, 10, 2
+    num_pages = batch * 3
+    torch_dtype = torch.int8 if dtype == "int8" else torch.float8_e4m3fn
+    k_cache = torch.zeros((num_pages, page_size, kv_heads, head_dim), dtype=torch_dtype)
+    v_cache = torch.zeros_like(k_cache)
+    k_scale = create_kv_scales(num_pages, kv_heads, device="cpu")
+    v_scale = create_kv_scales(num_pages, kv_heads, device="cpu")
+    block_table = torch.tensor([[5, 1, 3], [0, 4, 2]], dtype=torch.int32)
+    # growing magnitudes, so later tokens raise the page scale
+    k = torch.randn(seq_len, batch, kv_heads, head_dim) * torch.linspace(0.1, 4, seq_len)[:, None, None, None]
+    v = torch.randn(seq_len, batch, kv_heads, head_dim)
+    for step in range(seq_len):
+        kv_lens = torch.full((batch, ), step, dtype=torch.int32)
+        append_quantized_kv(k_cache, v_cache, k_scale, v_scale, k[step], v[step], block_table, kv_lens)
+
+    for x, cache, scales in [(k, k_cache, k_scale), (v, v_cache, v_scale)]:
+        deq = dequantize_paged_kv(cache, scales).double().numpy()
+        for b in range(batch):
+            ref = _reference_pages(x[:, b].double().numpy(), dtype, page_size)
+            for i, (q, scale) in enumerate(ref):
+                page = block_table[b, i].item()
+                np.testing.assert_allclose(scales[page].double().numpy(), scale, rtol=1e-6)
+                np.testing.assert_allclose(deq[page, :len(q)], q * scale[None, :, None], rtol=1e-5, atol=1e-6)
+
+
+def test_static_scales():
+    kv_heads, head_dim, num_pages, page_size = 2, 8, 3, 4
+    static = torch.tensor([0.05, 0.1])
+    k_scale = create_kv_scales(num_pages, kv_heads, device="cpu", per_page=False, static_scale=static)
+    assert k_scale.shape == (num_pages, kv_heads) and k_scale.stride(0) == 0
+    k_cache = torch.zeros((num_pages, page_size, kv_heads, head_dim), dtype=torch.int8)
+    v_cache = torch.zeros_like(k_cache)
+    v_scale = k_scale.clone()[:1].expand(num_pages, kv_heads)
+    k = torch.randn(1, kv_heads, head_dim)
+    block_table = torch.tensor([[2]], dtype=torch.int32)
+    append_quantized_kv(k_cache, v_cache, k_scale, v_scale, k, k, block_table, torch.tensor([1], dtype=torch.int32))
+    expected = torch.clamp(torch.round(k[0] / static[:, None]), -127, 127)
+    assert torch.equal(k_cache[2, 1].float(), expected)
+    assert torch.equal(static, k_scale[0])
+
+
+def test_attention_error():
+    for dtype in ["int8", "fp8"]:
+        _check_attention_error(dtype)
+
+
+def _check_attention_error(dtype):
+    """ single-query attention over a quantized cache stays close to the fp32 one """
+    rng = np.random.default_rng(2)
+    seq_len, head_dim = 512, 128
+    q = rng.standard_normal(head_dim)
+    k = rng.standard_normal((seq_len, head_dim))
+    v = rng.standard_normal((seq_len, head_dim))
+
+    def attn(k, v):
+        s = k @ q / np.sqrt(head_dim)
+        p = np.exp(s - s.max())
+        return (p / p.sum()) @ v
+
+    kq, k_s = quantize_np(k, dtype)
+    vq, v_s = quantize_np(v, dtype)
+    # the kernels scale qk by k_scale and p by v_scale instead of dequantizing the cache
+    s = (kq @ q) * k_s[:, 0] / np.sqrt(head_dim)
+    p = np.exp(s - s.max())
+    out = ((p / p.sum()) * v_s[:, 0]) @ vq
+    np.testing.assert_allclose(out, attn(dequantize_np(kq, k_s), dequantize_np(vq, v_s)), rtol=1e-9, atol=1e-12)
+    tol = 2e-2 if dtype == "int8" else 1e-1
+    assert np.max(np.abs(out - attn(k, v))) < tol, np.max(np.abs(out - attn(k, v)))
+
+
+if __name__ == "__main__":
+    test_fp8_rounding_matches_torch()
+    test_error_bounds()
+    test_append_per_page()
+    test_attention_error()
+    test_static_scales()
+    print("✅ kv quant passes")
@@ -0,0 +1,95 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+from triton_dist.kernels.kv_split_planner import KVSplitPlanner
+
+NUM_SMS = 132
+# per rank shapes of Qwen3-32B on 8 ranks, and of a 96 / 12 heads model
+SHAPES = [(8, 1), (96, 12)]
+
+
+def test_plans():
+    planner = KVSplitPlanner(NUM_SMS)
+    for q_heads, kv_heads in SHAPES:
+        for batch in [1, 4, 16, 64, 256]:
+            for kv_len in [64, 500, 4096, 32768, 131072]:
+                plan = planner.plan(batch, q_heads, kv_heads, kv_len)
+                # the plan is the cheapest of the candidates without empty splits
+                bucket = max(kv_len, 64)
+                bucket = 1 << (bucket - 1).bit_length()
+                for s in planner.candidates:
+                    if s * 64 <= bucket:
+                        other = planner.estimate(s, batch, q_heads, kv_heads, bucket, bucket)
+                        assert plan.cost <= other.cost, (batch, kv_len, plan, other)
+                assert plan.num_kv_splits == 1 or plan.num_kv_splits * 64 <= bucket
+
+    # short contexts do not split into empty splits
+    assert planner.plan(1, 8, 1, 100).num_kv_splits <= 2
+    # a small batch with a long context splits up to about a full wave
+    plan = planner.plan(1, 8, 1, 32768)
+    assert plan.num_kv_splits >= 32 and plan.waves == 1, plan
+    # a large batch already fills the GPU
+    assert planner.plan(256, 8, 1, 32768).num_kv_splits <= 2
+    # splits grow with the kv length, and shrink with the batch
+    splits = [planner.plan(4, 8, 1, kv_len).num_kv_splits for kv_len in [256, 2048, 16384, 131072]]
+    assert splits == sorted(splits), splits
+    splits = [planner.plan(batch, 8, 1, 16384).num_kv_splits for batch in [1, 8, 64, 512]]
+    assert splits == sorted(splits, reverse=True), splits
+    # many short sequences and one long one: the mean sets the waves, the longest sequence the critical path
+    assert planner.plan(64, 8, 1, 65536, mean_kv_len=1024).num_kv_splits >= planner.plan(64, 8, 1, 65536).num_kv_splits
+
+
+def test_constraints_and_cache():
+    planner = KVSplitPlanner(NUM_SMS, candidates=(16, 32, 64))
+    # the fewest candidate splits, even if some are empty
+    assert planner.plan(1, 8, 1, 128).num_kv_splits == 16
+    assert planner.plan(1, 8, 1, 1 << 20, max_splits=32).num_kv_splits <= 32
+    try:
+        planner.plan(1, 8, 1, 128, max_splits=8)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("no candidate below max_splits should fail")
+
+    # one plan per shape bucket
+    planner = KVSplitPlanner(NUM_SMS)
+    plan = planner.plan(2, 8, 1, 3000)
+    assert planner.plan(2, 8, 1, 4096) is plan and planner.plan(2, 8, 1, 2049) is plan
+    assert len(planner._cache) == 1
+    planner.plan(2, 8, 1, 4097)
+    assert len(planner._cache) == 2
+
+    for args in [(0, 8, 1, 128), (1, 8, 3, 128), (1, 8, 1, 0)]:
+        try:
+            planner.plan(*args)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"{args} should fail")
+
+
+if __name__ == "__main__":
+    test_plans()
+    test_constraints_and_cache()
+    print("✅ kv split planner passes")
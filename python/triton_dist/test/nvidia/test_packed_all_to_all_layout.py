@@ -0,0 +1,109 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import argparse
+
+import torch
+
+from triton_dist.kernels.packed_all_to_all import PackedAllToAllLayout, packed_all_to_all_reference
+
+
+def _random_send_splits(world_size, num_tot_experts, max_m, generator):
+    """ [world_size, num_tot_experts] with each row summing to at most max_m, some experts empty """
+    splits = torch.randint(0, 2 * max_m // num_tot_experts + 1, (world_size, num_tot_experts), generator=generator)
+    splits[torch.rand((world_size, num_tot_experts), generator=generator) < 0.3] = 0
+    for src in range(world_size):
+        while splits[src].sum() > max_m:
+            splits[src] //= 2
+    return splits.to(torch.int32)
+
+
+def _strided_all_to_all_reference(send_tensors, send_splits, max_m):
+    """ what fast_all_to_all + all_to_all_post_process produce: MAX_M strided slabs, then sliced """
+    layout = PackedAllToAllLayout(send_splits)
+    world_size = layout.world_size
+    outputs = []
+    for dst in range(world_size):
+        slab = torch.zeros((world_size * max_m, send_tensors[0].shape[1]), dtype=send_tensors[0].dtype)
+        for src in range(world_size):
+            send_offsets = layout.send_offsets(src)
+            rows = send_tensors[src][send_offsets[dst]:send_offsets[dst + 1]]
+            slab[src * max_m:src * max_m + rows.shape[0]] = rows
+        num_tokens_from_each_rank = layout.recv_splits(dst).sum(dim=1)
+        outputs.append(
+            torch.cat([slab[src * max_m:src * max_m + num_tokens_from_each_rank[src]] for src in range(world_size)]))
+    return outputs
+
+
+def test_packed_layout(world_size, experts_per_rank, max_m, hidden, seed):
+    generator = torch.Generator().manual_seed(seed)
+    num_tot_experts = world_size * experts_per_rank
+    send_splits = _random_send_splits(world_size, num_tot_experts, max_m, generator)
+    layout = PackedAllToAllLayout(send_splits)
+
+    # each row tells where it comes from: (src, row)
+    send_tensors = []
+    for src in range(world_size):
+        num_rows = int(send_splits[src].sum())
+        rows = torch.arange(num_rows, dtype=torch.float32)
+        send_tensors.append(torch.stack([torch.full_like(rows, src), rows], dim=1).repeat(1, hidden // 2))
+
+    outputs = packed_all_to_all_reference(send_tensors, send_splits)
+    golden = _strided_all_to_all_reference(send_tensors, send_splits, max_m)
+    for dst in range(world_size):
+        recv_offsets = layout.recv_offsets(dst)
+        assert outputs[dst].shape[0] == recv_offsets[-1] <= layout.max_recv_tokens() <= world_size * max_m
+        assert torch.equal(outputs[dst], golden[dst])
+        for src in range(world_size):
+            # what the kernel computes on device matches the prefix sum the host returns
+            assert layout.dst_offset(src, dst) == recv_offsets[src]
+            rows = outputs[dst][recv_offsets[src]:recv_offsets[src + 1]]
+            assert (rows[:, 0] == src).all()
+            assert rows.shape[0] == layout.recv_splits(dst)[src].sum()
+            assert rows.shape[0] == layout.tokens_per_pair[src, dst]
+    print(f"✅ test_packed_layout world_size={world_size} experts_per_rank={experts_per_rank} "
+          f"recv rows {layout.max_recv_tokens()} vs {world_size * max_m} strided passes")
+
+
+def test_empty_pairs():
+    send_splits = torch.zeros((4, 8), dtype=torch.int32)
+    send_splits[1, 2] = 3  # rank 1 => rank 1
+    send_splits[3, 0] = 5  # rank 3 => rank 0
+    layout = PackedAllToAllLayout(send_splits)
+    assert layout.recv_offsets(0).tolist() == [0, 0, 0, 0, 5]
+    assert layout.recv_offsets(1).tolist() == [0, 0, 3, 3, 3]
+    assert layout.send_offsets(3).tolist() == [0, 5, 5, 5, 5]
+    assert layout.max_recv_tokens() == 5
+    print("✅ test_empty_pairs passes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    test_empty_pairs()
+    for world_size in [2, 4, 8]:
+        for experts_per_rank in [1, 4]:
+            test_packed_layout(world_size, experts_per_rank, max_m=64, hidden=8, seed=args.seed)
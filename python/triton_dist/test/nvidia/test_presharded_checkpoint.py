@@ -0,0 +1,131 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import json
+import os
+import tempfile
+
+import torch
+from safetensors.torch import save_file
+
+from triton_dist.models.presharded_checkpoint import (PRESHARDED_MANIFEST_FILE, export_presharded_checkpoint,
+                                                      load_presharded_rank, read_presharded_manifest,
+                                                      validate_presharded_manifest)
+from triton_dist.models.safetensors_loader import Qwen3ShardedLoader
+
+HIDDEN = 16
+HEAD_DIM = 4
+NUM_HEADS = 4
+NUM_KV_HEADS = 2
+MLP_SIZE = 32
+NUM_LAYERS = 2
+VOCAB = 24
+
+
+def make_checkpoint(path, tie_word_embeddings=False):
+    """ a tiny Qwen3-shaped checkpoint in a single model.safetensors, with its config.json """
+    torch.manual_seed(0)
+    tensors = {
+        "model.embed_tokens.weight": torch.randn(VOCAB, HIDDEN),
+        "model.norm.weight": torch.randn(HIDDEN),
+    }
+    if not tie_word_embeddings:
+        tensors["lm_head.weight"] = torch.randn(VOCAB, HIDDEN)
+    for idx in range(NUM_LAYERS):
+        prefix = f"model.layers.{idx}."
+        for name, shape in [("self_attn.q_proj", (NUM_HEADS * HEAD_DIM, HIDDEN)),
+                            ("self_attn.k_proj", (NUM_KV_HEADS * HEAD_DIM, HIDDEN)),
+                            ("self_attn.v_proj", (NUM_KV_HEADS * HEAD_DIM, HIDDEN)),
+                            ("self_attn.o_proj", (HIDDEN, NUM_HEADS * HEAD_DIM)), ("self_attn.q_norm", (HEAD_DIM, )),
+                            ("self_attn.k_norm", (HEAD_DIM, )), ("mlp.gate_proj", (MLP_SIZE, HIDDEN)),
+                            ("mlp.up_proj", (MLP_SIZE, HIDDEN)), ("mlp.down_proj", (HIDDEN, MLP_SIZE)),
+                            ("input_layernorm", (HIDDEN, )), ("post_attention_layernorm", (HIDDEN, ))]:
+            tensors[prefix + name + ".weight"] = torch.randn(shape)
+    save_file(tensors, os.path.join(path, "model.safetensors"))
+    with open(os.path.join(path, "config.json"), "w") as f:
+        json.dump({"architectures": ["Qwen3ForCausalLM"], "num_hidden_layers": NUM_LAYERS}, f)
+
+
+def expect_value_error(fn, match):
+    try:
+        fn()
+    except ValueError as e:
+        assert match in str(e), e
+    else:
+        raise AssertionError(f"expected ValueError with {match!r}")
+
+
+def test_round_trip(src, dst, world_size, dtype, tied):
+    manifest = export_presharded_checkpoint(src, dst, world_size, dtype, num_layers=NUM_LAYERS)
+    assert manifest == read_presharded_manifest(dst)
+    assert manifest["tie_word_embeddings"] == tied
+    assert os.path.exists(os.path.join(dst, "config.json"))
+
+    for rank in range(world_size):
+        out = load_presharded_rank(dst, rank, world_size, dtype, device="cpu")
+        loader = Qwen3ShardedLoader(src, rank, world_size, dtype, device="cpu")
+        for key, value in loader.load_globals().items():
+            assert torch.equal(out[key], value), (rank, key)
+        if tied:
+            assert out["lm_head"] is out["embed_tokens"]
+        assert len(out["layers"]) == NUM_LAYERS
+        for idx, layer in loader.iter_layers(NUM_LAYERS):
+            assert out["layers"][idx].keys() == layer.keys()
+            for key, value in layer.items():
+                assert out["layers"][idx][key].dtype == dtype
+                assert torch.equal(out["layers"][idx][key], value), (rank, idx, key)
+        loader.close()
+
+
+def test_manifest_validation(dst, world_size, dtype):
+    manifest = read_presharded_manifest(dst)
+    validate_presharded_manifest(manifest, world_size, dtype)
+    other_dtype = torch.float16 if dtype != torch.float16 else torch.float32
+    expect_value_error(lambda: validate_presharded_manifest(manifest, world_size * 2, dtype), "world_size")
+    expect_value_error(lambda: validate_presharded_manifest(manifest, world_size, other_dtype), "got float")
+    expect_value_error(lambda: load_presharded_rank(dst, 0, world_size * 2, dtype, device="cpu"), "world_size")
+    for field, value, match in [("format_version", 0, "format_version"),
+                                ("layout", dict(manifest["layout"], wqkv="q, k, v interleaved"), "layout"),
+                                ("files", manifest["files"][:-1], "files")]:
+        expect_value_error(lambda: validate_presharded_manifest(dict(manifest, **{field: value}), world_size, dtype),
+                           match)
+
+
+if __name__ == "__main__":
+    for tied in [False, True]:
+        with tempfile.TemporaryDirectory() as src:
+            make_checkpoint(src, tie_word_embeddings=tied)
+            for world_size in [1, 2, 4]:
+                for dtype in [torch.float32, torch.bfloat16]:
+                    with tempfile.TemporaryDirectory() as dst:
+                        test_round_trip(src, dst, world_size, dtype, tied)
+                        test_manifest_validation(dst, world_size, dtype)
+    with tempfile.TemporaryDirectory() as empty:
+        try:
+            read_presharded_manifest(empty)
+        except FileNotFoundError as e:
+            assert PRESHARDED_MANIFEST_FILE in str(e)
+        else:
+            raise AssertionError("expected FileNotFoundError without a manifest")
+    print("✅ presharded checkpoint export/import passes")
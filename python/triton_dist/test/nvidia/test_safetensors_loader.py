@@ -0,0 +1,159 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import json
+import os
+import tempfile
+
+import torch
+from safetensors.torch import save_file
+
+from triton_dist.models.safetensors_loader import Qwen3ShardedLoader
+
+HIDDEN = 16
+HEAD_DIM = 4
+NUM_HEADS = 4
+NUM_KV_HEADS = 2
+MLP_SIZE = 32
+NUM_LAYERS = 3
+VOCAB = 24
+
+
+def make_checkpoint(path, tie_word_embeddings=False):
+    """ a tiny Qwen3-shaped checkpoint split over two files, like HF sharded checkpoints """
+    torch.manual_seed(0)
+    tensors = {
+        "model.embed_tokens.weight": torch.randn(VOCAB, HIDDEN),
+        "model.norm.weight": torch.randn(HIDDEN),
+    }
+    if not tie_word_embeddings:
+        tensors["lm_head.weight"] = torch.randn(VOCAB, HIDDEN)
+    for idx in range(NUM_LAYERS):
+        prefix = f"model.layers.{idx}."
+        tensors.update({
+            prefix + "self_attn.q_proj.weight": torch.randn(NUM_HEADS * HEAD_DIM, HIDDEN),
+            prefix + "self_attn.k_proj.weight": torch.randn(NUM_KV_HEADS * HEAD_DIM, HIDDEN),
+            prefix + "self_attn.v_proj.weight": torch.randn(NUM_KV_HEADS * HEAD_DIM, HIDDEN),
+            prefix + "self_attn.o_proj.weight": torch.randn(HIDDEN, NUM_HEADS * HEAD_DIM),
+            prefix + "self_attn.q_norm.weight": torch.randn(HEAD_DIM),
+            prefix + "self_attn.k_norm.weight": torch.randn(HEAD_DIM),
+            prefix + "mlp.gate_proj.weight": torch.randn(MLP_SIZE, HIDDEN),
+            prefix + "mlp.up_proj.weight": torch.randn(MLP_SIZE, HIDDEN),
+            prefix + "mlp.down_proj.weight": torch.randn(HIDDEN, MLP_SIZE),
+            prefix + "input_layernorm.weight": torch.randn(HIDDEN),
+            prefix + "post_attention_layernorm.weight": torch.randn(HIDDEN),
+        })
+    names = sorted(tensors)
+    files = {"model-00001-of-00002.safetensors": names[::2], "model-00002-of-00002.safetensors": names[1::2]}
+    weight_map = {}
+    for file, file_names in files.items():
+        save_file({name: tensors[name] for name in file_names}, os.path.join(path, file))
+        weight_map.update({name: file for name in file_names})
+    with open(os.path.join(path, "model.safetensors.index.json"), "w") as f:
+        json.dump({"metadata": {}, "weight_map": weight_map}, f)
+    return tensors
+
+
+def shard(tensor, dim, rank, world_size):
+    # same slicing as triton_dist.utils.shard_local
+    return torch.split(tensor, tensor.shape[dim] // world_size, dim=dim)[rank]
+
+
+def test_layer_shards(path, tensors, world_size, dtype):
+    for rank in range(world_size):
+        loader = Qwen3ShardedLoader(path, rank, world_size, dtype, device="cpu", num_threads=4, prefetch_layers=1)
+        seen = []
+        for idx, layer in loader.iter_layers(NUM_LAYERS):
+            seen.append(idx)
+            p = f"model.layers.{idx}."
+            wqkv = torch.cat([shard(tensors[p + f"self_attn.{x}_proj.weight"], 0, rank, world_size) for x in "qkv"])
+            gate_up = torch.cat(
+                [shard(tensors[p + f"mlp.{x}_proj.weight"], 0, rank, world_size) for x in ["gate", "up"]])
+            expected = {
+                "wqkv": wqkv,
+                "wo": shard(tensors[p + "self_attn.o_proj.weight"], 1, rank, world_size),
+                "gate_up_proj": gate_up,
+                "down_proj": shard(tensors[p + "mlp.down_proj.weight"], 1, rank, world_size),
+                "input_norm_w": tensors[p + "input_layernorm.weight"],
+                "post_norm_w": tensors[p + "post_attention_layernorm.weight"],
+                "q_norm_w": tensors[p + "self_attn.q_norm.weight"],
+                "k_norm_w": tensors[p + "self_attn.k_norm.weight"],
+            }
+            assert layer.keys() == expected.keys(), (layer.keys(), expected.keys())
+            for key, value in expected.items():
+                assert layer[key].dtype == dtype and layer[key].is_contiguous()
+                assert torch.equal(layer[key], value.to(dtype)), (world_size, rank, idx, key)
+        assert seen == list(range(NUM_LAYERS)), seen
+        loader.close()
+
+
+def test_globals(path, tensors, tied):
+    loader = Qwen3ShardedLoader(path, 1, 2, torch.float32, device="cpu")
+    out = loader.load_globals()
+    assert torch.equal(out["embed_tokens"], tensors["model.embed_tokens.weight"])
+    assert torch.equal(out["norm_weight"], tensors["model.norm.weight"])
+    lm_head = tensors["model.embed_tokens.weight" if tied else "lm_head.weight"]
+    assert torch.equal(out["lm_head"], lm_head)
+    loader.close()
+
+
+def test_not_divisible(path):
+    loader = Qwen3ShardedLoader(path, 0, 3, torch.float32, device="cpu")
+    try:
+        loader.load_layer(0)
+    except ValueError as e:
+        assert "not divisible" in str(e), e
+    else:
+        raise AssertionError("expected ValueError for world_size 3")
+    finally:
+        loader.close()
+
+
+def test_device(path):
+    """ every tensor lands on the rank's device, not cuda:0, even though workers run on other threads """
+    if not torch.cuda.is_available():
+        return
+    device = torch.device("cuda", torch.cuda.device_count() - 1)
+    torch.cuda.set_device(device)
+    loader = Qwen3ShardedLoader(path, 0, 2, torch.float32, device="cuda", num_threads=4, prefetch_layers=1)
+    assert loader.device == device, (loader.device, device)
+    tensors = list(loader.load_globals().values())
+    for _, layer in loader.iter_layers(NUM_LAYERS):
+        tensors.extend(layer.values())
+    loader.close()
+    for tensor in tensors:
+        assert tensor.device == device, (tensor.device, device)
+
+
+if __name__ == "__main__":
+    for tied in [False, True]:
+        with tempfile.TemporaryDirectory() as path:
+            tensors = make_checkpoint(path, tie_word_embeddings=tied)
+            for world_size in [1, 2, 4]:
+                for dtype in [torch.float32, torch.bfloat16]:
+                    test_layer_shards(path, tensors, world_size, dtype)
+            test_globals(path, tensors, tied)
+            test_not_divisible(path)
+            test_device(path)
+    print("✅ Qwen3ShardedLoader passes")
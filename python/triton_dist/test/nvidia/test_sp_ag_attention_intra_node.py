@@ -35,7 +35,8 @@ from functools import partial
 import nvshmem.core
 
 from triton_dist.utils import get_torch_prof_ctx, group_profile, perf_func, dist_print, init_nvshmem_by_torch_process_group, nvshmem_barrier_all_on_stream
-from triton_dist.kernels.nvidia import fused_sp_ag_attn_intra_node, create_sp_ag_attention_context_intra_node
+from triton_dist.kernels.nvidia import (fused_sp_ag_attn_intra_node, create_sp_ag_attention_context_intra_node,
+                                       fused_sp_ring_attn_intra_node, create_sp_ring_attention_context_intra_node)
 
 ##################################################
 
@@ -56,6 +57,8 @@ class FusedSequenceParallelAttn(torch.nn.Module):
         device="cuda",
         is_causal=True,
         enable_zig_zag=True,
+        use_copy_kernel=False,
+        use_ring=False,
     ):
         super(FusedSequenceParallelAttn, self).__init__()
         self.pg = pg
@@ -79,7 +82,23 @@ class FusedSequenceParallelAttn(torch.nn.Module):
         self.device = device
         self.is_causal = is_causal
         self.enable_zig_zag = enable_zig_zag
-
+        self.use_ring = use_ring
+
+        if use_ring:
+            self.ctx = create_sp_ring_attention_context_intra_node(
+                self.batch_size,
+                self.q_head,
+                self.kv_head,
+                self.max_seqlen_k,
+                self.max_q_shard_len,
+                self.head_dim,
+                self.input_dtype,
+                self.output_dtype,
+                self.rank,
+                self.world_size,
+                self.device,
+            )
+            return
         self.ctx = create_sp_ag_attention_context_intra_node(
             self.batch_size,
             self.q_head,
@@ -92,12 +111,19 @@ class FusedSequenceParallelAttn(torch.nn.Module):
             self.rank,
             self.world_size,
             self.device,
+            use_copy_kernel=use_copy_kernel,
         )
 
-    def forward(self, q_shard, k_shard, v_shard, cu_seqlens_q, cu_seqlens_k):
+    def forward(self, q_shard, k_shard, v_shard, cu_seqlens_q, cu_seqlens_k, cu_seqlens_k_cpu=None):
         total_q_shard = cu_seqlens_q[-1]
         output_buffer = self.ctx.attn_output_buffer[:total_q_shard]
 
+        if self.use_ring:
+            fused_sp_ring_attn_intra_node(self.ctx, q_shard, k_shard, v_shard, output_buffer, cu_seqlens_q,
+                                          cu_seqlens_k, self.max_q_shard_len, self.max_seqlen_k, self.rank,
+                                          self.world_size, self.is_causal, self.enable_zig_zag)
+            return output_buffer
+
         fused_sp_ag_attn_intra_node(
             self.ctx,
             q_shard,
@@ -112,6 +138,7 @@ class FusedSequenceParallelAttn(torch.nn.Module):
             self.world_size,
             self.is_causal,
             self.enable_zig_zag,
+            cu_seqlens_k_cpu=cu_seqlens_k_cpu,
         )
 
         return output_buffer
@@ -335,6 +362,10 @@ def parse_args():
         default=True,
         help="enable zig zag opt",
     )
+    parser.add_argument("--copy_kernel", default=False, action="store_true",
+                        help="all-gather KV with one batched copy kernel instead of cudaMemcpyAsync")
+    parser.add_argument("--ring", default=False, action="store_true",
+                        help="ring attention: pass KV shards around the ring instead of all-gathering them")
     parser.add_argument("--warmup", default=10, type=int, help="warmup iterations")
     parser.add_argument("--iters", default=100, type=int, help="perf iterations")
     parser.add_argument("--check", default=False, action="store_true", help="correctness check")
@@ -425,6 +456,8 @@ if __name__ == "__main__":
             device,
             is_causal,
             enable_zig_zag,
+            use_copy_kernel=args.copy_kernel,
+            use_ring=args.ring,
         )
 
         torch_module = TorchSequenceParallelAttn(
@@ -471,8 +504,9 @@ if __name__ == "__main__":
             nvshmem_barrier_all_on_stream(torch.cuda.current_stream())
             torch.cuda.synchronize()
 
-            output, perf = perf_func(partial(module.forward, q_shard, k_shard, v_shard, cu_seqlens_q, cu_seqlens_k),
-                                     iters=iters, warmup_iters=warmup_iters)
+            output, perf = perf_func(
+                partial(module.forward, q_shard, k_shard, v_shard, cu_seqlens_q, cu_seqlens_k,
+                        cu_seqlens_k_cpu=cu_seqlens_k_list), iters=iters, warmup_iters=warmup_iters)
 
         nvshmem_barrier_all_on_stream(torch.cuda.current_stream())
         torch.cuda.synchronize()
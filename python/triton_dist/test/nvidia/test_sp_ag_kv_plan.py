@@ -0,0 +1,116 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import torch
+
+from triton_dist.kernels.sp_ag_kv_plan import (LOCAL_SHARD, KVAllGatherCopyPlan, KVCopy, build_kv_all_gather_copy_plan,
+                                               get_kv_all_gather_copy_plan)
+
+
+def reference_all_gather(shards, cu_seqlens_k, world_size):
+    """ per-sequence loops of the original producer: rank r's chunk of sequence i lands at start + r * shard_len """
+    out = torch.zeros(cu_seqlens_k[-1], dtype=shards[0].dtype)
+    for start, end in zip(cu_seqlens_k[:-1], cu_seqlens_k[1:]):
+        shard_len = (end - start) // world_size
+        for r in range(world_size):
+            out[start + r * shard_len:start + (r + 1) * shard_len] = \
+                shards[r][start // world_size:start // world_size + shard_len]
+    return out
+
+
+def run_plans(shards, cu_seqlens_k, world_size):
+    """ executes the plans of all ranks phase by phase, as the producer does around its barrier """
+    plans = [build_kv_all_gather_copy_plan(cu_seqlens_k, r, world_size) for r in range(world_size)]
+    buffers = [torch.zeros(cu_seqlens_k[-1], dtype=shards[0].dtype) for _ in range(world_size)]
+    for r, plan in enumerate(plans):
+        for c in plan.local_copies:
+            assert c.src_rank == LOCAL_SHARD
+            buffers[r][c.dst_offset:c.dst_offset + c.num_tokens] = shards[r][c.src_offset:c.src_offset + c.num_tokens]
+    # barrier: peers only read what their owner wrote in the local phase
+    snapshots = [b.clone() for b in buffers]
+    for r, plan in enumerate(plans):
+        for c in plan.peer_copies:
+            assert c.src_rank != r and c.src_rank != LOCAL_SHARD
+            buffers[r][c.dst_offset:c.dst_offset + c.num_tokens] = \
+                snapshots[c.src_rank][c.src_offset:c.src_offset + c.num_tokens]
+    return plans, buffers
+
+
+def test_matches_reference(seqlens, world_size):
+    cu_seqlens_k = [0]
+    for seqlen in seqlens:
+        cu_seqlens_k.append(cu_seqlens_k[-1] + seqlen)
+    shards = [torch.arange(cu_seqlens_k[-1] // world_size) + 1000 * (r + 1) for r in range(world_size)]
+    expected = reference_all_gather(shards, cu_seqlens_k, world_size)
+    plans, buffers = run_plans(shards, cu_seqlens_k, world_size)
+    for r in range(world_size):
+        assert torch.equal(buffers[r], expected), (seqlens, world_size, r)
+    num_nonempty = sum(1 for seqlen in seqlens if seqlen > 0)
+    for plan in plans:
+        assert plan.num_copies <= num_nonempty * world_size, plan
+    return plans
+
+
+def test_coalescing():
+    # world_size 1: the whole batch is one copy
+    plan = build_kv_all_gather_copy_plan([0, 16, 48, 64], 0, 1)
+    assert plan.local_copies == (KVCopy(LOCAL_SHARD, 0, 0, 64), ) and not plan.peer_copies
+    # empty sequences are dropped, so the chunks around them can merge
+    plan = build_kv_all_gather_copy_plan([0, 0, 8, 8, 8], 0, 2)
+    assert len(plan.local_copies) == 1 and len(plan.peer_copies) == 1
+    # last rank's chunk of a sequence is adjacent to rank 0's chunk of the next one only in the destination
+    plan = build_kv_all_gather_copy_plan([0, 8, 16], 1, 2)
+    assert len(plan.local_copies) == 2 and len(plan.peer_copies) == 2
+    # peers are visited in ring order starting from rank + 1
+    plan = build_kv_all_gather_copy_plan([0, 8], 1, 4)
+    assert [c.src_rank for c in plan.peer_copies] == [2, 3, 0]
+
+
+def test_cache_and_descriptors():
+    plan = get_kv_all_gather_copy_plan((0, 8, 24), 1, 4)
+    assert get_kv_all_gather_copy_plan((0, 8, 24), 1, 4) is plan
+    assert get_kv_all_gather_copy_plan((0, 8, 28), 1, 4) is not plan
+    table = KVAllGatherCopyPlan.to_descriptor_table(plan.peer_copies)
+    assert table.dtype == torch.int64 and table.shape == (len(plan.peer_copies), 4)
+    for row, copy in zip(table.tolist(), plan.peer_copies):
+        assert tuple(row) == (copy.src_rank, copy.src_offset, copy.dst_offset, copy.num_tokens)
+    assert KVAllGatherCopyPlan.to_descriptor_table(()).shape == (0, 4)
+
+    for bad in [([0, 8, 4], 0, 2), ([0, 8], 2, 2)]:
+        try:
+            build_kv_all_gather_copy_plan(*bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"expected ValueError for {bad}")
+
+
+if __name__ == "__main__":
+    for world_size in [1, 2, 4, 8]:
+        # per-rank lengths, so every sequence splits evenly
+        for shard_lens in [[768, 1536], [8], [0, 4, 0, 0, 2], [1, 2, 3, 4, 5, 6, 7, 8]]:
+            test_matches_reference([n * world_size for n in shard_lens], world_size)
+    test_coalescing()
+    test_cache_and_descriptors()
+    print("✅ KV all-gather copy plan passes")
@@ -0,0 +1,177 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import random
+
+import numpy as np
+
+from triton_dist.kernels.sp_kv_shard_plan import KVShardPlanner
+
+
+def _check_invariants(planner, seq_ids):
+    plan = planner.plan(seq_ids)
+    page_size = planner.page_size
+    kv_lens = plan.kv_lens.numpy()
+    used = [set() for _ in range(planner.num_ranks)]
+    for i, seq_id in enumerate(seq_ids):
+        assert kv_lens[:, i].sum() == planner.kv_len(seq_id)
+        for rank in range(planner.num_ranks):
+            pages = planner.rank_pages(seq_id, rank)
+            num_pages = (kv_lens[rank, i] + page_size - 1) // page_size
+            # full pages but the last one, as the paged kernels read them
+            assert len(pages) == num_pages, (seq_id, rank, pages, kv_lens[rank, i])
+            assert plan.block_tables[rank, i, :num_pages].tolist() == pages
+            assert not used[rank] & set(pages)
+            used[rank] |= set(pages)
+    for rank in range(planner.num_ranks):
+        assert not used[rank] & set(planner.free_pages[rank])
+        assert len(used[rank]) + len(planner.free_pages[rank]) == planner.num_pages_per_rank
+    return plan
+
+
+def _lengths(rng, n):
+    """ long tailed, like real context lengths """
+    return [int(x) for x in np.clip(rng.lognormal(mean=8, sigma=1.5, size=n), 1, 200_000)]
+
+
+def test_balance():
+    rng = np.random.default_rng(0)
+    num_ranks, page_size = 8, 64
+    for trial in range(5):
+        lens = _lengths(rng, 16)
+        planner = KVShardPlanner(num_ranks, page_size, num_pages_per_rank=8192, bytes_per_token=4096)
+        for i, kv_len in enumerate(lens):
+            planner.add_sequence(i, kv_len)
+        plan = _check_invariants(planner, list(range(len(lens))))
+        assert sum(plan.rank_tokens) == sum(lens)
+        assert plan.rank_bytes == tuple(t * 4096 for t in plan.rank_tokens)
+        # within a page per sequence tail, as tails are counted full
+        assert max(plan.rank_tokens) - min(plan.rank_tokens) <= page_size * (len(lens) + 1)
+        assert max(planner.rank_load) - min(planner.rank_load) <= page_size
+
+        # whole sequences per rank, greedily: bounded by the longest sequence
+        whole = [0] * num_ranks
+        for kv_len in sorted(lens, reverse=True):
+            whole[whole.index(min(whole))] += kv_len
+        assert plan.imbalance <= max(whole) / (sum(lens) / num_ranks) + 1e-9
+
+
+def test_growth_and_rebalance():
+    rng = random.Random(1)
+    num_ranks, page_size = 4, 16
+    planner = KVShardPlanner(num_ranks, page_size, num_pages_per_rank=1024)
+    live = []
+    for i in range(12):
+        planner.add_sequence(i, rng.randint(1, 600))
+        live.append(i)
+    for step in range(400):
+        for seq_id in live:
+            planner.append(seq_id)
+        if step % 50 == 49:
+            # finished sequences leave holes on some ranks
+            for seq_id in rng.sample(live, 3):
+                planner.remove_sequence(seq_id)
+                live.remove(seq_id)
+            for j in range(3):
+                new_id = 100 * step + j
+                planner.add_sequence(new_id, rng.randint(1, 2000))
+                live.append(new_id)
+            before = _check_invariants(planner, live)
+            moves = planner.rebalance()
+            after = _check_invariants(planner, live)
+            assert max(planner.rank_load) - min(planner.rank_load) <= 2 * page_size
+            for move in moves:
+                assert move.src_rank != move.dst_rank
+                assert move.dst_page in planner.rank_pages(move.seq_id, move.dst_rank)
+            assert max(after.rank_tokens) <= max(before.rank_tokens)
+        # the load accounting matches a recount
+        plan = planner.plan(live)
+        assert list(plan.rank_tokens) == planner.rank_tokens
+
+    for seq_id in list(live):
+        planner.remove_sequence(seq_id)
+    assert planner.rank_tokens == [0] * num_ranks and planner.rank_load == [0] * num_ranks
+    assert all(len(pages) == 1024 for pages in planner.free_pages)
+
+
+def test_rebalance_budget():
+    planner = KVShardPlanner(num_ranks=2, page_size=4, num_pages_per_rank=64)
+    # one page sequences alternate between the ranks, a long one splits evenly
+    for i in range(6):
+        planner.add_sequence(i, 4)
+    planner.add_sequence("long", 40)
+    assert planner.rank_load == [32, 32]
+    # finished sequences of rank 1: 32 tokens against 20
+    for seq_id in [1, 3, 5]:
+        assert planner.rank_pages(seq_id, 1)
+        planner.remove_sequence(seq_id)
+    assert planner.rebalance(max_moves=0) == []
+    moves = planner.rebalance(max_moves=1)
+    assert len(moves) == 1 and moves[0].seq_id == "long" and (moves[0].src_rank, moves[0].dst_rank) == (0, 1)
+    assert planner.rank_load == [28, 24] and planner.rebalance() == []
+    _check_invariants(planner, [0, 2, 4, "long"])
+
+
+def test_sharded_attention_matches():
+    """ per rank attention over its pages, combined by log-sum-exp as the inter-rank combine kernel does """
+    rng = np.random.default_rng(2)
+    num_ranks, page_size, head_dim, num_pages = 4, 8, 16, 64
+    planner = KVShardPlanner(num_ranks, page_size, num_pages)
+    lens = [3, 70, 17, 130]
+    k_cache = rng.standard_normal((num_ranks, num_pages, page_size, head_dim))
+    v_cache = rng.standard_normal((num_ranks, num_pages, page_size, head_dim))
+    for i, kv_len in enumerate(lens):
+        planner.add_sequence(i, kv_len)
+    plan = planner.plan(list(range(len(lens))))
+    for i in range(len(lens)):
+        q = rng.standard_normal(head_dim)
+        ks, vs, partial = [], [], []
+        for rank in range(num_ranks):
+            kv_len = int(plan.kv_lens[rank, i])
+            if kv_len == 0:
+                continue
+            pages = plan.block_tables[rank, i, :(kv_len + page_size - 1) // page_size].tolist()
+            k = k_cache[rank, pages].reshape(-1, head_dim)[:kv_len]
+            v = v_cache[rank, pages].reshape(-1, head_dim)[:kv_len]
+            ks.append(k)
+            vs.append(v)
+            s = k @ q
+            m = s.max()
+            p = np.exp(s - m)
+            partial.append((p @ v / p.sum(), m + np.log(p.sum())))
+        lse = np.array([x[1] for x in partial])
+        w = np.exp(lse - lse.max())
+        out = sum(wi * o for wi, (o, _) in zip(w, partial)) / w.sum()
+        k, v = np.concatenate(ks), np.concatenate(vs)
+        s = k @ q
+        p = np.exp(s - s.max())
+        np.testing.assert_allclose(out, p @ v / p.sum(), rtol=1e-10, atol=1e-12)
+
+
+if __name__ == "__main__":
+    test_balance()
+    test_growth_and_rebalance()
+    test_rebalance_budget()
+    test_sharded_attention_matches()
+    print("✅ sp kv shard plan passes")
@@ -0,0 +1,147 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import numpy as np
+
+from triton_dist.kernels.sp_ring_attn_plan import build_ring_schedule, ring_src_rank, shard_ranges
+
+
+def _shard(x, rank, world_size, zig_zag):
+    return np.concatenate([x[begin:end] for begin, end in shard_ranges(len(x), rank, world_size, zig_zag)])
+
+
+def _reference(q, k, v, is_causal):
+    prefix_len = len(k) - len(q)
+    s = q @ k.T / np.sqrt(q.shape[-1])
+    if is_causal:
+        s = np.where(np.arange(len(k))[None, :] <= prefix_len + np.arange(len(q))[:, None], s, -np.inf)
+    p = np.exp(s - s.max(-1, keepdims=True))
+    return p @ v / p.sum(-1, keepdims=True)
+
+
+def _ring_attention(q, k, v, rank, world_size, is_causal, zig_zag, block_m, block_n):
+    """ runs the schedule of rank with online softmax, as the ring kernel does """
+    head_dim = q.shape[-1]
+    q_shard = _shard(q, rank, world_size, zig_zag)
+    acc = np.zeros_like(q_shard)
+    m = np.full(len(q_shard), -np.inf)
+    l = np.zeros(len(q_shard))
+    schedule = build_ring_schedule(rank, world_size, len(q), len(k), is_causal, zig_zag, block_m, block_n)
+    for step in schedule.steps:
+        assert step.src_rank == ring_src_rank(rank, step.step, world_size)
+        # the shard that arrived from the ring
+        k_shard = _shard(k, step.src_rank, world_size, zig_zag)
+        v_shard = _shard(v, step.src_rank, world_size, zig_zag)
+        for tile in step.tiles:
+            rows = slice(tile.q_start, tile.q_start + block_m)
+            keys = slice(tile.kv_offset, tile.kv_offset + block_n)
+            s = q_shard[rows] @ k_shard[keys].T / np.sqrt(head_dim)
+            if tile.masked:
+                visible = (tile.kv_start + np.arange(block_n))[None, :] <= (tile.q_pos + np.arange(block_m))[:, None]
+                s = np.where(visible, s, -np.inf)
+            m_new = np.maximum(m[rows], s.max(-1))
+            alpha = np.exp(m[rows] - m_new)
+            p = np.exp(s - m_new[:, None])
+            l[rows] = l[rows] * alpha + p.sum(-1)
+            acc[rows] = acc[rows] * alpha[:, None] + p @ v_shard[keys]
+            m[rows] = m_new
+    return acc / l[:, None], schedule
+
+
+def test_matches_reference():
+    rng = np.random.default_rng(0)
+    block_m, block_n, head_dim = 8, 4, 16
+    for world_size in [1, 2, 4]:
+        for zig_zag in [True, False]:
+            for is_causal in [True, False]:
+                for prefix_len in [0, 32]:
+                    q_len = 2 * world_size * block_m * 2
+                    kv_len = q_len + prefix_len
+                    q = rng.standard_normal((q_len, head_dim))
+                    k = rng.standard_normal((kv_len, head_dim))
+                    v = rng.standard_normal((kv_len, head_dim))
+                    ref = _reference(q, k, v, is_causal)
+                    for rank in range(world_size):
+                        out, _ = _ring_attention(q, k, v, rank, world_size, is_causal, zig_zag, block_m, block_n)
+                        np.testing.assert_allclose(out, _shard(ref, rank, world_size, zig_zag), rtol=1e-9,
+                                                   atol=1e-12)
+
+
+def test_skipping():
+    """ skipped tiles are all masked, full tiles all visible, and nothing is left out """
+    world_size, block_m, block_n = 4, 8, 4
+    q_len = kv_len = 2 * world_size * block_m * 2
+    for zig_zag in [True, False]:
+        for rank in range(world_size):
+            schedule = build_ring_schedule(rank, world_size, q_len, kv_len, True, zig_zag, block_m, block_n)
+            num_q_tiles = q_len // world_size // block_m
+            num_kv_tiles = kv_len // world_size // block_n
+            assert schedule.num_tiles + schedule.num_skipped == world_size * num_q_tiles * num_kv_tiles
+            seen = set()
+            for step in schedule.steps:
+                for tile in step.tiles:
+                    last_row, last_key = tile.q_pos + block_m - 1, tile.kv_start + block_n - 1
+                    assert tile.kv_start <= last_row, "a computed tile must see some key"
+                    assert tile.masked == (last_key > tile.q_pos)
+                    seen.add((tile.q_pos, tile.kv_start))
+            q_positions = {tile.q_pos for step in schedule.steps for tile in step.tiles}
+            for q_pos in q_positions:
+                for n in range(0, kv_len, block_n):
+                    assert ((q_pos, n) in seen) == (n <= q_pos + block_m - 1)
+
+
+def test_zig_zag_balance():
+    world_size, block_m, block_n = 8, 16, 16
+    q_len = kv_len = 2 * world_size * block_m * 4
+    work = {}
+    for zig_zag in [True, False]:
+        work[zig_zag] = [
+            build_ring_schedule(rank, world_size, q_len, kv_len, True, zig_zag, block_m, block_n).num_tiles
+            for rank in range(world_size)
+        ]
+    # every rank does the same causal work with zig-zag, the last rank the most without
+    assert len(set(work[True])) == 1
+    assert work[False][-1] > work[False][0] and max(work[False]) > work[True][0]
+    # a full schedule is the same with or without the layout
+    assert sum(work[True]) == sum(work[False])
+
+
+def test_invalid():
+    for kwargs in [dict(rank=2, world_size=2, q_len=64, kv_len=64), dict(rank=0, world_size=2, q_len=128, kv_len=64),
+                   dict(rank=0, world_size=2, q_len=48, kv_len=48, block_m=8, block_n=8)]:
+        kwargs = dict(dict(block_m=16, block_n=16), **kwargs)
+        try:
+            build_ring_schedule(**kwargs)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"{kwargs} should be rejected")
+
+
+if __name__ == "__main__":
+    test_matches_reference()
+    test_skipping()
+    test_zig_zag_balance()
+    test_invalid()
+    print("✅ sp ring attn plan passes")
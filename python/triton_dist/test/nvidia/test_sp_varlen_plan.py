@@ -0,0 +1,169 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import random
+
+import numpy as np
+import torch
+
+from triton_dist.kernels.sp_varlen_plan import PAD, gather_shard, plan_sp_varlen_batch, scatter_shard
+
+
+def _brute_pairs(q_len, kv_len, rows, is_causal):
+    """ (q, k) pairs of the q rows (positions in the sequence) """
+    prefix_len = kv_len - q_len
+    return sum(min(kv_len, prefix_len + i + 1) if is_causal else kv_len for i in rows)
+
+
+def _attention(q, k, v):
+    prefix_len = len(k) - len(q)
+    s = q @ k.T
+    s = np.where(np.arange(len(k))[None, :] <= prefix_len + np.arange(len(q))[:, None], s, -np.inf)
+    p = np.exp(s - s.max(-1, keepdims=True))
+    return p @ v / p.sum(-1, keepdims=True)
+
+
+def test_tables_and_pairs():
+    rng = random.Random(0)
+    for world_size in [1, 2, 4, 8]:
+        for zig_zag in [True, False]:
+            seqlens_q = [rng.randint(1, 300) for _ in range(5)]
+            num_chunks = 2 * world_size if zig_zag else world_size
+            # prefixes must split into whole chunks
+            seqlens_k = [q + num_chunks * rng.randint(0, 3) for q in seqlens_q]
+            plan = plan_sp_varlen_batch(seqlens_q, seqlens_k, world_size, zig_zag)
+            for q_len, kv_len, pq, pk in zip(seqlens_q, seqlens_k, plan.padded_seqlens_q, plan.padded_seqlens_k):
+                assert pq % num_chunks == 0 and pk % num_chunks == 0 and pq - q_len == pk - kv_len < num_chunks
+            cu_seqlens_q, cu_seqlens_k = plan.tables()
+            assert cu_seqlens_q.dtype == torch.int32 and cu_seqlens_q[-1] * world_size == sum(plan.padded_seqlens_q)
+            assert cu_seqlens_k.tolist() == [0] + list(np.cumsum(plan.padded_seqlens_k))
+
+            all_q_rows, all_kv_rows = [], []
+            for rank in range(world_size):
+                q_rows, kv_rows = plan.q_rows(rank), plan.kv_rows(rank)
+                assert len(q_rows) == cu_seqlens_q[-1] and len(kv_rows) == cu_seqlens_k[-1] // world_size
+                all_q_rows += q_rows
+                all_kv_rows += kv_rows
+                # the useful pairs of each rank from the positions of its real q rows
+                useful = 0
+                start, offset = 0, 0
+                for q_len, kv_len, pq in zip(seqlens_q, seqlens_k, plan.padded_seqlens_q):
+                    positions = [row - start for row in q_rows[offset:offset + pq // world_size] if row != PAD]
+                    useful += _brute_pairs(q_len, kv_len, positions, True)
+                    start += q_len
+                    offset += pq // world_size
+                assert plan.rank_useful_pairs[rank] == useful
+            # every real row is in exactly one shard
+            assert sorted(r for r in all_q_rows if r != PAD) == list(range(sum(seqlens_q)))
+            assert sorted(r for r in all_kv_rows if r != PAD) == list(range(sum(seqlens_k)))
+            total = sum(_brute_pairs(pq, pk, range(pq), True)
+                        for pq, pk in zip(plan.padded_seqlens_q, plan.padded_seqlens_k))
+            assert sum(plan.rank_pairs) == total
+            assert plan.rank_flops(8, 128) == tuple(4 * p * 8 * 128 for p in plan.rank_pairs)
+
+
+def test_balance():
+    rng = np.random.default_rng(1)
+    world_size = 8
+    seqlens = [int(x) for x in rng.integers(1, 8192, size=16)]
+    zig_zag = plan_sp_varlen_batch(seqlens, seqlens, world_size, zig_zag=True)
+    contiguous = plan_sp_varlen_batch(seqlens, seqlens, world_size, zig_zag=False)
+    # chunk pairs r and 2 * world_size - 1 - r are the same work, up to the padding
+    assert zig_zag.imbalance < 1.01, zig_zag.imbalance
+    assert contiguous.imbalance > 1.5, contiguous.imbalance
+    # the last rank holds the end of every sequence
+    assert np.argmax(contiguous.rank_pairs) == world_size - 1
+
+    exact = plan_sp_varlen_batch([64, 128], [64, 128], 4, zig_zag=True)
+    assert exact.num_pad_tokens == 0 and exact.imbalance == 1.0
+
+
+def test_padded_attention_matches():
+    """ causal attention of the padded sequences, cut and gathered as the kernels do, on the real rows """
+    rng = np.random.default_rng(2)
+    world_size, head_dim = 4, 8
+    seqlens_q = [5, 16, 23]
+    seqlens_k = [5, 32, 31]  # prefixes of 0, 16 and 8
+    plan = plan_sp_varlen_batch(seqlens_q, seqlens_k, world_size, zig_zag=True)
+    q = torch.from_numpy(rng.standard_normal((sum(seqlens_q), head_dim)))
+    k = torch.from_numpy(rng.standard_normal((sum(seqlens_k), head_dim)))
+    v = torch.from_numpy(rng.standard_normal((sum(seqlens_k), head_dim)))
+    out = torch.zeros_like(q)
+    for rank in range(world_size):
+        q_shard = gather_shard(q, plan.q_rows(rank))
+        # the all-gathered kv of each padded sequence, in order
+        k_full = torch.cat([gather_shard(k, plan.kv_rows(r)) for r in range(world_size)])
+        v_full = torch.cat([gather_shard(v, plan.kv_rows(r)) for r in range(world_size)])
+        q_rows = plan.q_rows(rank)
+        out_shard = torch.zeros_like(q_shard)
+        cu_q, cu_k = plan.cu_seqlens_q, plan.cu_seqlens_k
+        for i, (pq, pk) in enumerate(zip(plan.padded_seqlens_q, plan.padded_seqlens_k)):
+            # kv rows of sequence i in token order: chunk c is on the rank that holds it
+            kv_shard_len = pk // world_size
+            chunk = pk // (2 * world_size)
+            kv_seq = []
+            for c in range(2 * world_size):
+                r = c if c < world_size else 2 * world_size - 1 - c
+                base = r * (cu_k[-1] // world_size) + cu_k[i] // world_size + (0 if c < world_size else chunk)
+                kv_seq.append(torch.arange(base, base + chunk))
+            kv_seq = torch.cat(kv_seq)
+            assert len(kv_seq) == kv_shard_len * world_size
+            # q rows of the shard in token order: the two chunks of this rank
+            q_chunk = pq // (2 * world_size)
+            q_positions = list(range(rank * q_chunk, (rank + 1) * q_chunk)) + list(
+                range((2 * world_size - 1 - rank) * q_chunk, (2 * world_size - rank) * q_chunk))
+            q_full = torch.zeros((pq, head_dim), dtype=q.dtype)
+            q_full[q_positions] = q_shard[cu_q[i]:cu_q[i + 1]]
+            o = _attention(q_full.numpy(), k_full[kv_seq].numpy(), v_full[kv_seq].numpy())
+            out_shard[cu_q[i]:cu_q[i + 1]] = torch.from_numpy(o[q_positions])
+        scatter_shard(out, out_shard, q_rows)
+
+    start_q, start_k = 0, 0
+    for q_len, kv_len in zip(seqlens_q, seqlens_k):
+        ref = _attention(q[start_q:start_q + q_len].numpy(), k[start_k:start_k + kv_len].numpy(),
+                         v[start_k:start_k + kv_len].numpy())
+        np.testing.assert_allclose(out[start_q:start_q + q_len].numpy(), ref, rtol=1e-10, atol=1e-12)
+        start_q += q_len
+        start_k += kv_len
+
+
+def test_invalid():
+    for args, kwargs in [(([8], [4], 2), {}), (([8], [13], 2), {}), (([7], [7], 2), dict(is_causal=False)),
+                         (([1, 2], [1], 2), {})]:
+        try:
+            plan_sp_varlen_batch(*args, **kwargs)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"{args} {kwargs} should be rejected")
+    # lengths that divide need no mask
+    assert plan_sp_varlen_batch([8], [8], 2, is_causal=False).num_pad_tokens == 0
+
+
+if __name__ == "__main__":
+    test_tables_and_pairs()
+    test_balance()
+    test_padded_attention_matches()
+    test_invalid()
+    print("✅ sp varlen plan passes")
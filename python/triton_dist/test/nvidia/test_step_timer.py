@@ -0,0 +1,110 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+from triton_dist.kernels.step_timer import CATEGORIES, CPUTimerBackend, StepTimer, percentile, timed
+
+
+class FakeBackend(CPUTimerBackend):
+    """ marks are times of a fake clock, and complete only once released by the test """
+
+    def __init__(self):
+        self.now = 0.0
+        self.completed = 0.0
+
+    def mark(self):
+        return self.now
+
+    def ready(self, mark):
+        return mark <= self.completed
+
+    def wait(self, mark):
+        self.completed = max(self.completed, mark)
+
+
+def fake_step(timer, backend, num_layers=2, op_ms=1.0):
+    timer.begin_step()
+    for layer in range(num_layers):
+        for category in CATEGORIES:
+            with timed(timer, category, layer):
+                backend.now += op_ms * (1 + layer) / 1e3
+    backend.now += 0.5 / 1e3
+    timer.end_step()
+
+
+def test_step_timer():
+    backend = FakeBackend()
+    timer = StepTimer(backend, sample_every=4, capacity=3)
+    for _ in range(8):
+        fake_step(timer, backend)
+    # steps 0 and 4 are sampled, and not read before their marks complete
+    assert timer.num_steps == 8 and len(timer.records) == 0
+    backend.completed = backend.now
+    fake_step(timer, backend)
+    assert [record.step for record in timer.records] == [0, 4]
+    record = timer.records[0]
+    assert abs(record.step_ms - (5 * (1 + 2) + 0.5)) < 1e-6, record.step_ms
+    assert set(record.category_ms) == set(CATEGORIES) and abs(record.category_ms["qkv"] - 3) < 1e-6
+    assert abs(record.layer_ms[(1, "attn")] - 2) < 1e-6
+
+    # the ring buffer keeps the last capacity records
+    for _ in range(8):
+        fake_step(timer, backend, op_ms=2.0)
+    timer.flush()
+    assert [record.step for record in timer.records] == [8, 12, 16]
+    summary = timer.summary(by_layer=True)
+    assert summary["step"]["count"] == 3
+    assert abs(summary["qkv"]["p50_ms"] - 6) < 1e-6 and abs(summary["qkv"]["p99_ms"] - 6) < 1e-6
+    assert abs(summary["layer0.mlp_down"]["mean_ms"] - (1 + 2 + 2) / 3) < 1e-6
+
+    text = timer.to_prometheus()
+    assert "# TYPE triton_dist_decode_step_latency_ms summary\n" in text
+    assert 'triton_dist_decode_step_latency_ms_count{region="step"} 3\n' in text
+    assert 'triton_dist_decode_step_latency_ms{region="qkv",quantile="0.5"} ' in text
+
+
+def test_unsampled_steps():
+    # regions outside sampled steps, or without a timer, record nothing
+    timer = StepTimer(CPUTimerBackend(), sample_every=3)
+    with timed(None, "qkv"):
+        pass
+    with timer.region("qkv", 0):
+        pass
+    for step in range(7):
+        timer.begin_step()
+        assert timer.sampling == (step % 3 == 0)
+        with timer.region("attn", 0):
+            pass
+        timer.end_step()
+    timer.flush()
+    assert [record.step for record in timer.records] == [0, 3, 6]
+    assert all(set(record.category_ms) == {"attn"} for record in timer.records)
+
+    assert percentile([], 0.5) != percentile([], 0.5)  # nan
+    assert percentile([3, 1, 2], 0.5) == 2 and percentile(list(range(100)), 0.99) == 98
+
+
+if __name__ == "__main__":
+    test_step_timer()
+    test_unsampled_steps()
+    print("✅ step timer passes")
@@ -0,0 +1,83 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import numpy as np
+
+from triton_dist.kernels.swiglu_epilogue import (SWIGLU_INTERLEAVE_GROUP, fused_swiglu_gemm_reference,
+                                                 interleave_gate_up_reference, silu_reference,
+                                                 swiglu_epilogue_reference, swiglu_interleave_index)
+
+
+def unfused_reference(x, gate, up):
+    """ what TP_MLP does without the fused epilogue: GEMM into [M, 2 * I], chunk, act_fn(wg) * w1 """
+    out_fused = x @ np.concatenate([gate, up], axis=0).T
+    wg, w1 = np.split(out_fused, 2, axis=-1)
+    return silu_reference(wg) * w1
+
+
+def test_interleave_index(intermediate_size, group):
+    index = swiglu_interleave_index(intermediate_size, group)
+    assert sorted(index.tolist()) == list(range(2 * intermediate_size))
+    for row, src in enumerate(index):
+        g, i = divmod(row, 2 * group)
+        is_up, j = divmod(i, group)
+        assert src == is_up * intermediate_size + g * group + j, (row, src)
+
+
+def test_fused_matches_unfused(M, K, intermediate_size, block_n, group):
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((M, K), dtype=np.float32)
+    gate = rng.standard_normal((intermediate_size, K), dtype=np.float32) / np.sqrt(K)
+    up = rng.standard_normal((intermediate_size, K), dtype=np.float32) / np.sqrt(K)
+    w = interleave_gate_up_reference(gate, up, group)
+    out = fused_swiglu_gemm_reference(x, w, block_n, group)
+    assert out.shape == (M, intermediate_size)
+    np.testing.assert_allclose(out, unfused_reference(x, gate, up), rtol=1e-5, atol=1e-5)
+
+
+def test_epilogue_column_mapping(block_m, block_n, group):
+    # tile column c of the output reads gate at (c // group) * 2 * group + c % group and up group columns later
+    acc = np.arange(block_m * block_n, dtype=np.float32).reshape(block_m, block_n) / (block_m * block_n)
+    out = swiglu_epilogue_reference(acc, group)
+    cols = np.arange(block_n // 2)
+    gate_cols = cols // group * 2 * group + cols % group
+    np.testing.assert_allclose(out, silu_reference(acc[:, gate_cols]) * acc[:, gate_cols + group], rtol=1e-6)
+
+
+if __name__ == "__main__":
+    for intermediate_size, group in [(64, 64), (256, 64), (384, 64), (48, 16)]:
+        test_interleave_index(intermediate_size, group)
+    # 3200: Qwen3-32B at TP 8. 320 with BLOCK_N 256: the last N-tile holds only one group pair
+    for M, K, intermediate_size, block_n in [(16, 32, 256, 128), (8, 64, 256, 256), (4, 16, 3200, 256),
+                                             (3, 8, 384, 128), (3, 8, 320, 256)]:
+        test_fused_matches_unfused(M, K, intermediate_size, block_n, SWIGLU_INTERLEAVE_GROUP)
+    for block_n in [128, 256]:
+        test_epilogue_column_mapping(4, block_n, SWIGLU_INTERLEAVE_GROUP)
+    try:
+        swiglu_interleave_index(100, SWIGLU_INTERLEAVE_GROUP)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError for intermediate size not divisible by the group")
+    print("✅ fused SwiGLU epilogue reference passes")
@@ -0,0 +1,127 @@
+################################################################################
+#
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+################################################################################
+import numpy as np
+import pytest
+import torch
+
+from triton_dist.kernels import swizzle_lut
+from triton_dist.kernels.nvidia.ag_gemm_threadblock_swizzle import threadblock_swizzle_allgather_gemm
+from triton_dist.kernels.nvidia.gemm_rs_threadblock_swizzle import threadblock_swizzle_gemm_reduce_scatter
+from triton_dist.kernels.swizzle_lut import (AG_GEMM, GEMM_RS, ag_gemm_swizzle_lut, get_swizzle_lut_tensor,
+                                             gemm_rs_swizzle_lut)
+
+
+def _cdiv(n, m):
+    return (n - 1 + m) // m
+
+
+def _reference(kind):
+    """ the host references the swizzle modules check their triton kernels against, tile by tile """
+    return threadblock_swizzle_gemm_reduce_scatter if kind == GEMM_RS else threadblock_swizzle_allgather_gemm
+
+
+def _main_shapes(kind):
+    """ (M, world_size, nnodes, BLOCK_M) of the __main__ checks of the swizzle modules """
+    WORLD_SIZE, NNODES, BLOCK_SIZE_M = 16, 2, 128
+    if kind == AG_GEMM:
+        return [(999 * WORLD_SIZE, WORLD_SIZE, NNODES, BLOCK_SIZE_M)]
+    Ms = [
+        BLOCK_SIZE_M * WORLD_SIZE,
+        BLOCK_SIZE_M * WORLD_SIZE + WORLD_SIZE,
+        BLOCK_SIZE_M * WORLD_SIZE - WORLD_SIZE,
+        BLOCK_SIZE_M * WORLD_SIZE // 2,
+        BLOCK_SIZE_M * WORLD_SIZE // 2 + WORLD_SIZE,
+        BLOCK_SIZE_M * WORLD_SIZE // 2 - WORLD_SIZE,
+    ]
+    return [(M, WORLD_SIZE, NNODES, BLOCK_SIZE_M) for M in Ms]
+
+
+def _check(kind, lut_fn, M, world_size, nnodes, block_m):
+    num_tiles = _cdiv(M, block_m)
+    for rank in range(world_size):
+        lut = lut_fn(M, rank, world_size, nnodes, block_m)
+        assert lut.dtype == np.int32 and lut.shape == (num_tiles, )
+        assert sorted(lut.tolist()) == list(range(num_tiles)), f"{kind} M={M} rank={rank}: {lut.tolist()}"
+        expected = [int(_reference(kind)(t, M, rank, world_size, nnodes, block_m)) for t in range(num_tiles)]
+        assert lut.tolist() == expected, f"{kind} M={M} rank={rank}: {lut.tolist()} vs {expected}"
+
+
+def test_main_shapes():
+    for shape in _main_shapes(GEMM_RS):
+        _check(GEMM_RS, gemm_rs_swizzle_lut, *shape)
+    for shape in _main_shapes(AG_GEMM):
+        _check(AG_GEMM, ag_gemm_swizzle_lut, *shape)
+
+
+def test_more_shapes():
+    for world_size, nnodes in [(16, 2), (16, 4), (32, 4), (8, 2)]:
+        for block_m in [64, 128]:
+            for M in [block_m * world_size, 999 * world_size, 3 * block_m * world_size + 5 * world_size]:
+                _check(GEMM_RS, gemm_rs_swizzle_lut, M, world_size, nnodes, block_m)
+                _check(AG_GEMM, ag_gemm_swizzle_lut, M, world_size, nnodes, block_m)
+
+
+def test_cached_and_read_only():
+    lut = gemm_rs_swizzle_lut(2048, 3, 16, 2, 128)
+    assert gemm_rs_swizzle_lut(2048, 3, 16, 2, 128) is lut
+    with pytest.raises(ValueError):
+        lut[0] = 1
+
+
+def test_lut_tensor():
+    lut = get_swizzle_lut_tensor(AG_GEMM, 999 * 16, 5, 16, 2, 128, device="cpu")
+    assert lut.dtype == torch.int32
+    assert lut.tolist() == ag_gemm_swizzle_lut(999 * 16, 5, 16, 2, 128).tolist()
+    assert get_swizzle_lut_tensor(AG_GEMM, 999 * 16, 5, 16, 2, 128, device="cpu") is lut
+    with pytest.raises(ValueError):
+        get_swizzle_lut_tensor("gemm", 999 * 16, 5, 16, 2, 128, device="cpu")
+    # 4 nodes within one tile: no permutation, the kernels keep their own swizzle
+    with pytest.raises(ValueError):
+        gemm_rs_swizzle_lut(16, 4, 16, 4, 128)
+    assert get_swizzle_lut_tensor(GEMM_RS, 16, 4, 16, 4, 128, device="cpu") is None
+
+
+def test_graph_safe_tables_are_pinned():
+    cache_size = swizzle_lut.LUT_TENSOR_CACHE_SIZE
+    swizzle_lut.LUT_TENSOR_CACHE_SIZE = 2
+    try:
+        pinned = get_swizzle_lut_tensor(GEMM_RS, 4096, 1, 16, 2, 128, device="cpu", graph_safe=True)
+        cached = get_swizzle_lut_tensor(GEMM_RS, 4096, 2, 16, 2, 128, device="cpu")
+        for rank in range(3, 6):
+            get_swizzle_lut_tensor(GEMM_RS, 4096, rank, 16, 2, 128, device="cpu")
+        # a captured graph may read the pinned table by address: it outlives the LRU, the other one is evicted
+        assert get_swizzle_lut_tensor(GEMM_RS, 4096, 1, 16, 2, 128, device="cpu") is pinned
+        assert get_swizzle_lut_tensor(GEMM_RS, 4096, 2, 16, 2, 128, device="cpu") is not cached
+    finally:
+        swizzle_lut.LUT_TENSOR_CACHE_SIZE = cache_size
+
+
+if __name__ == "__main__":
+    test_main_shapes()
+    test_more_shapes()
+    test_cached_and_read_only()
+    test_lut_tensor()
+    test_graph_safe_tables_are_pinned()
+    print("✅ swizzle lut passes")
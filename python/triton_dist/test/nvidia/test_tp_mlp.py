@@ -80,6 +80,8 @@ def parse_args():
     parser.add_argument("--profile", default=False, action="store_true", help="dump torch.profiler.profile")
     parser.add_argument("--ag_gemm_persistent", default=False, action="store_true")
     parser.add_argument("--gemm_rs_persistent", default=False, action="store_true")
+    parser.add_argument("--fuse_swiglu", default=False, action="store_true",
+                        help="compute SiLU(gate) * up in the AG-GEMM epilogue")
     parser.add_argument("--seed", type=int, default=42)
 
     # for triton_dist_AR
@@ -128,6 +130,8 @@ if __name__ == "__main__":
     hf_mlp = hf_model.model.layers[0].mlp.eval()
     mlp = TP_MLP(rank=RANK, world_size=WORLD_SIZE, group=TP_GROUP)
     mlp._init_parameters(hf_mlp, verbose=True)
+    if args.fuse_swiglu:
+        mlp.enable_fused_swiglu()
 
     torch.manual_seed(args.seed)
     M = args.M